@@ -0,0 +1,138 @@
+"""
+Аналитика результатов анализа на NumPy: результаты класса, параллели или школы загружаются
+в массив ученик × критерий × период (ResultsCube), распределения по уровням, динамика между
+периодами и нагрузка специалистов считаются операциями над массивами, без цикла по ученикам.
+Модуль импортируется из обработчика окна «Мониторинг» — запуск программы NumPy не загружает.
+"""
+from typing import Iterable, Optional
+
+import numpy as np
+
+from db import Database, level_score, level_scores
+
+_SEP = "\x1f"
+
+
+def _factorize(keys: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Уникальные значения (по возрастанию) и номер значения для каждой строки."""
+    uniques, inverse = np.unique(np.asarray(keys, dtype=str), return_inverse=True)
+    return uniques, inverse.reshape(-1)
+
+
+class ResultsCube:
+    """
+    Результаты в массивах: scores[ученик, критерий, период] — балл уровня (NaN — нет результата);
+    критерий — пара (специалист, критерий). Повторные записи одной ячейки дают наибольший балл,
+    как в отчёте по классу. Исходные строки сохранены номерами осей (row_*) для подсчётов.
+    scores — баллы уровней из db.level_scores (те же, что у отчёта по классу).
+    """
+
+    def __init__(self, periods: list[str], rows: list[tuple], scores: dict[str, float]):
+        self.periods = list(periods)
+        period_index = {col: n for n, col in enumerate(self.periods)}
+        if rows:
+            classes, surnames, names, patronymics, specialists, criteria, columns, levels = zip(*rows)
+        else:
+            classes = surnames = names = patronymics = specialists = criteria = columns = levels = ()
+
+        pupil_keys, self.row_pupil = _factorize(
+            [_SEP.join(p or "" for p in key) for key in zip(classes, surnames, names, patronymics)]
+        )
+        criterion_keys, self.row_criterion = _factorize(
+            [f"{s or ''}{_SEP}{c or ''}" for s, c in zip(specialists, criteria)]
+        )
+        level_names, self.row_level = _factorize([level or "" for level in levels])
+        self.row_period = np.fromiter((period_index[c] for c in columns), dtype=np.intp, count=len(columns))
+
+        # (класс, фамилия, имя, отчество) и (специалист, критерий) по порядку осей
+        self.pupils = [tuple(key.split(_SEP)) for key in pupil_keys.tolist()]
+        self.criteria = [tuple(key.split(_SEP)) for key in criterion_keys.tolist()]
+
+        # Баллы: уровень переводится в число один раз на уникальное название
+        by_level = np.array(
+            [np.nan if score is None else score for score in (level_score(n, scores) for n in level_names.tolist())],
+            dtype=np.float32,
+        )
+        row_score = by_level[self.row_level]
+
+        # Уровни — по возрастанию балла (без балла — в конце, по названию)
+        order = np.lexsort((level_names, np.nan_to_num(by_level, nan=0.0), np.isnan(by_level)))  # последний ключ — главный
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        self.levels = level_names[order].tolist()
+        self.level_scores = by_level[order]
+        self.row_level = rank[self.row_level]
+
+        self.scores = np.full((len(self.pupils), len(self.criteria), len(self.periods)), np.nan, dtype=np.float32)
+        np.fmax.at(self.scores, (self.row_pupil, self.row_criterion, self.row_period), row_score)
+
+        # Специалист критерия и класс ученика — номерами
+        self.specialists, self.criterion_specialist = _factorize([s for s, _ in self.criteria])
+        self.specialists = self.specialists.tolist()
+        self.classes, self.pupil_class = _factorize([p[0] for p in self.pupils])
+        self.classes = self.classes.tolist()
+
+    def __len__(self) -> int:
+        return len(self.row_pupil)
+
+
+def load_cube(
+    db: Database,
+    class_numbers: Optional[Iterable[str]] = None,
+    specialist: Optional[str] = None,
+    grade: Optional[int] = None,
+) -> ResultsCube:
+    """Результаты классов class_numbers (None — школа) или параллели grade в ResultsCube."""
+    periods, rows = db.analysis_get_scores(class_numbers, specialist, grade)
+    return ResultsCube(periods, rows, level_scores(db.standards_get_all()))
+
+
+def _mean(values: np.ndarray, axis: int) -> tuple[np.ndarray, np.ndarray]:
+    """Среднее без NaN и число известных значений (для пустых — NaN и 0, без предупреждений NumPy)."""
+    known = ~np.isnan(values)
+    n = known.sum(axis=axis)
+    total = np.where(known, values, 0).sum(axis=axis, dtype=np.float64)
+    mean = np.divide(total, n, out=np.full(n.shape, np.nan), where=n > 0)
+    return mean, n
+
+
+def distributions(cube: ResultsCube) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Распределение по критериям: counts[критерий, период, уровень] — число результатов,
+    mean[критерий, период] — средний балл, pupils[критерий, период] — учеников с результатом.
+    """
+    counts = np.zeros((len(cube.criteria), len(cube.periods), len(cube.levels)), dtype=np.int64)
+    np.add.at(counts, (cube.row_criterion, cube.row_period, cube.row_level), 1)
+    mean, pupils = _mean(cube.scores, axis=0)
+    return counts, mean, pupils
+
+
+def progress(cube: ResultsCube) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Динамика между соседними периодами (ось пар периодов — len(periods) - 1): средний прирост
+    балла, доли учеников с ростом и со снижением, число учеников с результатами в обоих периодах.
+    """
+    deltas = np.diff(cube.scores, axis=2)
+    mean, n = _mean(deltas, axis=0)
+    with np.errstate(invalid="ignore"):
+        up = (deltas > 0).sum(axis=0)
+        down = (deltas < 0).sum(axis=0)
+    improved = np.divide(up, n, out=np.full(n.shape, np.nan), where=n > 0)
+    declined = np.divide(down, n, out=np.full(n.shape, np.nan), where=n > 0)
+    return mean, improved, declined, n
+
+
+def specialist_workload(cube: ResultsCube) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Нагрузка специалистов по периодам: results[специалист, период] — записей результатов,
+    pupils — разных учеников, classes — разных классов.
+    """
+    shape = (len(cube.specialists), len(cube.periods))
+    row_specialist = cube.criterion_specialist[cube.row_criterion]
+    results = np.zeros(shape, dtype=np.int64)
+    np.add.at(results, (row_specialist, cube.row_period), 1)
+    seen_pupils = np.zeros((len(cube.pupils),) + shape, dtype=bool)
+    seen_pupils[cube.row_pupil, row_specialist, cube.row_period] = True
+    seen_classes = np.zeros((len(cube.classes),) + shape, dtype=bool)
+    seen_classes[cube.pupil_class[cube.row_pupil], row_specialist, cube.row_period] = True
+    return results, seen_pupils.sum(axis=0), seen_classes.sum(axis=0)
@@ -0,0 +1,4 @@
+"""
+Бенчмарки SvedUch: генератор синтетических данных школы и замеры db.py.
+Запуск из корня проекта: python -m benchmarks.bench_db --help
+"""
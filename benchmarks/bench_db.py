@@ -0,0 +1,168 @@
+"""
+Замеры горячих путей db.py на синтетических БД (1k/10k/100k учеников).
+Результаты пишутся в JSON (версия приложения, SQLite, Python, медиана/минимум по повторам),
+чтобы сравнивать версии: python -m benchmarks.bench_db --compare old.json
+
+Пример:
+    python -m benchmarks.bench_db --sizes 1000 10000 --output bench_db.json
+"""
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.generator import generate, write_pupils_excel  # noqa: E402
+from db import Database  # noqa: E402
+from version import __version__  # noqa: E402
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+def _measure(fn: Callable[[], object], repeat: int) -> dict:
+    """Выполнить fn repeat раз; вернуть медиану, минимум и все замеры (секунды)."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(runs), "min_s": min(runs), "runs": runs}
+
+
+def _excel_import(db: Database, path: Path, class_number: str) -> int:
+    """Загрузка учеников из Excel так же, как PupilsTableDialog._excel_load: разбор файла и pupils_insert по строке."""
+    from excel_import import read_pupils_from_excel
+
+    rows, _errors = read_pupils_from_excel(str(path))
+    form_id = db.forms_get_or_create_id(class_number)
+    for r in rows:
+        db.pupils_insert({
+            "form_id": form_id,
+            "surname": r["surname"],
+            "name": r["name"],
+            "patronymic": r.get("patronymic", ""),
+            "birth_date": r.get("birth_date", ""),
+            "address": r.get("address", ""),
+            "gender": r.get("gender", ""),
+        })
+    return len(rows)
+
+
+def _promote_class(db: Database, form_id: int) -> int:
+    """Перевод класса так же, как TransferWindow._class_save (не 11-й класс): pupils_update каждого ученика."""
+    from transfer_window import _increment_class_number
+
+    forms = {r["id"]: r["number"] for r in db.forms_get_all()}
+    new_number = _increment_class_number(forms[form_id])
+    new_form_id = db.forms_get_or_create_id(new_number)
+    pupils = db.pupils_get_by_form_id(form_id)
+    for r in pupils:
+        upd = r.copy()
+        upd.form_id = new_form_id
+        db.pupils_update(r.id, upd)
+    return len(pupils)
+
+
+def bench_size(size: int, workdir: Path, repeat: int, import_rows: int, seed: int) -> list[dict]:
+    """Все замеры для БД из size учеников."""
+    db_path = workdir / f"bench_{size}.db"
+    start = time.perf_counter()
+    summary = generate(db_path, size, seed=seed)
+    print(f"[{size}] сгенерировано за {time.perf_counter() - start:.1f} с: {summary}", flush=True)
+
+    db = Database(db_path)
+    results = []
+
+    def record(name: str, fn: Callable[[], object], n: int = repeat, per_call: Optional[int] = None):
+        m = _measure(fn, n)
+        if per_call:
+            m["calls"] = per_call
+        m.update({"size": size, "name": name})
+        results.append(m)
+        print(f"[{size}] {name:<34} медиана {m['median_s'] * 1000:10.2f} мс", flush=True)
+
+    record("pupils_get_all", db.pupils_get_all)
+    record("pupils_count_by_program", db.pupils_count_by_program)
+
+    sample = db._get_conn().execute(
+        "SELECT class_number, surname, name, patronymic, specialist FROM analysis "
+        "GROUP BY class_number, surname, name, patronymic, specialist ORDER BY MIN(id) LIMIT 50"
+    ).fetchall()
+    record(
+        "analysis_get_results_for_pupil x50",
+        lambda: [db.analysis_get_results_for_pupil(*tuple(r)) for r in sample],
+        per_call=len(sample),
+    )
+
+    excel_path = write_pupils_excel(workdir / f"import_{size}.xlsx", import_rows, seed=seed + 1)
+    counter = iter(range(10 ** 6))
+    record(f"excel_import {import_rows} rows", lambda: _excel_import(db, excel_path, f"И{next(counter)}"))
+
+    # Каждый повтор переводит свой класс, чтобы замеры были сопоставимы
+    form_ids = iter(r[0] for r in db._get_conn().execute(
+        "SELECT form_id FROM pupils GROUP BY form_id HAVING COUNT(*) > 0 ORDER BY form_id"
+    ).fetchall())
+    record("class_promotion", lambda: _promote_class(db, next(form_ids)))
+
+    db.close()
+    return results
+
+
+def _compare(current: list[dict], baseline_path: str) -> None:
+    """Напечатать отношение медиан к прошлому прогону (>1 — стало медленнее)."""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    old = {(r["size"], r["name"]): r["median_s"] for r in baseline["results"]}
+    print(f"\nСравнение с {baseline_path} (версия {baseline['meta'].get('version')}):")
+    for r in current:
+        prev = old.get((r["size"], r["name"]))
+        if prev:
+            print(f"  [{r['size']}] {r['name']:<34} x{r['median_s'] / prev:6.2f}")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк db.py на синтетических БД.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Число учеников (по умолчанию 1000 10000 100000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов каждого замера")
+    parser.add_argument("--import-rows", type=int, default=500, help="Строк в файле Excel для замера загрузки")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_db.json", help="Файл результатов (JSON)")
+    parser.add_argument("--workdir", help="Каталог для сгенерированных БД (по умолчанию временный)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="sveduch_bench_") as tmp:
+        workdir = Path(args.workdir) if args.workdir else Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        for size in args.sizes:
+            results.extend(bench_size(size, workdir, args.repeat, args.import_rows, args.seed))
+
+    report = {
+        "meta": {
+            "version": __version__,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Результаты: {args.output}")
+    if args.compare:
+        _compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Замеры отзывчивости окон без экрана (QT_QPA_PLATFORM=offscreen) на синтетических БД:
+время до первой отрисовки, перелистывание страницы, выполнение выборки, заполнение таблицы,
+экспорт в Excel и самая длинная остановка цикла событий (по «пульсу» таймера).
+
+Пример:
+    python -m benchmarks.bench_gui --sizes 1000 10000 --output bench_gui.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PyQt5.QtCore import QEvent, QEventLoop, QObject, QTimer  # noqa: E402
+from PyQt5.QtWidgets import QApplication, QFileDialog, QMessageBox  # noqa: E402
+
+from benchmarks.generator import generate  # noqa: E402
+from db import Database  # noqa: E402
+from version import __version__  # noqa: E402
+
+DEFAULT_SIZES = (1000, 10000)
+# Интервал «пульса» цикла событий, мс; разрыв между срабатываниями — остановка цикла
+HEARTBEAT_MS = 2
+# Сколько ждать после действия, чтобы отработали отложенные отрисовки, мс
+SETTLE_MS = 30
+PAINT_TIMEOUT_S = 30
+
+
+class EventLoopMonitor(QObject):
+    """Таймер-«пульс»: самый большой разрыв между срабатываниями = самая длинная остановка цикла событий."""
+
+    def __init__(self):
+        super().__init__()
+        self._timer = QTimer(self)
+        self._timer.setInterval(HEARTBEAT_MS)
+        self._timer.timeout.connect(self._tick)
+        self._last = None
+        self.max_gap = 0.0
+
+    def start(self) -> None:
+        self.reset()
+        self._timer.start()
+
+    def reset(self) -> None:
+        self._last = time.perf_counter()
+        self.max_gap = 0.0
+
+    def _tick(self) -> None:
+        now = time.perf_counter()
+        self.max_gap = max(self.max_gap, now - self._last)
+        self._last = now
+
+
+class _PaintProbe(QObject):
+    """Запоминает момент первого события отрисовки окна."""
+
+    def __init__(self):
+        super().__init__()
+        self.painted_at: Optional[float] = None
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and self.painted_at is None:
+            self.painted_at = time.perf_counter()
+        return False
+
+
+@contextmanager
+def _silent_dialogs(save_path: str):
+    """Модальные окна не должны блокировать прогон: сообщения — без показа, «Сохранить как» — save_path."""
+    saved = (QMessageBox.information, QMessageBox.warning, QMessageBox.critical, QFileDialog.getSaveFileName)
+    QMessageBox.information = staticmethod(lambda *a, **k: QMessageBox.Ok)
+    QMessageBox.warning = staticmethod(lambda *a, **k: QMessageBox.Ok)
+    QMessageBox.critical = staticmethod(lambda *a, **k: QMessageBox.Ok)
+    QFileDialog.getSaveFileName = staticmethod(lambda *a, **k: (save_path, ""))
+    try:
+        yield
+    finally:
+        (QMessageBox.information, QMessageBox.warning, QMessageBox.critical,
+         QFileDialog.getSaveFileName) = saved
+
+
+class GuiBench:
+    def __init__(self, app: QApplication, size: int):
+        self.app = app
+        self.size = size
+        self.monitor = EventLoopMonitor()
+        self.monitor.start()
+        self.results: list[dict] = []
+
+    def _record(self, window: str, action: str, elapsed: Optional[float]) -> None:
+        stall = self.monitor.max_gap
+        self.results.append({
+            "size": self.size, "window": window, "action": action,
+            "elapsed_ms": elapsed * 1000 if elapsed is not None else None,
+            "stall_ms": stall * 1000,
+        })
+        shown = f"{elapsed * 1000:10.1f} мс" if elapsed is not None else "         — "
+        print(f"[{self.size}] {window:<20} {action:<18} {shown}  остановка {stall * 1000:8.1f} мс", flush=True)
+
+    def action(self, window: str, name: str, fn: Callable[[], object]) -> None:
+        """Выполнить fn из цикла событий; время — до возврата fn, остановка — с учётом отрисовки после неё."""
+        loop = QEventLoop()
+        out = {}
+
+        def call():
+            start = time.perf_counter()
+            try:
+                fn()
+            finally:
+                out["elapsed"] = time.perf_counter() - start
+                QTimer.singleShot(SETTLE_MS, loop.quit)
+
+        self.monitor.reset()
+        QTimer.singleShot(0, call)
+        loop.exec_()
+        self._record(window, name, out["elapsed"])
+
+    def open_window(self, window: str, factory: Callable[[], object]):
+        """Создать и показать окно; замер — от создания до первого события отрисовки."""
+        probe = _PaintProbe()
+        loop = QEventLoop()
+        out = {}
+
+        def call():
+            start = time.perf_counter()
+            w = factory()
+            w.installEventFilter(probe)
+            w.resize(1200, 800)
+            w.show()
+            out["start"], out["widget"] = start, w
+
+        def wait_paint():
+            if probe.painted_at is not None or time.perf_counter() - out.get("start", time.perf_counter()) > PAINT_TIMEOUT_S:
+                loop.quit()
+            else:
+                QTimer.singleShot(1, wait_paint)
+
+        self.monitor.reset()
+        QTimer.singleShot(0, call)
+        QTimer.singleShot(1, wait_paint)
+        loop.exec_()
+        elapsed = probe.painted_at - out["start"] if probe.painted_at is not None else None
+        self._record(window, "first_paint", elapsed)
+        return out["widget"]
+
+
+def bench_size(app: QApplication, size: int, workdir: Path, seed: int) -> list[dict]:
+    from monitoring_window import MonitoringWindow
+    from queries_window import QueriesWindow
+    from table_windows import ArchiveTableDialog, PupilsTableDialog
+
+    db_path = workdir / f"bench_gui_{size}.db"
+    summary = generate(db_path, size, seed=seed)
+    print(f"[{size}] сгенерировано: {summary}", flush=True)
+    db = Database(db_path)
+    db.create_tables()
+    bench = GuiBench(app, size)
+    export_path = str(workdir / f"export_{size}.xlsx")
+
+    with _silent_dialogs(export_path):
+        w = bench.open_window("PupilsTableDialog", lambda: PupilsTableDialog(db))
+        bench.action("PupilsTableDialog", "page_flip", w._next_page)
+        bench.action("PupilsTableDialog", "page_flip_back", w._prev_page)
+        bench.action("PupilsTableDialog", "refresh", w._refresh)
+        w.close()
+
+        w = bench.open_window("QueriesWindow", lambda: QueriesWindow(db))
+        w.radio_list.setChecked(True)
+        bench.action("QueriesWindow", "query_run", w._run)
+        bench.action("QueriesWindow", "table_fill", w._fill_pupils_table)
+        bench.action("QueriesWindow", "export", lambda: w._write_excel(export_path))
+        w.radio_count.setChecked(True)
+        bench.action("QueriesWindow", "query_count", w._run)
+        w.close()
+
+        w = bench.open_window("ArchiveTableDialog", lambda: ArchiveTableDialog(db))
+        bench.action("ArchiveTableDialog", "refresh", w._refresh)
+        w.close()
+
+        w = bench.open_window("MonitoringWindow", lambda: MonitoringWindow(db))
+        sample = db._get_conn().execute(
+            "SELECT class_number, surname, name, patronymic, specialist FROM analysis ORDER BY id LIMIT 1"
+        ).fetchone()
+        if sample is not None:
+            w._class_helper._set_class(sample["class_number"])
+            w._current_pupil = {"surname": sample["surname"], "name": sample["name"],
+                                "patronymic": sample["patronymic"]}
+            w.surname_edit.setText(sample["surname"])
+            w.name_edit.setText(sample["name"])
+            w.patronymic_edit.setText(sample["patronymic"] or "")
+            w.specialist_edit.setText(sample["specialist"])
+            bench.action("MonitoringWindow", "load_analysis", w._on_load_analysis)
+            bench.action("MonitoringWindow", "export", w._on_export_excel)
+        w.close()
+
+    db.close()
+    return bench.results
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк отзывчивости окон (offscreen Qt).")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Число учеников (по умолчанию 1000 10000)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_gui.json", help="Файл результатов (JSON)")
+    parser.add_argument("--workdir", help="Каталог для сгенерированных БД (по умолчанию временный)")
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    results = []
+    with tempfile.TemporaryDirectory(prefix="sveduch_bench_gui_") as tmp:
+        workdir = Path(args.workdir) if args.workdir else Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        for size in args.sizes:
+            results.extend(bench_size(app, size, workdir, args.seed))
+
+    report = {
+        "meta": {
+            "version": __version__,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "qt_platform": app.platformName(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+        },
+        "results": results,
+        "worst_stall_ms": {
+            window: max(r["stall_ms"] for r in results if r["window"] == window)
+            for window in dict.fromkeys(r["window"] for r in results)
+        },
+    }
+    Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Результаты: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Детерминированный генератор синтетической БД SvedUch для бенчмарков.
+Один и тот же seed и размер дают одинаковые данные: классы 1–11 с литерами по школам,
+программы, специалисты и рекомендации, ученики с русскими ФИО, архив и анализ.
+"""
+import random
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Optional
+
+from db import DEFAULT_LEVELS, Database
+
+# Примерно столько учеников в одной «школе» (11 параллелей × 4 литеры × ~23 ученика)
+PUPILS_PER_SCHOOL = 1000
+LETTERS = "АБВГДЕЖИКЛМН"
+
+MALE_NAMES = [
+    "Александр", "Алексей", "Андрей", "Артём", "Владимир", "Даниил", "Дмитрий", "Егор", "Иван",
+    "Илья", "Кирилл", "Максим", "Матвей", "Михаил", "Никита", "Роман", "Сергей", "Тимофей",
+]
+FEMALE_NAMES = [
+    "Алина", "Анастасия", "Анна", "Арина", "Василиса", "Вероника", "Дарья", "Екатерина", "Елизавета",
+    "Ксения", "Мария", "Милана", "Полина", "Софья", "Ульяна", "Варвара", "Виктория", "Ева",
+]
+# Фамилии в мужской форме; женская получается окончанием (-ов → -ова, -ин → -ина, -ий → -ая)
+SURNAMES = [
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков",
+    "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров", "Павлов", "Козлов",
+    "Степанов", "Николаев", "Орлов", "Андреев", "Макаров", "Никитин", "Захаров", "Зайцев", "Соловьёв",
+    "Борисов", "Яковлев", "Григорьев", "Романов", "Воробьёв", "Сергеев", "Кузьмин", "Фролов",
+    "Александров", "Дмитриев", "Королёв", "Гусев", "Киселёв", "Ильин", "Максимов", "Поляков",
+    "Сорокин", "Виноградов", "Ковалёв", "Белов", "Медведев", "Антонов", "Тарасов", "Жуков",
+    "Баранов", "Филиппов", "Комаров", "Давыдов", "Беляев", "Герасимов", "Богданов", "Осипов",
+    "Сидоров", "Матвеев", "Титов", "Марков", "Миронов", "Крылов", "Куликов", "Карпов", "Власов",
+    "Мельников", "Денисов", "Гаврилов", "Тихонов", "Казаков", "Афанасьев", "Данилов", "Савельев",
+    "Тимофеев", "Фомин", "Чернов", "Абрамов", "Мартынов", "Ефимов", "Федотов", "Щербаков",
+    "Назаров", "Калинин", "Исаев", "Чернышёв", "Быков", "Маслов", "Родионов", "Коновалов",
+    "Лазарев", "Воронин", "Климов", "Филатов", "Пономарёв", "Голубев", "Кудрявцев", "Прохоров",
+    "Наумов", "Потапов", "Журавлёв", "Овчинников", "Трофимов", "Леонов", "Соболев", "Ермаков",
+    "Колесников", "Гончаров", "Емельянов", "Никифоров", "Грачёв", "Котов", "Гришин", "Ефремов",
+    "Архипов", "Громов", "Кириллов", "Малышев", "Панов", "Моисеев", "Румянцев", "Акимов",
+    "Кондратьев", "Бирюков", "Горбунов", "Анисимов", "Ерёмин", "Тихомиров", "Галкин", "Лукьянов",
+    "Михеев", "Скворцов", "Юдин", "Белоусов", "Нестеров", "Симонов", "Прокофьев", "Харитонов",
+    "Князев", "Цветков", "Левин", "Митрофанов", "Воронов", "Аксёнов", "Софронов", "Мальцев",
+    "Логинов", "Горшков", "Савин", "Краснов", "Майоров", "Демидов", "Елисеев", "Рыбаков",
+    "Сафонов", "Плотников", "Дёмин", "Хохлов", "Фадеев", "Молчанов", "Игнатов", "Литвинов",
+    "Ершов", "Ушаков", "Дементьев", "Рябов", "Мухин", "Калашников", "Леонтьев", "Лобанов",
+    "Кузин", "Корнилов", "Евдокимов", "Бородин", "Платонов", "Некрасов", "Балашов", "Бобров",
+    "Жданов", "Блинов", "Игнатьев", "Коротков", "Муравьёв", "Крюков", "Беляков", "Богомолов",
+    "Дроздов", "Лавров", "Зуев", "Петухов", "Ларин", "Никулин", "Серов", "Терентьев", "Зотов",
+    "Устинов", "Фокин", "Самойлов", "Константинов", "Сахаров", "Шишкин", "Самсонов", "Черкасов",
+    "Чистяков", "Носов", "Спиридонов", "Карасёв", "Авдеев", "Воронцов", "Зверев", "Владимиров",
+    "Селезнёв", "Нечаев", "Кудряшов", "Седов", "Фирсов", "Андрианов", "Панин", "Головин",
+    "Терехов", "Ульянов", "Шестаков", "Агеев", "Никонов", "Селиванов", "Баженов", "Гордеев",
+]
+# Отчество от имени отца: (мужское, женское)
+PATRONYMICS = [
+    ("Александрович", "Александровна"), ("Алексеевич", "Алексеевна"), ("Андреевич", "Андреевна"),
+    ("Владимирович", "Владимировна"), ("Дмитриевич", "Дмитриевна"), ("Евгеньевич", "Евгеньевна"),
+    ("Иванович", "Ивановна"), ("Игоревич", "Игоревна"), ("Михайлович", "Михайловна"),
+    ("Николаевич", "Николаевна"), ("Олегович", "Олеговна"), ("Павлович", "Павловна"),
+    ("Романович", "Романовна"), ("Сергеевич", "Сергеевна"), ("Юрьевич", "Юрьевна"),
+]
+STREETS = ["Лесная", "Школьная", "Садовая", "Советская", "Молодёжная", "Центральная", "Новая", "Набережная"]
+SETTLEMENTS = ["г. Кострома", "с. Сырково", "д. Петрово", "пос. Северный", "г. Нерехта"]
+
+PROGRAMS = [
+    ("АООП ОВЗ", "в.7.1"), ("АООП ОВЗ", "в.7.2"), ("АООП ОВЗ", "в.5.1"), ("АООП ОВЗ", "в.6.1"),
+    ("АООП УО", "в.1"), ("АООП УО", "в.2"), ("ООП НОО", "1.0"), ("ООП ООО", "1.0"),
+]
+RECOMMENDATIONS = {
+    "Логопед": ["Коррекция звукопроизношения", "Развитие фонематического слуха", "Профилактика дисграфии",
+                "Развитие связной речи", "Обогащение словаря"],
+    "Дефектолог": ["Развитие познавательных процессов", "Формирование учебных навыков",
+                   "Коррекция пространственных представлений", "Развитие мелкой моторики"],
+    "Психолог": ["Развитие эмоционально-волевой сферы", "Адаптация к школе", "Снижение тревожности",
+                 "Развитие коммуникативных навыков"],
+    "Социальный педагог": ["Сопровождение семьи", "Профилактика пропусков"],
+}
+CRITERIA = ["Звукопроизношение", "Фонематический слух", "Лексика", "Грамматический строй", "Связная речь",
+            "Внимание", "Память", "Мышление"]
+RESULTS = [name for name, _ in DEFAULT_LEVELS]
+RESULT_COLUMNS = [("2024-2025", "I полугодие"), ("2024-2025", "II полугодие"), ("2025-2026", "I полугодие")]
+
+
+def _female_surname(surname: str) -> str:
+    if surname.endswith(("ов", "ев", "ёв", "ин")):
+        return surname + "а"
+    if surname.endswith("ий"):
+        return surname[:-2] + "ая"
+    return surname
+
+
+def _random_date(rnd: random.Random, start: date, end: date) -> str:
+    return (start + timedelta(days=rnd.randrange((end - start).days))).strftime("%d.%m.%Y")
+
+
+def random_pupil(rnd: random.Random) -> dict:
+    """Случайный ученик (ФИО, дата рождения, адрес, пол) — поля как в загрузке из Excel."""
+    male = rnd.random() < 0.5
+    surname = rnd.choice(SURNAMES)
+    patronymic = rnd.choice(PATRONYMICS)
+    return {
+        "surname": surname if male else _female_surname(surname),
+        "name": rnd.choice(MALE_NAMES if male else FEMALE_NAMES),
+        "patronymic": patronymic[0] if male else patronymic[1],
+        "birth_date": _random_date(rnd, date(2008, 9, 1), date(2019, 8, 31)),
+        "address": f"{rnd.choice(SETTLEMENTS)}, ул. {rnd.choice(STREETS)}, д.{rnd.randint(1, 80)}, кв.{rnd.randint(1, 120)}",
+        "gender": "м" if male else "ж",
+    }
+
+
+def generate(db_path: str | Path, pupils: int, seed: int = 1, analysis_share: float = 0.1,
+             history_share: float = 0.1) -> dict:
+    """
+    Создать БД db_path (файл перезаписывается) с pupils учениками.
+    analysis_share — доля учеников с записями анализа, history_share — размер архива относительно pupils.
+    Возвращает сводку: {"pupils", "forms", "history", "analysis", "seed"}.
+    """
+    db_path = Path(db_path)
+    if db_path.exists():
+        db_path.unlink()
+    rnd = random.Random(seed)
+    db = Database(db_path)
+    db.create_tables()
+    for school_year, period in RESULT_COLUMNS:
+        db.analysis_ensure_result_column(school_year, period)
+    db.close()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        schools = max(1, round(pupils / PUPILS_PER_SCHOOL))
+        letters = LETTERS[:max(1, min(len(LETTERS), schools * 4))]
+        forms = [f"{grade}{letter}" for grade in range(1, 12) for letter in letters]
+        conn.executemany("INSERT INTO forms (number) VALUES (?)", [(f,) for f in forms])
+        conn.executemany("INSERT INTO programs (name, version) VALUES (?, ?)", PROGRAMS)
+        conn.executemany("INSERT INTO experts (name) VALUES (?)", [(s,) for s in RECOMMENDATIONS])
+        conn.executemany("INSERT INTO criterions (name) VALUES (?)", [(c,) for c in CRITERIA])
+        conn.executemany("INSERT INTO standards (name, code) VALUES (?, ?)", DEFAULT_LEVELS)
+        conn.executemany(
+            "INSERT INTO recommendations (specialist_name, recommendation_name) VALUES (?, ?)",
+            [(spec, rec) for spec, recs in RECOMMENDATIONS.items() for rec in recs],
+        )
+        form_ids = {r[1]: r[0] for r in conn.execute("SELECT id, number FROM forms")}
+        program_ids = [r[0] for r in conn.execute("SELECT id FROM programs ORDER BY id")]
+        rec_ids = [r[0] for r in conn.execute("SELECT id FROM recommendations ORDER BY id")]
+
+        pupil_rows = []
+        for _ in range(pupils):
+            p = random_pupil(rnd)
+            on_program = rnd.random() < 0.6
+            pupil_rows.append((
+                form_ids[rnd.choice(forms)], p["surname"], p["name"], p["patronymic"], p["birth_date"],
+                p["address"], p["gender"],
+                _random_date(rnd, date(2020, 1, 1), date(2025, 12, 31)) if on_program else "",
+                str(rnd.randint(1, 999)) if on_program else "",
+                rnd.choice(program_ids) if on_program else None,
+                str(rnd.randint(1, 300)) if on_program else "",
+                _random_date(rnd, date(2020, 1, 1), date(2025, 12, 31)) if on_program else "",
+            ))
+        conn.executemany(
+            """INSERT INTO pupils (form_id, surname, name, patronymic, birth_date, address, gender,
+                   pmpk_date, pmpk_number, program_id, order_number, order_date)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            pupil_rows,
+        )
+        pupil_ids = [r[0] for r in conn.execute("SELECT id FROM pupils ORDER BY id")]
+        links = set()
+        for pid, row in zip(pupil_ids, pupil_rows):
+            if row[9] is not None:
+                for rec_id in rnd.sample(rec_ids, rnd.randint(1, 4)):
+                    links.add((pid, rec_id))
+        conn.executemany(
+            "INSERT INTO pupil_recommendations (pupil_id, recommendation_id) VALUES (?, ?)", sorted(links)
+        )
+
+        history_rows = []
+        for _ in range(int(pupils * history_share)):
+            p = random_pupil(rnd)
+            history_rows.append((
+                form_ids[rnd.choice(forms)], p["surname"], p["name"], p["patronymic"], p["birth_date"],
+                p["address"], p["gender"], rnd.choice(program_ids),
+                _random_date(rnd, date(2018, 9, 1), date(2025, 6, 30)),
+                rnd.choice(["Перевод в другую школу", "Выпуск (11 класс)", "Смена места жительства"]),
+                "нет",
+            ))
+        conn.executemany(
+            """INSERT INTO pupils_history (form_id, surname, name, patronymic, birth_date, address, gender,
+                   program_id, transfer_date, transfer_reason, recommendations)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            history_rows,
+        )
+
+        result_cols = [r[1] for r in conn.execute("PRAGMA table_info(analysis)") if r[1].startswith("result_")]
+        number_by_form = {v: k for k, v in form_ids.items()}
+        level_ids = {r[1]: r[0] for r in conn.execute("SELECT id, name FROM standards")}
+        analysis_rows = []
+        for row in rnd.sample(pupil_rows, int(pupils * analysis_share)):
+            for spec in rnd.sample(list(RECOMMENDATIONS), 2):
+                for criterion in rnd.sample(CRITERIA, 4):
+                    analysis_rows.append(
+                        (number_by_form[row[0]], row[1], row[2], row[3], spec, criterion)
+                        + tuple(level_ids[rnd.choice(RESULTS)] for _ in result_cols)
+                    )
+        conn.executemany(
+            f"""INSERT INTO analysis (class_number, surname, name, patronymic, specialist, criterion,
+                    {', '.join(result_cols)})
+                VALUES ({', '.join('?' * (6 + len(result_cols)))})""",
+            analysis_rows,
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return {
+        "pupils": pupils,
+        "forms": len(forms),
+        "history": len(history_rows),
+        "analysis": len(analysis_rows),
+        "seed": seed,
+    }
+
+
+def write_pupils_excel(path: str | Path, rows: int, seed: int = 2) -> Path:
+    """Файл .xlsx для загрузки учеников (графы EXCEL_LOAD_COLUMNS) с rows строками."""
+    import openpyxl
+
+    rnd = random.Random(seed)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Фамилия", "Имя", "Отчество", "Дата рождения", "Домашний адрес", "Пол"])
+    for _ in range(rows):
+        p = random_pupil(rnd)
+        ws.append([p["surname"], p["name"], p["patronymic"], p["birth_date"], p["address"], p["gender"]])
+    path = Path(path)
+    wb.save(path)
+    return path
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Сгенерировать синтетическую БД SvedUch.")
+    parser.add_argument("db_path", help="Файл БД (будет перезаписан)")
+    parser.add_argument("--pupils", type=int, default=1000, help="Число учеников (по умолчанию 1000)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    print(generate(args.db_path, args.pupils, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
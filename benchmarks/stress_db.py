@@ -0,0 +1,150 @@
+"""
+Нагрузочная проверка совместной записи: несколько процессов (как несколько сотрудников,
+открывших одну sveduch.db) и потоков одновременно добавляют и изменяют учеников.
+Проверяется, что ни одна запись не потеряна и не упала с «database is locked»,
+и печатается статистика ожидания блокировок (Database.lock_stats).
+
+Пример:
+    python -m benchmarks.stress_db --processes 4 --threads 2 --writes 200
+
+--db берёт копию указанного файла во временном каталоге; писать в сам файл
+(добавятся ученики классов «Нагрузка» и «Нагрузка 2») — только вместе с --in-place.
+"""
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.generator import generate, random_pupil  # noqa: E402
+from db import Database  # noqa: E402
+
+
+# Каждый TRANSFER_EVERY-й ученик писателя переводится в другой класс (pupils_update с другим form_id)
+TRANSFER_EVERY = 10
+
+
+def _writer(db: Database, form_ids: tuple[int, int], worker: str, writes: int, seed: int) -> dict:
+    """Поток записи: добавить ученика, изменить его, каждая 10-я запись — перевод в другой класс."""
+    import random
+
+    rng = random.Random(seed)
+    errors = []
+    inserted = 0
+    for i in range(writes):
+        try:
+            pupil = random_pupil(rng)
+            pupil["form_id"] = form_ids[0]
+            pupil["order_number"] = f"{worker}-{i}"
+            pid = db.pupils_insert(pupil)
+            inserted += 1
+            pupil["address"] = f"{worker}, запись {i}"
+            db.pupils_update(pid, pupil)
+            if i % TRANSFER_EVERY == 0:
+                db.pupils_update(pid, {**pupil, "form_id": form_ids[1]})
+        except Exception as e:  # учитываем все сбои записи
+            errors.append(f"{type(e).__name__}: {e}")
+    return {"inserted": inserted, "errors": errors}
+
+
+def _process(db_path: str, form_ids: tuple[int, int], index: int, threads: int, writes: int, queue) -> None:
+    db = Database(db_path)
+    results = [None] * threads
+
+    def run(t: int) -> None:
+        results[t] = _writer(db, form_ids, f"p{index}t{t}", writes, seed=index * 1000 + t)
+
+    workers = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    db.close()
+    queue.put({
+        "inserted": sum(r["inserted"] for r in results),
+        "errors": [e for r in results for e in r["errors"]],
+        "lock_stats": db.lock_stats(),
+    })
+
+
+def run(db_path: Path, processes: int, threads: int, writes: int) -> bool:
+    """Запустить писателей; True — все записи на месте и без ошибок."""
+    db = Database(db_path)
+    db.create_tables()
+    form_ids = (db.forms_get_or_create_id("Нагрузка"), db.forms_get_or_create_id("Нагрузка 2"))
+    before = [len(db.pupils_get_by_form_id(f)) for f in form_ids]
+    db.close()
+
+    queue = multiprocessing.Queue()
+    start = time.perf_counter()
+    procs = [
+        multiprocessing.Process(target=_process, args=(str(db_path), form_ids, i, threads, writes, queue))
+        for i in range(processes)
+    ]
+    for p in procs:
+        p.start()
+    reports = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    db = Database(db_path)
+    stored = [len(db.pupils_get_by_form_id(f)) - n for f, n in zip(form_ids, before)]
+    db.close()
+
+    expected = processes * threads * writes
+    transfers = processes * threads * len(range(0, writes, TRANSFER_EVERY))
+    inserted = sum(r["inserted"] for r in reports)
+    errors = [e for r in reports for e in r["errors"]]
+    waits = sum(r["lock_stats"]["waits"] for r in reports)
+    retries = sum(r["lock_stats"]["retries"] for r in reports)
+    failures = sum(r["lock_stats"]["failures"] for r in reports)
+    wait_max = max(r["lock_stats"]["wait_max_s"] for r in reports)
+    print(f"Писателей: {processes} процессов × {threads} потоков, записей на писателя: {writes}")
+    print(f"Время: {elapsed:.1f} с, операций записи в секунду: {(expected * 2 + transfers) / elapsed:.0f}")
+    print(f"Добавлено: {inserted} из {expected}, в базе: {sum(stored)}; "
+          f"переведено в другой класс: {stored[1]} из {transfers}")
+    print(f"Ожиданий блокировки: {waits}, повторов: {retries}, неудач: {failures}, "
+          f"самое долгое ожидание: {wait_max * 1000:.0f} мс")
+    for e in errors[:10]:
+        print("  ошибка:", e)
+    return not errors and inserted == expected == sum(stored) and stored[1] == transfers
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка совместной записи в БД.")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=2, help="Потоков записи в каждом процессе")
+    parser.add_argument("--writes", type=int, default=200, help="Учеников на каждый поток")
+    parser.add_argument("--pupils", type=int, default=1000, help="Размер исходной синтетической БД")
+    parser.add_argument("--db", help="Исходная БД: нагрузка идёт на её копию (по умолчанию — синтетическая БД)")
+    parser.add_argument("--in-place", action="store_true",
+                        help="Писать прямо в файл --db, а не в копию (ученики останутся в файле)")
+    args = parser.parse_args(argv)
+    if args.in_place and not args.db:
+        parser.error("--in-place требует --db")
+
+    with tempfile.TemporaryDirectory(prefix="sveduch_stress_") as tmp:
+        db_path = Path(tmp) / "stress.db"
+        if args.in_place:
+            db_path = Path(args.db)
+        elif args.db:
+            source = Database(args.db, read_only=True)
+            try:
+                source.backup_to(db_path)
+            finally:
+                source.close()
+        else:
+            generate(db_path, args.pupils)
+        ok = run(db_path, args.processes, args.threads, args.writes)
+    print("OK" if ok else "СБОЙ")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Шина уведомлений об изменении данных для открытых окон.
+Изменения, сделанные этим приложением, приходят от Database (add_change_listener) с id строк;
+изменения из другого процесса (вторая копия программы, test-db.py) обнаруживаются
+по счётчикам table_versions, которые опрашиваются таймером (id строк в этом случае неизвестны).
+Уведомления, пришедшие за один проход цикла событий, объединяются: окно получает
+table_changed(таблица, ids) один раз на таблицу; ids — frozenset id или None («обновить всё»).
+"""
+import sqlite3
+import weakref
+from typing import Optional
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from db import Database
+
+# Период опроса table_versions (изменения из других процессов), мс
+POLL_INTERVAL_MS = 2000
+
+
+def _merge(pending: dict[str, Optional[set]], table: str, ids: Optional[frozenset]) -> None:
+    """Добавить изменение в pending: ids объединяются, None («всё») поглощает любые ids."""
+    if ids is None or pending.get(table, set()) is None:
+        pending[table] = None
+    else:
+        pending.setdefault(table, set()).update(ids)
+
+
+class DataBus(QObject):
+    table_changed = pyqtSignal(str, object)
+    # Изменение из db: запись может идти из рабочего потока — в поток шины через очередь Qt
+    _local_changed = pyqtSignal(str, object)
+
+    def __init__(self, db: Database):
+        super().__init__()
+        self._db_ref = weakref.ref(db)
+        self._versions = db.data_versions()
+        self._pending: dict[str, Optional[set]] = {}
+        self._local_changed.connect(self._on_local_change)
+        db.add_change_listener(self._local_changed.emit)
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(0)
+        self._flush_timer.timeout.connect(self._flush)
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(POLL_INTERVAL_MS)
+        self._poll_timer.timeout.connect(self._poll)
+        self._poll_timer.start()
+
+    def _queue(self, table: str, ids: Optional[frozenset]) -> None:
+        _merge(self._pending, table, ids)
+        self._flush_timer.start()
+
+    def _on_local_change(self, table: str, ids: Optional[frozenset]) -> None:
+        db = self._db_ref()
+        if db is not None:
+            # Своё изменение уже учтено — при опросе оно не должно считаться внешним
+            self._versions[table] = db.data_versions([table])[table]
+        self._queue(table, ids)
+
+    def _poll(self) -> None:
+        db = self._db_ref()
+        if db is None or not db.is_open:
+            return
+        try:
+            current = db.data_versions()
+        except sqlite3.Error:
+            return
+        for table, version in current.items():
+            if self._versions.get(table) != version:
+                self._queue(table, None)
+        self._versions = current
+
+    def _flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        for table, ids in pending.items():
+            self.table_changed.emit(table, frozenset(ids) if ids is not None else None)
+
+
+_buses: "weakref.WeakKeyDictionary[Database, DataBus]" = weakref.WeakKeyDictionary()
+
+
+def bus_for(db: Database) -> DataBus:
+    """Общая шина для экземпляра Database (создаётся при первом обращении)."""
+    bus = _buses.get(db)
+    if bus is None:
+        bus = DataBus(db)
+        _buses[db] = bus
+    return bus
+
+
+class RefreshOnShowMixin:
+    """
+    Примесь окна, подписанного на table_changed: пока окно скрыто, уведомления не применяются,
+    а копятся (defer_if_hidden) и передаются в _on_data_changed при следующем показе окна —
+    открытое заново окно не показывает устаревшие данные. Ставится в базовые классы перед QWidget.
+    """
+
+    def defer_if_hidden(self, table: str, ids: Optional[frozenset], watched=None) -> bool:
+        """
+        Окно watched (по умолчанию — само окно) скрыто: запомнить изменение и вернуть True,
+        обработчику ничего делать не нужно. Видно — False.
+        """
+        if (watched if watched is not None else self).isVisible():
+            return False
+        pending = getattr(self, "_hidden_changes", None)
+        if pending is None:
+            pending = self._hidden_changes = {}
+        _merge(pending, table, ids)
+        return True
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        pending = getattr(self, "_hidden_changes", None)
+        if not pending:
+            return
+        self._hidden_changes = {}
+        for table, ids in pending.items():
+            self._on_data_changed(table, frozenset(ids) if ids is not None else None)
@@ -2,10 +2,21 @@
 Модуль доступа к базе данных SvedUch (SQLite).
 Инкапсулирует все операции с БД. Схема — см. DATABASE.md.
 """
+import functools
+import json
+import os
+import random
 import sqlite3
 import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Iterable, Optional
+
+from pupil import PUPIL_SELECT, Pupil
+from sql_profiler import ProfilingConnection, SqlProfiler
 
 
 def _default_db_dir() -> Path:
@@ -18,28 +29,476 @@ def _default_db_dir() -> Path:
 # Путь к БД по умолчанию (рядом с exe при установке, иначе рядом с проектом)
 DEFAULT_DB_PATH = _default_db_dir() / "sveduch.db"
 
+# Устаревшие текстовые поля рекомендаций (до перехода на pupil_recommendations)
+LEGACY_REC_COLUMNS = ("rec_spec_1", "rec_spec_2", "rec_spec_3", "rec_spec_4", "rec_spec_5")
+# Специалист для рекомендаций из слота rec_spec_<n>, которому нет специалиста в справочнике
+LEGACY_REC_SPECIALIST = "Специалист {}"
+
+# Таблицы со счётчиком изменений (table_versions), поддерживаемым триггерами
+VERSIONED_TABLES = ("forms", "programs", "recommendations", "pupils", "pupil_recommendations", "pupils_history")
+
+# Поля ученика в журнале pupils_changes: в diff ключ — индекс поля в этом кортеже
+PUPIL_AUDIT_COLUMNS = (
+    "form_id", "surname", "name", "patronymic", "birth_date", "address", "gender",
+    "pmpk_date", "pmpk_number", "program_id", "order_number", "order_date", "recommendation_ids",
+)
+
+# Каждое N-е изменение ученика пишется полным снимком — восстановление состояния
+# на дату читает не больше N записей журнала
+_AUDIT_SNAPSHOT_EVERY = 16
+
+# Ожидание блокировки внутри SQLite при чтении, с (busy timeout). Методы записи на время
+# вызова ставят 0: блокировку ждёт цикл повторов _call_with_retry, и всё ожидание видно в lock_stats
+BUSY_TIMEOUT_S = 0.25
+# Повторы записи при «database is locked»: задержка удваивается от _BUSY_BACKOFF_S до _BUSY_BACKOFF_MAX_S
+_BUSY_RETRIES = 10
+_BUSY_BACKOFF_S = 0.05
+_BUSY_BACKOFF_MAX_S = 2.0
+
+# Размер кэша подготовленных запросов соединения (по умолчанию в sqlite3 — 128)
+CACHED_STATEMENTS = 512
+
+# Архивный файл (<имя БД>_archive.db) подключается к соединению через ATTACH под этим именем
+ARCHIVE_SCHEMA = "archive"
+
+# Колонки pupils_history в представлении pupils_history_all (порядок в файлах может отличаться из-за миграций)
+HISTORY_COLUMNS = (
+    "id", "form_id", "surname", "name", "patronymic", "birth_date", "address", "gender",
+    "pmpk_date", "pmpk_number", "program_id", "order_number", "order_date",
+    *LEGACY_REC_COLUMNS, "transfer_date", "transfer_reason", "recommendations",
+)
+
+# Колонки ученика в таблице analysis (остальные — result_<период>_<год>: id уровня из standards)
+ANALYSIS_KEY_COLUMNS = ("class_number", "surname", "name", "patronymic", "specialist", "criterion")
+
+# Шкала уровней по умолчанию (название, код): баллы (level_scores), если в standards нет числовых кодов
+DEFAULT_LEVELS = (
+    ("низкий", "1"), ("ниже среднего", "2"), ("средний", "3"), ("выше среднего", "4"), ("высокий", "5"),
+)
+
+# Размер пачки id для запросов вида "WHERE id IN (...)" (лимит переменных SQLite)
+_IN_CHUNK = 500
+
+
+def discard_wal_files(db_path: str | Path) -> None:
+    """
+    Удаляет файлы журнала WAL (-wal, -shm) рядом с БД. Вызывать при закрытых соединениях
+    перед заменой файла БД копией, иначе старый журнал наложится на восстановленную базу.
+    """
+    for suffix in ("-wal", "-shm"):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+
+def _is_network_path(path: Path) -> bool:
+    """Файл на сетевом диске (UNC-путь \\\\сервер\\папка или подключённый сетевой диск Windows)."""
+    resolved = str(path.resolve())
+    if resolved.startswith("\\\\"):
+        return True
+    if sys.platform == "win32":
+        import ctypes
+
+        drive = os.path.splitdrive(resolved)[0]
+        if drive:
+            return ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") == 4  # DRIVE_REMOTE
+    return False
+
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    """Ошибка занятости БД другим соединением (SQLITE_BUSY/SQLITE_LOCKED)."""
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def _busy_sleep(attempt: int) -> None:
+    """Пауза перед повтором attempt (с 1): экспоненциальная, со случайной долей, не больше _BUSY_BACKOFF_MAX_S."""
+    delay = min(_BUSY_BACKOFF_MAX_S, _BUSY_BACKOFF_S * 2 ** (attempt - 1))
+    time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def _retry_on_busy(method):
+    """Метод записи повторяется при занятой БД (см. Database._call_with_retry)."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self._call_with_retry(method, self, *args, **kwargs)
+    wrapper.writes_data = True  # db_server выполняет такие методы в потоке записи
+    return wrapper
+
+
+def _result_column_order(column: str) -> tuple:
+    """Ключ сортировки колонок результатов по времени: result_II_2024_2025 -> (2024, 2025, 2)."""
+    parts = column[len("result_"):].split("_")
+    years = tuple(int(p) if p.isdigit() else 0 for p in parts[1:3])
+    return years + ({"I": 1, "II": 2}.get(parts[0], 0), column)
+
+
+def _level_sort_key(code: Optional[str]) -> tuple:
+    """Уровни по коду: числовые — по значению, затем остальные."""
+    try:
+        return (0, float((code or "").replace(",", ".")), "")
+    except ValueError:
+        return (1, 0.0, code or "")
+
+
+def level_scores(standards: Iterable) -> dict[str, float]:
+    """
+    {уровень в нижнем регистре: балл} для отчёта по классу и аналитики: числовые коды справочника
+    standards (строки с name и code; уровни без числового кода баллов не получают), а если числового
+    кода нет ни у одного уровня — шкала DEFAULT_LEVELS.
+    """
+    scores = {}
+    for r in standards:
+        try:
+            scores[(r["name"] or "").strip().casefold()] = float((r["code"] or "").replace(",", "."))
+        except ValueError:
+            continue
+    return scores or {name: float(code) for name, code in DEFAULT_LEVELS}
+
+
+def level_score(value, scores: dict[str, float]) -> Optional[float]:
+    """Балл результата: число как есть, уровень — по scores (level_scores); нераспознанный — None."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    try:
+        return float(text.replace(",", "."))
+    except ValueError:
+        return scores.get(text.casefold())
+
+
+class UnknownLevelsError(ValueError):
+    """Значения результатов анализа, которых нет в справочнике уровней (ни по названию, ни по коду)."""
+
+    def __init__(self, values: Iterable[str]):
+        self.values = sorted(values)
+        super().__init__(
+            "Уровней нет в справочнике «Уровни»: " + ", ".join(f"«{v}»" for v in self.values)
+        )
+
+
+def _blank(value) -> Any:
+    """Значение поля ученика для сравнения: NULL и пустая строка — одно и то же."""
+    return "" if value is None else value
+
+
+def _pupil_field_values(fields: dict[str, Any]) -> dict[str, Any]:
+    """
+    Проверить поля ученика для частичного UPDATE (колонки pupils из PUPIL_AUDIT_COLUMNS)
+    и привести значения: текст — '' вместо None, id класса и программы — как есть.
+    """
+    unknown = set(fields) - set(PUPIL_AUDIT_COLUMNS[:-1])
+    if unknown:
+        raise ValueError(f"Поля нельзя изменить: {', '.join(sorted(unknown))}")
+    if "form_id" in fields and not fields["form_id"]:
+        raise ValueError("Не указан класс.")
+    for col in ("surname", "name"):
+        if col in fields and not (fields[col] or "").strip():
+            raise ValueError("Фамилия и имя не могут быть пустыми.")
+    return {
+        col: value if col in ("form_id", "program_id") else (value or "")
+        for col, value in fields.items()
+    }
+
+
+def _chunks(ids: list, size: int = _IN_CHUNK):
+    """Разбивает список на пачки по size элементов."""
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
 
 class Database:
-    def __init__(self, db_path: Optional[str | Path] = None):
+    def __init__(self, db_path: Optional[str | Path] = None, read_only: bool = False):
         self._path = Path(db_path) if db_path else DEFAULT_DB_PATH
-        self._conn: Optional[sqlite3.Connection] = None
+        self._read_only = read_only
+        # Соединение на поток: id потока -> соединение (закрываются все разом в close())
+        self._conns: dict[int, sqlite3.Connection] = {}
+        self._conns_lock = threading.Lock()
+        self._retry_local = threading.local()
+        self._lock_stats = {"waits": 0, "retries": 0, "failures": 0, "wait_total_s": 0.0, "wait_max_s": 0.0}
+        self._reader: Optional["Database"] = None
+        self._columns_cache: dict[str, tuple[str, ...]] = {}
+        self._change_listeners: list[Callable[[str, Optional[frozenset]], None]] = []
+        self._profiler: Optional[SqlProfiler] = None
 
     @property
     def path(self) -> Path:
         """Путь к файлу БД (для восстановления из копии)."""
         return self._path
 
+    @property
+    def read_only(self) -> bool:
+        """Соединение только для чтения (см. reader())."""
+        return self._read_only
+
+    @property
+    def is_open(self) -> bool:
+        """Открыто ли соединение с БД (хотя бы в одном потоке)."""
+        return bool(self._conns)
+
+    @property
+    def journal_mode(self) -> str:
+        """
+        Режим журнала: WAL для локального файла; для файла в общей сетевой папке — DELETE,
+        потому что WAL требует общей памяти и не работает с разных компьютеров.
+        """
+        return "DELETE" if _is_network_path(self._path) else "WAL"
+
+    def lock_stats(self) -> dict:
+        """
+        Ожидания блокировок при записи: waits — записей, которым пришлось ждать, retries — повторов,
+        failures — записей, не дождавшихся блокировки, wait_total_s / wait_max_s — время ожидания
+        (от начала вызова до успешной попытки; внутри SQLite запись не ждёт — busy timeout 0).
+        """
+        with self._conns_lock:
+            return dict(self._lock_stats)
+
+    def _call_with_retry(self, method, *args, **kwargs):
+        """
+        Выполнить метод записи; при ошибке откатить незавершённую транзакцию, а при
+        «database is locked» — повторить с экспоненциальной задержкой. Вложенные вызовы
+        и вызовы внутри _transaction() не повторяются сами — повторяется внешний.
+        На время вызова busy timeout соединения — 0: занятая БД сразу даёт повтор, и время
+        ожидания блокировки целиком попадает в lock_stats, а не теряется внутри SQLite.
+        """
+        conn = self._get_conn()
+        if getattr(self._retry_local, "active", False) or conn.in_transaction:
+            return method(*args, **kwargs)
+        self._retry_local.active = True
+        conn.execute("PRAGMA busy_timeout = 0")
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    result = method(*args, **kwargs)
+                    break
+                except BaseException as e:
+                    # Неудачная запись не должна оставлять открытую неявную транзакцию:
+                    # иначе следующие _transaction() сочтут себя вложенными и не зафиксируются
+                    conn = self._get_conn()
+                    if conn.in_transaction:
+                        conn.rollback()
+                    busy = isinstance(e, sqlite3.OperationalError) and _is_busy(e)
+                    if not busy or attempt >= _BUSY_RETRIES:
+                        if busy:
+                            self._record_lock_wait(time.perf_counter() - start, attempt, failed=True)
+                        raise
+                attempt += 1
+                _busy_sleep(attempt)
+        finally:
+            self._retry_local.active = False
+            try:
+                conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT_S * 1000)}")
+            except sqlite3.ProgrammingError:
+                pass  # соединение закрыли во время записи (close() из другого потока)
+        if attempt:
+            self._record_lock_wait(time.perf_counter() - start, attempt)
+        return result
+
+    def _record_lock_wait(self, waited: float, retries: int, failed: bool = False) -> None:
+        with self._conns_lock:
+            st = self._lock_stats
+            st["waits"] += 1
+            st["retries"] += retries
+            st["failures"] += int(failed)
+            st["wait_total_s"] += waited
+            st["wait_max_s"] = max(st["wait_max_s"], waited)
+
+    def add_change_listener(self, callback: Callable[[str, Optional[frozenset]], None]) -> None:
+        """
+        Подписка на изменения данных этим экземпляром: callback(table, ids) вызывается после commit.
+        ids — frozenset затронутых id строк или None, если затронуты неизвестно какие строки.
+        """
+        self._change_listeners.append(callback)
+
+    def remove_change_listener(self, callback: Callable[[str, Optional[frozenset]], None]) -> None:
+        if callback in self._change_listeners:
+            self._change_listeners.remove(callback)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Явная транзакция записи: commit при успехе, rollback при ошибке.
+        Вложенный вызов выполняется в транзакции внешнего.
+        """
+        conn = self._get_conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        self._call_with_retry(conn.execute, "BEGIN IMMEDIATE")
+        try:
+            yield conn
+            self._commit(conn)
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _commit(self, conn: sqlite3.Connection) -> None:
+        """
+        COMMIT с повтором при занятой БД: в журнале DELETE фиксация ждёт, пока читатели отпустят
+        файл. Транзакция не откатывается — блокировка записи остаётся за ней; ожидание — в lock_stats.
+        """
+        timeout_ms = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+        if timeout_ms:
+            conn.execute("PRAGMA busy_timeout = 0")  # пакет batch(): ждать здесь, а не внутри SQLite
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    conn.commit()
+                    break
+                except sqlite3.OperationalError as e:
+                    if not _is_busy(e) or attempt >= _BUSY_RETRIES:
+                        if _is_busy(e):
+                            self._record_lock_wait(time.perf_counter() - start, attempt, failed=True)
+                        raise
+                attempt += 1
+                _busy_sleep(attempt)
+        finally:
+            if timeout_ms:
+                conn.execute(f"PRAGMA busy_timeout = {timeout_ms}")
+        if attempt:
+            self._record_lock_wait(time.perf_counter() - start, attempt)
+
+    @contextmanager
+    def batch(self):
+        """
+        Несколько записей одной транзакцией: with db.batch(): db.pupils_update(...) ...
+        Все методы записи работают через _transaction(), поэтому внутри пакета ничего не фиксируется
+        до выхода из блока; ошибка любого вызова откатывает весь пакет.
+        У RemoteDatabase пакет уходит на сервер одним запросом.
+        """
+        with self._transaction():
+            yield self
+
+    def _notify(self, table: str, ids: Optional[Iterable[int]] = None) -> None:
+        """Сообщить подписчикам об изменении таблицы (вызывается после commit)."""
+        changed = frozenset(ids) if ids is not None else None
+        for callback in list(self._change_listeners):
+            callback(table, changed)
+
+    @property
+    def profiler(self) -> Optional[SqlProfiler]:
+        """Профилировщик SQL, если включён (enable_profiling)."""
+        return self._profiler
+
+    @property
+    def slow_log_path(self) -> Path:
+        """Журнал медленных запросов по умолчанию — рядом с файлом БД."""
+        return self._path.with_name(f"{self._path.stem}_slow_sql.log")
+
+    @property
+    def archive_path(self) -> Path:
+        """Архивный файл (старые записи pupils_history и закрытые периоды анализа) — рядом с файлом БД."""
+        return self._path.with_name(f"{self._path.stem}_archive.db")
+
+    def enable_profiling(self, threshold_ms: float = 100.0, slow_log_path: Optional[str | Path] = None) -> SqlProfiler:
+        """
+        Включает замер всех запросов: счётчики, суммарное время и p95 по тексту запроса,
+        запросы дольше threshold_ms — в журнал медленных запросов.
+        Открытое соединение переоткрывается при следующем обращении (вне транзакции).
+        """
+        if self._profiler is not None:
+            self._profiler.threshold_ms = threshold_ms
+            return self._profiler
+        self._profiler = SqlProfiler(threshold_ms, slow_log_path or self.slow_log_path)
+        self._reopen_for_profiling()
+        return self._profiler
+
+    def disable_profiling(self) -> None:
+        self._profiler = None
+        self._reopen_for_profiling()
+
+    def _reopen_for_profiling(self) -> None:
+        """Соединения (и читателя) переоткрыть с профилировщиком или без — при следующем обращении."""
+        for db in (self, self._reader):
+            if db is None:
+                continue
+            db._profiler = self._profiler
+            db._close_connections(idle_only=True)
+
+    def reader(self) -> "Database":
+        """
+        Отдельное соединение только для чтения (mode=ro) для окон выборок и отчётов.
+        В режиме WAL долгое чтение не блокирует запись, а внутри snapshot() все запросы
+        видят одно согласованное состояние данных (в режиме DELETE снимок держит запись
+        других до конца блока — держите его коротким).
+        """
+        if self._read_only:
+            return self
+        if self._reader is None:
+            self._get_conn()  # файл БД и режим WAL — до открытия читателя
+            self._reader = Database(self._path, read_only=True)
+            self._reader._profiler = self._profiler
+        return self._reader
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Чтение одним снимком: все запросы внутри блока видят данные на момент первого из них.
+        Вложенный вызов выполняется в снимке внешнего.
+        """
+        conn = self._get_conn()
+        if conn.in_transaction:
+            yield self
+            return
+        conn.execute("BEGIN")
+        try:
+            yield self
+        finally:
+            conn.commit()
+
     def _get_conn(self) -> sqlite3.Connection:
-        if self._conn is None:
-            self._conn = sqlite3.connect(self._path)
-            self._conn.execute("PRAGMA foreign_keys = ON")
-            self._conn.row_factory = sqlite3.Row
-        return self._conn
+        """Соединение текущего потока (открывается при первом обращении)."""
+        conn = self._conns.get(threading.get_ident())
+        if conn is None:
+            conn = self._connect()
+            with self._conns_lock:
+                self._conns[threading.get_ident()] = conn
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        # check_same_thread=False: соединением пользуется только свой поток, но close() вызывается из любого
+        options = {"timeout": BUSY_TIMEOUT_S, "check_same_thread": False, "cached_statements": CACHED_STATEMENTS}
+        if self._read_only:
+            # Без неявных BEGIN: транзакция чтения открывается только в snapshot()
+            target = f"{self._path.resolve().as_uri()}?mode=ro"
+            options.update(uri=True, isolation_level=None)
+        else:
+            # Неявные транзакции записи — BEGIN IMMEDIATE: блокировка берётся сразу, а не при
+            # первой записи, поэтому две записи не упираются друг в друга посреди транзакции
+            target = self._path
+            options.update(isolation_level="IMMEDIATE")
+        if self._profiler is not None:
+            conn = sqlite3.connect(target, factory=ProfilingConnection, **options)
+            conn.profiler = self._profiler
+            conn.set_trace_callback(self._profiler.trace)
+        else:
+            conn = sqlite3.connect(target, **options)
+        if not self._read_only:
+            try:
+                conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e):
+                    raise  # режим сменит следующее соединение, когда БД освободится
+            conn.execute("PRAGMA foreign_keys = ON")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _close_connections(self, idle_only: bool = False) -> None:
+        with self._conns_lock:
+            for ident, conn in list(self._conns.items()):
+                if idle_only and conn.in_transaction:
+                    continue
+                conn.close()
+                del self._conns[ident]
 
     def close(self) -> None:
-        if self._conn is not None:
-            self._conn.close()
-            self._conn = None
+        if self._reader is not None:
+            self._reader.close()
+        self._close_connections()
 
     def backup_to(self, dest_path: str | Path) -> None:
         """
@@ -56,6 +515,7 @@ class Database:
         finally:
             dest_conn.close()
 
+    @_retry_on_busy
     def create_tables(self) -> None:
         """Создаёт все таблицы при первом запуске."""
         conn = self._get_conn()
@@ -107,6 +567,16 @@ class Database:
             );
             CREATE INDEX IF NOT EXISTS idx_pupils_form ON pupils(form_id);
             CREATE INDEX IF NOT EXISTS idx_pupils_program ON pupils(program_id);
+            CREATE INDEX IF NOT EXISTS idx_pupils_name ON pupils(surname, name);
+
+            -- Рекомендации ученика: связь pupils × recommendations (вместо rec_spec_1..5)
+            CREATE TABLE IF NOT EXISTS pupil_recommendations (
+                pupil_id INTEGER NOT NULL REFERENCES pupils(id) ON DELETE CASCADE,
+                recommendation_id INTEGER NOT NULL REFERENCES recommendations(id) ON DELETE CASCADE,
+                PRIMARY KEY (pupil_id, recommendation_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_pupil_recommendations_rec
+                ON pupil_recommendations(recommendation_id, pupil_id);
 
             CREATE TABLE IF NOT EXISTS pupils_history (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -128,7 +598,8 @@ class Database:
                 rec_spec_4 TEXT,
                 rec_spec_5 TEXT,
                 transfer_date TEXT NOT NULL,
-                transfer_reason TEXT
+                transfer_reason TEXT,
+                recommendations TEXT
             );
 
             CREATE TABLE IF NOT EXISTS experts (
@@ -148,6 +619,40 @@ class Database:
                 UNIQUE(name, code)
             );
 
+            -- Журнал изменений учеников (только добавление): op I — вставка, U — изменение,
+            -- S — полный снимок, D — удаление/архив; diff — JSON (см. PUPIL_AUDIT_COLUMNS)
+            CREATE TABLE IF NOT EXISTS pupils_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                pupil_id INTEGER NOT NULL,
+                ts TEXT NOT NULL,
+                op TEXT NOT NULL,
+                diff TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_pupils_changes_pupil_ts ON pupils_changes(pupil_id, ts);
+            CREATE TRIGGER IF NOT EXISTS trg_pupils_changes_no_update BEFORE UPDATE ON pupils_changes
+            BEGIN
+                SELECT RAISE(ABORT, 'pupils_changes: журнал только для добавления');
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_pupils_changes_no_delete BEFORE DELETE ON pupils_changes
+            BEGIN
+                SELECT RAISE(ABORT, 'pupils_changes: журнал только для добавления');
+            END;
+
+            -- Счётчики изменений таблиц (увеличиваются триггерами при любой записи)
+            CREATE TABLE IF NOT EXISTS table_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            );
+
+            -- Сохранённые выборки окна «Выборки»: параметры (JSON) и кэш последнего результата
+            CREATE TABLE IF NOT EXISTS query_presets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                params TEXT NOT NULL,
+                result TEXT,
+                result_version TEXT
+            );
+
             CREATE TABLE IF NOT EXISTS analysis (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 class_number TEXT NOT NULL,
@@ -158,9 +663,14 @@ class Database:
                 criterion TEXT NOT NULL
                 -- Поля результатов за периоды добавляются динамически (ALTER TABLE)
             );
+            CREATE INDEX IF NOT EXISTS idx_analysis_pupil
+                ON analysis(class_number, specialist, surname, name, criterion);
         """)
         conn.commit()
         self._migrate_pupils_address_gender()
+        self._migrate_pupil_recommendations()
+        self._migrate_analysis_codes()
+        self._create_version_triggers()
 
     def _migrate_pupils_address_gender(self) -> None:
         """Добавить поля address и gender в pupils и pupils_history, если их ещё нет (миграция)."""
@@ -174,6 +684,130 @@ class Database:
                 conn.execute(f"ALTER TABLE {table} ADD COLUMN gender TEXT")
         conn.commit()
 
+    def _migrate_analysis_codes(self) -> None:
+        """
+        Перевести текстовые колонки результатов analysis в INTEGER с id уровня из standards (миграция).
+        Текст сопоставляется с названием или кодом уровня без учёта регистра. Есть значения без
+        уровня в справочнике — UnknownLevelsError со списком, таблица не меняется (уровни не
+        придумываются). Таблица пересобирается: тип колонки в SQLite не меняется через ALTER TABLE.
+        """
+        conn = self._get_conn()
+        info = conn.execute("PRAGMA table_info(analysis)").fetchall()
+        result_cols = [r[1] for r in info if r[1].startswith("result_")]
+        text_cols = [r[1] for r in info if r[1].startswith("result_") and r[2].upper() != "INTEGER"]
+        if not text_cols:
+            return
+        keys = ", ".join(ANALYSIS_KEY_COLUMNS)
+        with self._transaction():
+            levels = self._level_id_map()
+            values = set()
+            for col in text_cols:
+                values.update(r[0] for r in conn.execute(f"SELECT DISTINCT {col} FROM analysis WHERE {col} IS NOT NULL"))
+            mapping, unknown = [], set()
+            for v in values:
+                try:
+                    mapping.append((v, self._level_id(levels, v)))
+                except UnknownLevelsError as e:
+                    unknown.update(e.values)
+            if unknown:
+                raise UnknownLevelsError(unknown)
+            conn.execute("CREATE TEMP TABLE level_map (value PRIMARY KEY, level_id INTEGER)")
+            conn.executemany("INSERT INTO temp.level_map (value, level_id) VALUES (?, ?)", mapping)
+            conn.execute("ALTER TABLE analysis RENAME TO analysis_text")
+            conn.execute(f"""CREATE TABLE analysis (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                class_number TEXT NOT NULL,
+                surname TEXT NOT NULL,
+                name TEXT NOT NULL,
+                patronymic TEXT,
+                specialist TEXT NOT NULL,
+                criterion TEXT NOT NULL,
+                {", ".join(f"{c} INTEGER" for c in result_cols)}
+            )""")
+            mapped = ", ".join(
+                f"(SELECT level_id FROM temp.level_map WHERE value = a.{c})" if c in text_cols else c
+                for c in result_cols
+            )
+            conn.execute(
+                f"INSERT INTO analysis (id, {keys}, {', '.join(result_cols)}) "
+                f"SELECT id, {keys}, {mapped} FROM analysis_text a"
+            )
+            conn.execute("DROP TABLE analysis_text")
+            conn.execute("DROP TABLE temp.level_map")
+            conn.execute("""CREATE INDEX IF NOT EXISTS idx_analysis_pupil
+                ON analysis(class_number, specialist, surname, name, criterion)""")
+
+    def _migrate_pupil_recommendations(self) -> None:
+        """
+        Перенести рекомендации из текстовых полей rec_spec_1..5 в таблицу pupil_recommendations.
+        Слот i соответствует i-му специалисту в порядке первого появления в recommendations
+        (как было в recommendations_get_specialists); слоту без специалиста — «Специалист <n>»
+        (LEGACY_REC_SPECIALIST), его можно переименовать в справочнике. Отсутствующие в справочнике
+        названия добавляются в recommendations, так что ни один текст не пропадает из окон.
+        Перенесённые поля обнуляются (NULL).
+        """
+        conn = self._get_conn()
+        info = conn.execute("PRAGMA table_info(pupils_history)").fetchall()
+        if "recommendations" not in [row[1] for row in info]:
+            conn.execute("ALTER TABLE pupils_history ADD COLUMN recommendations TEXT")
+
+        # «нет» и пустые строки — это отсутствие рекомендаций
+        for col in LEGACY_REC_COLUMNS:
+            conn.execute(f"UPDATE pupils SET {col} = NULL WHERE TRIM({col}) IN ('', 'нет')")
+        where = " OR ".join(f"{col} IS NOT NULL" for col in LEGACY_REC_COLUMNS)
+        rows = conn.execute(
+            f"SELECT id, {', '.join(LEGACY_REC_COLUMNS)} FROM pupils WHERE {where}"
+        ).fetchall()
+        if rows:
+            specialists = self.recommendations_get_specialists()
+            rec_ids = {
+                (r["specialist_name"], r["recommendation_name"]): r["id"]
+                for r in self.recommendations_get_all()
+            }
+            for r in rows:
+                for slot, col in enumerate(LEGACY_REC_COLUMNS):
+                    text = r[col]
+                    if text is None:
+                        continue
+                    spec = specialists[slot] if slot < len(specialists) else LEGACY_REC_SPECIALIST.format(slot + 1)
+                    for rec_name in [s.strip() for s in text.split(";") if s.strip()]:
+                        rec_id = rec_ids.get((spec, rec_name))
+                        if rec_id is None:
+                            cur = conn.execute(
+                                "INSERT INTO recommendations (specialist_name, recommendation_name) VALUES (?, ?)",
+                                (spec, rec_name),
+                            )
+                            rec_id = rec_ids[(spec, rec_name)] = cur.lastrowid
+                        conn.execute(
+                            "INSERT OR IGNORE INTO pupil_recommendations (pupil_id, recommendation_id) VALUES (?, ?)",
+                            (r["id"], rec_id),
+                        )
+                    conn.execute(f"UPDATE pupils SET {col} = NULL WHERE id = ?", (r["id"],))
+        conn.commit()
+
+    def _create_version_triggers(self) -> None:
+        """Триггеры, увеличивающие table_versions.version при INSERT/UPDATE/DELETE в VERSIONED_TABLES."""
+        conn = self._get_conn()
+        for table in VERSIONED_TABLES:
+            conn.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (table,))
+            for op in ("INSERT", "UPDATE", "DELETE"):
+                conn.execute(
+                    f"""CREATE TRIGGER IF NOT EXISTS trg_version_{table}_{op.lower()}
+                        AFTER {op} ON {table}
+                        BEGIN
+                            UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                        END"""
+                )
+        conn.commit()
+
+    def data_versions(self, tables: Optional[Iterable[str]] = None) -> dict[str, int]:
+        """Текущие счётчики изменений таблиц: {имя: версия}. tables=None — все отслеживаемые."""
+        rows = self._get_conn().execute("SELECT name, version FROM table_versions").fetchall()
+        versions = {r["name"]: r["version"] for r in rows}
+        if tables is None:
+            return versions
+        return {t: versions.get(t, 0) for t in tables}
+
     # --- experts ---
     def experts_get_all(self) -> list[sqlite3.Row]:
         """Список всех специалистов (experts)."""
@@ -181,27 +815,30 @@ class Database:
             "SELECT id, name FROM experts ORDER BY name"
         ).fetchall()
 
+    @_retry_on_busy
     def experts_add(self, name: str) -> int:
         """Добавить специалиста. Возвращает id."""
-        cur = self._get_conn().execute(
-            "INSERT INTO experts (name) VALUES (?)",
-            (name.strip(),),
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO experts (name) VALUES (?)",
+                (name.strip(),),
+            )
         return cur.lastrowid
 
+    @_retry_on_busy
     def experts_update(self, id: int, name: str) -> None:
         """Обновить имя специалиста."""
-        self._get_conn().execute(
-            "UPDATE experts SET name = ? WHERE id = ?",
-            (name.strip(), id),
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE experts SET name = ? WHERE id = ?",
+                (name.strip(), id),
+            )
 
+    @_retry_on_busy
     def experts_delete(self, id: int) -> None:
         """Удалить специалиста."""
-        self._get_conn().execute("DELETE FROM experts WHERE id = ?", (id,))
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM experts WHERE id = ?", (id,))
 
     # --- criterions ---
     def criterions_get_all(self) -> list[sqlite3.Row]:
@@ -210,27 +847,30 @@ class Database:
             "SELECT id, name FROM criterions ORDER BY name"
         ).fetchall()
 
+    @_retry_on_busy
     def criterions_add(self, name: str) -> int:
         """Добавить критерий. Возвращает id."""
-        cur = self._get_conn().execute(
-            "INSERT INTO criterions (name) VALUES (?)",
-            (name.strip(),),
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO criterions (name) VALUES (?)",
+                (name.strip(),),
+            )
         return cur.lastrowid
 
+    @_retry_on_busy
     def criterions_update(self, id: int, name: str) -> None:
         """Обновить критерий."""
-        self._get_conn().execute(
-            "UPDATE criterions SET name = ? WHERE id = ?",
-            (name.strip(), id),
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE criterions SET name = ? WHERE id = ?",
+                (name.strip(), id),
+            )
 
+    @_retry_on_busy
     def criterions_delete(self, id: int) -> None:
         """Удалить критерий."""
-        self._get_conn().execute("DELETE FROM criterions WHERE id = ?", (id,))
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM criterions WHERE id = ?", (id,))
 
     # --- standards ---
     def standards_get_all(self) -> list[sqlite3.Row]:
@@ -239,27 +879,79 @@ class Database:
             "SELECT id, name, code FROM standards ORDER BY name, code"
         ).fetchall()
 
+    @_retry_on_busy
     def standards_add(self, name: str, code: str) -> int:
         """Добавить уровень. Возвращает id."""
-        cur = self._get_conn().execute(
-            "INSERT INTO standards (name, code) VALUES (?, ?)",
-            (name.strip(), code.strip()),
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO standards (name, code) VALUES (?, ?)",
+                (name.strip(), code.strip()),
+            )
         return cur.lastrowid
 
+    @_retry_on_busy
     def standards_update(self, id: int, name: str, code: str) -> None:
         """Обновить уровень."""
-        self._get_conn().execute(
-            "UPDATE standards SET name = ?, code = ? WHERE id = ?",
-            (name.strip(), code.strip(), id),
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE standards SET name = ?, code = ? WHERE id = ?",
+                (name.strip(), code.strip(), id),
+            )
 
+    @_retry_on_busy
     def standards_delete(self, id: int) -> None:
-        """Удалить уровень."""
-        self._get_conn().execute("DELETE FROM standards WHERE id = ?", (id,))
-        self._get_conn().commit()
+        """Удалить уровень (если он не указан ни в одном результате анализа)."""
+        with self._transaction() as conn:
+            result_cols = self.analysis_result_columns()
+            if result_cols:
+                where = " OR ".join(f"{c} = ?" for c in result_cols)
+                used = conn.execute(
+                    f"SELECT 1 FROM analysis WHERE {where} LIMIT 1", (id,) * len(result_cols)
+                ).fetchone()
+                if used:
+                    raise ValueError("Уровень указан в результатах анализа — удалить его нельзя.")
+            conn.execute("DELETE FROM standards WHERE id = ?", (id,))
+
+    @_retry_on_busy
+    def standards_get_or_create_id(self, name: str) -> int:
+        """
+        Получить id уровня по названию или коду (без учёта регистра); если такого нет —
+        создать уровень с этим названием и пустым кодом и вернуть id.
+        """
+        name = (name or "").strip()
+        if not name:
+            raise ValueError("Уровень не указан.")
+        with self._transaction() as conn:
+            try:
+                return self._level_id(self._level_id_map(), name)
+            except UnknownLevelsError:
+                return conn.execute("INSERT INTO standards (name, code) VALUES (?, ?)", (name, "")).lastrowid
+
+    def _level_id_map(self) -> dict[str, int]:
+        """
+        {название или код уровня в нижнем регистре: id}. Название важнее кода; при повторе
+        названия (кода) у нескольких уровней — меньший id.
+        """
+        rows = self._get_conn().execute("SELECT id, name, code FROM standards ORDER BY id").fetchall()
+        levels = {}
+        for r in rows:
+            levels.setdefault((r[1] or "").strip().casefold(), r[0])
+        for r in rows:
+            code = (r[2] or "").strip().casefold()
+            if code:
+                levels.setdefault(code, r[0])
+        levels.pop("", None)
+        return levels
+
+    def _level_id(self, levels: dict[str, int], value) -> Optional[int]:
+        """Id уровня по названию или коду (пустое значение — None); нет в справочнике — UnknownLevelsError."""
+        name = "" if value is None else str(value).strip()
+        if not name:
+            return None
+        level_id = levels.get(name.casefold())
+        if level_id is None:
+            raise UnknownLevelsError([name])
+        return level_id
 
     # --- forms ---
     def forms_get_all(self) -> list[sqlite3.Row]:
@@ -268,37 +960,45 @@ class Database:
             "SELECT id, number FROM forms ORDER BY number"
         ).fetchall()
 
+    @_retry_on_busy
     def forms_add(self, number: str) -> int:
         """Добавить класс. Возвращает id."""
-        cur = self._get_conn().execute(
-            "INSERT INTO forms (number) VALUES (?)", (number.strip(),)
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO forms (number) VALUES (?)", (number.strip(),)
+            )
+        self._notify("forms", [cur.lastrowid])
         return cur.lastrowid
 
+    @_retry_on_busy
     def forms_update(self, id: int, number: str) -> None:
         """Обновить номер класса."""
-        self._get_conn().execute(
-            "UPDATE forms SET number = ? WHERE id = ?", (number.strip(), id)
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE forms SET number = ? WHERE id = ?", (number.strip(), id)
+            )
+        self._notify("forms", [id])
 
+    @_retry_on_busy
     def forms_delete(self, id: int) -> None:
         """Удалить класс."""
-        self._get_conn().execute("DELETE FROM forms WHERE id = ?", (id,))
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM forms WHERE id = ?", (id,))
+        self._notify("forms", [id])
 
+    @_retry_on_busy
     def forms_get_or_create_id(self, number: str) -> int:
         """Получить id класса по номеру; если такого нет — создать и вернуть id."""
         number = number.strip()
         if not number:
             raise ValueError("Номер класса не указан.")
-        row = self._get_conn().execute(
-            "SELECT id FROM forms WHERE number = ?", (number,)
-        ).fetchone()
-        if row is not None:
-            return row["id"]
-        return self.forms_add(number)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id FROM forms WHERE number = ?", (number,)
+            ).fetchone()
+            if row is not None:
+                return row["id"]
+            return self.forms_add(number)
 
     # --- programs ---
     def programs_get_all(self) -> list[sqlite3.Row]:
@@ -307,27 +1007,33 @@ class Database:
             "SELECT id, name, version FROM programs ORDER BY name, version"
         ).fetchall()
 
+    @_retry_on_busy
     def programs_add(self, name: str, version: str) -> int:
         """Добавить программу. Возвращает id."""
-        cur = self._get_conn().execute(
-            "INSERT INTO programs (name, version) VALUES (?, ?)",
-            (name.strip(), version.strip()),
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO programs (name, version) VALUES (?, ?)",
+                (name.strip(), version.strip()),
+            )
+        self._notify("programs", [cur.lastrowid])
         return cur.lastrowid
 
+    @_retry_on_busy
     def programs_update(self, id: int, name: str, version: str) -> None:
         """Обновить программу."""
-        self._get_conn().execute(
-            "UPDATE programs SET name = ?, version = ? WHERE id = ?",
-            (name.strip(), version.strip(), id),
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE programs SET name = ?, version = ? WHERE id = ?",
+                (name.strip(), version.strip(), id),
+            )
+        self._notify("programs", [id])
 
+    @_retry_on_busy
     def programs_delete(self, id: int) -> None:
         """Удалить программу."""
-        self._get_conn().execute("DELETE FROM programs WHERE id = ?", (id,))
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM programs WHERE id = ?", (id,))
+        self._notify("programs", [id])
 
     # --- recommendations ---
     def recommendations_get_all(self) -> list[sqlite3.Row]:
@@ -344,132 +1050,358 @@ class Database:
         ).fetchall()
 
     def recommendations_get_specialists(self) -> list[str]:
-        """Уникальные имена специалистов (порядок по первому появлению, до 5)."""
+        """Уникальные имена специалистов (порядок по первому появлению)."""
         rows = self._get_conn().execute(
-            "SELECT DISTINCT specialist_name FROM recommendations ORDER BY id"
+            "SELECT specialist_name FROM recommendations GROUP BY specialist_name ORDER BY MIN(id)"
         ).fetchall()
-        return [r["specialist_name"] for r in rows][:5]
+        return [r["specialist_name"] for r in rows]
 
+    @_retry_on_busy
     def recommendations_add(self, specialist_name: str, recommendation_name: str) -> int:
         """Добавить рекомендацию. Возвращает id. Игнорирует дубликат пары (специалист, рекомендация)."""
-        conn = self._get_conn()
-        try:
-            cur = conn.execute(
-                "INSERT INTO recommendations (specialist_name, recommendation_name) VALUES (?, ?)",
-                (specialist_name.strip(), recommendation_name.strip()),
-            )
-            conn.commit()
-            return cur.lastrowid
-        except sqlite3.IntegrityError:
-            conn.rollback()
+        pair = (specialist_name.strip(), recommendation_name.strip())
+        with self._transaction() as conn:
+            # Дубликат ищется запросом, а не по IntegrityError: откат ошибки отменил бы и пакет batch()
             row = conn.execute(
-                "SELECT id FROM recommendations WHERE specialist_name = ? AND recommendation_name = ?",
-                (specialist_name.strip(), recommendation_name.strip()),
+                "SELECT id FROM recommendations WHERE specialist_name = ? AND recommendation_name = ?", pair
             ).fetchone()
-            return row["id"] if row else 0
+            if row is not None:
+                return row["id"]
+            cur = conn.execute(
+                "INSERT INTO recommendations (specialist_name, recommendation_name) VALUES (?, ?)", pair
+            )
+        self._notify("recommendations", [cur.lastrowid])
+        return cur.lastrowid
 
+    @_retry_on_busy
     def recommendations_update(self, id: int, specialist_name: str, recommendation_name: str) -> None:
         """Изменить рекомендацию по id."""
-        self._get_conn().execute(
-            "UPDATE recommendations SET specialist_name = ?, recommendation_name = ? WHERE id = ?",
-            (specialist_name.strip(), recommendation_name.strip(), id),
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE recommendations SET specialist_name = ?, recommendation_name = ? WHERE id = ?",
+                (specialist_name.strip(), recommendation_name.strip(), id),
+            )
+        self._notify("recommendations", [id])
 
+    @_retry_on_busy
     def recommendations_delete(self, id: int) -> None:
         """Удалить рекомендацию."""
-        self._get_conn().execute("DELETE FROM recommendations WHERE id = ?", (id,))
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM recommendations WHERE id = ?", (id,))
+        self._notify("recommendations", [id])
+        self._notify("pupil_recommendations")  # связи удалены каскадно
 
     # --- pupils ---
+    @_retry_on_busy
     def pupils_insert(self, row: dict[str, Any]) -> int:
-        """Вставить ученика. row: form_id, surname, name, patronymic, birth_date, address, gender, pmpk_date, pmpk_number, program_id, order_number, order_date, rec_spec_1..5. Возвращает id."""
-        conn = self._get_conn()
-        cur = conn.execute(
-            """INSERT INTO pupils (
-                form_id, surname, name, patronymic, birth_date, address, gender,
-                pmpk_date, pmpk_number, program_id, order_number, order_date,
-                rec_spec_1, rec_spec_2, rec_spec_3, rec_spec_4, rec_spec_5
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                row["form_id"],
-                row["surname"],
-                row["name"],
-                row.get("patronymic") or "",
-                row.get("birth_date") or "",
-                row.get("address") or "",
-                row.get("gender") or "",
-                row.get("pmpk_date") or "",
-                row.get("pmpk_number") or "",
-                row.get("program_id"),
-                row.get("order_number") or "",
-                row.get("order_date") or "",
-                row.get("rec_spec_1") or "нет",
-                row.get("rec_spec_2") or "нет",
-                row.get("rec_spec_3") or "нет",
-                row.get("rec_spec_4") or "нет",
-                row.get("rec_spec_5") or "нет",
-            ),
-        )
-        conn.commit()
-        return cur.lastrowid
+        """Вставить ученика. row: form_id, surname, name, patronymic, birth_date, address, gender, pmpk_date, pmpk_number, program_id, order_number, order_date, recommendation_ids (список id рекомендаций). Возвращает id."""
+        return self.pupils_insert_many([row])[0]
 
-    def pupils_update(self, id: int, row: dict[str, Any]) -> None:
-        """Обновить ученика по id."""
-        conn = self._get_conn()
-        conn.execute(
-            """UPDATE pupils SET
-                form_id = ?, surname = ?, name = ?, patronymic = ?, birth_date = ?, address = ?, gender = ?,
-                pmpk_date = ?, pmpk_number = ?, program_id = ?, order_number = ?, order_date = ?,
-                rec_spec_1 = ?, rec_spec_2 = ?, rec_spec_3 = ?, rec_spec_4 = ?, rec_spec_5 = ?
-            WHERE id = ?""",
-            (
-                row["form_id"],
-                row["surname"],
-                row["name"],
-                row.get("patronymic") or "",
-                row.get("birth_date") or "",
-                row.get("address") or "",
-                row.get("gender") or "",
-                row.get("pmpk_date") or "",
-                row.get("pmpk_number") or "",
-                row.get("program_id"),
-                row.get("order_number") or "",
-                row.get("order_date") or "",
-                row.get("rec_spec_1") or "нет",
-                row.get("rec_spec_2") or "нет",
-                row.get("rec_spec_3") or "нет",
-                row.get("rec_spec_4") or "нет",
-                row.get("rec_spec_5") or "нет",
-                id,
-            ),
-        )
-        conn.commit()
+    @_retry_on_busy
+    def pupils_insert_many(self, rows: Iterable[dict[str, Any]]) -> list[int]:
+        """
+        Вставить учеников одной транзакцией (поля row — как у pupils_insert): все или ни одного.
+        Каждому пишется запись I в журнал pupils_changes. Возвращает id в порядке rows.
+        """
+        rows = list(rows)
+        ids, with_recs = [], []
+        with self._transaction() as conn:
+            for row in rows:
+                values = [
+                    row["form_id"],
+                    row["surname"],
+                    row["name"],
+                    row.get("patronymic") or "",
+                    row.get("birth_date") or "",
+                    row.get("address") or "",
+                    row.get("gender") or "",
+                    row.get("pmpk_date") or "",
+                    row.get("pmpk_number") or "",
+                    row.get("program_id"),
+                    row.get("order_number") or "",
+                    row.get("order_date") or "",
+                ]
+                cur = conn.execute(
+                    """INSERT INTO pupils (
+                        form_id, surname, name, patronymic, birth_date, address, gender,
+                        pmpk_date, pmpk_number, program_id, order_number, order_date
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    values,
+                )
+                pupil_id = cur.lastrowid
+                rec_ids = sorted(set(row.get("recommendation_ids") or []))
+                if rec_ids:
+                    self._set_pupil_recommendations(pupil_id, rec_ids)
+                    with_recs.append(pupil_id)
+                # Состояние для журнала — из записанных значений, без повторного чтения ученика
+                self._log_pupil_change(pupil_id, "I", None, values + [rec_ids])
+                ids.append(pupil_id)
+        if ids:
+            self._notify("pupils", ids)
+        if with_recs:
+            self._notify("pupil_recommendations", with_recs)
+        return ids
+
+    @_retry_on_busy
+    def pupils_insert_by_class(
+        self, rows_by_class: dict[str, list[dict[str, Any]]]
+    ) -> tuple[list[int], dict[str, int]]:
+        """
+        Загрузка учеников по классам одной транзакцией: {номер класса: записи (поля — как у
+        pupils_insert, без form_id)}. Недостающие классы создаются в той же транзакции —
+        при ошибке не остаётся пустых классов. Возвращает (id учеников по порядку, {номер класса: id}).
+        """
+        form_ids, created = {}, []
+        with self._transaction() as conn:
+            for number in rows_by_class:
+                clean = (number or "").strip()
+                if not clean:
+                    raise ValueError("Номер класса не указан.")
+                row = conn.execute("SELECT id FROM forms WHERE number = ?", (clean,)).fetchone()
+                if row is None:
+                    row = (conn.execute("INSERT INTO forms (number) VALUES (?)", (clean,)).lastrowid,)
+                    created.append(row[0])
+                form_ids[number] = row[0]
+            ids = self.pupils_insert_many(
+                {**r, "form_id": form_ids[number]} for number, rows in rows_by_class.items() for r in rows
+            )
+        if created:
+            self._notify("forms", created)
+        return ids, form_ids
 
-    def pupils_get_by_id(self, id: int) -> Optional[sqlite3.Row]:
+    def pupils_find_duplicates(self, rows: Iterable[dict[str, Any]]) -> list[tuple[int, Pupil]]:
+        """
+        Ученики из БД, совпадающие с новыми записями rows: (номер записи в rows, ученик).
+        Совпадение — та же фамилия и имя (поиск по индексу idx_pupils_name), отчество без учёта
+        регистра и дата рождения, если она указана у обоих.
+        """
+        rows = list(rows)
+        keys = {}
+        for n, row in enumerate(rows):
+            keys.setdefault(((row["surname"] or "").strip(), (row["name"] or "").strip()), []).append(n)
+        found = []
+        for chunk in _chunks(list(keys), _IN_CHUNK // 2):
+            found += self._select_pupils(
+                f"JOIN (VALUES {', '.join(['(?, ?)'] * len(chunk))}) AS k "
+                f"ON pupils.surname = k.column1 AND pupils.name = k.column2",
+                [v for key in chunk for v in key],
+            )
+        matches = []
+        for pupil in found:
+            for n in keys.get(((pupil.surname or "").strip(), (pupil.name or "").strip()), []):
+                row = rows[n]
+                if (row.get("patronymic") or "").strip().casefold() != (pupil.patronymic or "").strip().casefold():
+                    continue
+                birth_date = (row.get("birth_date") or "").strip()
+                if birth_date and pupil.birth_date and birth_date != pupil.birth_date.strip():
+                    continue
+                matches.append((n, pupil))
+        return sorted(matches, key=lambda m: (m[0], m[1].id))
+
+    @_retry_on_busy
+    def pupils_update(self, id: int, row: dict[str, Any]) -> None:
+        """Обновить ученика по id. Рекомендации заменяются, только если в row есть ключ recommendation_ids."""
+        with self._transaction() as conn:
+            old = self._pupil_audit_state(id)
+            conn.execute(
+                """UPDATE pupils SET
+                    form_id = ?, surname = ?, name = ?, patronymic = ?, birth_date = ?, address = ?, gender = ?,
+                    pmpk_date = ?, pmpk_number = ?, program_id = ?, order_number = ?, order_date = ?
+                WHERE id = ?""",
+                (
+                    row["form_id"],
+                    row["surname"],
+                    row["name"],
+                    row.get("patronymic") or "",
+                    row.get("birth_date") or "",
+                    row.get("address") or "",
+                    row.get("gender") or "",
+                    row.get("pmpk_date") or "",
+                    row.get("pmpk_number") or "",
+                    row.get("program_id"),
+                    row.get("order_number") or "",
+                    row.get("order_date") or "",
+                    id,
+                ),
+            )
+            if "recommendation_ids" in row:
+                self._set_pupil_recommendations(id, row["recommendation_ids"] or [])
+            self._log_pupil_change(id, "U", old, self._pupil_audit_state(id))
+        self._notify("pupils", [id])
+        if "recommendation_ids" in row:
+            self._notify("pupil_recommendations", [id])
+
+    @_retry_on_busy
+    def pupils_update_many(self, ids: Iterable[int], fields: dict[str, Any]) -> int:
+        """
+        Записать одни и те же значения fields ученикам ids одной транзакцией: UPDATE ... WHERE id IN (...)
+        (пачками по _IN_CHUNK id). Поля — колонки pupils из PUPIL_AUDIT_COLUMNS, рекомендации не меняются.
+        Изменения каждого ученика пишутся в журнал pupils_changes. Возвращает число обновлённых учеников.
+        """
+        values = _pupil_field_values(fields)
+        ids = list(dict.fromkeys(ids))
+        if not ids or not values:
+            return 0
+        assignments = ", ".join(f"{col} = ?" for col in values)
+        positions = {PUPIL_AUDIT_COLUMNS.index(col): value for col, value in values.items()}
+        with self._transaction() as conn:
+            old = self._pupil_audit_states(ids)
+            updated = [i for i in ids if i in old]
+            for chunk in _chunks(updated):
+                conn.execute(
+                    f"UPDATE pupils SET {assignments} WHERE id IN ({', '.join('?' * len(chunk))})",
+                    [*values.values(), *chunk],
+                )
+            for pupil_id in updated:
+                state = old[pupil_id]
+                new = [positions.get(i, v) for i, v in enumerate(state)]
+                self._log_pupil_change(pupil_id, "U", state, new)
+        if updated:
+            self._notify("pupils", updated)
+        return len(updated)
+
+    @_retry_on_busy
+    def pupils_update_cells(
+        self, changes: dict[int, dict[str, Any]], expected: Optional[dict[int, dict[str, Any]]] = None
+    ) -> list[int]:
+        """
+        Записать правки из таблицы учеников одной транзакцией: changes — {id: {колонка: значение}},
+        у каждого ученика обновляются только изменённые колонки. expected — {id: {колонка: значение}},
+        которые пользователь видел до правки (оптимистическая проверка): если колонка в БД уже другая
+        (её изменил другой пользователь) или ученик удалён, ученик не записывается.
+        Возвращает id таких учеников (конфликты); правки остальных записаны и внесены в журнал.
+        """
+        changes = {int(i): _pupil_field_values(f) for i, f in changes.items() if f}
+        expected = {int(i): f for i, f in (expected or {}).items()}
+        conflicts, written = [], []
+        with self._transaction() as conn:
+            old = self._pupil_audit_states(changes)
+            for pupil_id, values in changes.items():
+                state = old.get(pupil_id)
+                seen = expected.get(pupil_id, {})
+                if state is None or any(
+                    _blank(state[PUPIL_AUDIT_COLUMNS.index(col)]) != _blank(seen[col])
+                    for col in values if col in seen
+                ):
+                    conflicts.append(pupil_id)
+                    continue
+                conn.execute(
+                    f"UPDATE pupils SET {', '.join(f'{col} = ?' for col in values)} WHERE id = ?",
+                    [*values.values(), pupil_id],
+                )
+                positions = {PUPIL_AUDIT_COLUMNS.index(col): value for col, value in values.items()}
+                self._log_pupil_change(pupil_id, "U", state, [positions.get(i, v) for i, v in enumerate(state)])
+                written.append(pupil_id)
+        if written:
+            self._notify("pupils", written)
+        return conflicts
+
+    def _select_pupils(self, tail: str = "", params: Iterable = ()) -> list[Pupil]:
+        """SELECT PUPIL_SELECT FROM pupils tail — записи Pupil прямо из кортежей курсора."""
+        cur = self._get_conn().cursor()
+        cur.row_factory = None
+        return list(map(Pupil.from_tuple, cur.execute(f"SELECT {PUPIL_SELECT} FROM pupils {tail}", tuple(params))))
+
+    def pupils_get_by_id(self, id: int) -> Optional[Pupil]:
         """Получить ученика по id."""
-        return self._get_conn().execute(
-            "SELECT * FROM pupils WHERE id = ?", (id,)
-        ).fetchone()
+        rows = self._select_pupils("WHERE id = ?", (id,))
+        return rows[0] if rows else None
+
+    def pupils_get_by_ids(self, ids: Iterable[int]) -> list[Pupil]:
+        """Ученики по списку id (отсутствующие в БД пропускаются)."""
+        rows = []
+        for chunk in _chunks(list(ids)):
+            rows.extend(self._select_pupils(f"WHERE id IN ({', '.join('?' * len(chunk))})", chunk))
+        return rows
+
+    def _table_columns(self, table: str) -> tuple[str, ...]:
+        """Имена колонок таблицы (кэшируются: pupils и pupils_history меняются только миграциями при запуске)."""
+        cols = self._columns_cache.get(table)
+        if cols is None:
+            info = self._get_conn().execute(f"PRAGMA table_info({table})").fetchall()
+            cols = self._columns_cache[table] = tuple(r[1] for r in info)
+        return cols
+
+    def _select_tuples(self, table: str, columns: Iterable[str], tail: str = "", params: Iterable = ()) -> list[tuple]:
+        """SELECT columns FROM table tail — строки простыми кортежами, без sqlite3.Row."""
+        columns = list(columns)
+        unknown = [c for c in columns if c not in self._table_columns(table)]
+        if unknown:
+            raise ValueError(f"В таблице {table} нет колонок: {', '.join(unknown)}")
+        cur = self._get_conn().cursor()
+        cur.row_factory = None
+        return cur.execute(f"SELECT {', '.join(columns)} FROM {table} {tail}", tuple(params)).fetchall()
+
+    def pupils_get_columns(self, columns: Iterable[str], form_id: Optional[int] = None) -> list[tuple]:
+        """
+        Ученики кортежами значений columns (порядок — как у pupils_get_all / pupils_get_by_form_id).
+        Для заполнения таблиц: без sqlite3.Row и поиска колонок по имени в каждой ячейке.
+        """
+        if form_id is None:
+            return self._select_tuples("pupils", columns, "ORDER BY form_id, surname, name")
+        return self._select_tuples("pupils", columns, "WHERE form_id = ? ORDER BY surname, name", (form_id,))
 
-    def pupils_get_by_form_id(self, form_id: int) -> list[sqlite3.Row]:
+    def pupils_get_by_form_id(self, form_id: int) -> list[Pupil]:
         """Список учеников класса."""
-        return self._get_conn().execute(
-            "SELECT * FROM pupils WHERE form_id = ? ORDER BY surname, name", (form_id,)
-        ).fetchall()
+        return self._select_pupils("WHERE form_id = ? ORDER BY surname, name", (form_id,))
 
-    def pupils_get_by_program_id(self, program_id: int) -> list[sqlite3.Row]:
+    def pupils_get_by_program_id(self, program_id: int) -> list[Pupil]:
         """Список учеников по программе."""
-        return self._get_conn().execute(
-            "SELECT * FROM pupils WHERE program_id = ? ORDER BY form_id, surname, name",
-            (program_id,),
-        ).fetchall()
+        return self._select_pupils("WHERE program_id = ? ORDER BY form_id, surname, name", (program_id,))
 
-    def pupils_get_all(self) -> list[sqlite3.Row]:
+    def pupils_get_all(self) -> list[Pupil]:
         """Все ученики."""
-        return self._get_conn().execute(
-            "SELECT * FROM pupils ORDER BY form_id, surname, name"
-        ).fetchall()
+        return self._select_pupils("ORDER BY form_id, surname, name")
+
+    def pupils_query(
+        self,
+        form_id: Optional[int] = None,
+        program_id: Optional[int] = None,
+        specialist: Optional[str] = None,
+        recommendation_ids: Optional[Iterable[int]] = None,
+        match_all: bool = False,
+        grade_from: Optional[int] = None,
+        grade_to: Optional[int] = None,
+    ) -> list[Pupil]:
+        """
+        Выборка учеников по совокупности критериев (все необязательны):
+        класс, программа, специалист, рекомендации (любая из списка или все — match_all),
+        диапазон параллелей (цифровая часть номера класса: grade_from..grade_to).
+        Фильтры по рекомендациям идут через индексы pupil_recommendations/recommendations.
+        """
+        where = []
+        params: list[Any] = []
+        if form_id is not None:
+            where.append("form_id = ?")
+            params.append(form_id)
+        if program_id is not None:
+            where.append("program_id = ?")
+            params.append(program_id)
+        if grade_from is not None or grade_to is not None:
+            # CAST('5А' AS INTEGER) = 5; forms маленькая, отбор учеников — по idx_pupils_form
+            where.append(
+                "form_id IN (SELECT id FROM forms WHERE CAST(number AS INTEGER) BETWEEN ? AND ?)"
+            )
+            params.extend([grade_from if grade_from is not None else 0,
+                           grade_to if grade_to is not None else 99])
+        rec_ids = sorted(set(recommendation_ids or []))
+        if rec_ids:
+            having = f" HAVING COUNT(*) = {len(rec_ids)}" if match_all else ""
+            where.append(
+                f"""id IN (SELECT pupil_id FROM pupil_recommendations
+                           WHERE recommendation_id IN ({', '.join('?' * len(rec_ids))})
+                           GROUP BY pupil_id{having})"""
+            )
+            params.extend(rec_ids)
+        elif specialist:
+            where.append(
+                """id IN (SELECT pr.pupil_id FROM recommendations r
+                          JOIN pupil_recommendations pr ON pr.recommendation_id = r.id
+                          WHERE r.specialist_name = ?)"""
+            )
+            params.append(specialist)
+        tail = "WHERE " + " AND ".join(where) if where else ""
+        return self._select_pupils(tail + " ORDER BY form_id, surname, name", params)
 
     def pupils_count_by_program(self) -> list[sqlite3.Row]:
         """Агрегация: программа (id, name, version) и количество учеников."""
@@ -482,53 +1414,544 @@ class Database:
                ORDER BY p.name, p.version"""
         ).fetchall()
 
+    @_retry_on_busy
     def pupils_delete(self, id: int) -> None:
-        """Удалить ученика (например, перед переносом в архив)."""
-        self._get_conn().execute("DELETE FROM pupils WHERE id = ?", (id,))
-        self._get_conn().commit()
+        """Удалить ученика (например, перед переносом в архив). Связи с рекомендациями удаляются каскадно."""
+        with self._transaction() as conn:
+            old = self._pupil_audit_state(id)
+            conn.execute("DELETE FROM pupils WHERE id = ?", (id,))
+            self._log_pupil_change(id, "D", old, None)
+        self._notify("pupils", [id])
+        self._notify("pupil_recommendations", [id])
+
+    # --- pupil_recommendations ---
+    def _set_pupil_recommendations(self, pupil_id: int, recommendation_ids: Iterable[int]) -> None:
+        """Заменить набор рекомендаций ученика (без commit — вызывается внутри операции записи)."""
+        conn = self._get_conn()
+        conn.execute("DELETE FROM pupil_recommendations WHERE pupil_id = ?", (pupil_id,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO pupil_recommendations (pupil_id, recommendation_id) VALUES (?, ?)",
+            [(pupil_id, rec_id) for rec_id in recommendation_ids],
+        )
+
+    def pupils_get_recommendation_ids(self, pupil_id: int) -> list[int]:
+        """id рекомендаций ученика."""
+        rows = self._get_conn().execute(
+            "SELECT recommendation_id FROM pupil_recommendations WHERE pupil_id = ? ORDER BY recommendation_id",
+            (pupil_id,),
+        ).fetchall()
+        return [r["recommendation_id"] for r in rows]
+
+    @_retry_on_busy
+    def pupils_set_recommendations(self, pupil_id: int, recommendation_ids: Iterable[int]) -> None:
+        """Заменить набор рекомендаций ученика."""
+        with self._transaction():
+            old = self._pupil_audit_state(pupil_id)
+            self._set_pupil_recommendations(pupil_id, recommendation_ids)
+            self._log_pupil_change(pupil_id, "U", old, self._pupil_audit_state(pupil_id))
+        self._notify("pupil_recommendations", [pupil_id])
+
+    def pupils_recommendations_map(
+        self, pupil_ids: Optional[Iterable[int]] = None
+    ) -> dict[int, dict[str, list[str]]]:
+        """
+        Рекомендации учеников для отображения: {pupil_id: {специалист: [рекомендации]}}.
+        pupil_ids=None — по всем ученикам.
+        """
+        conn = self._get_conn()
+        sql = (
+            "SELECT pr.pupil_id, r.specialist_name, r.recommendation_name "
+            "FROM pupil_recommendations pr JOIN recommendations r ON r.id = pr.recommendation_id"
+        )
+        if pupil_ids is None:
+            rows = conn.execute(sql + " ORDER BY r.recommendation_name").fetchall()
+        else:
+            rows = []
+            for chunk in _chunks(list(pupil_ids)):
+                rows.extend(conn.execute(
+                    sql + f" WHERE pr.pupil_id IN ({', '.join('?' * len(chunk))}) ORDER BY r.recommendation_name",
+                    chunk,
+                ).fetchall())
+        result: dict[int, dict[str, list[str]]] = {}
+        for r in rows:
+            result.setdefault(r[0], {}).setdefault(r[1], []).append(r[2])
+        return result
+
+    def pupils_recommendations_text(self, pupil_id: int) -> str:
+        """Рекомендации ученика одной строкой: «Специалист: рек1; рек2 | …» или «нет»."""
+        by_spec = self.pupils_recommendations_map([pupil_id]).get(pupil_id, {})
+        order = self.recommendations_get_specialists()
+        parts = [f"{spec}: {'; '.join(by_spec[spec])}" for spec in order if spec in by_spec]
+        return " | ".join(parts) if parts else "нет"
+
+    def pupils_get_by_recommendation(self, recommendation_id: int) -> list[Pupil]:
+        """Ученики с указанной рекомендацией (по индексу idx_pupil_recommendations_rec)."""
+        return self.pupils_get_by_recommendations([recommendation_id])
+
+    def pupils_get_by_recommendations(
+        self, recommendation_ids: Iterable[int], match_all: bool = False
+    ) -> list[Pupil]:
+        """
+        Ученики, у которых есть хотя бы одна из рекомендаций (match_all=False)
+        или все перечисленные рекомендации (match_all=True).
+        """
+        ids = sorted(set(recommendation_ids))
+        if not ids:
+            return []
+        placeholders = ", ".join("?" * len(ids))
+        having = f" HAVING COUNT(*) = {len(ids)}" if match_all else ""
+        return self._select_pupils(
+            f"""WHERE id IN (
+                    SELECT pupil_id FROM pupil_recommendations
+                    WHERE recommendation_id IN ({placeholders})
+                    GROUP BY pupil_id{having}
+                )
+                ORDER BY form_id, surname, name""",
+            ids,
+        )
+
+    # --- pupils_changes (журнал изменений) ---
+    def _pupil_audit_state(self, pupil_id: int) -> Optional[list]:
+        """Значения полей PUPIL_AUDIT_COLUMNS ученика (None — ученика нет)."""
+        return self._pupil_audit_states([pupil_id]).get(pupil_id)
+
+    def _pupil_audit_states(self, pupil_ids: Iterable[int]) -> dict[int, list]:
+        """{id: значения PUPIL_AUDIT_COLUMNS} для учеников pupil_ids — два запроса на пачку id."""
+        conn = self._get_conn()
+        states: dict[int, list] = {}
+        for chunk in _chunks(list(pupil_ids)):
+            marks = ", ".join("?" * len(chunk))
+            for row in conn.execute(
+                f"SELECT id, {', '.join(PUPIL_AUDIT_COLUMNS[:-1])} FROM pupils WHERE id IN ({marks})", chunk
+            ):
+                states[row[0]] = list(row)[1:] + [[]]
+            for pupil_id, rec_id in conn.execute(
+                f"SELECT pupil_id, recommendation_id FROM pupil_recommendations "
+                f"WHERE pupil_id IN ({marks}) ORDER BY pupil_id, recommendation_id",
+                chunk,
+            ):
+                if pupil_id in states:
+                    states[pupil_id][-1].append(rec_id)
+        return states
+
+    def _log_pupil_change(self, pupil_id: int, op: str, old: Optional[list], new: Optional[list]) -> None:
+        """
+        Дописать изменение ученика в журнал (без commit — внутри транзакции операции).
+        U хранит только изменившиеся поля; каждое _AUDIT_SNAPSHOT_EVERY-е изменение пишется снимком S.
+        Для ученика без записей в журнале (добавлен до его появления) сначала пишется снимок прежнего состояния.
+        """
+        conn = self._get_conn()
+        ts = datetime.now().isoformat(timespec="seconds")
+        if op != "I" and old is not None:
+            recent = [r[0] for r in conn.execute(
+                "SELECT op FROM pupils_changes WHERE pupil_id = ? ORDER BY ts DESC, id DESC LIMIT ?",
+                (pupil_id, _AUDIT_SNAPSHOT_EVERY),
+            ).fetchall()]
+            since_snapshot = next((i for i, o in enumerate(recent) if o in ("I", "S")), None)
+            if since_snapshot is None and len(recent) < _AUDIT_SNAPSHOT_EVERY:
+                self._append_pupil_change(pupil_id, ts, "S", old)
+                since_snapshot = 0
+            if op == "U":
+                diff = {str(i): v for i, (a, v) in enumerate(zip(old, new)) if a != v}
+                if not diff:
+                    return
+                if since_snapshot is None or since_snapshot >= _AUDIT_SNAPSHOT_EVERY - 1:
+                    self._append_pupil_change(pupil_id, ts, "S", new)
+                    return
+                self._append_pupil_change(pupil_id, ts, "U", diff)
+                return
+        self._append_pupil_change(pupil_id, ts, op, new if op == "I" else None)
+
+    def _append_pupil_change(self, pupil_id: int, ts: str, op: str, diff: Any) -> None:
+        self._get_conn().execute(
+            "INSERT INTO pupils_changes (pupil_id, ts, op, diff) VALUES (?, ?, ?, ?)",
+            (pupil_id, ts, op,
+             json.dumps(diff, ensure_ascii=False, separators=(",", ":")) if diff is not None else None),
+        )
+
+    def pupils_changes_last_id(self) -> int:
+        """Номер последней записи журнала pupils_changes (0 — журнал пуст)."""
+        return self._get_conn().execute("SELECT COALESCE(MAX(id), 0) FROM pupils_changes").fetchone()[0]
+
+    def pupils_changed_since(self, after_id: int) -> tuple[int, list[int]]:
+        """
+        Ученики, изменённые после записи журнала after_id (по индексу первичного ключа):
+        (номер последней записи журнала, [pupil_id без повторов]).
+        """
+        rows = self._get_conn().execute(
+            "SELECT id, pupil_id FROM pupils_changes WHERE id > ? ORDER BY id", (after_id,)
+        ).fetchall()
+        if not rows:
+            return after_id, []
+        return rows[-1][0], list(dict.fromkeys(r[1] for r in rows))
+
+    def pupils_changes_get(self, pupil_id: int) -> list[sqlite3.Row]:
+        """Журнал изменений ученика по времени."""
+        return self._get_conn().execute(
+            "SELECT id, pupil_id, ts, op, diff FROM pupils_changes WHERE pupil_id = ? ORDER BY ts, id",
+            (pupil_id,),
+        ).fetchall()
+
+    def pupils_state_as_of(self, pupil_id: int, as_of: date | datetime | str) -> Optional[dict[str, Any]]:
+        """
+        Состояние ученика на дату/момент as_of (date, datetime или ISO-строка; дата — на конец дня)
+        по журналу pupils_changes: ближайший снимок (I/S) не позже as_of и изменения после него.
+        Возвращает {поле: значение} по PUPIL_AUDIT_COLUMNS или None, если на этот момент ученика
+        не было (или журнал о нём ещё ничего не знал).
+        """
+        if isinstance(as_of, datetime):
+            bound = as_of.isoformat(timespec="seconds")
+        elif isinstance(as_of, date):
+            bound = as_of.isoformat() + "T23:59:59"
+        else:
+            bound = as_of if "T" in as_of else as_of + "T23:59:59"
+        conn = self._get_conn()
+        base = conn.execute(
+            """SELECT id, ts, op, diff FROM pupils_changes
+               WHERE pupil_id = ? AND ts <= ? AND op IN ('I', 'S', 'D')
+               ORDER BY ts DESC, id DESC LIMIT 1""",
+            (pupil_id, bound),
+        ).fetchone()
+        if base is None or base["op"] == "D":
+            return None
+        state = json.loads(base["diff"])
+        for r in conn.execute(
+            """SELECT diff FROM pupils_changes
+               WHERE pupil_id = ? AND ts >= ? AND ts <= ? AND id > ? AND op = 'U'
+               ORDER BY ts, id""",
+            (pupil_id, base["ts"], bound, base["id"]),
+        ):
+            for idx, value in json.loads(r["diff"]).items():
+                state[int(idx)] = value
+        return dict(zip(PUPIL_AUDIT_COLUMNS, state))
 
     # --- pupils_history ---
+    @_retry_on_busy
     def pupils_history_insert(self, row: dict[str, Any], transfer_date: str, transfer_reason: str) -> int:
-        """Вставить запись в архив. row — те же поля, что у pupils; добавляются transfer_date, transfer_reason. Возвращает id."""
+        """Вставить запись в архив. row — те же поля, что у pupils, и recommendations (текст); добавляются transfer_date, transfer_reason. Возвращает id."""
+        with self._transaction() as conn:
+            cur = conn.execute(
+                """INSERT INTO pupils_history (
+                    form_id, surname, name, patronymic, birth_date, address, gender,
+                    pmpk_date, pmpk_number, program_id, order_number, order_date,
+                    recommendations, transfer_date, transfer_reason
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    row["form_id"],
+                    row["surname"],
+                    row["name"],
+                    row.get("patronymic") or "",
+                    row.get("birth_date") or "",
+                    row.get("address") or "",
+                    row.get("gender") or "",
+                    row.get("pmpk_date") or "",
+                    row.get("pmpk_number") or "",
+                    row.get("program_id"),
+                    row.get("order_number") or "",
+                    row.get("order_date") or "",
+                    row.get("recommendations") or "нет",
+                    transfer_date,
+                    transfer_reason or "",
+                ),
+            )
+        self._notify("pupils_history", [cur.lastrowid])
+        return cur.lastrowid
+
+    @_retry_on_busy
+    def pupils_archive(self, pupil_id: int, transfer_date: str, transfer_reason: str) -> int:
+        """
+        Перенести ученика в архив одной транзакцией: копия строки в pupils_history
+        (рекомендации — текстом) и удаление из pupils. Возвращает id записи архива.
+        """
+        recommendations = self.pupils_recommendations_text(pupil_id)
+        with self._transaction() as conn:
+            old = self._pupil_audit_state(pupil_id)
+            cur = conn.execute(
+                """INSERT INTO pupils_history (
+                    form_id, surname, name, patronymic, birth_date, address, gender,
+                    pmpk_date, pmpk_number, program_id, order_number, order_date,
+                    rec_spec_1, rec_spec_2, rec_spec_3, rec_spec_4, rec_spec_5,
+                    recommendations, transfer_date, transfer_reason
+                )
+                SELECT form_id, surname, name, patronymic, birth_date, address, gender,
+                       pmpk_date, pmpk_number, program_id, order_number, order_date,
+                       rec_spec_1, rec_spec_2, rec_spec_3, rec_spec_4, rec_spec_5,
+                       ?, ?, ?
+                FROM pupils WHERE id = ?""",
+                (recommendations, transfer_date, transfer_reason or "", pupil_id),
+            )
+            if cur.rowcount == 0:
+                raise ValueError(f"Ученик с id={pupil_id} не найден.")
+            history_id = cur.lastrowid
+            conn.execute("DELETE FROM pupils WHERE id = ?", (pupil_id,))
+            self._log_pupil_change(pupil_id, "D", old, None)
+        self._notify("pupils_history", [history_id])
+        self._notify("pupils", [pupil_id])
+        self._notify("pupil_recommendations", [pupil_id])
+        return history_id
+
+    def pupils_history_get_columns(self, columns: Iterable[str]) -> list[tuple]:
+        """Архив кортежами значений columns (порядок — как у pupils_history_get_all)."""
+        self._tier_conn()
+        return self._select_tuples("pupils_history_all", columns, "ORDER BY transfer_date DESC, surname, name")
+
+    def pupils_history_get_all(self) -> list[sqlite3.Row]:
+        """Все записи архива (из файла БД и архивного файла)."""
+        conn, _ = self._tier_conn()
+        return conn.execute(
+            "SELECT * FROM pupils_history_all ORDER BY transfer_date DESC, surname, name"
+        ).fetchall()
+
+    # --- архивный файл (второй уровень хранения) ---
+    def _tier_conn(self, create: bool = False) -> tuple[sqlite3.Connection, bool]:
+        """
+        Соединение потока с подключённым архивным файлом и TEMP-представлением pupils_history_all
+        по обоим файлам. Возвращает (соединение, подключён ли архив). Файл, появившийся после
+        открытия соединения (в том числе в другом процессе), подключается при следующем обращении
+        вне транзакции. create=True — создать архивный файл и его таблицы, если их нет.
+        """
         conn = self._get_conn()
-        cur = conn.execute(
-            """INSERT INTO pupils_history (
-                form_id, surname, name, patronymic, birth_date, address, gender,
-                pmpk_date, pmpk_number, program_id, order_number, order_date,
-                rec_spec_1, rec_spec_2, rec_spec_3, rec_spec_4, rec_spec_5,
-                transfer_date, transfer_reason
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                row["form_id"],
-                row["surname"],
-                row["name"],
-                row.get("patronymic") or "",
-                row.get("birth_date") or "",
-                row.get("address") or "",
-                row.get("gender") or "",
-                row.get("pmpk_date") or "",
-                row.get("pmpk_number") or "",
-                row.get("program_id"),
-                row.get("order_number") or "",
-                row.get("order_date") or "",
-                row.get("rec_spec_1") or "нет",
-                row.get("rec_spec_2") or "нет",
-                row.get("rec_spec_3") or "нет",
-                row.get("rec_spec_4") or "нет",
-                row.get("rec_spec_5") or "нет",
-                transfer_date,
-                transfer_reason or "",
-            ),
+        attached = any(r[1] == ARCHIVE_SCHEMA for r in conn.execute("PRAGMA database_list"))
+        if not attached and not conn.in_transaction and (create or self.archive_path.exists()):
+            if self._read_only:
+                target = f"{self.archive_path.resolve().as_uri()}?mode=ro"
+            else:
+                target = str(self.archive_path)
+            conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (target,))
+            attached = True
+        if create:
+            if not attached:
+                raise RuntimeError("Архивный файл нельзя подключить внутри транзакции.")
+            self._create_archive_tables(conn)
+        tiered = attached and conn.execute(
+            f"SELECT 1 FROM {ARCHIVE_SCHEMA}.sqlite_master WHERE name = 'pupils_history'"
+        ).fetchone() is not None
+        view = conn.execute("SELECT sql FROM temp.sqlite_master WHERE name = 'pupils_history_all'").fetchone()
+        if view is None or (f"{ARCHIVE_SCHEMA}.pupils_history" in view[0]) != tiered:
+            # Постоянное представление в main не может ссылаться на подключённый файл — только TEMP
+            cols = ", ".join(HISTORY_COLUMNS)
+            sql = f"SELECT {cols} FROM main.pupils_history"
+            if tiered:
+                # Запись, уже скопированная в архив, но ещё не удалённая из основного файла
+                # (прерванный archive_move_history), показывается один раз
+                sql += (f" UNION ALL SELECT {cols} FROM {ARCHIVE_SCHEMA}.pupils_history"
+                        " WHERE id NOT IN (SELECT id FROM main.pupils_history)")
+            conn.execute("DROP VIEW IF EXISTS temp.pupils_history_all")
+            conn.execute(f"CREATE TEMP VIEW pupils_history_all AS {sql}")
+        return conn, tiered
+
+    def _create_archive_tables(self, conn: sqlite3.Connection) -> None:
+        """
+        Таблицы архивного файла: pupils_history (id сохраняются) и analysis_results (результат на строку,
+        ключ переноса — id строки analysis и колонка периода).
+        """
+        conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.pupils_history (
+                id INTEGER PRIMARY KEY,
+                form_id INTEGER NOT NULL,
+                surname TEXT NOT NULL,
+                name TEXT NOT NULL,
+                patronymic TEXT,
+                birth_date TEXT,
+                address TEXT,
+                gender TEXT,
+                pmpk_date TEXT,
+                pmpk_number TEXT,
+                program_id INTEGER,
+                order_number TEXT,
+                order_date TEXT,
+                rec_spec_1 TEXT,
+                rec_spec_2 TEXT,
+                rec_spec_3 TEXT,
+                rec_spec_4 TEXT,
+                rec_spec_5 TEXT,
+                transfer_date TEXT NOT NULL,
+                transfer_reason TEXT,
+                recommendations TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.analysis_results (
+                id INTEGER PRIMARY KEY,
+                analysis_id INTEGER,
+                class_number TEXT NOT NULL,
+                surname TEXT NOT NULL,
+                name TEXT NOT NULL,
+                patronymic TEXT,
+                specialist TEXT NOT NULL,
+                criterion TEXT NOT NULL,
+                result_column TEXT NOT NULL,
+                value TEXT
+            );
+            CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_analysis_results_pupil
+                ON analysis_results(surname, name, class_number, specialist);
+        """)
+        columns = [r[1] for r in conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.table_info(analysis_results)")]
+        if "analysis_id" not in columns:
+            # Архив прежней версии: у перенесённых раньше результатов ключа нет (NULL)
+            conn.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.analysis_results ADD COLUMN analysis_id INTEGER")
+        conn.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_analysis_results_key "
+            "ON analysis_results(analysis_id, result_column)"
+        )
+
+    @_retry_on_busy
+    def archive_move_history(self, before_year: int) -> int:
+        """
+        Перенести в архивный файл записи pupils_history, переведённые раньше before_year
+        (по году даты ДД.ММ.ГГГГ; записи с нераспознанной датой остаются). Возвращает число записей.
+        Перенос идёт в два шага — копия (INSERT OR IGNORE по id), затем удаление из основного
+        файла только уже скопированных записей: прерванный перенос повторяется без дублей и потерь.
+        """
+        conn, _ = self._tier_conn(create=True)
+        cols = ", ".join(HISTORY_COLUMNS)
+        where = "transfer_date GLOB '*[0-9][0-9][0-9][0-9]' AND CAST(substr(transfer_date, -4) AS INTEGER) < ?"
+        with self._transaction():
+            conn.execute(
+                f"INSERT OR IGNORE INTO {ARCHIVE_SCHEMA}.pupils_history ({cols}) "
+                f"SELECT {cols} FROM main.pupils_history WHERE {where}",
+                (before_year,),
+            )
+        archived = f"id IN (SELECT id FROM {ARCHIVE_SCHEMA}.pupils_history)"
+        with self._transaction():
+            ids = [r[0] for r in conn.execute(f"SELECT id FROM main.pupils_history WHERE {archived}")]
+            if ids:
+                conn.execute(f"DELETE FROM main.pupils_history WHERE {archived}")
+        if ids:
+            self._notify("pupils_history", ids)
+        return len(ids)
+
+    @_retry_on_busy
+    def archive_move_analysis_period(self, result_column: str) -> int:
+        """
+        Перенести результаты закрытого периода (колонка result_* таблицы analysis) в архивный файл:
+        в analysis_results по строке на результат, уровень — названием (архив не зависит от
+        дальнейших правок справочника). Колонка удаляется из analysis, строки без других
+        результатов — тоже. Возвращает число перенесённых результатов.
+        """
+        result_cols = self.analysis_result_columns()
+        if result_column not in result_cols:
+            raise ValueError(f"В таблице analysis нет колонки {result_column}.")
+        conn, _ = self._tier_conn(create=True)
+        keys = ", ".join(ANALYSIS_KEY_COLUMNS)
+        no_other = "".join(f" AND {c} IS NULL" for c in result_cols if c != result_column)
+        # Как archive_move_history: сначала копия (ключ — id строки analysis и колонка), затем
+        # из основного файла убираются только результаты, уже лежащие в архиве
+        with self._transaction():
+            conn.execute(
+                f"INSERT OR IGNORE INTO {ARCHIVE_SCHEMA}.analysis_results (analysis_id, {keys}, result_column, value) "
+                f"SELECT id, {keys}, ?, (SELECT s.name FROM main.standards s WHERE s.id = a.{result_column}) "
+                f"FROM main.analysis a WHERE {result_column} IS NOT NULL ORDER BY id",
+                (result_column,),
+            )
+        archived = (
+            f"{result_column} IS NOT NULL AND id IN "
+            f"(SELECT analysis_id FROM {ARCHIVE_SCHEMA}.analysis_results WHERE result_column = ?)"
         )
+        with self._transaction():
+            moved = conn.execute(f"SELECT COUNT(*) FROM main.analysis WHERE {archived}", (result_column,)).fetchone()[0]
+            conn.execute(f"DELETE FROM main.analysis WHERE {archived}{no_other}", (result_column,))
+            conn.execute(f"UPDATE main.analysis SET {result_column} = NULL WHERE {archived}", (result_column,))
+            left = conn.execute(f"SELECT 1 FROM main.analysis WHERE {result_column} IS NOT NULL LIMIT 1").fetchone()
+            if left is None:
+                try:
+                    conn.execute(f"ALTER TABLE main.analysis DROP COLUMN {result_column}")
+                except sqlite3.OperationalError:
+                    pass  # SQLite до 3.35 не умеет DROP COLUMN — колонка остаётся пустой
+        return moved
+
+    def archive_stats(self) -> dict[str, int]:
+        """
+        Размеры и содержимое уровней: hot_bytes / archive_bytes — размеры файлов (0 — архива нет),
+        history / history_archived — записи pupils_history, analysis_archived — результаты в архиве.
+        """
+        conn, tiered = self._tier_conn()
+        stats = {
+            "hot_bytes": self._path.stat().st_size if self._path.exists() else 0,
+            "archive_bytes": self.archive_path.stat().st_size if self.archive_path.exists() else 0,
+            "history": conn.execute("SELECT COUNT(*) FROM main.pupils_history").fetchone()[0],
+            "history_archived": 0,
+            "analysis_archived": 0,
+        }
+        if tiered:
+            stats["history_archived"] = conn.execute(
+                f"SELECT COUNT(*) FROM {ARCHIVE_SCHEMA}.pupils_history").fetchone()[0]
+            stats["analysis_archived"] = conn.execute(
+                f"SELECT COUNT(*) FROM {ARCHIVE_SCHEMA}.analysis_results").fetchone()[0]
+        return stats
+
+    def archive_backup_to(self, dest_path: str | Path) -> bool:
+        """Резервная копия архивного файла (как backup_to). False — архивного файла нет."""
+        conn, tiered = self._tier_conn()
+        if not tiered:
+            return False
+        dest = Path(dest_path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest_conn = sqlite3.connect(dest)
+        try:
+            conn.backup(dest_conn, name=ARCHIVE_SCHEMA)
+            dest_conn.commit()
+        finally:
+            dest_conn.close()
+        return True
+
+    @_retry_on_busy
+    def compact(self) -> None:
+        """VACUUM файла БД: место удалённых строк (например, после переноса в архив) возвращается диску."""
+        conn = self._get_conn()
         conn.commit()
-        return cur.lastrowid
+        conn.execute("VACUUM main")
 
-    def pupils_history_get_all(self) -> list[sqlite3.Row]:
-        """Все записи архива."""
+    # --- query_presets ---
+    def query_presets_get_all(self) -> list[sqlite3.Row]:
+        """Сохранённые выборки (без кэша результата)."""
         return self._get_conn().execute(
-            "SELECT * FROM pupils_history ORDER BY transfer_date DESC, surname, name"
+            "SELECT id, name, params FROM query_presets ORDER BY name"
         ).fetchall()
 
+    def query_presets_get(self, id: int) -> Optional[dict[str, Any]]:
+        """Выборка по id: {id, name, params (dict), result (dict или None), result_version}."""
+        row = self._get_conn().execute(
+            "SELECT id, name, params, result, result_version FROM query_presets WHERE id = ?", (id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "name": row["name"],
+            "params": json.loads(row["params"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "result_version": row["result_version"],
+        }
+
+    @_retry_on_busy
+    def query_presets_save(self, name: str, params: dict[str, Any]) -> int:
+        """Сохранить выборку под именем (существующая с тем же именем перезаписывается, кэш сбрасывается). Возвращает id."""
+        name = name.strip()
+        if not name:
+            raise ValueError("Имя выборки не указано.")
+        with self._transaction() as conn:
+            conn.execute(
+                """INSERT INTO query_presets (name, params, result, result_version) VALUES (?, ?, NULL, NULL)
+                   ON CONFLICT(name) DO UPDATE SET params = excluded.params, result = NULL, result_version = NULL""",
+                (name, json.dumps(params, ensure_ascii=False)),
+            )
+            return conn.execute("SELECT id FROM query_presets WHERE name = ?", (name,)).fetchone()["id"]
+
+    @_retry_on_busy
+    def query_presets_store_result(self, id: int, result_version: str, result: dict[str, Any]) -> None:
+        """Запомнить результат выборки и ключ версии данных, на которых он получен."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE query_presets SET result = ?, result_version = ? WHERE id = ?",
+                (json.dumps(result, ensure_ascii=False, separators=(",", ":")), result_version, id),
+            )
+
+    @_retry_on_busy
+    def query_presets_delete(self, id: int) -> None:
+        """Удалить сохранённую выборку."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM query_presets WHERE id = ?", (id,))
+
     # --- settings ---
     def settings_get(self, key: str) -> Optional[str]:
         """Значение настройки по ключу."""
@@ -537,13 +1960,14 @@ class Database:
         ).fetchone()
         return row["value"] if row else None
 
+    @_retry_on_busy
     def settings_set(self, key: str, value: str) -> None:
         """Записать настройку (ключ — значение)."""
-        self._get_conn().execute(
-            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
-            (key, value),
-        )
-        self._get_conn().commit()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                (key, value),
+            )
 
     def settings_get_all(self) -> list[sqlite3.Row]:
         """Все настройки (ключ, значение)."""
@@ -552,11 +1976,9 @@ class Database:
         ).fetchall()
 
     # --- analysis (динамические поля результатов) ---
-    def analysis_ensure_result_column(self, school_year: str, period: str) -> str:
-        """
-        Гарантирует наличие колонки результата для заданного учебного года и периода.
-        Возвращает имя колонки (для дальнейших INSERT/UPDATE).
-        """
+    @staticmethod
+    def analysis_result_column_name(school_year: str, period: str) -> str:
+        """Имя колонки результата analysis для учебного года и периода: result_I_2025_2026."""
         school_year = (school_year or "").strip()
         period = (period or "").strip()
         if not school_year or not period:
@@ -571,16 +1993,24 @@ class Database:
 
         # Формируем безопасное имя колонки
         base = f"result_{period_key}_{school_year.replace('-', '_')}"
-        column_name = "".join(ch if (ch.isalnum() or ch == "_") else "_" for ch in base)
+        return "".join(ch if (ch.isalnum() or ch == "_") else "_" for ch in base)
 
-        conn = self._get_conn()
-        info = conn.execute("PRAGMA table_info(analysis)").fetchall()
-        names = [row[1] for row in info]
-        if column_name not in names:
-            conn.execute(f"ALTER TABLE analysis ADD COLUMN {column_name} TEXT")
-            conn.commit()
+    @_retry_on_busy
+    def analysis_ensure_result_column(self, school_year: str, period: str) -> str:
+        """
+        Гарантирует наличие колонки результата для заданного учебного года и периода.
+        Возвращает имя колонки (для дальнейших INSERT/UPDATE).
+        """
+        column_name = self.analysis_result_column_name(school_year, period)
+
+        with self._transaction() as conn:
+            info = conn.execute("PRAGMA table_info(analysis)").fetchall()
+            names = [row[1] for row in info]
+            if column_name not in names:
+                conn.execute(f"ALTER TABLE analysis ADD COLUMN {column_name} INTEGER")
         return column_name
 
+    @_retry_on_busy
     def analysis_insert_row(
         self,
         class_number: str,
@@ -594,28 +2024,139 @@ class Database:
     ) -> int:
         """
         Вставляет одну запись в таблицу analysis с указанным столбцом результата.
-        result_column должен быть получен из analysis_ensure_result_column.
+        result_column должен быть получен из analysis_ensure_result_column; result_value —
+        название или код уровня (сохраняется id из standards; нет в справочнике — UnknownLevelsError).
         """
-        conn = self._get_conn()
         sql = (
             f"INSERT INTO analysis (class_number, surname, name, patronymic, specialist, criterion, {result_column}) "
             "VALUES (?, ?, ?, ?, ?, ?, ?)"
         )
-        cur = conn.execute(
-            sql,
-            (
-                class_number.strip(),
-                surname.strip(),
-                name.strip(),
-                (patronymic or "").strip(),
-                specialist.strip(),
-                criterion.strip(),
-                (result_value or "").strip(),
-            ),
-        )
-        conn.commit()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                sql,
+                (
+                    class_number.strip(),
+                    surname.strip(),
+                    name.strip(),
+                    (patronymic or "").strip(),
+                    specialist.strip(),
+                    criterion.strip(),
+                    self._level_id(self._level_id_map(), result_value),
+                ),
+            )
         return cur.lastrowid
 
+    def analysis_get_class_results(
+        self, class_number: str, specialist: str, result_column: str
+    ) -> dict[tuple[str, str, str, str], str]:
+        """
+        Результаты класса у специалиста за период (колонка result_column):
+        {(фамилия, имя, отчество, критерий): название уровня}. Колонки ещё нет — пустой словарь.
+        """
+        if result_column not in self.analysis_result_columns():
+            return {}
+        cur = self._get_conn().execute(
+            f"SELECT a.surname, a.name, a.patronymic, a.criterion, s.name FROM analysis a "
+            f"JOIN standards s ON s.id = a.{result_column} "
+            f"WHERE a.class_number = ? AND a.specialist = ? ORDER BY a.id",
+            ((class_number or "").strip(), (specialist or "").strip()),
+        )
+        return {(r[0], r[1], r[2] or "", r[3]): r[4] for r in cur}
+
+    @_retry_on_busy
+    def analysis_upsert_results(
+        self,
+        class_number: str,
+        specialist: str,
+        result_column: str,
+        results: Iterable[tuple[str, str, str, str, str]],
+    ) -> int:
+        """
+        Сохранить результаты класса за период одной транзакцией. results — (фамилия, имя, отчество,
+        критерий, название или код уровня): имеющийся результат за период заменяется, нового — добавляется
+        строка, пустое значение удаляет результат; уровня нет в справочнике — UnknownLevelsError.
+        result_column — из analysis_ensure_result_column.
+        Возвращает число изменённых результатов.
+        """
+        if result_column not in self.analysis_result_columns():
+            raise ValueError(f"В таблице analysis нет колонки {result_column}.")
+        class_number = (class_number or "").strip()
+        specialist = (specialist or "").strip()
+        key = "class_number = ? AND specialist = ? AND surname = ? AND name = ? AND patronymic = ? AND criterion = ?"
+        no_result = " AND ".join(f"{c} IS NULL" for c in self.analysis_result_columns())
+        changed = 0
+        with self._transaction() as conn:
+            levels = self._level_id_map()
+            for surname, name, patronymic, criterion, value in results:
+                params = (class_number, specialist, (surname or "").strip(), (name or "").strip(),
+                          (patronymic or "").strip(), (criterion or "").strip())
+                value = self._level_id(levels, value)
+                cur = conn.execute(
+                    f"UPDATE analysis SET {result_column} = ? "
+                    f"WHERE {key} AND {result_column} IS NOT NULL AND {result_column} IS NOT ?",
+                    (value, *params, value),
+                )
+                changed += cur.rowcount
+                if value is None:
+                    continue
+                exists = conn.execute(
+                    f"SELECT 1 FROM analysis WHERE {key} AND {result_column} IS NOT NULL LIMIT 1", params
+                ).fetchone()
+                if exists is None:
+                    conn.execute(
+                        f"INSERT INTO analysis (class_number, specialist, surname, name, patronymic, criterion, "
+                        f"{result_column}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (*params, value),
+                    )
+                    changed += 1
+            # Строки, у которых после очистки не осталось ни одного результата
+            conn.execute(f"DELETE FROM analysis WHERE class_number = ? AND specialist = ? AND {no_result}",
+                         (class_number, specialist))
+        return changed
+
+    def analysis_result_columns(self) -> list[str]:
+        """Колонки результатов таблицы analysis (result_*) в файле БД, в порядке добавления."""
+        info = self._get_conn().execute("PRAGMA main.table_info(analysis)").fetchall()
+        return [row[1] for row in info if isinstance(row[1], str) and row[1].startswith("result_")]
+
+    def _analysis_union(self, keys: str, where: str, params: tuple) -> tuple[list[str], str, list]:
+        """
+        (колонки результатов, SQL, параметры): SELECT keys и колонок результатов по analysis
+        и analysis_results архивного файла одним UNION ALL. Закрытые периоды из архива идут первыми.
+        """
+        conn, tiered = self._tier_conn()
+        main_cols = self.analysis_result_columns()
+        archived = []
+        if tiered:
+            archived = [r[0] for r in conn.execute(
+                f"SELECT result_column FROM {ARCHIVE_SCHEMA}.analysis_results WHERE {where} "
+                "GROUP BY result_column ORDER BY MIN(id)",
+                params,
+            )]
+        result_cols = archived + [c for c in main_cols if c not in archived]
+        if not result_cols:
+            return [], "", []
+
+        # Строим SELECT с динамическими колонками: analysis и архив — одним UNION ALL
+        parts, args = [], []
+        if main_cols:
+            # В analysis — id уровней, в архиве — названия: наружу отдаются названия
+            cols_sql = ", ".join(
+                f"(SELECT s.name FROM main.standards s WHERE s.id = a.{c}) AS {c}" if c in main_cols else f"NULL AS {c}"
+                for c in result_cols
+            )
+            parts.append(f"SELECT {keys}, {cols_sql} FROM main.analysis a WHERE {where}")
+            args.extend(params)
+        if archived:
+            cols_sql = ", ".join(
+                f"CASE WHEN result_column = ? THEN value END AS {c}" if c in archived else f"NULL AS {c}"
+                for c in result_cols
+            )
+            parts.append(f"SELECT {keys}, {cols_sql} FROM {ARCHIVE_SCHEMA}.analysis_results WHERE {where}")
+            args.extend(c for c in result_cols if c in archived)
+            args.extend(params)
+        return result_cols, " UNION ALL ".join(parts), args
+
     def analysis_get_results_for_pupil(
         self,
         class_number: str,
@@ -626,29 +2167,157 @@ class Database:
     ) -> tuple[list[str], list[sqlite3.Row]]:
         """
         Возвращает (список имён колонок результатов, строки) для указанного ученика и специалиста.
-        Колонки результатов — все поля таблицы analysis, начинающиеся с 'result_'.
+        Колонки результатов — поля таблицы analysis, начинающиеся с 'result_', и закрытые периоды
+        из архивного файла (идут первыми; их строки — по одной на результат, как в analysis).
         """
-        conn = self._get_conn()
-        info = conn.execute("PRAGMA table_info(analysis)").fetchall()
-        result_cols = [row[1] for row in info if isinstance(row[1], str) and row[1].startswith("result_")]
+        where = "class_number = ? AND surname = ? AND name = ? AND patronymic = ? AND specialist = ?"
+        params = (
+            (class_number or "").strip(),
+            (surname or "").strip(),
+            (name or "").strip(),
+            (patronymic or "").strip(),
+            (specialist or "").strip(),
+        )
+        result_cols, sql, args = self._analysis_union("criterion", where, params)
         if not result_cols:
             return [], []
+        rows = self._get_conn().execute(sql + " ORDER BY criterion", args).fetchall()
+        return result_cols, rows
 
-        # Строим SELECT с динамическими колонками
-        cols_sql = ", ".join(result_cols)
-        sql = (
-            f"SELECT criterion, {cols_sql} FROM analysis "
-            "WHERE class_number = ? AND surname = ? AND name = ? AND patronymic = ? AND specialist = ? "
-            "ORDER BY criterion"
+    def analysis_get_class_report(self, class_number: str, specialist: str) -> tuple[list[str], list[tuple]]:
+        """
+        Результаты класса у специалиста за все периоды одним запросом: (колонки результатов
+        по порядку учебных лет и периодов, кортежи (фамилия, имя, отчество, критерий, результаты...)).
+        Строка — ученик и критерий; результаты периодов из разных строк analysis сведены в одну:
+        при нескольких результатах за период — наивысший уровень (по коду, как _level_sort_key).
+        """
+        keys = "surname, name, patronymic, criterion"
+        params = ((class_number or "").strip(), (specialist or "").strip())
+        result_cols, sql, args = self._analysis_union(keys, "class_number = ? AND specialist = ?", params)
+        if not result_cols:
+            return [], []
+        result_cols.sort(key=_result_column_order)
+        # Место уровня в шкале (1 — наименьший): MAX берётся по месту, затем место снова сводится
+        # к названию. Название, которого нет в справочнике (архив), — только если других нет
+        ranks = {}
+        ranked = sorted(self.standards_get_all(), key=lambda r: (_level_sort_key(r["code"]), r["id"]))
+        for n, r in enumerate(ranked, start=1):
+            ranks[r["name"]] = n
+        if ranks:
+            levels_sql = "VALUES " + ", ".join("(?, ?)" for _ in ranks)
+            level_args = [v for item in ranks.items() for v in item]
+        else:
+            levels_sql, level_args = "SELECT NULL, NULL WHERE 0", []
+        grouped = ", ".join(
+            f"MAX((SELECT rank FROM levels WHERE name = u.{c})) AS rank_{c}, MAX(u.{c}) AS text_{c}"
+            for c in result_cols
         )
-        rows = conn.execute(
-            sql,
-            (
-                (class_number or "").strip(),
-                (surname or "").strip(),
-                (name or "").strip(),
-                (patronymic or "").strip(),
-                (specialist or "").strip(),
-            ),
+        cols_sql = ", ".join(
+            f"COALESCE((SELECT name FROM levels WHERE rank = g.rank_{c}), g.text_{c})" for c in result_cols
+        )
+        cur = self._get_conn().cursor()
+        cur.row_factory = None
+        rows = cur.execute(
+            f"WITH levels(name, rank) AS ({levels_sql}) "
+            f"SELECT {keys}, {cols_sql} FROM ("
+            f"SELECT {keys}, {grouped} FROM ({sql}) u GROUP BY {keys}"
+            f") g ORDER BY {keys}",
+            level_args + args,
         ).fetchall()
         return result_cols, rows
+
+    def analysis_get_scores(
+        self,
+        class_numbers: Optional[Iterable[str]] = None,
+        specialist: Optional[str] = None,
+        grade: Optional[int] = None,
+    ) -> tuple[list[str], list[tuple]]:
+        """
+        Результаты «по строке на результат» для аналитики: (колонки периодов по порядку учебных лет,
+        кортежи (класс, фамилия, имя, отчество, специалист, критерий, колонка периода, уровень)).
+        class_numbers — классы (None — вся школа), grade — параллель (цифровая часть номера класса);
+        закрытые периоды — из архивного файла. Баллы уровней — level_scores(standards_get_all()).
+        """
+        conn, tiered = self._tier_conn()
+        where, params = "1", []
+        if class_numbers is not None:
+            numbers = [n.strip() for n in class_numbers]
+            if not numbers:
+                return [], []
+            where = f"a.class_number IN ({', '.join('?' * len(numbers))})"
+            params = numbers
+        if grade is not None:
+            where += " AND CAST(a.class_number AS INTEGER) = ?"
+            params = [*params, int(grade)]
+        if specialist:
+            where += " AND a.specialist = ?"
+            params = [*params, specialist.strip()]
+        keys = "a.class_number, a.surname, a.name, a.patronymic, a.specialist, a.criterion"
+        parts, args = [], []
+        result_cols = self.analysis_result_columns()
+        for col in result_cols:
+            parts.append(
+                f"SELECT {keys}, ? AS result_column, s.name AS level "
+                f"FROM main.analysis a JOIN main.standards s ON s.id = a.{col} WHERE {where}"
+            )
+            args += [col, *params]
+        if tiered:
+            archived = [r[0] for r in conn.execute(
+                f"SELECT DISTINCT result_column FROM {ARCHIVE_SCHEMA}.analysis_results"
+            )]
+            result_cols += [c for c in archived if c not in result_cols]
+            parts.append(
+                f"SELECT {keys}, a.result_column, a.value "
+                f"FROM {ARCHIVE_SCHEMA}.analysis_results a WHERE {where} AND a.value IS NOT NULL"
+            )
+            args += params
+        if not parts:
+            return [], []
+        cur = conn.cursor()
+        cur.row_factory = None
+        rows = cur.execute(" UNION ALL ".join(parts), args).fetchall()
+        return sorted(result_cols, key=_result_column_order), rows
+
+    def analysis_level_shares(
+        self, class_number: str, specialist: Optional[str] = None, criterion: Optional[str] = None
+    ) -> list[tuple[str, str, str, int, float]]:
+        """
+        Распределение результатов класса по уровням за каждый период: (колонка периода, уровень, код,
+        число результатов, доля от результатов периода). Считается в SQL по индексу класса
+        и специалиста; закрытые периоды — из архивного файла. Порядок — по периодам, затем по коду.
+        """
+        conn, tiered = self._tier_conn()
+        where, params = "a.class_number = ?", [(class_number or "").strip()]
+        if specialist:
+            where += " AND a.specialist = ?"
+            params.append(specialist.strip())
+        if criterion:
+            where += " AND a.criterion = ?"
+            params.append(criterion.strip())
+        parts, args = [], []
+        for col in self.analysis_result_columns():
+            parts.append(
+                f"SELECT ? AS result_column, s.name AS level, s.code AS code, COUNT(*) AS n "
+                f"FROM main.analysis a JOIN main.standards s ON s.id = a.{col} WHERE {where} GROUP BY s.id"
+            )
+            args += [col, *params]
+        if tiered:
+            parts.append(
+                f"SELECT a.result_column AS result_column, a.value AS level, s.code AS code, COUNT(*) AS n "
+                f"FROM {ARCHIVE_SCHEMA}.analysis_results a "
+                f"LEFT JOIN main.standards s ON s.id = (SELECT MIN(id) FROM main.standards WHERE name = a.value) "
+                f"WHERE {where} AND a.value IS NOT NULL GROUP BY a.result_column, a.value"
+            )
+            args += params
+        if not parts:
+            return []
+        rows = conn.execute(
+            f"SELECT result_column, level, code, SUM(n), "
+            f"SUM(n) * 1.0 / SUM(SUM(n)) OVER (PARTITION BY result_column) "
+            f"FROM ({' UNION ALL '.join(parts)}) GROUP BY result_column, level",
+            args,
+        ).fetchall()
+        return sorted(
+            (tuple(r) for r in rows),
+            key=lambda r: (_result_column_order(r[0]), _level_sort_key(r[2]), r[1]),
+        )
@@ -0,0 +1,337 @@
+"""
+Сервер БД SvedUch: методы db.Database по HTTP/JSON для работы многих пользователей
+без общего файла sveduch.db в сетевой папке. Сервер владеет единственным соединением записи
+(все записи выполняются по очереди в одном потоке) и пулом соединений только для чтения.
+Клиент — remote_db.RemoteDatabase (в программе: SVEDUCH_SERVER=http://хост:порт).
+
+Запуск:
+    python db_server.py --db sveduch.db --host 0.0.0.0 --port 8765 --token s3cr3t-token
+Адрес, доступный из сети (не localhost/127.0.0.1), без --token не запускается.
+
+Протокол (тело и ответ — JSON, значения кодируются remote_db.encode):
+    GET  /ping    -> {"version", "path", "journal_mode", "methods": {имя: пишет ли}}
+    POST /call    {"method", "args", "kwargs"} -> {"result", "changes": [[таблица, ids|null]]}
+    POST /batch   {"calls": [{"method", "args", "kwargs"}, ...]} -> {"results", "changes"}
+                  (все вызовы — одной транзакцией записи)
+    GET  /backup  -> файл согласованной копии БД
+Ошибка: HTTP 400/403/413/500 и {"error": {"type", "message"}}; тело запроса — не больше MAX_BODY_BYTES.
+"""
+import argparse
+import hmac
+import inspect
+import ipaddress
+import json
+import logging
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+from db import Database, DEFAULT_DB_PATH, UnknownLevelsError
+from remote_db import TOKEN_HEADER, decode, encode
+from version import __version__
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Соединений только для чтения (потоков чтения)
+DEFAULT_READERS = 4
+# Наибольшее тело запроса: пакет из тысяч учеников занимает единицы МБ
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+logger = logging.getLogger("sveduch.server")
+
+# Методы Database, которые не вызываются удалённо (управление соединениями и локальные файлы)
+_LOCAL_ONLY = {
+    "close", "reader", "snapshot", "batch", "backup_to", "archive_backup_to", "add_change_listener", "remove_change_listener",
+    "enable_profiling", "disable_profiling",
+}
+# Методы чтения, которые отвечают про соединение записи, а не про читателя
+_WRITER_STATE = {"lock_stats"}
+
+
+def is_loopback(host: str) -> bool:
+    """Адрес доступен только с этого компьютера (localhost, 127.x.x.x, ::1)."""
+    if host.strip().lower() == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False  # имя хоста: может указывать на сетевой адрес
+
+
+def remote_methods() -> dict[str, bool]:
+    """Публичные методы Database, доступные клиенту: имя -> пишет ли (выполняется в потоке записи)."""
+    methods = {}
+    for name, member in inspect.getmembers(Database, inspect.isfunction):
+        if name.startswith("_") or name in _LOCAL_ONLY:
+            continue
+        methods[name] = bool(getattr(member, "writes_data", False))
+    return methods
+
+
+class _ApiError(Exception):
+    def __init__(self, status: int, error_type: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+
+
+class DatabaseServer:
+    """HTTP-сервер над Database: один поток записи, пул потоков чтения."""
+
+    def __init__(self, db_path: str | Path, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 token: Optional[str] = None, readers: int = DEFAULT_READERS, slow_ms: Optional[float] = None,
+                 add_unknown_levels: bool = False):
+        if not token and not is_loopback(host):
+            # Без токена любой в сети мог бы писать в БД и скачать /backup с личными данными учеников
+            raise ValueError(f"Адрес {host} доступен из сети: укажите токен доступа (--token).")
+        if token and not token.isascii():
+            raise ValueError("Токен передаётся в заголовке HTTP: используйте латиницу, цифры и знаки ASCII.")
+        self.db = Database(db_path)
+        try:
+            self._create_tables(add_unknown_levels)
+        except BaseException:
+            self.db.close()
+            raise
+        if slow_ms is not None:
+            self.db.enable_profiling(slow_ms)
+        self.token = token
+        self.methods = remote_methods()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sveduch-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="sveduch-reader")
+        self._capture = threading.local()
+        self.db.add_change_listener(self._on_change)
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    def _create_tables(self, add_unknown_levels: bool) -> None:
+        """
+        create_tables() при запуске. Значения старых результатов анализа, которых нет в справочнике
+        «Уровни», добавляются уровнями без кода только с add_unknown_levels (как ответ «Да» в программе);
+        иначе UnknownLevelsError — база не меняется.
+        """
+        try:
+            self.db.create_tables()
+        except UnknownLevelsError as e:
+            if not add_unknown_levels:
+                raise
+            logger.warning("Добавлены уровни без кода: %s", ", ".join(e.values))
+            for value in e.values:
+                self.db.standards_add(value, "")
+            self.db.create_tables()
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _on_change(self, table: str, ids: Optional[frozenset]) -> None:
+        changes = getattr(self._capture, "changes", None)
+        if changes is not None:
+            changes.append([table, sorted(ids) if ids is not None else None])
+
+    # --- выполнение вызовов ---
+
+    def _check_method(self, name) -> bool:
+        if not isinstance(name, str) or name not in self.methods:
+            raise _ApiError(400, "AttributeError", f"Неизвестный метод: {name!r}")
+        return self.methods[name]
+
+    def _write(self, fn):
+        """Выполнить fn() в потоке записи; вернуть (результат, изменения)."""
+        def run():
+            self._capture.changes = changes = []
+            try:
+                return fn(), changes
+            finally:
+                self._capture.changes = None
+        return self._writer.submit(run).result()
+
+    def call(self, name: str, args: list, kwargs: dict) -> dict:
+        writes = self._check_method(name)
+        if writes:
+            result, changes = self._write(lambda: getattr(self.db, name)(*args, **kwargs))
+        elif name in _WRITER_STATE:
+            result, changes = getattr(self.db, name)(*args, **kwargs), []
+        else:
+            result, changes = self._readers.submit(lambda: getattr(self.db.reader(), name)(*args, **kwargs)).result(), []
+        return {"result": encode(result), "changes": changes}
+
+    def batch(self, calls: list) -> dict:
+        parsed = []
+        for c in calls:
+            self._check_method(c.get("method"))
+            parsed.append((c["method"], decode(c.get("args") or []), decode(c.get("kwargs") or {})))
+
+        def run_all():
+            with self.db.batch():
+                return [getattr(self.db, name)(*args, **kwargs) for name, args, kwargs in parsed]
+
+        results, changes = self._write(lambda: self.db._call_with_retry(run_all))
+        return {"results": encode(results), "changes": changes}
+
+    def backup_bytes(self) -> bytes:
+        with tempfile.TemporaryDirectory(prefix="sveduch_backup_") as tmp:
+            path = Path(tmp) / "backup.db"
+            self._readers.submit(lambda: self.db.reader().backup_to(path)).result()
+            return path.read_bytes()
+
+    def ping(self) -> dict:
+        return {
+            "version": __version__,
+            "path": str(self.db.path),
+            "journal_mode": self.db.journal_mode,
+            "methods": self.methods,
+        }
+
+    # --- HTTP ---
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive: клиент держит соединение
+
+            def log_message(self, fmt, *args):
+                logger.debug("%s " + fmt, self.address_string(), *args)
+
+            def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, status: int, payload: dict) -> None:
+                self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+            def _authorized(self) -> bool:
+                if not server.token:
+                    return True
+                return hmac.compare_digest(self.headers.get(TOKEN_HEADER, "").encode("utf-8"), server.token.encode("utf-8"))
+
+            def _handle(self, fn) -> None:
+                if not self._authorized():
+                    self._send_json(403, {"error": {"type": "PermissionError", "message": "Неверный токен"}})
+                    return
+                try:
+                    result = fn()
+                except _ApiError as e:
+                    self._send_json(e.status, {"error": {"type": e.error_type, "message": str(e)}})
+                    return
+                except (sqlite3.Error, ValueError, KeyError, TypeError) as e:
+                    error = {"type": type(e).__name__, "message": str(e)}
+                    if isinstance(e, UnknownLevelsError):
+                        error["values"] = e.values
+                    self._send_json(400, {"error": error})
+                    return
+                except Exception as e:
+                    logger.exception("Ошибка обработки %s", self.path)
+                    self._send_json(500, {"error": {"type": type(e).__name__, "message": str(e)}})
+                    return
+                if isinstance(result, bytes):
+                    self._send(200, result, "application/octet-stream")
+                else:
+                    self._send_json(200, result)
+
+            def _body(self) -> dict:
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                except ValueError:
+                    raise _ApiError(400, "ValueError", "Неверный Content-Length") from None
+                if length < 0 or length > MAX_BODY_BYTES:
+                    self.close_connection = True  # тело не читается — соединение дальше не годится
+                    raise _ApiError(413, "ValueError", f"Тело запроса больше {MAX_BODY_BYTES // (1024 * 1024)} МБ")
+                try:
+                    return json.loads(self.rfile.read(length).decode("utf-8")) if length else {}
+                except ValueError:
+                    raise _ApiError(400, "ValueError", "Тело запроса — не JSON") from None
+
+            def do_GET(self):
+                if self.path == "/ping":
+                    self._handle(server.ping)
+                elif self.path == "/backup":
+                    self._handle(server.backup_bytes)
+                else:
+                    self._send_json(404, {"error": {"type": "NotFound", "message": self.path}})
+
+            def do_POST(self):
+                if self.path == "/call":
+                    def run():
+                        body = self._body()
+                        return server.call(body.get("method"), decode(body.get("args") or []),
+                                           decode(body.get("kwargs") or {}))
+                    self._handle(run)
+                elif self.path == "/batch":
+                    self._handle(lambda: server.batch(self._body().get("calls") or []))
+                else:
+                    self._send_json(404, {"error": {"type": "NotFound", "message": self.path}})
+
+        return Handler
+
+    # --- запуск и остановка ---
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def start(self) -> "DatabaseServer":
+        """Запустить в фоновом потоке (для проверки на localhost: port=0 — свободный порт)."""
+        self._thread = threading.Thread(target=self.serve_forever, name="sveduch-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._writer.shutdown()
+        self._readers.shutdown()
+        self.db.close()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Сервер БД SvedUch (HTTP/JSON).")
+    parser.add_argument("--db", default=str(DEFAULT_DB_PATH), help="Файл БД (по умолчанию sveduch.db программы)")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Адрес (0.0.0.0 — доступ из сети)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--token", help="Токен доступа (ASCII); клиенты передают его в SVEDUCH_TOKEN")
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS, help="Соединений только для чтения")
+    parser.add_argument("--slow-ms", type=float, help="Включить профилирование SQL с таким порогом медленного запроса")
+    parser.add_argument("--add-unknown-levels", action="store_true",
+                        help="Значения старых результатов анализа, которых нет в справочнике «Уровни», "
+                             "добавить уровнями без кода")
+    args = parser.parse_args(argv)
+
+    if not args.token and not is_loopback(args.host):
+        parser.error(f"--host {args.host} открывает БД для сети: без --token запуск запрещён")
+    if args.token and not args.token.isascii():
+        parser.error("--token: только латиница, цифры и знаки ASCII (токен передаётся в заголовке HTTP)")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if not is_loopback(args.host):
+        logger.warning("Сервер доступен из сети по HTTP без шифрования: токен и данные учеников "
+                       "передаются открыто — запускайте его только во внутренней сети школы")
+    try:
+        server = DatabaseServer(args.db, args.host, args.port, args.token, args.readers, args.slow_ms,
+                                args.add_unknown_levels)
+    except UnknownLevelsError as e:
+        parser.exit(1, (
+            f"{parser.prog}: результаты анализа в {args.db} не переведены на справочник «Уровни» — "
+            f"значений нет ни среди названий, ни среди кодов уровней:\n  {', '.join(e.values)}\n"
+            "База не изменена. Добавьте эти уровни в справочник (в программе без сервера) "
+            "или запустите сервер с --add-unknown-levels, чтобы добавить их уровнями без кода.\n"
+        ))
+    logger.info("SvedUch %s: сервер БД %s на %s", __version__, server.db.path, server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Загрузка учеников из Excel (п. 9 PROJECT.md): разбор листа с графами EXCEL_LOAD_COLUMNS
+и пакетная загрузка — папка с файлами или книга с листами, класс определяется по имени файла/листа.
+Книги разбираются параллельно в процессах (ProcessPoolExecutor): openpyxl нагружает процессор,
+а потоки Python не дали бы выигрыша. Запись в БД — в вызывающем коде, одной транзакцией.
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+# Ожидаемые графы для загрузки из Excel (п. 9 PROJECT.md)
+EXCEL_LOAD_COLUMNS = ["Фамилия", "Имя", "Отчество", "Дата рождения", "Домашний адрес", "Пол"]
+
+EXCEL_SUFFIXES = (".xlsx", ".xlsm")
+
+# Класс в имени файла/листа — цифра с буквой: «5А», «5 а», «10-Б», «Список 7В» (не «10-й»: Й, Ъ, Ы, Ь
+# в литерах не бывает); латинские буквы-двойники — как кириллица
+_CLASS_RE = re.compile(r"(?<!\d)(\d{1,2})\s*[-–—]?\s*([A-Za-zА-ИК-ЩЭ-Яа-ик-щэ-яЁё])(?![A-Za-zА-Яа-яЁё])")
+# Или параллель со словом «класс»: «5 класс», «класс 5»
+_GRADE_RE = re.compile(r"(?<!\d)(\d{1,2})(?!\d)\s*[-–—]?\s*(?:й\s*)?класс|класс\s*(\d{1,2})(?!\d)", re.IGNORECASE)
+_LATIN_TO_CYRILLIC = str.maketrans("ABCEHKMOPTX", "АВСЕНКМОРТХ")
+
+
+def class_from_name(name: str) -> Optional[str]:
+    """
+    Номер класса из имени файла или листа («5а класс» -> «5А», «5 класс» -> «5»); None — в имени
+    нет ни цифры с буквой, ни слова «класс» (имена по умолчанию «Лист1», «Sheet1» — тоже None).
+    """
+    m = _CLASS_RE.search(name or "")
+    if m:
+        return f"{int(m.group(1))}{m.group(2).upper().translate(_LATIN_TO_CYRILLIC)}"
+    m = _GRADE_RE.search(name or "")
+    if m:
+        return str(int(m.group(1) or m.group(2)))
+    return None
+
+
+def _normalize_date(val) -> str:
+    """Приводит дату к формату дд.мм.гггг. val может быть строкой, числом (Excel) или datetime."""
+    if val is None:
+        return ""
+    # openpyxl data_only может вернуть datetime — сразу в нужный формат
+    if isinstance(val, datetime):
+        return val.strftime("%d.%m.%Y")
+    s = str(val).strip()
+    if not s:
+        return ""
+    # Excel: число дней от 1899-12-30
+    try:
+        n = float(s)
+        if 1000 < n < 100000:
+            d = datetime(1899, 12, 30) + timedelta(days=int(n))
+            return d.strftime("%d.%m.%Y")
+    except (ValueError, TypeError):
+        pass
+    # Строка в формате гггг-мм-дд или гггг-мм-дд чч:мм:сс
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+        try:
+            d = datetime.strptime(s[:19] if len(s) > 10 else s, fmt)
+            return d.strftime("%d.%m.%Y")
+        except ValueError:
+            continue
+    # Уже дд.мм.гггг или другой формат — не трогать
+    return s
+
+
+def read_pupils_from_rows(rows: list) -> tuple[list[dict], list[str]]:
+    """
+    Разбор строк листа (первая — заголовки): (словари surname, name, patronymic, birth_date,
+    address, gender; сообщения об ошибках по строкам). Нет обязательных граф — ValueError.
+    """
+    if not rows:
+        raise ValueError("Файл не содержит данных.")
+
+    header_row = [str(c).strip() if c is not None else "" for c in rows[0]]
+    col_index = {}
+    missing = []
+    for col_name in EXCEL_LOAD_COLUMNS:
+        try:
+            idx = header_row.index(col_name)
+            col_index[col_name] = idx
+        except ValueError:
+            missing.append(col_name)
+    if missing:
+        raise ValueError(
+            f"В файле отсутствуют обязательные графы: {', '.join(missing)}. "
+            f"Ожидаются: {', '.join(EXCEL_LOAD_COLUMNS)}."
+        )
+
+    def _cell(row, col_name):
+        idx = col_index[col_name]
+        if idx >= len(row):
+            return ""
+        v = row[idx]
+        if v is None:
+            return ""
+        return str(v).strip()
+
+    result = []
+    errors = []
+    for i, row in enumerate(rows[1:], start=2):
+        row = list(row) if row else []
+        surname = _cell(row, "Фамилия")
+        name = _cell(row, "Имя")
+        if not surname and not name and not _cell(row, "Отчество"):
+            continue
+        if not surname or not name:
+            errors.append(f"Строка {i}: не заполнены Фамилия или Имя.")
+            continue
+        result.append({
+            "surname": surname,
+            "name": name,
+            "patronymic": _cell(row, "Отчество"),
+            "birth_date": _normalize_date(_cell(row, "Дата рождения")),
+            "address": _cell(row, "Домашний адрес"),
+            "gender": _cell(row, "Пол"),
+        })
+    return result, errors
+
+
+def _open_workbook(path: str):
+    import openpyxl
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        return openpyxl.load_workbook(path, read_only=True, data_only=True)
+    except InvalidFileException as e:
+        raise ValueError(f"Неверный формат файла или файл не Excel: {e}")
+    except Exception as e:
+        raise ValueError(f"Ошибка открытия файла: {e}")
+
+
+def read_pupils_from_excel(path: str, sheet: Optional[str] = None) -> tuple[list[dict], list[str]]:
+    """
+    Читает из файла Excel таблицу с графами Фамилия, Имя, Отчество, Дата рождения, Домашний адрес, Пол
+    (лист sheet, по умолчанию — активный). Возвращает (список словарей с ключами surname, name,
+    patronymic, birth_date, address, gender; список сообщений об ошибках по строкам).
+    При ошибке формата файла или отсутствии обязательных граф выбрасывает ValueError.
+    """
+    wb = _open_workbook(path)
+    try:
+        ws = wb[sheet] if sheet is not None else wb.active
+        if ws is None:
+            raise ValueError("В книге нет активного листа.")
+        rows = list(ws.iter_rows(values_only=True))
+    finally:
+        wb.close()
+    return read_pupils_from_rows(rows)
+
+
+def workbook_sheets(path: str) -> list[str]:
+    """Имена листов книги (ValueError — файл не открывается)."""
+    wb = _open_workbook(path)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def _parse_source(task: tuple[str, Optional[str]]) -> tuple[list[dict], list[str], Optional[str]]:
+    """Разбор одного листа в процессе пула: (строки, ошибки по строкам, ошибка листа целиком)."""
+    path, sheet = task
+    try:
+        rows, errors = read_pupils_from_excel(path, sheet)
+    except ValueError as e:
+        return [], [], str(e)
+    return rows, errors, None
+
+
+class ImportSource:
+    """Файл или лист пакетной загрузки: класс по имени, разобранные строки и ошибки."""
+
+    def __init__(self, path: str, sheet: Optional[str] = None, class_number: Optional[str] = None):
+        self.path = path
+        self.sheet = sheet
+        self.label = f"{Path(path).name} / {sheet}" if sheet is not None else Path(path).name
+        self.class_number = class_number or class_from_name(sheet if sheet is not None else Path(path).stem)
+        self.rows: list[dict] = []
+        self.errors: list[str] = []
+        self.failure: Optional[str] = None
+
+    def report_lines(self) -> list[str]:
+        """Строки сводного отчёта об ошибках для этого источника."""
+        if self.failure:
+            return [f"{self.label}: {self.failure}"]
+        return [f"{self.label}: {e}" for e in self.errors]
+
+
+def folder_sources(folder: str) -> list[ImportSource]:
+    """Файлы Excel папки (активный лист каждого), класс — по имени файла."""
+    names = sorted(
+        n for n in os.listdir(folder)
+        if n.lower().endswith(EXCEL_SUFFIXES) and not n.startswith("~$")
+    )
+    return [ImportSource(os.path.join(folder, n)) for n in names]
+
+
+def workbook_sources(path: str) -> list[ImportSource]:
+    """Листы книги, класс — по имени листа."""
+    return [ImportSource(path, sheet) for sheet in workbook_sheets(path)]
+
+
+def parse_sources(
+    sources: Iterable[ImportSource],
+    max_workers: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> list[ImportSource]:
+    """
+    Разобрать источники с известным классом; один источник — в текущем процессе,
+    несколько — параллельно в пуле процессов (по процессу на ядро).
+    Источник без номера класса получает ошибку и не разбирается.
+    progress(готово, всего) вызывается после каждого разобранного источника (в потоке вызова).
+    """
+    sources = list(sources)
+    todo = []
+    for source in sources:
+        if source.class_number is None:
+            source.failure = "класс не указан: в имени нет номера класса (например, «5А»)."
+        else:
+            todo.append(source)
+
+    def finished():
+        if len(todo) > 1:
+            workers = min(len(todo), max_workers or os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(_parse_source, (s.path, s.sheet)): s for s in todo}
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+        else:
+            for source in todo:
+                yield source, _parse_source((source.path, source.sheet))
+
+    for n, (source, result) in enumerate(finished(), start=1):
+        source.rows, source.errors, source.failure = result
+        if progress is not None:
+            progress(n, len(todo))
+    return sources
@@ -5,6 +5,7 @@ SvedUch — учёт сведений об учениках школы.
 """
 import sys
 import logging
+import multiprocessing
 import shutil
 import sqlite3
 from datetime import datetime
@@ -28,14 +29,26 @@ from PyQt5.QtGui import QIcon, QFont
 
 from version import __version__
 from app_icon import get_icon_path
-from db import Database, DEFAULT_DB_PATH
+from db import Database, DEFAULT_DB_PATH, UnknownLevelsError, discard_wal_files
+from remote_db import RemoteDatabase
 from table_windows import TablesWindow
 from queries_window import QueriesWindow
 from transfer_window import TransferWindow
-from settings_dialog import SettingsDialog, AboutDialog
+from settings_dialog import SettingsDialog, AboutDialog, DiagnosticsDialog, apply_sql_profiling
 from monitoring_window import MonitoringWindow
 
 
+def open_database():
+    """
+    БД программы: локальный файл sveduch.db или сервер db_server.py,
+    если задана переменная окружения SVEDUCH_SERVER (http://хост:порт; токен — SVEDUCH_TOKEN).
+    """
+    server = os.environ.get("SVEDUCH_SERVER", "").strip()
+    if server:
+        return RemoteDatabase(server, token=os.environ.get("SVEDUCH_TOKEN") or None)
+    return Database(DEFAULT_DB_PATH)
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -46,13 +59,14 @@ class MainWindow(QMainWindow):
         if os.path.exists(icon_path):
             self.setWindowIcon(QIcon(icon_path))
 
-        # Подключение к БД: по умолчанию в каталоге приложения
-        self.db = Database(DEFAULT_DB_PATH)
+        # Подключение к БД: по умолчанию в каталоге приложения, либо сервер БД
+        self.db = open_database()
         try:
             self.db.create_tables()
         except Exception:
             self.db.close()
             raise
+        apply_sql_profiling(self.db)
 
         # Восстановление геометрии и состояния окна из настроек
         geom = self.db.settings_get("window_geometry")
@@ -155,6 +169,11 @@ class MainWindow(QMainWindow):
         btn_settings.clicked.connect(self._open_settings)
         info_layout.addWidget(btn_settings)
         
+        btn_diagnostics = QPushButton("Диагностика")
+        btn_diagnostics.setToolTip("Статистика SQL-запросов: сколько, как долго и из какого окна")
+        btn_diagnostics.clicked.connect(self._open_diagnostics)
+        info_layout.addWidget(btn_diagnostics)
+
         btn_about = QPushButton("О программе")
         btn_about.clicked.connect(self._open_about)
         info_layout.addWidget(btn_about)
@@ -235,6 +254,11 @@ class MainWindow(QMainWindow):
             # Перезагружаем тему и шрифт
             apply_app_theme_and_font(self.db)
     
+    def _open_diagnostics(self):
+        """Открывает диалог "Диагностика" (статистика SQL-запросов)."""
+        dialog = DiagnosticsDialog(self.db, self)
+        dialog.exec_()
+
     def _open_about(self):
         """Открывает диалог "О программе"."""
         dialog = AboutDialog(self)
@@ -253,10 +277,24 @@ class MainWindow(QMainWindow):
             return
         try:
             self.db.backup_to(path)
+            saved = path
+            # Архивный файл меняется редко — его копия по запросу, чтобы копия БД оставалась небольшой
+            if not isinstance(self.db, RemoteDatabase) and self.db.archive_path.exists():
+                answer = QMessageBox.question(
+                    self,
+                    "Резервная копия",
+                    "Сохранить также копию архивного файла (старые записи архива и закрытые периоды анализа)?",
+                    QMessageBox.Yes | QMessageBox.No,
+                    QMessageBox.No,
+                )
+                if answer == QMessageBox.Yes:
+                    archive_path = os.path.splitext(path)[0] + "_archive.db"
+                    self.db.archive_backup_to(archive_path)
+                    saved += "\n%s" % archive_path
             QMessageBox.information(
                 self,
                 "Резервная копия",
-                "Копия базы данных сохранена:\n%s\n\nРекомендуется хранить копии на другом диске, флешке или в облаке." % path,
+                "Копия базы данных сохранена:\n%s\n\nРекомендуется хранить копии на другом диске, флешке или в облаке." % saved,
             )
         except Exception as e:
             QMessageBox.critical(
@@ -267,6 +305,15 @@ class MainWindow(QMainWindow):
 
     def _restore_database(self):
         """Восстанавливает БД из выбранной резервной копии; после этого требуется перезапуск приложения."""
+        if isinstance(self.db, RemoteDatabase):
+            QMessageBox.information(
+                self,
+                "Восстановление БД",
+                "Программа работает через сервер БД (%s).\n"
+                "Восстановление из копии выполняется на сервере: остановите db_server.py "
+                "и замените файл базы копией." % self.db.url,
+            )
+            return
         path, _ = QFileDialog.getOpenFileName(
             self,
             "Восстановить базу из резервной копии",
@@ -290,6 +337,7 @@ class MainWindow(QMainWindow):
             return
         try:
             self.db.close()
+            discard_wal_files(db_path)
             shutil.copy2(path, db_path)
             QMessageBox.information(
                 self,
@@ -424,6 +472,35 @@ def apply_app_theme_and_font(db: Database):
             pass
 
 
+def _create_tables_checked(db: Database) -> bool:
+    """
+    create_tables() при запуске. Если старые результаты анализа содержат значения, которых нет
+    в справочнике «Уровни», — спросить, добавить ли их уровнями без кода. Возвращает False,
+    если пользователь отказался (база не изменена, программу нужно закрыть).
+    """
+    try:
+        db.create_tables()
+        return True
+    except UnknownLevelsError as e:
+        answer = QMessageBox.question(
+            None,
+            "Результаты анализа",
+            "Результаты анализа переводятся на справочник «Уровни», но часть значений "
+            "не совпадает ни с названием, ни с кодом уровня:\n%s\n\n"
+            "Добавить их в справочник как уровни без кода? "
+            "Нет — закрыть программу; база не изменится, уровни можно добавить вручную."
+            % "\n".join(e.values),
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        )
+        if answer != QMessageBox.Yes:
+            return False
+        for value in e.values:
+            db.standards_add(value, "")
+        db.create_tables()
+        return True
+
+
 def _try_restore_on_corrupt(app: QApplication) -> bool:
     """
     Если БД повреждена при запуске — предлагает выбрать резервную копию и восстановить.
@@ -438,6 +515,7 @@ def _try_restore_on_corrupt(app: QApplication) -> bool:
     if not path:
         return False
     try:
+        discard_wal_files(DEFAULT_DB_PATH)
         shutil.copy2(path, DEFAULT_DB_PATH)
         QMessageBox.information(
             None,
@@ -469,10 +547,26 @@ def main():
     if os.path.exists(icon_path):
         app.setWindowIcon(QIcon(icon_path))
 
+    if os.environ.get("SVEDUCH_SERVER", "").strip():
+        # Работа через сервер БД: восстановление из копии при запуске не предлагается
+        try:
+            window = MainWindow()
+        except (sqlite3.Error, OSError) as e:
+            QMessageBox.critical(
+                None,
+                "Сервер БД недоступен",
+                "Не удалось подключиться к серверу %s:\n%s" % (os.environ["SVEDUCH_SERVER"], e),
+            )
+            sys.exit(1)
+        apply_app_theme_and_font(window.db)
+        window.show()
+        sys.exit(app.exec_())
+
     # Подключение к БД для загрузки настроек темы и шрифта
     temp_db = Database(DEFAULT_DB_PATH)
     try:
-        temp_db.create_tables()
+        if not _create_tables_checked(temp_db):
+            sys.exit(1)
         apply_app_theme_and_font(temp_db)
     except (sqlite3.Error, OSError) as e:
         temp_db.close()
@@ -510,4 +604,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Пакетная загрузка из Excel разбирает книги в дочерних процессах — нужно для сборки в exe
+    multiprocessing.freeze_support()
     main()
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import math
 import os
-from typing import List, Tuple
+import re
+from typing import List, Optional, Tuple
 
 from PyQt5.QtWidgets import (
     QWidget,
@@ -20,12 +22,89 @@ from PyQt5.QtWidgets import (
     QListWidgetItem,
     QDialogButtonBox,
     QHeaderView,
+    QTabWidget,
+    QTableView,
+    QAbstractItemView,
+    QComboBox,
 )
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QIcon, QColor
 
-from db import Database
+from db import Database, level_score, level_scores
 from app_icon import get_icon_path
+from perf_trace import timed_action
+
+
+# Охват вкладки «Аналитика»: выбранный класс, его параллель, вся школа
+ANALYTICS_SCOPES = ("Класс", "Параллель", "Школа")
+
+
+def trend_deltas(periods: list[list], scores: dict[str, float]) -> list[list[Optional[float]]]:
+    """
+    Изменения между соседними периодами: periods — колонки результатов (по периоду на список),
+    ответ — по колонке на пару периодов. Обычный проход по ячейкам: в отчёте одного класса их сотни,
+    а NumPy окно загружает только для вкладки «Аналитика» — отчёт по классу работает и без неё.
+    Балл считается один раз на каждое различное значение.
+    """
+    by_value = {v: level_score(v, scores) for column in periods for v in set(column)}
+    scored = [[by_value[v] for v in column] for column in periods]
+    return [
+        [None if a is None or b is None else b - a for a, b in zip(prev, cur)]
+        for prev, cur in zip(scored, scored[1:])
+    ]
+
+
+def _round(value: float, digits: int = 2) -> Optional[float]:
+    """Число для таблицы и Excel: NaN (нет данных) — пустая ячейка."""
+    value = float(value)
+    return None if math.isnan(value) else round(value, digits)
+
+
+class _ClassReportModel(QAbstractTableModel):
+    """Отчёт по классу для QTableView: ячейки отдаются по запросу представления (видимые строки)."""
+
+    def __init__(self, headers: list[str], rows: list[list], delta_from: int, parent=None):
+        super().__init__(parent)
+        self._headers = headers
+        self._rows = rows
+        self._delta_from = delta_from  # первая колонка изменений
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._headers)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        value = self._rows[index.row()][index.column()]
+        if role == Qt.DisplayRole:
+            if value is None:
+                return ""
+            if index.column() >= self._delta_from:
+                return f"{value:+g}"
+            return str(value)
+        if role == Qt.ForegroundRole and index.column() >= self._delta_from and value:
+            return QColor("#2e7d32") if value > 0 else QColor("#c62828")
+        return None
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self._headers[section]
+        return None
+
+    @property
+    def headers(self) -> list[str]:
+        return self._headers
+
+    @property
+    def rows(self) -> list[list]:
+        return self._rows
+
+    @property
+    def delta_from(self) -> int:
+        return self._delta_from
 
 
 class _ClassSelectMenuHelper:
@@ -91,7 +170,7 @@ class _PupilSelectDialog(QDialog):
 
         rows = self.db.pupils_get_by_form_id(form_id)
         for r in rows:
-            text = f"{r['surname']} {r['name']} {r['patronymic'] or ''}".strip()
+            text = f"{r.surname} {r.name} {r.patronymic or ''}".strip()
             item = QListWidgetItem(text)
             item.setData(Qt.UserRole, r)
             self.list_widget.addItem(item)
@@ -140,7 +219,8 @@ class MonitoringWindow(QWidget):
 
     def __init__(self, db: Database, parent: QWidget | None = None):
         super().__init__(parent)
-        self.db = db
+        # Окно только читает анализ — отдельное соединение только для чтения
+        self.db = db.reader()
         self.setWindowTitle("Мониторинг")
 
         icon_path = get_icon_path()
@@ -191,6 +271,11 @@ class MonitoringWindow(QWidget):
         self.btn_load_analysis.clicked.connect(self._on_load_analysis)
         row1.addWidget(self.btn_load_analysis)
 
+        self.btn_class_report = QPushButton("Отчёт по классу")
+        self.btn_class_report.setToolTip("Все ученики класса по всем критериям и периодам с динамикой")
+        self.btn_class_report.clicked.connect(self._on_class_report)
+        row1.addWidget(self.btn_class_report)
+
         row1.addStretch()
         top_layout.addLayout(row1)
 
@@ -227,7 +312,51 @@ class MonitoringWindow(QWidget):
         self.table.setColumnCount(1)
         self.table.setHorizontalHeaderLabels(["Критерий"])
         self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
-        layout.addWidget(self.table)
+
+        # Отчёт по классу: модель отдаёт ячейки только видимых строк
+        self.report_view = QTableView()
+        self.report_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.report_label = QLabel("")
+        report_tab = QWidget()
+        report_layout = QVBoxLayout(report_tab)
+        report_layout.setContentsMargins(0, 0, 0, 0)
+        report_layout.addWidget(self.report_label)
+        report_layout.addWidget(self.report_view)
+
+        # Аналитика по классу, параллели или школе (NumPy загружается при первом расчёте)
+        analytics_tab = QWidget()
+        analytics_layout = QVBoxLayout(analytics_tab)
+        analytics_layout.setContentsMargins(0, 0, 0, 0)
+        analytics_row = QHBoxLayout()
+        analytics_row.addWidget(QLabel("Охват:"))
+        self.scope_combo = QComboBox()
+        self.scope_combo.addItems(ANALYTICS_SCOPES)
+        analytics_row.addWidget(self.scope_combo)
+        self.btn_analytics = QPushButton("Рассчитать")
+        self.btn_analytics.setToolTip(
+            "Распределение по уровням, динамика и нагрузка специалистов (по выбранному специалисту, если он указан)"
+        )
+        self.btn_analytics.clicked.connect(self._on_analytics)
+        analytics_row.addWidget(self.btn_analytics)
+        self.analytics_label = QLabel("")
+        analytics_row.addWidget(self.analytics_label, 1)
+        analytics_layout.addLayout(analytics_row)
+        self.analytics_tabs = QTabWidget()
+        self._analytics_tables: list[QTableWidget] = []
+        for title in ("Распределение", "Динамика", "Нагрузка специалистов"):
+            table = QTableWidget()
+            table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+            self.analytics_tabs.addTab(table, title)
+            self._analytics_tables.append(table)
+        analytics_layout.addWidget(self.analytics_tabs)
+        # Последний расчёт для выгрузки: [(лист, заголовки, строки)]
+        self._analytics: list[tuple[str, list[str], list[list]]] = []
+
+        self.tabs = QTabWidget()
+        self.tabs.addTab(self.table, "Ученик")
+        self.tabs.addTab(report_tab, "Класс")
+        self.tabs.addTab(analytics_tab, "Аналитика")
+        layout.addWidget(self.tabs)
 
         self.setMinimumSize(900, 500)
 
@@ -259,9 +388,9 @@ class MonitoringWindow(QWidget):
         if not pupil:
             return
         self._current_pupil = pupil
-        self.surname_edit.setText(pupil["surname"] or "")
-        self.name_edit.setText(pupil["name"] or "")
-        self.patronymic_edit.setText(pupil["patronymic"] or "")
+        self.surname_edit.setText(pupil.surname or "")
+        self.name_edit.setText(pupil.name or "")
+        self.patronymic_edit.setText(pupil.patronymic or "")
 
     def _on_choose_specialist(self) -> None:
         current = self.specialist_edit.text().strip()
@@ -271,6 +400,7 @@ class MonitoringWindow(QWidget):
             if name:
                 self.specialist_edit.setText(name)
 
+    @timed_action
     def _on_load_analysis(self) -> None:
         if not self._require_class_and_pupil():
             return
@@ -308,14 +438,153 @@ class MonitoringWindow(QWidget):
         self.table.setHorizontalHeaderLabels(headers)
 
         self.table.setRowCount(len(rows))
+        # Колонки результатов выбраны тем же запросом — номера считаются один раз
+        index = {k: n for n, k in enumerate(rows[0].keys())}
+        result_idx = [index[col] for col in result_cols]
         for i, r in enumerate(rows):
             self.table.setItem(i, 0, QTableWidgetItem(r["criterion"] or ""))
-            for j, col in enumerate(result_cols, start=1):
-                val = r[col] if col in r.keys() else ""
-                self.table.setItem(i, j, QTableWidgetItem(val or ""))
+            for j, k in enumerate(result_idx, start=1):
+                self.table.setItem(i, j, QTableWidgetItem(r[k] or ""))
 
         self.table.resizeColumnsToContents()
 
+    @timed_action
+    def _on_class_report(self) -> None:
+        class_number = self._class_helper.current_class_number if self._class_helper else ""
+        if not class_number:
+            QMessageBox.warning(self, "Класс", "Сначала выберите класс.")
+            return
+        specialist = self.specialist_edit.text().strip()
+        if not specialist:
+            QMessageBox.warning(self, "Специалист", "Выберите специалиста.")
+            return
+
+        result_cols, rows = self.db.analysis_get_class_report(class_number, specialist)
+        if not rows:
+            QMessageBox.information(
+                self,
+                "Отчёт по классу",
+                "Для выбранного класса и специалиста нет записей в таблице анализа.",
+            )
+            self.report_view.setModel(None)
+            self.report_label.clear()
+            return
+
+        # Результаты по периодам (колонками) — изменения между соседними колонками
+        periods = [list(column) for column in zip(*rows)][4:]
+        deltas = trend_deltas(periods, level_scores(self.db.standards_get_all()))
+        names = [self._humanize_result_column(c) for c in result_cols]
+        headers = ["Ученик", "Критерий"] + names + [
+            f"Δ {self._period_label(b)} / {self._period_label(a)}" for a, b in zip(result_cols, result_cols[1:])
+        ]
+        pupils = [" ".join(p for p in r[:3] if p) for r in rows]
+        table = [
+            [pupil, r[3], *r[4:], *values]
+            for pupil, r, values in zip(pupils, rows, zip(*deltas) if deltas else [()] * len(rows))
+        ]
+        model = _ClassReportModel(headers, table, 2 + len(result_cols), self.report_view)
+        self.report_view.setModel(model)
+        self.report_view.resizeColumnsToContents()
+        self.tabs.setCurrentIndex(1)
+
+        summary = f"Класс {class_number}, {specialist}: учеников {len(set(pupils))}, строк {len(rows)}."
+        if deltas:
+            last = deltas[-1]
+            up = sum(1 for d in last if d is not None and d > 0)
+            down = sum(1 for d in last if d is not None and d < 0)
+            same = sum(1 for d in last if d == 0)
+            summary += f" За последний период: рост {up}, без изменений {same}, снижение {down}."
+        self.report_label.setText(summary)
+
+    @timed_action
+    def _on_analytics(self) -> None:
+        scope = ANALYTICS_SCOPES[self.scope_combo.currentIndex()]
+        class_number = self._class_helper.current_class_number if self._class_helper else ""
+        if scope != "Школа" and not class_number:
+            QMessageBox.warning(self, "Класс", "Сначала выберите класс.")
+            return
+        grade = None
+        if scope == "Параллель":
+            m = re.match(r"\s*(\d+)", class_number)
+            if not m:
+                QMessageBox.warning(self, "Параллель", f"В номере класса «{class_number}» нет номера параллели.")
+                return
+            grade = int(m.group(1))
+        try:
+            import analytics
+        except Exception as e:
+            QMessageBox.critical(
+                self,
+                "Ошибка",
+                f"Не удалось загрузить библиотеку NumPy для аналитики:\n{e}",
+            )
+            return
+
+        specialist = self.specialist_edit.text().strip() or None
+        cube = analytics.load_cube(
+            self.db,
+            class_numbers=[class_number] if scope == "Класс" else None,
+            specialist=specialist,
+            grade=grade,
+        )
+        title = {"Класс": f"Класс {class_number}", "Параллель": f"Параллель {grade}", "Школа": "Школа"}[scope]
+        if specialist:
+            title += f", {specialist}"
+        if not len(cube):
+            QMessageBox.information(self, "Аналитика", f"{title}: нет записей в таблице анализа.")
+            self._show_analytics([])
+            self.analytics_label.clear()
+            return
+
+        periods = [self._period_label(c) for c in cube.periods]
+        counts, mean, pupils = analytics.distributions(cube)
+        distribution = [
+            [*cube.criteria[c], periods[t], *counts[c, t].tolist(), int(pupils[c, t]), _round(mean[c, t])]
+            for c, t in zip(*(counts.sum(axis=2) > 0).nonzero())
+        ]
+        delta, improved, declined, n = analytics.progress(cube)
+        dynamics = [
+            [*cube.criteria[c], f"{periods[t + 1]} / {periods[t]}", int(n[c, t]), _round(delta[c, t]),
+             _round(improved[c, t] * 100, 1), _round(declined[c, t] * 100, 1)]
+            for c, t in zip(*(n > 0).nonzero())
+        ]
+        results, workload_pupils, workload_classes = analytics.specialist_workload(cube)
+        workload = [
+            [cube.specialists[s], periods[t], int(results[s, t]), int(workload_pupils[s, t]),
+             int(workload_classes[s, t])]
+            for s, t in zip(*(results > 0).nonzero())
+        ]
+        self._show_analytics([
+            ("Распределение", ["Специалист", "Критерий", "Период", *cube.levels, "Учеников", "Средний балл"],
+             distribution),
+            ("Динамика", ["Специалист", "Критерий", "Периоды", "Учеников", "Средний прирост", "Рост, %",
+                          "Снижение, %"], dynamics),
+            ("Нагрузка", ["Специалист", "Период", "Результатов", "Учеников", "Классов"], workload),
+        ])
+        self.analytics_label.setText(
+            f"{title}: учеников {len(cube.pupils)}, критериев {len(cube.criteria)}, "
+            f"результатов {len(cube)}, периодов {len(cube.periods)}."
+        )
+        self.tabs.setCurrentIndex(2)
+
+    def _show_analytics(self, sheets: list[tuple[str, list[str], list[list]]]) -> None:
+        """Заполнить таблицы вкладки «Аналитика» (пустой список — очистить)."""
+        self._analytics = sheets
+        for n, table in enumerate(self._analytics_tables):
+            headers, rows = (sheets[n][1], sheets[n][2]) if sheets else ([], [])
+            table.setRowCount(0)
+            table.setColumnCount(len(headers))
+            table.setHorizontalHeaderLabels(headers)
+            table.setRowCount(len(rows))
+            for i, row in enumerate(rows):
+                for j, value in enumerate(row):
+                    table.setItem(i, j, QTableWidgetItem("" if value is None else str(value)))
+            table.resizeColumnsToContents()
+
+    def _period_label(self, col: str) -> str:
+        # result_I_2025_2026 -> "I 2025-2026"
+        return self._humanize_result_column(col).replace("Результат ", "")
+
     def _humanize_result_column(self, col: str) -> str:
         # result_I_2025_2026 -> "Результат I 2025-2026"
         if not col.startswith("result_"):
@@ -329,7 +598,14 @@ class MonitoringWindow(QWidget):
             return f"Результат {period} {year1}-{year2}"
         return f"Результат {rest.replace('_', ' ')}"
 
+    @timed_action
     def _on_export_excel(self) -> None:
+        if self.tabs.currentIndex() == 1:
+            self._export_class_report()
+            return
+        if self.tabs.currentIndex() == 2:
+            self._export_analytics()
+            return
         if self.table.rowCount() == 0 or self.table.columnCount() <= 1:
             QMessageBox.information(
                 self,
@@ -398,11 +674,144 @@ class MonitoringWindow(QWidget):
                 f"Не удалось сохранить файл Excel:\n{e}",
             )
 
+    def _export_class_report(self) -> None:
+        """Отчёт по классу одной книгой: лист с учениками и лист средней динамики по критериям."""
+        model = self.report_view.model()
+        if model is None or model.rowCount() == 0:
+            QMessageBox.information(
+                self,
+                "Выгрузка в Excel",
+                "Нет данных для выгрузки. Сначала постройте отчёт по классу.",
+            )
+            return
+        try:
+            from openpyxl import Workbook
+        except Exception as e:
+            QMessageBox.critical(
+                self,
+                "Ошибка",
+                f"Не удалось загрузить библиотеку openpyxl для выгрузки в Excel:\n{e}",
+            )
+            return
+
+        class_number = self._class_helper.current_class_number if self._class_helper else ""
+        path, _ = QFileDialog.getSaveFileName(
+            self,
+            "Сохранить отчёт по классу",
+            f"monitoring_{class_number}.xlsx",
+            "Файлы Excel (*.xlsx);;Все файлы (*)",
+        )
+        if not path:
+            return
+
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Класс"
+        ws["A1"] = self.report_label.text()
+        ws.append([])
+        ws.append(model.headers)
+        for row in model.rows:
+            ws.append(row)
+
+        # Средние изменения по критериям для каждой пары периодов
+        delta_headers = model.headers[model.delta_from:]
+        if delta_headers:
+            ws_trend = wb.create_sheet("Динамика")
+            ws_trend.append(["Критерий"] + delta_headers)
+            by_criterion: dict[str, list] = {}
+            for row in model.rows:
+                by_criterion.setdefault(row[1], []).append(row[model.delta_from:])
+            for criterion, values in sorted(by_criterion.items()):
+                averages = []
+                for column in zip(*values):
+                    known = [v for v in column if v is not None]
+                    averages.append(round(sum(known) / len(known), 2) if known else None)
+                ws_trend.append([criterion] + averages)
+
+        # Доли уровней по периодам (агрегация в SQL)
+        specialist = self.specialist_edit.text().strip()
+        shares = self.db.analysis_level_shares(class_number, specialist)
+        if shares:
+            ws_levels = wb.create_sheet("Уровни")
+            ws_levels.append(["Период", "Уровень", "Код", "Результатов", "Доля, %"])
+            for column, level, code, count, share in shares:
+                ws_levels.append([self._period_label(column), level, code, count, round(share * 100, 1)])
+
+        try:
+            wb.save(path)
+            QMessageBox.information(
+                self,
+                "Выгрузка в Excel",
+                f"Отчёт по классу сохранён:\n{path}",
+            )
+        except Exception as e:
+            QMessageBox.critical(
+                self,
+                "Ошибка сохранения",
+                f"Не удалось сохранить файл Excel:\n{e}",
+            )
+
+    def _export_analytics(self) -> None:
+        """Таблицы вкладки «Аналитика» — по листу на таблицу."""
+        if not self._analytics:
+            QMessageBox.information(
+                self,
+                "Выгрузка в Excel",
+                "Нет данных для выгрузки. Сначала выполните расчёт на вкладке «Аналитика».",
+            )
+            return
+        try:
+            from openpyxl import Workbook
+        except Exception as e:
+            QMessageBox.critical(
+                self,
+                "Ошибка",
+                f"Не удалось загрузить библиотеку openpyxl для выгрузки в Excel:\n{e}",
+            )
+            return
+
+        path, _ = QFileDialog.getSaveFileName(
+            self,
+            "Сохранить аналитику",
+            "analytics.xlsx",
+            "Файлы Excel (*.xlsx);;Все файлы (*)",
+        )
+        if not path:
+            return
+
+        wb = Workbook()
+        wb.remove(wb.active)
+        for title, headers, rows in self._analytics:
+            ws = wb.create_sheet(title)
+            ws["A1"] = self.analytics_label.text()
+            ws.append([])
+            ws.append(headers)
+            for row in rows:
+                ws.append(row)
+
+        try:
+            wb.save(path)
+            QMessageBox.information(
+                self,
+                "Выгрузка в Excel",
+                f"Аналитика сохранена:\n{path}",
+            )
+        except Exception as e:
+            QMessageBox.critical(
+                self,
+                "Ошибка сохранения",
+                f"Не удалось сохранить файл Excel:\n{e}",
+            )
+
     def _on_clear_all(self) -> None:
         """Очистить временную таблицу и все окошки."""
         self.table.setRowCount(0)
         self.table.setColumnCount(1)
         self.table.setHorizontalHeaderLabels(["Критерий"])
+        self.report_view.setModel(None)
+        self.report_label.clear()
+        self._show_analytics([])
+        self.analytics_label.clear()
 
         self.class_edit.clear()
         self.specialist_edit.clear()
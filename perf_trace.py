@@ -0,0 +1,188 @@
+"""
+Замер действий интерфейса (обработчиков кнопок): общее время, время в БД и время отрисовки
+после обработчика. Последние события хранятся в кольцевом буфере и выгружаются в формате
+Chrome trace — файл открывается в chrome://tracing или https://ui.perfetto.dev.
+Время в БД и запросы внутри действия видны, когда включено профилирование SQL (Database.enable_profiling).
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+import sql_profiler
+from version import __version__
+
+# Сколько последних событий (действия, отрисовка, запросы) хранить
+RING_SIZE = 5000
+# Длина имени события-запроса в трассировке (полный текст — в args)
+_SQL_NAME_LEN = 80
+
+
+class _Frame:
+    __slots__ = ("name", "start", "db")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.db = 0.0
+
+
+class ActionRecorder:
+    """Реестр действий интерфейса: сводка по имени действия и кольцевой буфер событий."""
+
+    def __init__(self, size: int = RING_SIZE):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._events: deque = deque(maxlen=size)
+        self._stats: dict[str, dict] = {}
+        self._t0 = time.perf_counter()
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _us(self, t: float) -> float:
+        return (t - self._t0) * 1_000_000
+
+    def _append(self, name: str, cat: str, start: float, seconds: float, args: dict) -> None:
+        self._events.append({
+            "name": name, "cat": cat, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+            "ts": self._us(start), "dur": seconds * 1_000_000, "args": args,
+        })
+
+    def begin(self, name: str) -> _Frame:
+        frame = _Frame(name)
+        self._stack().append(frame)
+        return frame
+
+    def end(self, frame: _Frame) -> None:
+        end = time.perf_counter()
+        stack = self._stack()
+        if stack and stack[-1] is frame:
+            stack.pop()
+        wall = end - frame.start
+        with self._lock:
+            st = self._stats.setdefault(frame.name, {
+                "name": frame.name, "count": 0, "wall": 0.0, "wall_max": 0.0, "db": 0.0, "paint": 0.0, "paints": 0,
+            })
+            st["count"] += 1
+            st["wall"] += wall
+            st["wall_max"] = max(st["wall_max"], wall)
+            st["db"] += frame.db
+            self._append(frame.name, "action", frame.start, wall, {"db_ms": frame.db * 1000})
+        if not stack:
+            self._measure_paint(frame.name, end)
+
+    def _measure_paint(self, name: str, since: float) -> None:
+        """Время, пока цикл событий отрабатывает отложенные раскладку и отрисовку после обработчика."""
+        from PyQt5.QtCore import QCoreApplication, QThread, QTimer
+
+        app = QCoreApplication.instance()
+        if app is None or QThread.currentThread() is not app.thread():
+            return
+
+        def done():
+            now = time.perf_counter()
+            with self._lock:
+                st = self._stats.get(name)
+                if st is not None:
+                    st["paint"] += now - since
+                    st["paints"] += 1
+                self._append(f"{name} (отрисовка)", "paint", since, now - since, {})
+
+        QTimer.singleShot(0, done)
+
+    def on_sql(self, sql: str, seconds: float, rows: int) -> None:
+        """Наблюдатель sql_profiler: время запроса добавляется к выполняющимся действиям."""
+        stack = self._stack()
+        if not stack:
+            return
+        for frame in stack:
+            frame.db += seconds
+        with self._lock:
+            self._append(sql[:_SQL_NAME_LEN], "sql", time.perf_counter() - seconds, seconds,
+                         {"sql": sql, "rows": rows})
+
+    def actions(self) -> list[dict]:
+        """Сводка по действиям (мс), по убыванию суммарного времени."""
+        with self._lock:
+            result = [{
+                "name": st["name"],
+                "count": st["count"],
+                "total_ms": st["wall"] * 1000,
+                "avg_ms": st["wall"] * 1000 / st["count"],
+                "max_ms": st["wall_max"] * 1000,
+                "db_avg_ms": st["db"] * 1000 / st["count"],
+                "paint_avg_ms": st["paint"] * 1000 / st["paints"] if st["paints"] else 0.0,
+            } for st in self._stats.values()]
+        return sorted(result, key=lambda r: r["total_ms"], reverse=True)
+
+    def events(self) -> list[dict]:
+        with self._lock:
+            return list(self._events)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._events.clear()
+            self._stats.clear()
+
+    def export_chrome_trace(self, path: str | Path) -> int:
+        """Записывает буфер событий в JSON формата Chrome trace; возвращает число событий."""
+        events = self.events()
+        meta = [
+            {"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": f"SvedUch {__version__}"}},
+        ]
+        for tid in dict.fromkeys(e["tid"] for e in events):
+            name = "main" if tid == threading.main_thread().ident else str(tid)
+            meta.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}})
+        report = {
+            "traceEvents": meta + events,
+            "displayTimeUnit": "ms",
+            "otherData": {"version": __version__, "exported": datetime.now().isoformat(timespec="seconds")},
+        }
+        Path(path).write_text(json.dumps(report, ensure_ascii=False), encoding="utf-8")
+        return len(events)
+
+
+recorder = ActionRecorder()
+sql_profiler.add_observer(recorder.on_sql)
+
+
+def _positional_limit(fn: Callable) -> Optional[int]:
+    """Сколько позиционных аргументов принимает fn (None — без ограничения, есть *args)."""
+    params = inspect.signature(fn).parameters.values()
+    if any(p.kind is p.VAR_POSITIONAL for p in params):
+        return None
+    return sum(1 for p in params if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
+
+
+def timed_action(fn: Optional[Callable] = None, *, name: Optional[str] = None):
+    """
+    Декоратор обработчика действия: замер в recorder под именем name (по умолчанию Класс.метод).
+    Лишние позиционные аргументы отбрасываются, как это делает PyQt для обычных слотов
+    (clicked передаёт checked в обработчик без параметров).
+    """
+    if fn is None:
+        return lambda f: timed_action(f, name=name)
+    action = name or fn.__qualname__
+    limit = _positional_limit(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if limit is not None:
+            args = args[:limit]
+        frame = recorder.begin(action)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            recorder.end(frame)
+
+    return wrapper
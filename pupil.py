@@ -0,0 +1,149 @@
+"""
+Запись об ученике (строка pupils) — общий тип для db.py и окон.
+Pupil хранит поля в __slots__ (без словаря на каждый объект) и создаётся прямо из кортежа
+курсора (Pupil.from_tuple); для старого кода поддерживает доступ как к sqlite3.Row/dict:
+pupil["surname"], pupil.get("address"), keys(), "recommendation_ids" in pupil.
+"""
+from typing import Any, Iterable, Optional
+
+# Колонки pupils в порядке значений Pupil.from_tuple (устаревшие rec_spec_* не читаются)
+PUPIL_FIELDS = (
+    "id", "form_id", "surname", "name", "patronymic", "birth_date", "address", "gender",
+    "pmpk_date", "pmpk_number", "program_id", "order_number", "order_date",
+)
+PUPIL_SELECT = ", ".join(PUPIL_FIELDS)
+
+# Ключи ячеек Pupil.cells: класс и программа — по справочникам, остальное — поля ученика
+CELL_KEYS = (
+    "id", "class", "surname", "name", "patronymic", "birth_date", "address", "gender",
+    "pmpk_date", "pmpk_number", "program_name", "program_version", "order_number", "order_date",
+)
+
+_INDEX = {name: i for i, name in enumerate(PUPIL_FIELDS)}
+
+
+class Pupil:
+    """
+    Ученик. recommendation_ids — id рекомендаций, если запись пришла из формы ввода;
+    None — рекомендации не заданы (pupils_update их не меняет).
+    """
+
+    __slots__ = PUPIL_FIELDS + ("recommendation_ids",)
+
+    def __init__(
+        self,
+        id: Optional[int] = None,
+        form_id: Optional[int] = None,
+        surname: str = "",
+        name: str = "",
+        patronymic: str = "",
+        birth_date: str = "",
+        address: str = "",
+        gender: str = "",
+        pmpk_date: str = "",
+        pmpk_number: str = "",
+        program_id: Optional[int] = None,
+        order_number: str = "",
+        order_date: str = "",
+        recommendation_ids: Optional[list[int]] = None,
+    ):
+        self.id = id
+        self.form_id = form_id
+        self.surname = surname
+        self.name = name
+        self.patronymic = patronymic
+        self.birth_date = birth_date
+        self.address = address
+        self.gender = gender
+        self.pmpk_date = pmpk_date
+        self.pmpk_number = pmpk_number
+        self.program_id = program_id
+        self.order_number = order_number
+        self.order_date = order_date
+        self.recommendation_ids = recommendation_ids
+
+    @classmethod
+    def from_tuple(cls, values: Iterable) -> "Pupil":
+        """Из значений колонок PUPIL_FIELDS (строка курсора SELECT PUPIL_SELECT без row_factory)."""
+        p = cls.__new__(cls)
+        (p.id, p.form_id, p.surname, p.name, p.patronymic, p.birth_date, p.address, p.gender,
+         p.pmpk_date, p.pmpk_number, p.program_id, p.order_number, p.order_date) = values
+        p.recommendation_ids = None
+        return p
+
+    @classmethod
+    def from_row(cls, row) -> "Pupil":
+        """Из sqlite3.Row, dict или другого Pupil (недостающие поля — значения по умолчанию)."""
+        if isinstance(row, Pupil):
+            return row.copy()
+        keys = row.keys()
+        return cls(**{k: row[k] for k in keys if k in _INDEX or k == "recommendation_ids"})
+
+    def copy(self) -> "Pupil":
+        p = Pupil.from_tuple(self.values())
+        p.recommendation_ids = None if self.recommendation_ids is None else list(self.recommendation_ids)
+        return p
+
+    def values(self) -> tuple:
+        """Значения PUPIL_FIELDS по порядку."""
+        return (self.id, self.form_id, self.surname, self.name, self.patronymic, self.birth_date,
+                self.address, self.gender, self.pmpk_date, self.pmpk_number, self.program_id,
+                self.order_number, self.order_date)
+
+    def to_dict(self, exclude: Iterable[str] = ()) -> dict[str, Any]:
+        d = dict(zip(PUPIL_FIELDS, self.values()))
+        if self.recommendation_ids is not None:
+            d["recommendation_ids"] = self.recommendation_ids
+        for key in exclude:
+            d.pop(key, None)
+        return d
+
+    def cells(self, forms: dict, programs: dict) -> list[str]:
+        """
+        Ячейки CELL_KEYS для таблиц: forms — {id: номер класса}, programs — {id: (название, версия)}.
+        """
+        form_id = self.form_id
+        prog_name, prog_ver = programs.get(self.program_id, ("", ""))
+        return [
+            "" if self.id is None else str(self.id),
+            forms.get(form_id, "" if form_id is None else str(form_id)),
+            self.surname or "", self.name or "", self.patronymic or "", self.birth_date or "",
+            self.address or "", self.gender or "", self.pmpk_date or "", self.pmpk_number or "",
+            prog_name, prog_ver, self.order_number or "", self.order_date or "",
+        ]
+
+    # --- совместимость с sqlite3.Row / dict ---
+
+    def keys(self) -> list[str]:
+        if self.recommendation_ids is None:
+            return list(PUPIL_FIELDS)
+        return list(PUPIL_FIELDS) + ["recommendation_ids"]
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return getattr(self, PUPIL_FIELDS[key])
+        if key in _INDEX or key == "recommendation_ids":
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self else default
+
+    def __contains__(self, key) -> bool:
+        return key in _INDEX or (key == "recommendation_ids" and self.recommendation_ids is not None)
+
+    def __iter__(self):
+        return iter([self[k] for k in self.keys()])
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Pupil):
+            return self.values() == other.values() and self.recommendation_ids == other.recommendation_ids
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"Pupil({self.to_dict()!r})"
@@ -2,26 +2,26 @@
 Форма ввода сведений об ученике и временная таблица (этап 4).
 Макет по PROJECT.md п. 4.3.
 """
+from typing import Optional
+
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QFormLayout,
     QLineEdit, QPushButton, QLabel, QTableWidget, QTableWidgetItem,
     QMenu, QDialog, QListWidget, QDialogButtonBox, QMessageBox,
     QGroupBox, QListWidgetItem, QPlainTextEdit, QComboBox,
 )
-from PyQt5.QtCore import pyqtSignal, Qt
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, Qt
 
+from data_bus import RefreshOnShowMixin, bus_for
 from db import Database
 from date_widget import DateLineEdit
-
-
-def _pad_specialists(specialists: list, size: int = 5) -> list:
-    """Добить список специалистов до size (для отображения 5 слотов)."""
-    return (specialists + ["—"] * size)[:size]
+from perf_trace import timed_action
+from pupil import Pupil
 
 
 class RecommendationSelectDialog(QDialog):
     """Диалог мультивыбора рекомендаций для одного специалиста."""
-    def __init__(self, specialist_name: str, current_text: str, db: Database, parent=None):
+    def __init__(self, specialist_name: str, selected_ids: set, db: Database, parent=None):
         super().__init__(parent)
         self.db = db
         self.specialist_name = specialist_name
@@ -32,25 +32,21 @@ class RecommendationSelectDialog(QDialog):
         recs = db.recommendations_get_by_specialist(specialist_name)
         for r in recs:
             item = QListWidgetItem(r["recommendation_name"])
+            item.setData(Qt.UserRole, r["id"])
             self.list_widget.addItem(item)
+            # Предвыбор уже назначенных рекомендаций
+            if r["id"] in selected_ids:
+                item.setSelected(True)
         layout.addWidget(self.list_widget)
-        # Предвыбор: current_text содержит рекомендации через ";"
-        if current_text and current_text != "нет":
-            for name in [s.strip() for s in current_text.split(";") if s.strip()]:
-                for i in range(self.list_widget.count()):
-                    if self.list_widget.item(i).text() == name:
-                        self.list_widget.item(i).setSelected(True)
-                        break
         bb = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         bb.accepted.connect(self.accept)
         bb.rejected.connect(self.reject)
         layout.addWidget(bb)
 
-    def selected_as_text(self) -> str:
-        """Выбранные рекомендации через «;» или «нет»."""
-        names = [self.list_widget.item(i).text() for i in range(self.list_widget.count())
-                 if self.list_widget.item(i).isSelected()]
-        return "; ".join(names) if names else "нет"
+    def selected_ids(self) -> set:
+        """id выбранных рекомендаций."""
+        return {self.list_widget.item(i).data(Qt.UserRole) for i in range(self.list_widget.count())
+                if self.list_widget.item(i).isSelected()}
 
 
 class PupilEntryWidget(QWidget):
@@ -62,7 +58,14 @@ class PupilEntryWidget(QWidget):
         self.db = db
         self._form_id = None   # id выбранного класса
         self._program_id = None # id выбранной программы
-        self._rec_specs = ["нет"] * 5
+        # Специалисты (порядок по первому появлению в recommendations) и выбранные id рекомендаций
+        self.specialists = self.db.recommendations_get_specialists()
+        self._rec_selected = [set() for _ in self.specialists]
+        self._rec_other = set()
+        self._rec_names = {r["id"]: r["recommendation_name"] for r in self.db.recommendations_get_all()}
+        # Справочники классов и программ для ячеек временной таблицы — до их изменения
+        self._references = None
+        bus_for(self.db).table_changed.connect(self._on_data_changed)
 
         layout = QVBoxLayout(self)
 
@@ -138,24 +141,23 @@ class PupilEntryWidget(QWidget):
         row3.addWidget(self.btn_program)
         layout.addLayout(row3)
 
-        # Блок «Рекомендации специалистам»: 5 специалистов
+        # Блок «Рекомендации специалистам»: по строке на каждого специалиста из recommendations
         grp = QGroupBox("Рекомендации специалистам")
         rec_layout = QVBoxLayout(grp)
-        specialists = _pad_specialists(self.db.recommendations_get_specialists())
+        if not self.specialists:
+            rec_layout.addWidget(QLabel("Нет специалистов. Добавьте рекомендации в разделе «Таблицы» → «Рекомендации»."))
         self.rec_edits = []
         self.rec_buttons = []
-        for i, spec_name in enumerate(specialists):
+        for i, spec_name in enumerate(self.specialists):
             h = QHBoxLayout()
-            h.addWidget(QLabel(spec_name or "—"))
+            h.addWidget(QLabel(spec_name))
             rec_edit = QPlainTextEdit()
+            rec_edit.setReadOnly(True)
             rec_edit.setPlaceholderText("нет")
             rec_edit.setPlainText("нет")
             rec_edit.setMaximumHeight(60)
             rec_edit.setFixedWidth(320)
             rec_edit.setLineWrapMode(QPlainTextEdit.WidgetWidth)
-            idx_for_sync = i
-            rec_edit.textChanged.connect(lambda: self._sync_rec_spec(idx_for_sync))
-            rec_edit.textChanged.connect(self._emit_changed)
             btn = QPushButton("…")
             btn.setMaximumWidth(36)
             btn.setToolTip("Выбрать из списка рекомендаций")
@@ -176,10 +178,28 @@ class PupilEntryWidget(QWidget):
     def _emit_changed(self):
         self.data_changed.emit()
 
-    def _sync_rec_spec(self, index: int):
-        """Синхронизировать _rec_specs[index] с текстом из поля."""
-        text = self.rec_edits[index].toPlainText().strip()
-        self._rec_specs[index] = text if text else "нет"
+    @pyqtSlot(str, object)
+    def _on_data_changed(self, table: str, ids):
+        if table in ("forms", "programs"):
+            self._references = None
+
+    def references(self) -> tuple[dict, dict]:
+        """({id класса: номер}, {id программы: (название, версия)}) — читаются один раз до изменения справочников."""
+        if self._references is None:
+            self._references = (
+                {r["id"]: r["number"] for r in self.db.forms_get_all()},
+                {r["id"]: (r["name"], r["version"]) for r in self.db.programs_get_all()},
+            )
+        return self._references
+
+    def recommendations_text(self, index: int) -> str:
+        """Выбранные рекомендации специалиста index через «;» или «нет»."""
+        names = sorted(self._rec_names.get(rec_id, "") for rec_id in self._rec_selected[index])
+        return "; ".join(n for n in names if n) or "нет"
+
+    def _show_recommendations(self):
+        for i, edit in enumerate(self.rec_edits):
+            edit.setPlainText(self.recommendations_text(i))
 
     def _on_select_class(self):
         forms = self.db.forms_get_all()
@@ -216,46 +236,52 @@ class PupilEntryWidget(QWidget):
         self.data_changed.emit()
 
     def _on_select_recommendations(self, index: int):
-        specialists = _pad_specialists(self.db.recommendations_get_specialists())
-        spec_name = specialists[index] if index < len(specialists) else ""
-        if spec_name == "—" or not spec_name:
-            QMessageBox.information(self, "Рекомендации", "Для этого слота нет специалиста. Добавьте рекомендации в разделе «Таблицы» → «Рекомендации».")
-            return
-        current = self.rec_edits[index].toPlainText() if self.rec_edits[index].toPlainText() else "нет"
-        d = RecommendationSelectDialog(spec_name, current, self.db, self)
+        spec_name = self.specialists[index]
+        d = RecommendationSelectDialog(spec_name, self._rec_selected[index], self.db, self)
         if d.exec_() == QDialog.Accepted:
-            text = d.selected_as_text()
-            self._rec_specs[index] = text
-            self.rec_edits[index].setPlainText(text)
+            for r in self.db.recommendations_get_by_specialist(spec_name):
+                self._rec_names[r["id"]] = r["recommendation_name"]
+            self._rec_selected[index] = d.selected_ids()
+            self.rec_edits[index].setPlainText(self.recommendations_text(index))
             self.data_changed.emit()
 
-    def get_current_row(self) -> dict:
-        """Текущие данные формы в виде словаря для db.pupils_insert."""
-        return {
-            "form_id": self._form_id,
-            "surname": self.surname_edit.text().strip(),
-            "name": self.name_edit.text().strip(),
-            "patronymic": self.patronymic_edit.text().strip(),
-            "birth_date": self.birth_date_edit.text().strip(),
-            "address": self.address_edit.text().strip(),
-            "gender": self.gender_edit.text().strip(),
-            "pmpk_date": self.pmpk_date_edit.text().strip(),
-            "pmpk_number": self.pmpk_number_edit.text().strip(),
-            "program_id": self._program_id,
-            "order_number": self.order_number_edit.text().strip(),
-            "order_date": self.order_date_edit.text().strip(),
-            "rec_spec_1": self.rec_edits[0].toPlainText().strip() if self.rec_edits[0].toPlainText().strip() else "нет",
-            "rec_spec_2": self.rec_edits[1].toPlainText().strip() if self.rec_edits[1].toPlainText().strip() else "нет",
-            "rec_spec_3": self.rec_edits[2].toPlainText().strip() if self.rec_edits[2].toPlainText().strip() else "нет",
-            "rec_spec_4": self.rec_edits[3].toPlainText().strip() if self.rec_edits[3].toPlainText().strip() else "нет",
-            "rec_spec_5": self.rec_edits[4].toPlainText().strip() if self.rec_edits[4].toPlainText().strip() else "нет",
-        }
-
-    def clear_form(self):
-        self._form_id = None
-        self._program_id = None
-        self._rec_specs = ["нет"] * 5
-        self.class_edit.clear()
+    def get_current_row(self) -> Pupil:
+        """Текущие данные формы (без id) для db.pupils_insert / pupils_update."""
+        return Pupil(
+            form_id=self._form_id,
+            surname=self.surname_edit.text().strip(),
+            name=self.name_edit.text().strip(),
+            patronymic=self.patronymic_edit.text().strip(),
+            birth_date=self.birth_date_edit.text().strip(),
+            address=self.address_edit.text().strip(),
+            gender=self.gender_edit.text().strip(),
+            pmpk_date=self.pmpk_date_edit.text().strip(),
+            pmpk_number=self.pmpk_number_edit.text().strip(),
+            program_id=self._program_id,
+            order_number=self.order_number_edit.text().strip(),
+            order_date=self.order_date_edit.text().strip(),
+            recommendation_ids=sorted(self._rec_other.union(*self._rec_selected)),
+        )
+
+    def current_cells(self) -> list[str]:
+        """Ячейки временной таблицы: поля формы (как в таблице учеников, без id) и рекомендации."""
+        forms, programs = self.references()
+        return self.get_current_row().cells(forms, programs)[1:] + [
+            self.recommendations_text(i) for i in range(len(self.specialists))
+        ]
+
+    def clear_form(self, keep_common: bool = False):
+        """Очистить форму; keep_common — оставить класс, программу и приказ (ввод учеников одного класса)."""
+        if not keep_common:
+            self._form_id = None
+            self._program_id = None
+            self.class_edit.clear()
+            self.program_edit.clear()
+            self.version_edit.clear()
+            self.order_number_edit.clear()
+            self.order_date_edit.clear()
+        self._rec_selected = [set() for _ in self.specialists]
+        self._rec_other = set()
         self.surname_edit.clear()
         self.name_edit.clear()
         self.patronymic_edit.clear()
@@ -264,30 +290,23 @@ class PupilEntryWidget(QWidget):
         self.gender_edit.clear()
         self.pmpk_date_edit.clear()
         self.pmpk_number_edit.clear()
-        self.program_edit.clear()
-        self.version_edit.clear()
-        self.order_number_edit.clear()
-        self.order_date_edit.clear()
-        for i, e in enumerate(self.rec_edits):
-            e.setPlainText("нет")
-            self._rec_specs[i] = "нет"
+        self._show_recommendations()
         self.data_changed.emit()
 
-    def load_from_row(self, row):
-        """Загрузить данные ученика из строки БД (sqlite3.Row) в форму."""
-        self._form_id = row["form_id"]
-        forms = {r["id"]: r["number"] for r in self.db.forms_get_all()}
+    def load_from_row(self, row: Pupil):
+        """Загрузить данные ученика из БД в форму."""
+        self._form_id = row.form_id
+        forms, programs = self.references()
         self.class_edit.setText(forms.get(self._form_id, ""))
-        self.surname_edit.setText(row["surname"] or "")
-        self.name_edit.setText(row["name"] or "")
-        self.patronymic_edit.setText(row["patronymic"] or "")
-        self.birth_date_edit.setText(row["birth_date"] or "")
-        self.address_edit.setText((row["address"] if "address" in row.keys() else "") or "")
-        self.gender_edit.setText((row["gender"] if "gender" in row.keys() else "") or "")
-        self.pmpk_date_edit.setText(row["pmpk_date"] or "")
-        self.pmpk_number_edit.setText(row["pmpk_number"] or "")
-        self._program_id = row["program_id"]
-        programs = {r["id"]: (r["name"], r["version"]) for r in self.db.programs_get_all()}
+        self.surname_edit.setText(row.surname or "")
+        self.name_edit.setText(row.name or "")
+        self.patronymic_edit.setText(row.patronymic or "")
+        self.birth_date_edit.setText(row.birth_date or "")
+        self.address_edit.setText(row.address or "")
+        self.gender_edit.setText(row.gender or "")
+        self.pmpk_date_edit.setText(row.pmpk_date or "")
+        self.pmpk_number_edit.setText(row.pmpk_number or "")
+        self._program_id = row.program_id
         if self._program_id:
             prog = programs.get(self._program_id, ("", ""))
             self.program_edit.setText(prog[0])
@@ -295,32 +314,49 @@ class PupilEntryWidget(QWidget):
         else:
             self.program_edit.clear()
             self.version_edit.clear()
-        self.order_number_edit.setText(row["order_number"] or "")
-        self.order_date_edit.setText(row["order_date"] or "")
-        for i in range(5):
-            key = f"rec_spec_{i+1}"
-            rec_text = (row[key] if key in row.keys() else "") or "нет"
-            self.rec_edits[i].setPlainText(rec_text)
-            self._rec_specs[i] = rec_text
+        self.order_number_edit.setText(row.order_number or "")
+        self.order_date_edit.setText(row.order_date or "")
+        # Рекомендации: раскладываем id по специалистам
+        slot = {name: i for i, name in enumerate(self.specialists)}
+        self._rec_selected = [set() for _ in self.specialists]
+        self._rec_other = set()
+        spec_by_id = {}
+        for r in self.db.recommendations_get_all():
+            self._rec_names[r["id"]] = r["recommendation_name"]
+            spec_by_id[r["id"]] = r["specialist_name"]
+        for rec_id in self.db.pupils_get_recommendation_ids(row.id):
+            i = slot.get(spec_by_id.get(rec_id))
+            if i is not None:
+                self._rec_selected[i].add(rec_id)
+            else:
+                # Специалист появился после открытия формы — сохраняем рекомендацию как есть
+                self._rec_other.add(rec_id)
+        self._show_recommendations()
         self.data_changed.emit()
 
     def is_valid_for_save(self) -> tuple[bool, str]:
         """Проверка: можно ли сохранить. Возвращает (ok, сообщение об ошибке)."""
         row = self.get_current_row()
-        if not row["form_id"]:
+        if not row.form_id:
             return False, "Выберите класс."
-        if not row["surname"]:
+        if not row.surname:
             return False, "Укажите фамилию."
-        if not row["name"]:
+        if not row.name:
             return False, "Укажите имя."
         return True, ""
 
 
 class PupilEntryTab(QWidget):
-    """Вкладка «Добавить ученика»: форма + временная таблица (одна строка) + кнопка Сохранить."""
+    """
+    Вкладка «Добавить ученика»: форма, временная таблица текущей записи и список к сохранению.
+    Ученики копятся в списке, проверяются вместе (повторы в списке и совпадения с БД)
+    и записываются одной транзакцией (db.pupils_insert_many).
+    """
     def __init__(self, db: Database, parent=None):
         super().__init__(parent)
         self.db = db
+        # Список к сохранению: (запись, ячейки таблицы на момент добавления)
+        self._queue: list[tuple[Pupil, list[str]]] = []
         layout = QVBoxLayout(self)
 
         self.form = PupilEntryWidget(db, self)
@@ -331,38 +367,57 @@ class PupilEntryTab(QWidget):
         self.temp_table = QTableWidget()
         self._temp_headers = [
             "Класс", "Фамилия", "Имя", "Отчество", "Дата рожд.", "Дом.адр.", "Пол",
-            "ПМПК дата", "ПМПК №", "Программа", "Версия", "Приказ №", "Дата приказа", "Рек.1", "Рек.2", "Рек.3", "Рек.4", "Рек.5"
-        ]
+            "ПМПК дата", "ПМПК №", "Программа", "Версия", "Приказ №", "Дата приказа",
+        ] + self.form.specialists
         self.temp_table.setColumnCount(len(self._temp_headers))
         self.temp_table.setHorizontalHeaderLabels(self._temp_headers)
         self.temp_table.setRowCount(1)
         self.temp_table.setMaximumHeight(80)
         layout.addWidget(self.temp_table)
 
+        btn_layout = QHBoxLayout()
+        queue_btn = QPushButton("Добавить в список")
+        queue_btn.setToolTip("Запись уходит в список к сохранению; класс, программа и приказ остаются в форме")
+        queue_btn.clicked.connect(self._enqueue)
+        btn_layout.addWidget(queue_btn)
         save_btn = QPushButton("Сохранить")
+        save_btn.setToolTip("Сохранить только текущую запись")
         save_btn.clicked.connect(self._save)
-        layout.addWidget(save_btn)
+        btn_layout.addWidget(save_btn)
+        layout.addLayout(btn_layout)
+
+        self.queue_label = QLabel()
+        layout.addWidget(self.queue_label)
+        self.queue_table = QTableWidget()
+        self.queue_table.setColumnCount(len(self._temp_headers) + 1)
+        self.queue_table.setHorizontalHeaderLabels(["Проверка"] + self._temp_headers)
+        self.queue_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.queue_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.queue_table)
+
+        queue_layout = QHBoxLayout()
+        remove_btn = QPushButton("Убрать из списка")
+        remove_btn.clicked.connect(self._remove_selected)
+        queue_layout.addWidget(remove_btn)
+        check_btn = QPushButton("Проверить")
+        check_btn.setToolTip("Повторы в списке и ученики с теми же ФИО и датой рождения в базе")
+        check_btn.clicked.connect(self._check_queue)
+        queue_layout.addWidget(check_btn)
+        save_all_btn = QPushButton("Сохранить список")
+        save_all_btn.clicked.connect(self._save_queue)
+        queue_layout.addWidget(save_all_btn)
+        queue_layout.addStretch()
+        layout.addLayout(queue_layout)
 
         self._update_temp_table()
+        self._fill_queue()
 
     def _update_temp_table(self):
         """Обновить единственную строку временной таблицы из формы."""
-        row = self.form.get_current_row()
-        forms = {r["id"]: r["number"] for r in self.db.forms_get_all()}
-        programs = {r["id"]: (r["name"], r["version"]) for r in self.db.programs_get_all()}
-        form_num = forms.get(row["form_id"], "") if row["form_id"] else ""
-        prog = programs.get(row["program_id"], ("", "")) if row["program_id"] else ("", "")
-        cells = [
-            form_num, row["surname"], row["name"], row["patronymic"], row.get("birth_date", ""),
-            row.get("address", ""), row.get("gender", ""),
-            row.get("pmpk_date", ""), row.get("pmpk_number", ""), prog[0], prog[1],
-            row.get("order_number", ""), row.get("order_date", ""),
-            row.get("rec_spec_1", "нет"), row.get("rec_spec_2", "нет"), row.get("rec_spec_3", "нет"),
-            row.get("rec_spec_4", "нет"), row.get("rec_spec_5", "нет"),
-        ]
-        for j, val in enumerate(cells):
-            self.temp_table.setItem(0, j, QTableWidgetItem(str(val or "")))
+        for j, val in enumerate(self.form.current_cells()):
+            self.temp_table.setItem(0, j, QTableWidgetItem(val))
 
+    @timed_action
     def _save(self):
         ok, msg = self.form.is_valid_for_save()
         if not ok:
@@ -377,8 +432,122 @@ class PupilEntryTab(QWidget):
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", str(e))
 
+    # --- список к сохранению ---
 
-class EditPupilTab(QWidget):
+    def _enqueue(self):
+        ok, msg = self.form.is_valid_for_save()
+        if not ok:
+            QMessageBox.warning(self, "Нельзя добавить", msg)
+            return
+        self._queue.append((self.form.get_current_row(), self.form.current_cells()))
+        self.form.clear_form(keep_common=True)
+        self._check_queue()
+        self.form.surname_edit.setFocus()
+
+    def _remove_selected(self):
+        rows = {index.row() for index in self.queue_table.selectionModel().selectedRows()}
+        if not rows:
+            QMessageBox.information(self, "Выбор", "Выберите строки списка.")
+            return
+        self._queue = [entry for i, entry in enumerate(self._queue) if i not in rows]
+        self._check_queue()
+
+    def _fill_queue(self, statuses: Optional[list[str]] = None):
+        statuses = statuses or [""] * len(self._queue)
+        self.queue_table.setRowCount(len(self._queue))
+        for i, ((_pupil, cells), status) in enumerate(zip(self._queue, statuses)):
+            item = QTableWidgetItem(status)
+            if status:
+                item.setForeground(Qt.red)
+            self.queue_table.setItem(i, 0, item)
+            for j, val in enumerate(cells, start=1):
+                self.queue_table.setItem(i, j, QTableWidgetItem(val))
+        self.queue_table.resizeColumnsToContents()
+        self.queue_label.setText(f"Список к сохранению: {len(self._queue)}")
+
+    def _queue_statuses(self) -> tuple[list[str], list[str]]:
+        """
+        Проверка списка целиком: (замечания по строкам, ошибки, из-за которых сохранить нельзя).
+        Повтор — те же ФИО и дата рождения в списке; совпадения с БД — одним запросом по индексу.
+        """
+        forms, _programs = self.form.references()
+        notes: list[list[str]] = [[] for _ in self._queue]
+        errors = []
+        seen = {}
+        for i, (p, _cells) in enumerate(self._queue):
+            if p.form_id not in forms:
+                notes[i].append("класс удалён")
+                errors.append(f"Строка {i + 1}: класс удалён из справочника.")
+            key = tuple((v or "").strip().casefold() for v in (p.surname, p.name, p.patronymic, p.birth_date))
+            if key in seen:
+                notes[i].append(f"повтор строки {seen[key] + 1}")
+            else:
+                seen[key] = i
+        for i, existing in self.db.pupils_find_duplicates([p for p, _cells in self._queue]):
+            notes[i].append(f"есть в базе: {forms.get(existing.form_id, '?')}, id {existing.id}")
+        return ["; ".join(n) for n in notes], errors
+
+    def _check_queue(self) -> list[str]:
+        statuses, _errors = self._queue_statuses()
+        self._fill_queue(statuses)
+        return statuses
+
+    @timed_action
+    def _save_queue(self):
+        if not self._queue:
+            QMessageBox.information(self, "Список", "Список к сохранению пуст.")
+            return
+        statuses, errors = self._queue_statuses()
+        self._fill_queue(statuses)
+        if errors:
+            QMessageBox.warning(self, "Нельзя сохранить", "\n".join(errors[:15]))
+            return
+        flagged = [i for i, status in enumerate(statuses) if status]
+        skip = set()
+        if flagged:
+            answer = QMessageBox.question(
+                self, "Совпадения",
+                f"У {len(flagged)} записей есть повторы в списке или совпадения с базой (см. «Проверка»).\n"
+                "Да — сохранить все записи, Нет — сохранить без отмеченных, Отмена — вернуться к списку.",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.Cancel,
+            )
+            if answer == QMessageBox.Cancel:
+                return
+            if answer == QMessageBox.No:
+                skip = set(flagged)
+        rows = [p for i, (p, _cells) in enumerate(self._queue) if i not in skip]
+        try:
+            ids = self.db.pupils_insert_many(rows)
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Список не сохранён:\n{e}")
+            return
+        self._queue = [entry for i, entry in enumerate(self._queue) if i in skip]
+        self._check_queue()
+        msg = f"Сохранено учеников: {len(ids)}."
+        if skip:
+            msg += f" В списке оставлено записей с совпадениями: {len(skip)}."
+        QMessageBox.information(self, "Сохранено", msg)
+
+    def confirm_discard_queue(self) -> bool:
+        """Перед закрытием: в списке есть записи — сохранить, отбросить или остаться (False)."""
+        if not self._queue:
+            return True
+        answer = QMessageBox.question(
+            self, "Несохранённый список",
+            f"В списке к сохранению {len(self._queue)} учеников. Сохранить?",
+            QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel, QMessageBox.Save,
+        )
+        if answer == QMessageBox.Cancel:
+            return False
+        if answer == QMessageBox.Save:
+            self._save_queue()
+            return not self._queue
+        self._queue = []
+        self._fill_queue()
+        return True
+
+
+class EditPupilTab(RefreshOnShowMixin, QWidget):
     """Вкладка «Изменения по ученику»: поиск по классу и ФИО, форма редактирования."""
     def __init__(self, db: Database, parent=None):
         super().__init__(parent)
@@ -435,8 +604,8 @@ class EditPupilTab(QWidget):
         self.temp_table = QTableWidget()
         self._temp_headers = [
             "Класс", "Фамилия", "Имя", "Отчество", "Дата рожд.", "Дом.адр.", "Пол",
-            "ПМПК дата", "ПМПК №", "Программа", "Версия", "Приказ №", "Дата приказа", "Рек.1", "Рек.2", "Рек.3", "Рек.4", "Рек.5"
-        ]
+            "ПМПК дата", "ПМПК №", "Программа", "Версия", "Приказ №", "Дата приказа",
+        ] + self.form.specialists
         self.temp_table.setColumnCount(len(self._temp_headers))
         self.temp_table.setHorizontalHeaderLabels(self._temp_headers)
         self.temp_table.setRowCount(1)
@@ -454,14 +623,22 @@ class EditPupilTab(QWidget):
 
         self._refresh_class_combo()
         self._update_temp_table()
+        bus_for(self.db).table_changed.connect(self._on_data_changed)
+
+    @pyqtSlot(str, object)
+    def _on_data_changed(self, table: str, ids):
+        if table == "forms" and not self.defer_if_hidden(table, ids, self.window()):
+            self._refresh_class_combo()
 
     def _refresh_class_combo(self):
         forms = {r["id"]: r["number"] for r in self.db.forms_get_all()}
+        current = self.search_class_combo.currentData()
         self.search_class_combo.blockSignals(True)
         self.search_class_combo.clear()
         self.search_class_combo.addItem("— все —", None)
         for fid, num in forms.items():
             self.search_class_combo.addItem(num, fid)
+        self.search_class_combo.setCurrentIndex(max(self.search_class_combo.findData(current), 0))
         self.search_class_combo.blockSignals(False)
 
     def _search(self):
@@ -476,11 +653,11 @@ class EditPupilTab(QWidget):
         result = []
         forms = {r["id"]: r["number"] for r in self.db.forms_get_all()}
         for r in rows:
-            if surname and (r["surname"] or "").lower().find(surname) < 0:
+            if surname and (r.surname or "").lower().find(surname) < 0:
                 continue
-            if name and (r["name"] or "").lower().find(name) < 0:
+            if name and (r.name or "").lower().find(name) < 0:
                 continue
-            if patronymic and (r["patronymic"] or "").lower().find(patronymic) < 0:
+            if patronymic and (r.patronymic or "").lower().find(patronymic) < 0:
                 continue
             result.append(r)
         self._search_results = result
@@ -493,7 +670,7 @@ class EditPupilTab(QWidget):
             self._update_temp_table()
             return
         if len(result) == 1:
-            self._current_pupil_id = result[0]["id"]
+            self._current_pupil_id = result[0].id
             self.form.load_from_row(result[0])
             self._update_temp_table()
             return
@@ -501,14 +678,14 @@ class EditPupilTab(QWidget):
         self.search_result_label.setText("Найдено записей: %d, выберите ученика:" % len(result))
         self.search_result_combo.blockSignals(True)
         for r in result:
-            form_num = forms.get(r["form_id"], "")
+            form_num = forms.get(r.form_id, "")
             label = "%s %s %s, %s" % (
-                r["surname"] or "", r["name"] or "", (r["patronymic"] or "").strip(), form_num
+                r.surname or "", r.name or "", (r.patronymic or "").strip(), form_num
             )
-            self.search_result_combo.addItem(label.strip(" ,"), r["id"])
+            self.search_result_combo.addItem(label.strip(" ,"), r.id)
         self.search_result_combo.blockSignals(False)
         self.search_result_widget.setVisible(True)
-        self._current_pupil_id = result[0]["id"]
+        self._current_pupil_id = result[0].id
         self.form.load_from_row(result[0])
         self._update_temp_table()
 
@@ -516,7 +693,7 @@ class EditPupilTab(QWidget):
         if index < 0 or index >= len(self._search_results):
             return
         pupil_row = self._search_results[index]
-        self._current_pupil_id = pupil_row["id"]
+        self._current_pupil_id = pupil_row.id
         self.form.load_from_row(pupil_row)
         self._update_temp_table()
 
@@ -534,27 +711,15 @@ class EditPupilTab(QWidget):
 
     def _update_temp_table(self):
         """Обновить единственную строку временной таблицы из формы."""
-        row = self.form.get_current_row()
-        forms = {r["id"]: r["number"] for r in self.db.forms_get_all()}
-        programs = {r["id"]: (r["name"], r["version"]) for r in self.db.programs_get_all()}
-        form_num = forms.get(row["form_id"], "") if row["form_id"] else ""
-        prog = programs.get(row["program_id"], ("", "")) if row["program_id"] else ("", "")
-        cells = [
-            form_num, row["surname"], row["name"], row["patronymic"], row.get("birth_date", ""),
-            row.get("address", ""), row.get("gender", ""),
-            row.get("pmpk_date", ""), row.get("pmpk_number", ""), prog[0], prog[1],
-            row.get("order_number", ""), row.get("order_date", ""),
-            row.get("rec_spec_1", "нет"), row.get("rec_spec_2", "нет"), row.get("rec_spec_3", "нет"),
-            row.get("rec_spec_4", "нет"), row.get("rec_spec_5", "нет"),
-        ]
-        for j, val in enumerate(cells):
-            self.temp_table.setItem(0, j, QTableWidgetItem(str(val or "")))
+        for j, val in enumerate(self.form.current_cells()):
+            self.temp_table.setItem(0, j, QTableWidgetItem(val))
 
     def _clear_form(self):
         self._current_pupil_id = None
         self.form.clear_form()
         self._update_temp_table()
 
+    @timed_action
     def _save(self):
         ok, msg = self.form.is_valid_for_save()
         if not ok:
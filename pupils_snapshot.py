@@ -0,0 +1,266 @@
+"""
+Колоночный снимок таблицы pupils в памяти — для сортировки и фильтрации списка учеников
+без запроса к SQLite на каждый щелчок.
+Числовые колонки (id, form_id, program_id) — array('q'), текстовые — списки интернированных строк;
+класс и программа хранятся кодами (id), порядок классов/программ — по справочникам.
+Снимок обновляется по счётчику table_versions и журналу pupils_changes: перечитываются
+только изменённые ученики. Один снимок на Database — snapshot_for(db).
+"""
+import re
+import sys
+import weakref
+from array import array
+from itertools import compress
+from typing import Iterable, Optional
+
+from pupil import PUPIL_FIELDS, Pupil
+
+# Текстовые колонки снимка (порядок — как в PUPIL_FIELDS)
+TEXT_COLUMNS = tuple(c for c in PUPIL_FIELDS if c not in ("id", "form_id", "program_id"))
+# Колонки, по которым ищет текстовый фильтр
+SEARCH_COLUMNS = ("surname", "name", "patronymic", "birth_date", "address", "gender",
+                  "pmpk_number", "order_number")
+# Ключи сортировки, кроме колонок PUPIL_FIELDS: класс и программа — в порядке справочников
+DERIVED_SORT_KEYS = ("class", "program_name", "program_version")
+DEFAULT_ORDER = (("form_id", False), ("surname", False), ("name", False))
+
+_SEP = "\x1f"
+_NO_RANK = sys.maxsize
+
+
+def _text(value) -> str:
+    """Значение текстовой колонки: интернированная строка ('' вместо NULL)."""
+    if value is None:
+        return ""
+    return sys.intern(value if isinstance(value, str) else str(value))
+
+
+def _grade(number: str) -> int:
+    """Цифровая часть номера класса (как CAST(number AS INTEGER) в SQLite)."""
+    m = re.match(r"\s*(\d+)", number or "")
+    return int(m.group(1)) if m else 0
+
+
+class PupilsSnapshot:
+    """Ученики в колонках; позиции строк (индексы) действительны до следующего refresh()."""
+
+    def __init__(self, db):
+        self.db = db
+        self._versions: dict[str, int] = {}
+        self._last_change = 0
+        self._clear()
+
+    def _clear(self) -> None:
+        self.ids = array("q")
+        self.form_ids = array("q")
+        self.program_ids = array("q")  # 0 — программа не указана
+        self.text: dict[str, list[str]] = {c: [] for c in TEXT_COLUMNS}
+        self._pos: dict[int, int] = {}
+        self._haystack: Optional[list[str]] = None
+        self._derived: dict[str, list] = {}
+        self._forms: dict[int, str] = {}
+        self._programs: dict[int, tuple[str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def forms(self) -> dict[int, str]:
+        """{id класса: номер} на момент последнего обновления."""
+        return self._forms
+
+    @property
+    def programs(self) -> dict[int, tuple[str, str]]:
+        """{id программы: (название, версия)} на момент последнего обновления."""
+        return self._programs
+
+    # --- загрузка и обновление ---
+
+    def reload(self) -> None:
+        """Прочитать всех учеников заново."""
+        # Номер журнала — до чтения строк: изменения между ними применятся повторно (без вреда)
+        self._versions = self.db.data_versions(["pupils", "forms", "programs"])
+        self._last_change = self.db.pupils_changes_last_id()
+        rows = self.db.pupils_get_columns(PUPIL_FIELDS)
+        self._clear()
+        self._load_references()
+        if not rows:
+            return
+        columns = dict(zip(PUPIL_FIELDS, zip(*rows)))
+        self.ids = array("q", columns["id"])
+        self.form_ids = array("q", [v or 0 for v in columns["form_id"]])
+        self.program_ids = array("q", [v or 0 for v in columns["program_id"]])
+        self.text = {c: [_text(v) for v in columns[c]] for c in TEXT_COLUMNS}
+        self._pos = dict(zip(self.ids, range(len(self.ids))))
+
+    def refresh(self) -> Optional[set]:
+        """
+        Догнать базу: изменённые ученики перечитываются по журналу pupils_changes.
+        Возвращает id изменённых учеников, пустое множество — изменений нет,
+        None — снимок перечитан целиком (позиции строк сменились).
+        """
+        if not self._versions:
+            self.reload()
+            return None
+        versions = self.db.data_versions(["pupils", "forms", "programs"])
+        if versions == self._versions:
+            return set()
+        if versions["forms"] != self._versions["forms"] or versions["programs"] != self._versions["programs"]:
+            self._load_references()
+        changed: set = set()
+        if versions["pupils"] != self._versions["pupils"]:
+            last, ids = self.db.pupils_changed_since(self._last_change)
+            if not ids:
+                # Счётчик сменился без записи в журнал (правка в обход db.py) — перечитать всё
+                self.reload()
+                return None
+            self._apply(ids)
+            self._last_change = last
+            changed = set(ids)
+        self._versions = versions
+        return changed
+
+    def _load_references(self) -> None:
+        self._forms = {r["id"]: r["number"] for r in self.db.forms_get_all()}
+        self._programs = {r["id"]: (r["name"], r["version"]) for r in self.db.programs_get_all()}
+        for key in DERIVED_SORT_KEYS:
+            self._derived.pop(key, None)
+
+    def _append(self, values) -> None:
+        row = dict(zip(PUPIL_FIELDS, values))
+        self._pos[row["id"]] = len(self.ids)
+        self.ids.append(row["id"])
+        self.form_ids.append(row["form_id"] or 0)
+        self.program_ids.append(row["program_id"] or 0)
+        for col in TEXT_COLUMNS:
+            self.text[col].append(_text(row[col]))
+
+    def _apply(self, ids: Iterable[int]) -> None:
+        """Заменить/добавить/удалить учеников с указанными id по текущему состоянию БД."""
+        ids = list(ids)
+        fresh = {p.id: p.values() for p in self.db.pupils_get_by_ids(ids)}
+        for pid in ids:
+            values = fresh.get(pid)
+            i = self._pos.get(pid)
+            if i is not None:
+                self._remove(i)
+            if values is not None:
+                self._append(values)
+        self._haystack = None
+        self._derived.clear()
+
+    def _remove(self, i: int) -> None:
+        """Удалить строку i: на её место встаёт последняя (колонки остаются плотными)."""
+        last = len(self.ids) - 1
+        del self._pos[self.ids[i]]
+        if i != last:
+            self._pos[self.ids[last]] = i
+        for col in [self.ids, self.form_ids, self.program_ids, *self.text.values()]:
+            col[i] = col[last]
+            col.pop()
+
+    # --- фильтр и сортировка ---
+
+    def _search_haystack(self) -> list[str]:
+        """Строка поиска на ученика: SEARCH_COLUMNS в нижнем регистре через разделитель."""
+        if self._haystack is None:
+            cols = [self.text[c] for c in SEARCH_COLUMNS]
+            self._haystack = [_SEP.join(values).casefold() for values in zip(*cols)]
+        return self._haystack
+
+    def _grades(self) -> dict[int, int]:
+        return {fid: _grade(number) for fid, number in self._forms.items()}
+
+    def filter(
+        self,
+        text: str = "",
+        form_ids: Optional[Iterable[int]] = None,
+        program_ids: Optional[Iterable[int]] = None,
+        grade_from: Optional[int] = None,
+        grade_to: Optional[int] = None,
+    ) -> list[int]:
+        """
+        Позиции учеников, подходящих под все условия: каждое слово text встречается
+        в одной из SEARCH_COLUMNS; класс/программа — из множеств; параллель — в диапазоне.
+        """
+        rows = range(len(self.ids))
+        if form_ids is not None:
+            wanted = set(form_ids)
+            rows = compress(rows, [f in wanted for f in self.form_ids])
+        if program_ids is not None:
+            wanted = {p or 0 for p in program_ids}
+            rows = compress(rows, [p in wanted for p in self.program_ids])
+        if grade_from is not None or grade_to is not None:
+            grades = self._grades()
+            lo = grade_from if grade_from is not None else -sys.maxsize
+            hi = grade_to if grade_to is not None else sys.maxsize
+            wanted = {fid for fid, g in grades.items() if lo <= g <= hi}
+            rows = compress(rows, [f in wanted for f in self.form_ids])
+        rows = list(rows)
+        words = text.casefold().split()
+        if words:
+            haystack = self._search_haystack()
+            for word in words:
+                rows = [i for i in rows if word in haystack[i]]
+        return rows
+
+    def _sort_column(self, key: str):
+        """Колонка значений для ключа сортировки (производные — кэшируются до изменения данных)."""
+        if key == "id":
+            return self.ids
+        if key == "form_id":
+            return self.form_ids
+        if key == "program_id":
+            return self.program_ids
+        if key in self.text:
+            return self.text[key]
+        column = self._derived.get(key)
+        if column is None:
+            if key == "class":
+                order = sorted(self._forms, key=lambda fid: (_grade(self._forms[fid]), self._forms[fid]))
+                rank = {fid: n for n, fid in enumerate(order)}
+                column = [rank.get(f, _NO_RANK) for f in self.form_ids]
+            elif key in ("program_name", "program_version"):
+                # Название, затем версия (или наоборот); без программы — в начале, как пустая ячейка
+                flip = key == "program_version"
+                order = sorted(self._programs, key=lambda pid: self._programs[pid][::-1] if flip else self._programs[pid])
+                rank = {pid: n for n, pid in enumerate(order)}
+                column = [rank.get(p, -1) for p in self.program_ids]
+            else:
+                raise KeyError(key)
+            self._derived[key] = column
+        return column
+
+    def sort(self, rows: list[int], order: Iterable[tuple[str, bool]] = DEFAULT_ORDER) -> list[int]:
+        """Отсортировать позиции по ключам [(колонка, по убыванию), ...] — устойчиво, с последнего ключа."""
+        rows = list(rows)
+        for key, descending in reversed(list(order)):
+            rows.sort(key=self._sort_column(key).__getitem__, reverse=descending)
+        return rows
+
+    # --- выдача ---
+
+    def pupil(self, i: int) -> Pupil:
+        row = {c: self.text[c][i] for c in TEXT_COLUMNS}
+        row.update(id=self.ids[i], form_id=self.form_ids[i] or None, program_id=self.program_ids[i] or None)
+        return Pupil.from_tuple([row[c] for c in PUPIL_FIELDS])
+
+    def pupils(self, rows: Iterable[int]) -> list[Pupil]:
+        """Записи Pupil для позиций rows (для отображаемой страницы)."""
+        return [self.pupil(i) for i in rows]
+
+    def position(self, pupil_id: int) -> Optional[int]:
+        return self._pos.get(pupil_id)
+
+
+_snapshots: "weakref.WeakKeyDictionary[object, PupilsSnapshot]" = weakref.WeakKeyDictionary()
+
+
+def snapshot_for(db) -> PupilsSnapshot:
+    """Общий снимок для экземпляра Database (читается при первом обращении)."""
+    snapshot = _snapshots.get(db)
+    if snapshot is None:
+        snapshot = PupilsSnapshot(db)
+        snapshot.reload()
+        _snapshots[db] = snapshot
+    return snapshot
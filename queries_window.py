@@ -1,20 +1,30 @@
 """
-Окно «Выборки»: фильтры по классу/программе, список учеников или агрегация по программе,
+Окно «Выборки»: фильтры по классу/программе, рекомендациям специалистов и параллелям,
+список учеников или агрегация по программе,
 выбор полей, экспорт в Excel (этап 5).
+Сохранённые выборки: параметры и последний результат хранятся в БД (query_presets);
+результат показывается из кэша, пока не изменились данные (table_versions).
 """
+import json
 import os
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem,
     QLabel, QComboBox, QGroupBox, QRadioButton, QButtonGroup, QFileDialog,
-    QMessageBox, QHeaderView, QScrollArea,     QCheckBox,
+    QMessageBox, QScrollArea, QCheckBox, QListWidget, QListWidgetItem,
+    QSpinBox, QAbstractItemView, QInputDialog,
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSlot
 from PyQt5.QtGui import QIcon
 
 from app_icon import get_icon_path
+from data_bus import RefreshOnShowMixin, bus_for
 from db import Database
+from perf_trace import timed_action
+from pupil import CELL_KEYS, Pupil
+from pupils_snapshot import snapshot_for
 
-# Все колонки для режима «Список учеников» (ключ, заголовок)
+# Колонки для режима «Список учеников» (ключ, заголовок); к ним добавляются
+# колонки рекомендаций — по одной на специалиста (ключ "rec:<специалист>")
 PUPIL_COLUMNS = [
     ("id", "id"),
     ("class", "Класс"),
@@ -30,31 +40,57 @@ PUPIL_COLUMNS = [
     ("program_version", "Версия"),
     ("order_number", "Приказ №"),
     ("order_date", "Дата приказа"),
-    ("rec_spec_1", "Рек.1"),
-    ("rec_spec_2", "Рек.2"),
-    ("rec_spec_3", "Рек.3"),
-    ("rec_spec_4", "Рек.4"),
-    ("rec_spec_5", "Рек.5"),
 ]
 
 
-class QueriesWindow(QWidget):
+class QueriesWindow(RefreshOnShowMixin, QWidget):
     def __init__(self, db: Database, parent=None):
         super().__init__(parent)
         self.db = db
+        # Чтение — через отдельное соединение только для чтения: долгая выборка не мешает
+        # сохранению в окнах ввода; запись (сохранённые выборки) — через db
+        self._reader = db.reader()
+        # Выборки без условий по рекомендациям и сортировка результата — по колоночному снимку учеников.
+        # Снимок читается через то же соединение, что и рекомендации: внутри _reader.snapshot()
+        # ученики и их рекомендации — на один момент времени
+        self._snapshot = snapshot_for(self._reader)
         self.setWindowTitle("Выборки")
         # Установка иконки
         icon_path = get_icon_path()
         if os.path.exists(icon_path):
             self.setWindowIcon(QIcon(icon_path))
-        self._rows_list = []   # текущие строки (список dict/Row) для экспорта
+        self._cells_list = []  # текущий результат: строки ячеек по self._columns (или агрегат) для таблицы и экспорта
         self._mode_count = False  # True = режим «Количество по программе»
         self._result_is_aggregate = False  # True = в таблице общая статистика (программа «все»)
         self._form_map = {}
         self._program_map = {}
+        self._rec_map = {}  # pupil_id -> {специалист: [рекомендации]} для текущей выборки
+        self._sort_key = None  # (ключ колонки, по убыванию) — сортировка результата щелчком по заголовку
+        self._columns = PUPIL_COLUMNS + [
+            (f"rec:{spec}", spec) for spec in self._reader.recommendations_get_specialists()
+        ]
 
         layout = QVBoxLayout(self)
 
+        # Сохранённые выборки
+        preset_grp = QGroupBox("Сохранённые выборки")
+        preset_layout = QHBoxLayout(preset_grp)
+        self.combo_preset = QComboBox()
+        self.combo_preset.setMinimumWidth(200)
+        preset_layout.addWidget(self.combo_preset)
+        self.btn_preset_open = QPushButton("Открыть")
+        self.btn_preset_open.clicked.connect(self._open_preset)
+        preset_layout.addWidget(self.btn_preset_open)
+        self.btn_preset_save = QPushButton("Сохранить как…")
+        self.btn_preset_save.clicked.connect(self._save_preset)
+        preset_layout.addWidget(self.btn_preset_save)
+        self.btn_preset_delete = QPushButton("Удалить")
+        self.btn_preset_delete.clicked.connect(self._delete_preset)
+        preset_layout.addWidget(self.btn_preset_delete)
+        self.label_preset_status = QLabel("")
+        preset_layout.addWidget(self.label_preset_status, 1)
+        layout.addWidget(preset_grp)
+
         # Критерии фильтрации
         filter_grp = QGroupBox("Критерии")
         filter_layout = QHBoxLayout(filter_grp)
@@ -70,6 +106,44 @@ class QueriesWindow(QWidget):
         filter_layout.addWidget(self.combo_program)
         layout.addWidget(filter_grp)
 
+        # Рекомендации специалистов и диапазон параллелей
+        rec_grp = QGroupBox("Рекомендации и параллели")
+        rec_layout = QHBoxLayout(rec_grp)
+        rec_left = QVBoxLayout()
+        spec_row = QHBoxLayout()
+        spec_row.addWidget(QLabel("Специалист:"))
+        self.combo_specialist = QComboBox()
+        self.combo_specialist.setMinimumWidth(160)
+        self.combo_specialist.currentIndexChanged.connect(self._refresh_recommendations)
+        spec_row.addWidget(self.combo_specialist)
+        rec_left.addLayout(spec_row)
+        grade_row = QHBoxLayout()
+        grade_row.addWidget(QLabel("Параллели с:"))
+        self.spin_grade_from = QSpinBox()
+        self.spin_grade_from.setRange(0, 11)
+        self.spin_grade_from.setSpecialValueText("—")
+        grade_row.addWidget(self.spin_grade_from)
+        grade_row.addWidget(QLabel("по:"))
+        self.spin_grade_to = QSpinBox()
+        self.spin_grade_to.setRange(0, 11)
+        self.spin_grade_to.setSpecialValueText("—")
+        grade_row.addWidget(self.spin_grade_to)
+        grade_row.addStretch()
+        rec_left.addLayout(grade_row)
+        self.check_match_all = QCheckBox("Все отмеченные рекомендации одновременно")
+        self.check_match_all.setToolTip("Иначе — хотя бы одна из отмеченных")
+        rec_left.addWidget(self.check_match_all)
+        rec_left.addStretch()
+        rec_layout.addLayout(rec_left)
+        self.list_recommendations = QListWidget()
+        self.list_recommendations.setSelectionMode(QAbstractItemView.MultiSelection)
+        self.list_recommendations.setMaximumHeight(90)
+        self.list_recommendations.setToolTip(
+            "Отметьте рекомендации; если ничего не отмечено — любые рекомендации выбранного специалиста"
+        )
+        rec_layout.addWidget(self.list_recommendations, 1)
+        layout.addWidget(rec_grp)
+
         # Режим: список учеников / количество по программе
         mode_grp = QGroupBox("Режим")
         mode_layout = QHBoxLayout(mode_grp)
@@ -89,7 +163,7 @@ class QueriesWindow(QWidget):
         fields_layout = QHBoxLayout(fields_inner)
         fields_layout.setContentsMargins(0, 0, 0, 0)
         self.field_checks = []
-        for key, title in PUPIL_COLUMNS:
+        for key, title in self._columns:
             cb = QCheckBox(title)
             cb.setChecked(True)
             cb.setProperty("col_key", key)
@@ -122,15 +196,182 @@ class QueriesWindow(QWidget):
         # Таблица результатов
         layout.addWidget(QLabel("Результат:"))
         self.table = QTableWidget()
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().sectionClicked.connect(self._on_header_clicked)
+        # Ширина колонок — один раз после заполнения (ResizeToContents пересчитывает её на каждый setItem)
         layout.addWidget(self.table)
 
         self._refresh_combos()
+        self._refresh_presets()
+        bus_for(self.db).table_changed.connect(self._on_data_changed)
+
+    @pyqtSlot(str, object)
+    def _on_data_changed(self, table: str, ids):
+        """Обновление по шине: справочники — комбобоксы (с сохранением выбора), результат — только затронутые строки."""
+        if self.defer_if_hidden(table, ids):
+            return
+        if table in ("forms", "programs", "recommendations"):
+            params = self._current_params()
+            self._refresh_combos()
+            self._apply_params(params)
+        if not self._cells_list:
+            return
+        if self._result_is_aggregate:
+            if table in ("pupils", "programs"):
+                self._run_count_by_program()
+                self.label_preset_status.setText("Данные изменились — результат пересчитан")
+            return
+        if table in ("forms", "programs", "pupils", "pupil_recommendations"):
+            if table in ("forms", "programs"):
+                ids = None  # в строках изменились названия классов/программ
+            if self._update_result_rows(ids):
+                self.label_preset_status.setText(
+                    "Данные изменились — строки результата обновлены (новые ученики — после «Выполнить»)"
+                )
+
+    def _update_result_rows(self, ids) -> bool:
+        """Пересчитать ячейки строк результата с указанными id (None — всех); удалённых учеников убрать."""
+        result_ids = [int(cells[0]) for cells in self._cells_list]
+        affected = [pid for pid in result_ids if ids is None or pid in ids]
+        if not affected:
+            return False
+        fresh = {p.id: p for p in self._reader.pupils_get_by_ids(affected)}
+        self._rec_map = self._reader.pupils_recommendations_map(list(fresh))
+        cells_list = []
+        for pid, cells in zip(result_ids, self._cells_list):
+            if ids is None or pid in ids:
+                row = fresh.get(pid)
+                if row is None:
+                    continue
+                cells = self._row_to_cells(row)
+            cells_list.append(cells)
+        self._cells_list = cells_list
+        self._fill_pupils_table()
+        return True
+
+    def _refresh_presets(self, select_id=None):
+        """Заполнить список сохранённых выборок."""
+        self.combo_preset.clear()
+        for r in self.db.query_presets_get_all():
+            self.combo_preset.addItem(r["name"], r["id"])
+        if select_id is not None:
+            idx = self.combo_preset.findData(select_id)
+            if idx >= 0:
+                self.combo_preset.setCurrentIndex(idx)
+        has_presets = self.combo_preset.count() > 0
+        self.btn_preset_open.setEnabled(has_presets)
+        self.btn_preset_delete.setEnabled(has_presets)
+
+    def _current_params(self) -> dict:
+        """Параметры текущей выборки для сохранения (фильтры, режим, отмеченные поля)."""
+        params = {
+            "form_id": self.combo_class.currentData(),
+            "program_id": self.combo_program.currentData(),
+            "mode": "count" if self.radio_count.isChecked() else "list",
+            "fields": [cb.property("col_key") for cb in self.field_checks if cb.isChecked()],
+        }
+        params.update(self._recommendation_filters())
+        return params
+
+    def _apply_params(self, params: dict) -> None:
+        """Выставить элементы управления по сохранённым параметрам (отсутствующие в БД значения сбрасываются)."""
+        def select_data(combo, value):
+            idx = combo.findData(value) if value is not None else 0
+            combo.setCurrentIndex(max(idx, 0))
+
+        select_data(self.combo_class, params.get("form_id"))
+        select_data(self.combo_program, params.get("program_id"))
+        select_data(self.combo_specialist, params.get("specialist"))  # перезаполняет список рекомендаций
+        rec_ids = set(params.get("recommendation_ids") or [])
+        for i in range(self.list_recommendations.count()):
+            item = self.list_recommendations.item(i)
+            item.setSelected(item.data(Qt.UserRole) in rec_ids)
+        self.check_match_all.setChecked(bool(params.get("match_all")))
+        self.spin_grade_from.setValue(params.get("grade_from") or 0)
+        self.spin_grade_to.setValue(params.get("grade_to") or 0)
+        if params.get("mode") == "count":
+            self.radio_count.setChecked(True)
+        else:
+            self.radio_list.setChecked(True)
+        fields = params.get("fields")
+        for cb in self.field_checks:
+            cb.setChecked(fields is None or cb.property("col_key") in fields)
+
+    def _data_version_key(self) -> str:
+        """Ключ версии данных: счётчики изменений всех таблиц, от которых зависит выборка."""
+        return json.dumps(self._reader.data_versions(), sort_keys=True)
+
+    def _result_snapshot(self) -> dict:
+        """Текущий результат в виде, пригодном для кэша выборки."""
+        return {
+            "aggregate": self._result_is_aggregate,
+            "keys": [k for k, _ in self._columns],
+            "rows": self._cells_list,
+        }
+
+    def _open_preset(self):
+        """Открыть выборку: показать кэш, если данные не менялись, иначе выполнить заново и обновить кэш."""
+        preset_id = self.combo_preset.currentData()
+        if preset_id is None:
+            return
+        preset = self.db.query_presets_get(preset_id)
+        if preset is None:
+            self._refresh_presets()
+            return
+        self._refresh_combos()
+        self._apply_params(preset["params"])
+        with self._reader.snapshot():
+            version = self._data_version_key()
+            cached = preset["result"]
+            if (cached is not None and preset["result_version"] == version
+                    and cached.get("keys") == [k for k, _ in self._columns]):
+                self._show_cached(cached)
+                self.label_preset_status.setText("Результат из кэша (данные не изменялись)")
+                return
+            self._run()
+        self.db.query_presets_store_result(preset_id, version, self._result_snapshot())
+        self.label_preset_status.setText("Выборка выполнена заново")
+
+    def _show_cached(self, cached: dict) -> None:
+        self._reset_sort()
+        self._mode_count = self.radio_count.isChecked()
+        self._result_is_aggregate = bool(cached.get("aggregate"))
+        self._cells_list = cached.get("rows") or []
+        if self._result_is_aggregate:
+            self._fill_aggregate_table()
+        else:
+            self._fill_pupils_table()
+
+    def _save_preset(self):
+        name, ok = QInputDialog.getText(
+            self, "Сохранить выборку", "Название выборки:", text=self.combo_preset.currentText()
+        )
+        if not ok or not name.strip():
+            return
+        try:
+            preset_id = self.db.query_presets_save(name, self._current_params())
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        self._refresh_presets(select_id=preset_id)
+        self.label_preset_status.setText("Выборка сохранена")
+
+    def _delete_preset(self):
+        preset_id = self.combo_preset.currentData()
+        if preset_id is None:
+            return
+        if QMessageBox.question(
+            self, "Удаление", f"Удалить выборку «{self.combo_preset.currentText()}»?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No,
+        ) != QMessageBox.Yes:
+            return
+        self.db.query_presets_delete(preset_id)
+        self._refresh_presets()
+        self.label_preset_status.setText("")
 
     def _refresh_combos(self):
         """Заполнить комбобоксы класса и программы."""
-        self._form_map = {r["id"]: r["number"] for r in self.db.forms_get_all()}
-        self._program_map = {r["id"]: (r["name"], r["version"]) for r in self.db.programs_get_all()}
+        self._form_map = {r["id"]: r["number"] for r in self._reader.forms_get_all()}
+        self._program_map = {r["id"]: (r["name"], r["version"]) for r in self._reader.programs_get_all()}
 
         self.combo_class.blockSignals(True)
         self.combo_program.blockSignals(True)
@@ -145,84 +386,119 @@ class QueriesWindow(QWidget):
         self.combo_class.blockSignals(False)
         self.combo_program.blockSignals(False)
 
+        self.combo_specialist.blockSignals(True)
+        self.combo_specialist.clear()
+        self.combo_specialist.addItem("— любой —", None)
+        for spec in self._reader.recommendations_get_specialists():
+            self.combo_specialist.addItem(spec, spec)
+        self.combo_specialist.blockSignals(False)
+        self._refresh_recommendations()
+
+    def _refresh_recommendations(self):
+        """Список рекомендаций выбранного специалиста (все — если специалист не выбран)."""
+        spec = self.combo_specialist.currentData()
+        rows = (self._reader.recommendations_get_by_specialist(spec) if spec
+                else self._reader.recommendations_get_all())
+        self.list_recommendations.clear()
+        for r in rows:
+            text = r["recommendation_name"] if spec else f"{r['specialist_name']}: {r['recommendation_name']}"
+            item = QListWidgetItem(text)
+            item.setData(Qt.UserRole, r["id"])
+            self.list_recommendations.addItem(item)
+
+    def _recommendation_filters(self) -> dict:
+        """Критерии группы «Рекомендации и параллели» для db.pupils_query."""
+        grade_from = self.spin_grade_from.value() or None
+        grade_to = self.spin_grade_to.value() or None
+        if grade_from and grade_to and grade_from > grade_to:
+            grade_from, grade_to = grade_to, grade_from
+        return {
+            "specialist": self.combo_specialist.currentData(),
+            "recommendation_ids": [item.data(Qt.UserRole) for item in self.list_recommendations.selectedItems()],
+            "match_all": self.check_match_all.isChecked(),
+            "grade_from": grade_from,
+            "grade_to": grade_to,
+        }
+
+    @timed_action
     def _run(self):
+        self.label_preset_status.setText("")
+        self._reset_sort()
         self._mode_count = self.radio_count.isChecked()
         program_id = self.combo_program.currentData()
-        if self._mode_count and program_id is None:
-            self._run_count_by_program()
-        elif self._mode_count and program_id is not None:
-            self._run_pupils_by_program(program_id)
-        else:
-            self._run_pupils_list()
+        # Ученики и их рекомендации — из одного снимка данных
+        with self._reader.snapshot():
+            if self._mode_count and program_id is None:
+                self._run_count_by_program()
+            elif self._mode_count and program_id is not None:
+                self._run_pupils_by_program(program_id)
+            else:
+                self._run_pupils_list()
 
     def _run_pupils_list(self):
         self._result_is_aggregate = False
-        form_id = self.combo_class.currentData()
-        program_id = self.combo_program.currentData()
-        if form_id is not None and program_id is not None:
-            rows = self.db.pupils_get_by_form_id(form_id)
-            rows = [r for r in rows if r["program_id"] == program_id]
-        elif form_id is not None:
-            rows = self.db.pupils_get_by_form_id(form_id)
-        elif program_id is not None:
-            rows = self.db.pupils_get_by_program_id(program_id)
-        else:
-            rows = self.db.pupils_get_all()
-        self._rows_list = list(rows)
+        rows = self._query_pupils(self.combo_class.currentData(), self.combo_program.currentData())
+        self._set_pupil_rows(rows)
+
+    def _query_pupils(self, form_id, program_id) -> list[Pupil]:
+        """
+        Ученики по критериям окна. Без условий по рекомендациям выборка идёт по снимку учеников
+        (класс, программа, параллели) — тот же состав и порядок, что у db.pupils_query.
+        """
+        filters = self._recommendation_filters()
+        if filters["specialist"] or filters["recommendation_ids"]:
+            return self._reader.pupils_query(form_id=form_id, program_id=program_id, **filters)
+        snap = self._snapshot
+        snap.refresh()
+        rows = snap.filter(
+            form_ids=None if form_id is None else [form_id],
+            program_ids=None if program_id is None else [program_id],
+            grade_from=filters["grade_from"],
+            grade_to=filters["grade_to"],
+        )
+        return snap.pupils(snap.sort(rows))
+
+    def _set_pupil_rows(self, rows):
+        """Построить ячейки выборки (с рекомендациями) и заполнить таблицу."""
+        rows = list(rows)
+        self._rec_map = self._reader.pupils_recommendations_map([p.id for p in rows])
+        self._cells_list = [self._row_to_cells(p) for p in rows]
         self._fill_pupils_table()
 
     def _run_pupils_by_program(self, program_id: int):
         """Список учеников по выбранной программе с выбором полей."""
         self._result_is_aggregate = False
-        rows = self.db.pupils_get_by_program_id(program_id)
-        self._rows_list = list(rows)
-        self._fill_pupils_table()
+        self._set_pupil_rows(self._query_pupils(None, program_id))
 
     def _run_count_by_program(self):
         """Общая статистика: количество учеников по каждой программе (программа «— все —»)."""
         self._result_is_aggregate = True
-        rows = self.db.pupils_count_by_program()
-        self._rows_list = list(rows)
+        self._cells_list = [
+            [r["program_name"] or "", r["program_version"] or "", r["pupils_count"], r["program_id"]]
+            for r in self._reader.pupils_count_by_program()
+        ]
+        self._fill_aggregate_table()
+
+    def _fill_aggregate_table(self):
         self.table.setColumnCount(4)
         self.table.setHorizontalHeaderLabels(["Программа", "Версия", "Количество учеников", "program_id"])
-        self.table.setRowCount(len(rows))
-        for i, r in enumerate(rows):
-            self.table.setItem(i, 0, QTableWidgetItem(str(r["program_name"] or "")))
-            self.table.setItem(i, 1, QTableWidgetItem(str(r["program_version"] or "")))
-            self.table.setItem(i, 2, QTableWidgetItem(str(r["pupils_count"])))
-            self.table.setItem(i, 3, QTableWidgetItem(str(r["program_id"] or "")))
+        self.table.setRowCount(len(self._cells_list))
+        for i, cells in enumerate(self._cells_list):
+            for j, value in enumerate(cells):
+                self.table.setItem(i, j, QTableWidgetItem(str(value if value is not None else "")))
         self.table.setColumnHidden(3, True)
+        self.table.resizeColumnsToContents()
 
-    def _row_to_cells(self, r) -> list:
-        """Одна строка pupils (Row) в список ячеек для отображаемых колонок."""
-        form_num = self._form_map.get(r["form_id"], str(r["form_id"]))
-        prog = self._program_map.get(r["program_id"], ("", ""))
-        data = {
-            "id": str(r["id"]),
-            "class": form_num,
-            "surname": r["surname"] or "",
-            "name": r["name"] or "",
-            "patronymic": r["patronymic"] or "",
-            "birth_date": r["birth_date"] or "",
-            "address": (r["address"] if "address" in r.keys() else "") or "",
-            "gender": (r["gender"] if "gender" in r.keys() else "") or "",
-            "pmpk_date": r["pmpk_date"] or "",
-            "pmpk_number": r["pmpk_number"] or "",
-            "program_name": prog[0],
-            "program_version": prog[1],
-            "order_number": r["order_number"] or "",
-            "order_date": r["order_date"] or "",
-            "rec_spec_1": r["rec_spec_1"] or "",
-            "rec_spec_2": r["rec_spec_2"] or "",
-            "rec_spec_3": r["rec_spec_3"] or "",
-            "rec_spec_4": r["rec_spec_4"] or "",
-            "rec_spec_5": r["rec_spec_5"] or "",
-        }
-        return [data.get(key, "") for key, _ in PUPIL_COLUMNS]
+    def _row_to_cells(self, pupil: Pupil) -> list:
+        """Ученик в список ячеек для отображаемых колонок."""
+        data = dict(zip(CELL_KEYS, pupil.cells(self._form_map, self._program_map)))
+        for spec, names in self._rec_map.get(pupil.id, {}).items():
+            data[f"rec:{spec}"] = "; ".join(names)
+        return [data.get(key, "") or ("нет" if key.startswith("rec:") else "") for key, _ in self._columns]
 
     def _get_selected_columns(self):
         """Список выбранных полей: [(key, title), ...]. Пусто, если ничего не выбрано."""
-        return [(PUPIL_COLUMNS[i][0], PUPIL_COLUMNS[i][1]) for i in range(len(PUPIL_COLUMNS))
+        return [self._columns[i] for i in range(len(self._columns))
                 if self.field_checks[i].isChecked()]
 
     def _fill_pupils_table(self):
@@ -232,16 +508,56 @@ class QueriesWindow(QWidget):
             return
         self.table.setColumnCount(len(selected))
         self.table.setHorizontalHeaderLabels([t for _, t in selected])
-        self.table.setRowCount(len(self._rows_list))
-        keys = [k for k, _ in selected]
-        for i, r in enumerate(self._rows_list):
-            cells = self._row_to_cells(r)
-            cell_map = dict(zip([k for k, _ in PUPIL_COLUMNS], cells))
-            for j, key in enumerate(keys):
-                self.table.setItem(i, j, QTableWidgetItem(str(cell_map.get(key, ""))))
+        self.table.setColumnHidden(3, False)
+        self.table.setRowCount(len(self._cells_list))
+        indexes = self._column_indexes(selected)
+        for i, cells in enumerate(self._cells_list):
+            for j, idx in enumerate(indexes):
+                self.table.setItem(i, j, QTableWidgetItem(str(cells[idx])))
+        self.table.resizeColumnsToContents()
+
+    def _reset_sort(self):
+        self._sort_key = None
+        self.table.horizontalHeader().setSortIndicatorShown(False)
 
+    def _on_header_clicked(self, column: int):
+        """
+        Сортировка списка учеников по колонке (повторный щелчок — в обратном порядке).
+        Поля учеников сортируются по снимку (id — как числа, класс и программа — в порядке справочников),
+        колонки рекомендаций — как текст.
+        """
+        selected = self._get_selected_columns()
+        if self._result_is_aggregate or not self._cells_list or column >= len(selected):
+            return
+        key = selected[column][0]
+        descending = self._sort_key == (key, False)
+        self._sort_key = (key, descending)
+        if key in CELL_KEYS:
+            snap = self._snapshot
+            snap.refresh()
+            positions = [snap.position(int(cells[0])) for cells in self._cells_list]
+            by_position = dict(zip(positions, self._cells_list))
+            ordered = snap.sort([p for p in positions if p is not None], [(key, descending)])
+            # Ученики, которых уже нет в базе, — в конце
+            self._cells_list = [by_position[p] for p in ordered] + [
+                cells for p, cells in zip(positions, self._cells_list) if p is None
+            ]
+        else:
+            idx = self._column_indexes([selected[column]])[0]
+            self._cells_list.sort(key=lambda cells: cells[idx], reverse=descending)
+        self._fill_pupils_table()
+        header = self.table.horizontalHeader()
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(column, Qt.DescendingOrder if descending else Qt.AscendingOrder)
+
+    def _column_indexes(self, selected) -> list:
+        """Позиции выбранных колонок в строке ячеек."""
+        positions = {k: i for i, (k, _) in enumerate(self._columns)}
+        return [positions[k] for k, _ in selected]
+
+    @timed_action
     def _export_excel(self):
-        if not self._rows_list:
+        if not self._cells_list:
             QMessageBox.information(self, "Экспорт", "Нет данных для экспорта. Выполните выборку.")
             return
         path, _ = QFileDialog.getSaveFileName(
@@ -263,28 +579,30 @@ class QueriesWindow(QWidget):
         if self._result_is_aggregate:
             headers = ["Программа", "Версия", "Количество учеников"]
             ws.append(headers)
-            for r in self._rows_list:
-                ws.append([r["program_name"] or "", r["program_version"] or "", r["pupils_count"]])
+            for cells in self._cells_list:
+                ws.append(cells[:3])
         else:
             selected = self._get_selected_columns()
             if not selected:
-                selected = [(k, t) for k, t in PUPIL_COLUMNS]
-            headers = [t for _, t in selected]
-            keys = [k for k, _ in selected]
-            ws.append(headers)
-            cell_map_keys = [k for k, _ in PUPIL_COLUMNS]
-            for r in self._rows_list:
-                cells = self._row_to_cells(r)
-                cell_map = dict(zip(cell_map_keys, cells))
-                row_data = [cell_map.get(key, "") for key in keys]
-                ws.append(row_data)
+                selected = list(self._columns)
+            ws.append([t for _, t in selected])
+            indexes = self._column_indexes(selected)
+            for cells in self._cells_list:
+                ws.append([cells[idx] for idx in indexes])
         wb.save(path)
 
     def _clear(self):
-        self._rows_list = []
+        self._cells_list = []
+        self.label_preset_status.setText("")
+        self._rec_map = {}
         self._result_is_aggregate = False
         self.table.setRowCount(0)
         self.table.setColumnCount(0)
         self.combo_class.setCurrentIndex(0)
         self.combo_program.setCurrentIndex(0)
+        self.combo_specialist.setCurrentIndex(0)
+        self.list_recommendations.clearSelection()
+        self.check_match_all.setChecked(False)
+        self.spin_grade_from.setValue(0)
+        self.spin_grade_to.setValue(0)
         self.radio_list.setChecked(True)
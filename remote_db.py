@@ -0,0 +1,333 @@
+"""
+Клиент сервера БД (db_server.py): RemoteDatabase с тем же интерфейсом, что у db.Database.
+Вызов метода уходит на сервер запросом HTTP/JSON; строки результата приходят как RemoteRow
+(доступ по имени и индексу, keys() — как у sqlite3.Row).
+Включается переменной окружения SVEDUCH_SERVER=http://хост:порт (см. main.open_database).
+"""
+import base64
+import http.client
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Optional
+from urllib.parse import urlsplit
+
+from db import UnknownLevelsError
+from pupil import Pupil
+
+# Заголовок с токеном доступа (если сервер запущен с --token)
+TOKEN_HEADER = "X-SvedUch-Token"
+DEFAULT_TIMEOUT_S = 60
+
+
+class RemoteError(OSError):
+    """Ошибка на стороне сервера, не соответствующая известному типу исключения."""
+
+
+class RemoteRow:
+    """Строка результата с сервера — замена sqlite3.Row."""
+
+    __slots__ = ("_keys", "_values", "_index")
+
+    def __init__(self, keys: list, values: list, index: Optional[dict] = None):
+        self._keys = keys
+        self._values = values
+        self._index = index if index is not None else {k: i for i, k in enumerate(keys)}
+
+    def keys(self) -> list:
+        return list(self._keys)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, slice)):
+            return self._values[key]
+        return self._values[self._index[key]]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, RemoteRow):
+            return self._keys == other._keys and self._values == other._values
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(tuple(self._values))
+
+    def __repr__(self) -> str:
+        return f"RemoteRow({dict(zip(self._keys, self._values))!r})"
+
+
+def _is_row(value) -> bool:
+    return isinstance(value, (sqlite3.Row, RemoteRow))
+
+
+def encode(value: Any) -> Any:
+    """Значение -> JSON-совместимая структура (строки, множества, даты, словари с нестроковыми ключами)."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if _is_row(value):
+        return {"__row__": [list(value.keys()), [encode(v) for v in value]]}
+    if isinstance(value, Pupil):
+        return {"__pupil__": [[encode(v) for v in value.values()], value.recommendation_ids]}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(v, Pupil) for v in value) and all(v.recommendation_ids is None for v in value):
+            # Список учеников: только значения PUPIL_FIELDS, без имён колонок
+            return {"__pupils__": [[encode(v) for v in p.values()] for p in value]}
+        if value and all(_is_row(v) for v in value):
+            # Список строк одного запроса: имена колонок один раз
+            return {"__rows__": [list(value[0].keys()), [[encode(v) for v in row] for row in value]]}
+        return [encode(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return {"__set__": [encode(v) for v in value]}
+    if isinstance(value, dict):
+        if all(isinstance(k, str) and not k.startswith("__") for k in value):
+            return {k: encode(v) for k, v in value.items()}
+        return {"__dict__": [[encode(k), encode(v)] for k, v in value.items()]}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, Path):
+        return str(value)
+    raise TypeError(f"Нельзя передать значение типа {type(value).__name__}")
+
+
+def decode(value: Any) -> Any:
+    if isinstance(value, list):
+        return [decode(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        tag, payload = next(iter(value.items()))
+        if tag == "__rows__":
+            keys, rows = payload
+            index = {k: i for i, k in enumerate(keys)}
+            return [RemoteRow(keys, [decode(v) for v in row], index) for row in rows]
+        if tag == "__pupils__":
+            return [Pupil.from_tuple([decode(v) for v in values]) for values in payload]
+        if tag == "__pupil__":
+            pupil = Pupil.from_tuple([decode(v) for v in payload[0]])
+            pupil.recommendation_ids = payload[1]
+            return pupil
+        if tag == "__row__":
+            return RemoteRow(payload[0], [decode(v) for v in payload[1]])
+        if tag == "__set__":
+            return frozenset(decode(v) for v in payload)
+        if tag == "__dict__":
+            return {decode(k): decode(v) for k, v in payload}
+        if tag == "__datetime__":
+            return datetime.fromisoformat(payload)
+        if tag == "__date__":
+            return date.fromisoformat(payload)
+        if tag == "__bytes__":
+            return base64.b64decode(payload)
+    return {k: decode(v) for k, v in value.items()}
+
+
+# Исключения, которые сервер передаёт по имени типа — окна ловят их так же, как у локальной БД
+_ERRORS = {
+    "ValueError": ValueError,
+    "UnknownLevelsError": UnknownLevelsError,
+    "KeyError": KeyError,
+    "TypeError": TypeError,
+    "IntegrityError": sqlite3.IntegrityError,
+    "OperationalError": sqlite3.OperationalError,
+    "DatabaseError": sqlite3.DatabaseError,
+    "Error": sqlite3.Error,
+}
+
+
+def error_from_payload(error: dict) -> Exception:
+    cls = _ERRORS.get(error.get("type"), RemoteError)
+    if cls is UnknownLevelsError:
+        return cls(error.get("values") or [])  # список значений — как у локальной БД
+    return cls(error.get("message", ""))
+
+
+class _Batch:
+    """Отложенные вызовы записи внутри RemoteDatabase.batch(); results — после выхода из блока."""
+
+    def __init__(self, remote: "RemoteDatabase"):
+        self._remote = remote
+        self.calls: list[dict] = []
+        self.results: list = []
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            self.calls.append({"method": name, "args": encode(list(args)), "kwargs": encode(kwargs)})
+
+        return call
+
+
+class RemoteDatabase:
+    """
+    Database через сервер db_server.py. Методы чтения и записи вызываются так же, как у Database;
+    уведомления об изменениях (add_change_listener) приходят в ответе на запись.
+    """
+
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = DEFAULT_TIMEOUT_S):
+        parts = urlsplit(url if "//" in url else f"http://{url}")
+        self._host = parts.hostname or "127.0.0.1"
+        self._port = parts.port or 8765
+        self._token = token
+        self._timeout = timeout
+        self._local = threading.local()
+        self._change_listeners: list[Callable[[str, Optional[frozenset]], None]] = []
+        self._batch: Optional[_Batch] = None
+        self._closed = False
+        info = self._request("GET", "/ping")
+        self._methods: dict[str, bool] = info["methods"]  # имя -> пишет ли метод
+        self._info = info
+
+    # --- транспорт ---
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+        return conn
+
+    def _request(self, method: str, path: str, payload: Optional[dict] = None, raw: bool = False):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"}
+        if self._token:
+            headers[TOKEN_HEADER] = self._token
+        for attempt in (0, 1):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # Сервер закрыл keep-alive соединение — один повтор на новом
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            try:
+                error = json.loads(data.decode("utf-8"))["error"]
+            except (ValueError, KeyError):
+                raise RemoteError(f"HTTP {response.status}: {data[:200]!r}") from None
+            raise error_from_payload(error)
+        if raw:
+            return data
+        return json.loads(data.decode("utf-8"))
+
+    def _dispatch_changes(self, changes: list) -> None:
+        for table, ids in changes:
+            changed = frozenset(ids) if ids is not None else None
+            for callback in list(self._change_listeners):
+                callback(table, changed)
+
+    def _call(self, name: str, args: tuple, kwargs: dict):
+        if self._batch is not None and self._methods.get(name):
+            self._batch.calls.append({"method": name, "args": encode(list(args)), "kwargs": encode(kwargs)})
+            return None
+        reply = self._request("POST", "/call", {"method": name, "args": encode(list(args)), "kwargs": encode(kwargs)})
+        self._dispatch_changes(reply.get("changes", []))
+        return decode(reply["result"])
+
+    def __getattr__(self, name: str):
+        methods = self.__dict__.get("_methods")
+        if methods is None or name not in methods:
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            return self._call(name, args, kwargs)
+
+        method.__name__ = name
+        return method
+
+    # --- интерфейс Database, не сводящийся к вызову метода на сервере ---
+
+    @property
+    def path(self) -> Path:
+        """Путь к файлу БД на сервере."""
+        return Path(self._info["path"])
+
+    @property
+    def url(self) -> str:
+        return f"http://{self._host}:{self._port}"
+
+    @property
+    def read_only(self) -> bool:
+        return False
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closed
+
+    @property
+    def journal_mode(self) -> str:
+        return self._info.get("journal_mode", "")
+
+    @property
+    def profiler(self):
+        """Профилирование выполняется на сервере (db_server.py --slow-ms)."""
+        return None
+
+    def enable_profiling(self, threshold_ms: float = 100.0, slow_log_path=None):
+        return None
+
+    def disable_profiling(self) -> None:
+        pass
+
+    def reader(self) -> "RemoteDatabase":
+        """Чтение на сервере и так идёт через пул читателей."""
+        return self
+
+    @contextmanager
+    def snapshot(self):
+        """Каждый вызов читает согласованно на сервере; снимок на несколько вызовов не поддерживается."""
+        yield self
+
+    @contextmanager
+    def batch(self):
+        """Записи внутри блока отправляются одним запросом и выполняются на сервере одной транзакцией."""
+        if self._batch is not None:
+            yield self._batch
+            return
+        self._batch = batch = _Batch(self)
+        try:
+            yield batch
+        except BaseException:
+            self._batch = None
+            raise
+        self._batch = None
+        if batch.calls:
+            reply = self._request("POST", "/batch", {"calls": batch.calls})
+            batch.results = decode(reply["results"])
+            self._dispatch_changes(reply.get("changes", []))
+
+    def add_change_listener(self, callback: Callable[[str, Optional[frozenset]], None]) -> None:
+        self._change_listeners.append(callback)
+
+    def remove_change_listener(self, callback: Callable[[str, Optional[frozenset]], None]) -> None:
+        if callback in self._change_listeners:
+            self._change_listeners.remove(callback)
+
+    def backup_to(self, dest_path: str | Path) -> None:
+        """Резервная копия: сервер делает согласованную копию, клиент сохраняет её в dest_path."""
+        dest = Path(dest_path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(self._request("GET", "/backup", raw=True))
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        self._closed = True
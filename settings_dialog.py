@@ -1,10 +1,14 @@
 """
-Окно настроек приложения и диалог "О программе".
+Окно настроек приложения, диалог "Диагностика" (профилирование SQL) и диалог "О программе".
 """
 import os
+from datetime import date
+
 from PyQt5.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QComboBox,
     QFormLayout, QDialogButtonBox, QMessageBox, QSpinBox, QGroupBox,
+    QCheckBox, QTabWidget, QTableWidget, QTableWidgetItem, QAbstractItemView, QFileDialog,
+    QInputDialog,
 )
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon, QFont
@@ -12,6 +16,26 @@ from PyQt5.QtGui import QIcon, QFont
 from version import __version__
 from app_icon import get_icon_path
 from db import Database
+from perf_trace import recorder
+
+# Порог медленного запроса по умолчанию, мс
+DEFAULT_SLOW_QUERY_MS = 100
+
+
+def slow_query_ms(db: Database) -> int:
+    """Порог журнала медленных запросов из настроек."""
+    try:
+        return max(1, int(db.settings_get("slow_query_ms") or DEFAULT_SLOW_QUERY_MS))
+    except ValueError:
+        return DEFAULT_SLOW_QUERY_MS
+
+
+def apply_sql_profiling(db: Database) -> None:
+    """Включает или выключает профилирование SQL согласно настройкам."""
+    if db.settings_get("sql_profiling") == "1":
+        db.enable_profiling(slow_query_ms(db))
+    elif db.profiler is not None:
+        db.disable_profiling()
 
 
 class SettingsDialog(QDialog):
@@ -71,6 +95,42 @@ class SettingsDialog(QDialog):
         font_layout.addRow("Размер шрифта панелей:", self.font_size_spin)
         font_group.setLayout(font_layout)
         layout.addWidget(font_group)
+
+        # Группа "Диагностика"
+        diag_group = QGroupBox("Диагностика")
+        diag_layout = QFormLayout()
+
+        self.profiling_check = QCheckBox("Профилирование SQL-запросов")
+        self.profiling_check.setChecked(self.db.settings_get("sql_profiling") == "1")
+        diag_layout.addRow(self.profiling_check)
+
+        self.slow_query_spin = QSpinBox()
+        self.slow_query_spin.setRange(1, 60000)
+        self.slow_query_spin.setSuffix(" мс")
+        self.slow_query_spin.setValue(slow_query_ms(self.db))
+        diag_layout.addRow("Медленный запрос от:", self.slow_query_spin)
+        diag_group.setLayout(diag_layout)
+        layout.addWidget(diag_group)
+
+        # Группа "Архивный файл": старые записи архива и закрытые периоды анализа
+        archive_group = QGroupBox("Архивный файл")
+        archive_layout = QVBoxLayout()
+        self.archive_label = QLabel()
+        self.archive_label.setWordWrap(True)
+        archive_layout.addWidget(self.archive_label)
+        archive_buttons = QHBoxLayout()
+        btn_history = QPushButton("Перенести архив учеников…")
+        btn_history.setToolTip("Записи архива учеников, переведённых до указанного года, — в архивный файл")
+        btn_history.clicked.connect(self._archive_history)
+        archive_buttons.addWidget(btn_history)
+        btn_period = QPushButton("Закрыть период анализа…")
+        btn_period.setToolTip("Результаты прошедшего периода из таблицы анализа — в архивный файл")
+        btn_period.clicked.connect(self._archive_analysis_period)
+        archive_buttons.addWidget(btn_period)
+        archive_layout.addLayout(archive_buttons)
+        archive_group.setLayout(archive_layout)
+        layout.addWidget(archive_group)
+        self._update_archive_label()
         
         # Кнопки
         buttons = QDialogButtonBox(
@@ -93,9 +153,219 @@ class SettingsDialog(QDialog):
         # Сохраняем размер шрифта
         font_size = str(self.font_size_spin.value())
         self.db.settings_set("font_size", font_size)
+
+        # Профилирование SQL
+        self.db.settings_set("sql_profiling", "1" if self.profiling_check.isChecked() else "0")
+        self.db.settings_set("slow_query_ms", str(self.slow_query_spin.value()))
+        apply_sql_profiling(self.db)
         
         self.accept()
 
+    def _update_archive_label(self):
+        stats = self.db.archive_stats()
+        mb = 1024 * 1024
+        text = "Файл БД: %.1f МБ, записей архива учеников: %d." % (stats["hot_bytes"] / mb, stats["history"])
+        if stats["archive_bytes"]:
+            text += "\nАрхивный файл: %.1f МБ, записей архива учеников: %d, результатов анализа: %d." % (
+                stats["archive_bytes"] / mb, stats["history_archived"], stats["analysis_archived"])
+        else:
+            text += "\nАрхивного файла нет."
+        self.archive_label.setText(text)
+
+    def _archive_history(self):
+        """Переносит старые записи pupils_history в архивный файл."""
+        year, ok = QInputDialog.getInt(
+            self, "Архив учеников", "Перенести записи с датой перевода раньше года:",
+            date.today().year - 1, 1900, 2999,
+        )
+        if not ok:
+            return
+        try:
+            moved = self.db.archive_move_history(year)
+            if moved:
+                self.db.compact()
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", "Не удалось перенести записи в архивный файл:\n%s" % e)
+            return
+        self._update_archive_label()
+        QMessageBox.information(self, "Архив учеников", "Перенесено записей: %d." % moved)
+
+    def _archive_analysis_period(self):
+        """Переносит результаты закрытого периода анализа в архивный файл."""
+        try:
+            current = self.db.analysis_result_column_name(
+                self.db.settings_get("school_year"), self.db.settings_get("school_period"))
+        except ValueError:
+            current = ""
+        columns = [c for c in self.db.analysis_result_columns() if c != current]
+        if not columns:
+            QMessageBox.information(self, "Закрыть период", "Нет закрытых периодов в таблице анализа.")
+            return
+        column, ok = QInputDialog.getItem(self, "Закрыть период", "Период (колонка результатов):", columns, 0, False)
+        if not ok:
+            return
+        answer = QMessageBox.question(
+            self, "Закрыть период",
+            "Результаты %s будут перенесены в архивный файл. Продолжить?" % column,
+        )
+        if answer != QMessageBox.Yes:
+            return
+        try:
+            moved = self.db.archive_move_analysis_period(column)
+            self.db.compact()
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", "Не удалось перенести период в архивный файл:\n%s" % e)
+            return
+        self._update_archive_label()
+        QMessageBox.information(self, "Закрыть период", "Перенесено результатов: %d." % moved)
+
+
+class DiagnosticsDialog(QDialog):
+    """Диалог "Диагностика": статистика SQL-запросов профилировщика БД и замеры действий интерфейса."""
+
+    STATEMENT_HEADERS = ["Запрос", "Выполнений", "Всего, мс", "Среднее, мс", "p95, мс", "Макс., мс", "Строк", "Чаще всего из"]
+    SOURCE_HEADERS = ["Источник", "Запросов", "Всего, мс"]
+    TRACE_HEADERS = ["Команда SQLite", "Программ (с триггерами)"]
+    ACTION_HEADERS = ["Действие", "Выполнений", "Всего, мс", "Среднее, мс", "Макс., мс", "БД в среднем, мс", "Отрисовка в среднем, мс"]
+
+    def __init__(self, db: Database, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.setWindowTitle("Диагностика")
+
+        icon_path = get_icon_path()
+        if os.path.exists(icon_path):
+            self.setWindowIcon(QIcon(icon_path))
+
+        layout = QVBoxLayout(self)
+
+        self.label_status = QLabel()
+        self.label_status.setWordWrap(True)
+        layout.addWidget(self.label_status)
+        self.label_lock = QLabel()
+        self.label_lock.setWordWrap(True)
+        layout.addWidget(self.label_lock)
+
+        self.tabs = QTabWidget()
+        self.table_statements = self._make_table(self.STATEMENT_HEADERS)
+        self.table_sources = self._make_table(self.SOURCE_HEADERS)
+        self.table_trace = self._make_table(self.TRACE_HEADERS)
+        self.table_actions = self._make_table(self.ACTION_HEADERS)
+        self.tabs.addTab(self.table_actions, "Действия интерфейса")
+        self.tabs.addTab(self.table_statements, "Запросы")
+        self.tabs.addTab(self.table_sources, "По источникам")
+        self.tabs.addTab(self.table_trace, "Трассировка SQLite")
+        layout.addWidget(self.tabs)
+
+        btn_layout = QHBoxLayout()
+        self.btn_enable = QPushButton("Включить профилирование")
+        self.btn_enable.setToolTip("Включить до перезапуска; постоянно — в «Настройках»")
+        self.btn_enable.clicked.connect(self._enable)
+        btn_layout.addWidget(self.btn_enable)
+        btn_refresh = QPushButton("Обновить")
+        btn_refresh.clicked.connect(self._refresh)
+        btn_layout.addWidget(btn_refresh)
+        btn_reset = QPushButton("Сбросить")
+        btn_reset.clicked.connect(self._reset)
+        btn_layout.addWidget(btn_reset)
+        btn_export = QPushButton("Сохранить трассировку…")
+        btn_export.setToolTip("Последние действия и запросы в формате Chrome trace (chrome://tracing, ui.perfetto.dev)")
+        btn_export.clicked.connect(self._export_trace)
+        btn_layout.addWidget(btn_export)
+        btn_layout.addStretch()
+        btn_close = QPushButton("Закрыть")
+        btn_close.clicked.connect(self.accept)
+        btn_layout.addWidget(btn_close)
+        layout.addLayout(btn_layout)
+
+        self.resize(1000, 600)
+        self._refresh()
+
+    @staticmethod
+    def _make_table(headers: list) -> QTableWidget:
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.setWordWrap(False)
+        table.horizontalHeader().setStretchLastSection(True)
+        return table
+
+    @staticmethod
+    def _fill_table(table: QTableWidget, rows: list) -> None:
+        table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                if isinstance(value, float):
+                    item = QTableWidgetItem(f"{value:.2f}")
+                else:
+                    item = QTableWidgetItem(str(value))
+                if j == 0:
+                    item.setToolTip(str(value))
+                else:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                table.setItem(i, j, item)
+        table.resizeColumnsToContents()
+        if table.columnWidth(0) > 450:
+            table.setColumnWidth(0, 450)
+
+    def _refresh(self):
+        self._fill_table(self.table_actions, [
+            (r["name"], r["count"], r["total_ms"], r["avg_ms"], r["max_ms"], r["db_avg_ms"], r["paint_avg_ms"])
+            for r in recorder.actions()
+        ])
+        locks = self.db.lock_stats()
+        self.label_lock.setText(
+            f"Журнал БД: {self.db.journal_mode}. Ожиданий блокировки при записи: {locks['waits']}, "
+            f"повторов: {locks['retries']}, неудач: {locks['failures']}, "
+            f"всего ждали: {locks['wait_total_s'] * 1000:.0f} мс, самое долгое: {locks['wait_max_s'] * 1000:.0f} мс"
+        )
+        profiler = self.db.profiler
+        self.btn_enable.setVisible(profiler is None)
+        if profiler is None:
+            self.label_status.setText(
+                "Профилирование SQL выключено: запросы и время в БД у действий не замеряются. "
+                "Включите его здесь (до перезапуска) или в «Настройки» → «Диагностика»."
+            )
+            for table in (self.table_statements, self.table_sources, self.table_trace):
+                table.setRowCount(0)
+            return
+        self.label_status.setText(
+            f"Порог медленного запроса: {profiler.threshold_ms:g} мс. "
+            f"Журнал медленных запросов: {profiler.slow_log_path}"
+        )
+        self._fill_table(self.table_statements, [
+            (r["sql"], r["count"], r["total_ms"], r["avg_ms"], r["p95_ms"], r["max_ms"], r["rows"], r["source"])
+            for r in profiler.statements()
+        ])
+        self._fill_table(self.table_sources, [
+            (r["source"], r["count"], r["total_ms"]) for r in profiler.sources()
+        ])
+        self._fill_table(self.table_trace, profiler.traced())
+
+    def _enable(self):
+        self.db.enable_profiling(slow_query_ms(self.db))
+        self._refresh()
+
+    def _reset(self):
+        recorder.reset()
+        if self.db.profiler is not None:
+            self.db.profiler.reset()
+        self._refresh()
+
+    def _export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить трассировку", "SvedUch_trace.json", "Chrome trace (*.json)"
+        )
+        if not path:
+            return
+        try:
+            count = recorder.export_chrome_trace(path)
+        except OSError as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить трассировку:\n{e}")
+            return
+        QMessageBox.information(self, "Трассировка", f"Сохранено событий: {count}\n{path}")
+
 
 class AboutDialog(QDialog):
     """Диалог "О программе"."""
@@ -0,0 +1,276 @@
+"""
+Профилирование SQL для Database (без зависимостей от Qt).
+Соединение ProfilingConnection и курсор ProfilingCursor замеряют каждое выполнение запроса
+(execute + выборка строк), SqlProfiler копит статистику по тексту запроса: число выполнений,
+суммарное время, p95, число строк и откуда вызван (модуль.функция вне db.py).
+Через set_trace_callback считаются все программы SQLite: срабатывание триггера приходит
+с текстом внешнего запроса, поэтому счётчик трассировки больше числа выполнений — это работа триггеров.
+Запросы дольше порога пишутся в журнал медленных запросов (RotatingFileHandler).
+"""
+import logging
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Callable, Optional
+
+SLOW_LOG_NAME = "sveduch.sql.slow"
+SLOW_LOG_MAX_BYTES = 1_000_000
+SLOW_LOG_BACKUPS = 3
+# Сколько последних замеров хранить на запрос для p95
+_SAMPLES_PER_STATEMENT = 512
+# Файлы, кадры которых пропускаются при поиске источника запроса
+_SKIP_SOURCE_FILES = {"db.py", "sql_profiler.py", "contextlib.py"}
+
+# Наблюдатели за каждым учтённым запросом: fn(sql, секунды, строк) — например, perf_trace
+_observers: list[Callable[[str, float, int], None]] = []
+
+_WS_RE = re.compile(r"\s+")
+_IN_LIST_RE = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+def normalize_sql(sql: str) -> str:
+    """Ключ статистики: пробелы схлопнуты, списки «?, ?, …» (IN по пачкам id) — в один «?…»."""
+    return _IN_LIST_RE.sub("?…", _WS_RE.sub(" ", sql).strip())
+
+
+def add_observer(callback: Callable[[str, float, int], None]) -> None:
+    """Подписка на каждый учтённый запрос (вызывается в потоке, выполнившем запрос)."""
+    if callback not in _observers:
+        _observers.append(callback)
+
+
+def _caller() -> str:
+    """Первый кадр стека вне db.py/профилировщика: «модуль.функция»."""
+    frame = sys._getframe(2)
+    while frame is not None and Path(frame.f_code.co_filename).name in _SKIP_SOURCE_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    return f"{Path(frame.f_code.co_filename).stem}.{frame.f_code.co_name}"
+
+
+class StatementStats:
+    __slots__ = ("sql", "count", "total", "rows", "max", "samples", "sources")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.rows = 0
+        self.max = 0.0
+        self.samples: deque = deque(maxlen=_SAMPLES_PER_STATEMENT)
+        self.sources: Counter = Counter()
+
+    def p95(self) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class SqlProfiler:
+    """Статистика выполнения запросов и журнал медленных запросов."""
+
+    def __init__(self, threshold_ms: float = 100.0, slow_log_path: Optional[str | Path] = None):
+        self.threshold_ms = threshold_ms
+        self.slow_log_path = Path(slow_log_path) if slow_log_path else None
+        self._lock = threading.Lock()
+        self._stats: dict[str, StatementStats] = {}
+        self._traced: Counter = Counter()
+        self._logger = logging.getLogger(SLOW_LOG_NAME)
+        self._logger.propagate = False
+        self._logger.setLevel(logging.WARNING)
+        if self.slow_log_path is not None and not any(
+            isinstance(h, RotatingFileHandler) and Path(h.baseFilename) == self.slow_log_path.resolve()
+            for h in self._logger.handlers
+        ):
+            self.slow_log_path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                self.slow_log_path, maxBytes=SLOW_LOG_MAX_BYTES, backupCount=SLOW_LOG_BACKUPS, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._logger.addHandler(handler)
+
+    def record(self, sql: str, seconds: float, rows: int, source: str) -> None:
+        """Учесть одно выполнение запроса (execute и выборка строк)."""
+        key = normalize_sql(sql)
+        with self._lock:
+            st = self._stats.get(key)
+            if st is None:
+                st = self._stats[key] = StatementStats(key)
+            st.count += 1
+            st.total += seconds
+            st.rows += rows
+            st.max = max(st.max, seconds)
+            st.samples.append(seconds)
+            st.sources[source] += 1
+        for callback in _observers:
+            callback(key, seconds, rows)
+        if seconds * 1000 >= self.threshold_ms:
+            self._logger.warning("%.1f мс, строк: %d, источник: %s | %s", seconds * 1000, rows, source, key)
+
+    def trace(self, statement: str) -> None:
+        """Callback для Connection.set_trace_callback: каждая программа SQLite, включая триггеры и executescript."""
+        key = normalize_sql(statement)
+        with self._lock:
+            self._traced[key] += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._traced.clear()
+
+    def statements(self) -> list[dict]:
+        """Статистика по запросам, по убыванию суммарного времени."""
+        with self._lock:
+            stats = list(self._stats.values())
+            result = [{
+                "sql": st.sql,
+                "count": st.count,
+                "total_ms": st.total * 1000,
+                "avg_ms": st.total * 1000 / st.count,
+                "p95_ms": st.p95() * 1000,
+                "max_ms": st.max * 1000,
+                "rows": st.rows,
+                "source": st.sources.most_common(1)[0][0] if st.sources else "",
+            } for st in stats]
+        return sorted(result, key=lambda r: r["total_ms"], reverse=True)
+
+    def sources(self) -> list[dict]:
+        """Сводка по источникам (окно/функция): число запросов и суммарное время."""
+        by_source: dict[str, dict] = {}
+        with self._lock:
+            for st in self._stats.values():
+                share = st.total / st.count if st.count else 0.0
+                for source, n in st.sources.items():
+                    agg = by_source.setdefault(source, {"source": source, "count": 0, "total_ms": 0.0})
+                    agg["count"] += n
+                    agg["total_ms"] += share * n * 1000
+        return sorted(by_source.values(), key=lambda r: r["total_ms"], reverse=True)
+
+    def traced(self) -> list[tuple[str, int]]:
+        """Команды SQLite из трассировки: [(текст, число)], по убыванию числа."""
+        with self._lock:
+            return self._traced.most_common()
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Курсор, замеряющий execute и выборку строк; выполнение учитывается, когда строки выбраны или курсор освобождён."""
+
+    _pending: Optional[list] = None  # [sql, секунды, строк, источник]
+
+    def _profiler(self) -> Optional[SqlProfiler]:
+        return getattr(self.connection, "profiler", None)
+
+    def _finish(self) -> None:
+        pending, self._pending = self._pending, None
+        profiler = self._profiler()
+        if pending is None or profiler is None:
+            return
+        sql, seconds, rows, source = pending
+        if rows == 0 and self.rowcount > 0:
+            rows = self.rowcount  # INSERT/UPDATE/DELETE: затронуто строк
+        profiler.record(sql, seconds, rows, source)
+
+    def _add(self, seconds: float, rows: int) -> None:
+        if self._pending is not None:
+            self._pending[1] += seconds
+            self._pending[2] += rows
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        source = _caller()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._pending = [sql, time.perf_counter() - start, 0, source]
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        source = _caller()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._pending = [sql, time.perf_counter() - start, 0, source]
+            self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - start, 0 if row is None else 1)
+        self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(time.perf_counter() - start, len(rows))
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - start, len(rows))
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - start, 0)
+            self._finish()
+            raise
+        self._add(time.perf_counter() - start, 1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """Соединение, у которого execute/executemany/executescript идут через ProfilingCursor."""
+
+    profiler: Optional[SqlProfiler] = None
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        cur = self.cursor()
+        cur.execute(sql, parameters)
+        return cur
+
+    def executemany(self, sql, seq_of_parameters):
+        cur = self.cursor()
+        cur.executemany(sql, seq_of_parameters)
+        return cur
+
+    def executescript(self, sql_script):
+        source = _caller()
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            if self.profiler is not None:
+                self.profiler.record(sql_script, time.perf_counter() - start, 0, source)
@@ -2,7 +2,7 @@
 Окно «Таблицы» и диалоги для работы с таблицами БД (этап 3).
 """
 import os
-from datetime import datetime, timedelta
+from typing import Optional
 from PyQt5.QtWidgets import (
     QWidget,
     QVBoxLayout,
@@ -24,12 +24,24 @@ from PyQt5.QtWidgets import (
     QListWidgetItem,
     QComboBox,
     QGroupBox,
+    QCompleter,
+    QStyledItemDelegate,
+    QCheckBox,
+    QMenu,
+    QInputDialog,
+    QProgressDialog,
 )
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QIcon, QColor
 
 from app_icon import get_icon_path
+from data_bus import RefreshOnShowMixin, bus_for
+from date_widget import DateLineEdit
 from db import Database
+from excel_import import ImportSource, class_from_name, folder_sources, parse_sources, workbook_sources
+from perf_trace import timed_action
+from pupil import CELL_KEYS, Pupil
+from pupils_snapshot import DEFAULT_ORDER, snapshot_for
 from pupil_form import PupilEntryTab, EditPupilTab
 
 
@@ -103,119 +115,15 @@ class TablesWindow(QWidget):
         self._open_window(SettingsDialog)
 
 
-def _row_to_dict(row) -> dict:
-    """sqlite3.Row -> dict."""
-    return {k: row[k] for k in row.keys()}
-
-
-# Ожидаемые графы для загрузки из Excel (п. 9 PROJECT.md)
-EXCEL_LOAD_COLUMNS = ["Фамилия", "Имя", "Отчество", "Дата рождения", "Домашний адрес", "Пол"]
-
-
-def _read_pupils_from_excel(path: str) -> tuple[list[dict], list[str]]:
-    """
-    Читает из файла Excel таблицу с графами Фамилия, Имя, Отчество, Дата рождения, Домашний адрес, Пол.
-    Возвращает (список словарей с ключами surname, name, patronymic, birth_date, address, gender;
-                 список сообщений об ошибках по строкам).
-    При ошибке формата файла или отсутствии обязательных граф выбрасывает ValueError.
-    """
-    import openpyxl
-    from openpyxl.utils.exceptions import InvalidFileException
-
-    try:
-        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
-    except InvalidFileException as e:
-        raise ValueError(f"Неверный формат файла или файл не Excel: {e}")
-    except Exception as e:
-        raise ValueError(f"Ошибка открытия файла: {e}")
-
-    try:
-        ws = wb.active
-        if ws is None:
-            raise ValueError("В книге нет активного листа.")
-        rows = list(ws.iter_rows(values_only=True))
-    finally:
-        wb.close()
-
-    if not rows:
-        raise ValueError("Файл не содержит данных.")
-
-    header_row = [str(c).strip() if c is not None else "" for c in rows[0]]
-    col_index = {}
-    missing = []
-    for col_name in EXCEL_LOAD_COLUMNS:
-        try:
-            idx = header_row.index(col_name)
-            col_index[col_name] = idx
-        except ValueError:
-            missing.append(col_name)
-    if missing:
-        raise ValueError(
-            f"В файле отсутствуют обязательные графы: {', '.join(missing)}. "
-            f"Ожидаются: {', '.join(EXCEL_LOAD_COLUMNS)}."
-        )
-
-    def _cell(row, col_name):
-        idx = col_index[col_name]
-        if idx >= len(row):
-            return ""
-        v = row[idx]
-        if v is None:
-            return ""
-        return str(v).strip()
-
-    def _normalize_date(val):
-        """Приводит дату к формату дд.мм.гггг. val может быть строкой, числом (Excel) или datetime."""
-        if val is None:
-            return ""
-        # openpyxl data_only может вернуть datetime — сразу в нужный формат
-        if isinstance(val, datetime):
-            return val.strftime("%d.%m.%Y")
-        s = str(val).strip()
-        if not s:
-            return ""
-        # Excel: число дней от 1899-12-30
-        try:
-            n = float(s)
-            if 1000 < n < 100000:
-                d = datetime(1899, 12, 30) + timedelta(days=int(n))
-                return d.strftime("%d.%m.%Y")
-        except (ValueError, TypeError):
-            pass
-        # Строка в формате гггг-мм-дд или гггг-мм-дд чч:мм:сс
-        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
-            try:
-                d = datetime.strptime(s[:19] if len(s) > 10 else s, fmt)
-                return d.strftime("%d.%m.%Y")
-            except ValueError:
-                continue
-        # Уже дд.мм.гггг или другой формат — не трогать
-        return s
-
-    result = []
-    errors = []
-    for i, row in enumerate(rows[1:], start=2):
-        row = list(row) if row else []
-        surname = _cell(row, "Фамилия")
-        name = _cell(row, "Имя")
-        if not surname and not name and not _cell(row, "Отчество"):
-            continue
-        if not surname or not name:
-            errors.append(f"Строка {i}: не заполнены Фамилия или Имя.")
-            continue
-        result.append({
-            "surname": surname,
-            "name": name,
-            "patronymic": _cell(row, "Отчество"),
-            "birth_date": _normalize_date(_cell(row, "Дата рождения")),
-            "address": _cell(row, "Домашний адрес"),
-            "gender": _cell(row, "Пол"),
-        })
-    return result, errors
+# Колонки pupils_history в порядке ячеек таблицы архива
+_ARCHIVE_CELL_COLUMNS = (
+    "id", "form_id", "surname", "name", "patronymic", "address", "gender",
+    "transfer_date", "transfer_reason", "recommendations",
+)
 
 
 # --- Справочник: Классы ---
-class FormsTableDialog(QWidget):
+class FormsTableDialog(RefreshOnShowMixin, QWidget):
     def __init__(self, db: Database, parent=None):
         super().__init__(parent)
         self.db = db
@@ -244,6 +152,12 @@ class FormsTableDialog(QWidget):
         btn_layout.addWidget(refresh_btn)
         layout.addLayout(btn_layout)
         self._refresh()
+        bus_for(self.db).table_changed.connect(self._on_data_changed)
+
+    @pyqtSlot(str, object)
+    def _on_data_changed(self, table: str, ids):
+        if table == "forms" and not self.defer_if_hidden(table, ids):
+            self._refresh()
 
     def _refresh(self):
         rows = self.db.forms_get_all()
@@ -257,7 +171,6 @@ class FormsTableDialog(QWidget):
         if d.exec_() == QDialog.Accepted and d.number:
             try:
                 self.db.forms_add(d.number)
-                self._refresh()
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", str(e))
 
@@ -272,7 +185,6 @@ class FormsTableDialog(QWidget):
         if d.exec_() == QDialog.Accepted and d.number:
             try:
                 self.db.forms_update(id_val, d.number)
-                self._refresh()
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", str(e))
 
@@ -287,7 +199,6 @@ class FormsTableDialog(QWidget):
             return
         try:
             self.db.forms_delete(id_val)
-            self._refresh()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", str(e))
 
@@ -313,7 +224,7 @@ class FormEditDialog(QDialog):
 
 
 # --- Справочник: Программы ---
-class ProgramsTableDialog(QWidget):
+class ProgramsTableDialog(RefreshOnShowMixin, QWidget):
     def __init__(self, db: Database, parent=None):
         super().__init__(parent)
         self.db = db
@@ -335,6 +246,12 @@ class ProgramsTableDialog(QWidget):
             btn_layout.addWidget(b)
         layout.addLayout(btn_layout)
         self._refresh()
+        bus_for(self.db).table_changed.connect(self._on_data_changed)
+
+    @pyqtSlot(str, object)
+    def _on_data_changed(self, table: str, ids):
+        if table == "programs" and not self.defer_if_hidden(table, ids):
+            self._refresh()
 
     def _refresh(self):
         rows = self.db.programs_get_all()
@@ -349,7 +266,6 @@ class ProgramsTableDialog(QWidget):
         if d.exec_() == QDialog.Accepted and d.name:
             try:
                 self.db.programs_add(d.name, d.version)
-                self._refresh()
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", str(e))
 
@@ -365,7 +281,6 @@ class ProgramsTableDialog(QWidget):
         if d.exec_() == QDialog.Accepted and d.name:
             try:
                 self.db.programs_update(id_val, d.name, d.version)
-                self._refresh()
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", str(e))
 
@@ -380,7 +295,6 @@ class ProgramsTableDialog(QWidget):
             return
         try:
             self.db.programs_delete(id_val)
-            self._refresh()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", str(e))
 
@@ -681,7 +595,7 @@ class _StandardEditDialog(QDialog):
 
 
 # --- Справочник: Рекомендации ---
-class RecommendationsTableDialog(QWidget):
+class RecommendationsTableDialog(RefreshOnShowMixin, QWidget):
     def __init__(self, db: Database, parent=None):
         super().__init__(parent)
         self.db = db
@@ -704,6 +618,12 @@ class RecommendationsTableDialog(QWidget):
             btn_layout.addWidget(b)
         layout.addLayout(btn_layout)
         self._refresh()
+        bus_for(self.db).table_changed.connect(self._on_data_changed)
+
+    @pyqtSlot(str, object)
+    def _on_data_changed(self, table: str, ids):
+        if table == "recommendations" and not self.defer_if_hidden(table, ids):
+            self._refresh()
 
     def _refresh(self):
         rows = self.db.recommendations_get_all()
@@ -718,7 +638,6 @@ class RecommendationsTableDialog(QWidget):
         if d.exec_() == QDialog.Accepted and d.specialist_name:
             try:
                 self.db.recommendations_add(d.specialist_name, d.recommendation_name)
-                self._refresh()
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", str(e))
 
@@ -734,7 +653,6 @@ class RecommendationsTableDialog(QWidget):
         if d.exec_() == QDialog.Accepted and d.specialist_name:
             try:
                 self.db.recommendations_update(id_val, d.specialist_name, d.recommendation_name)
-                self._refresh()
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", str(e))
 
@@ -749,7 +667,6 @@ class RecommendationsTableDialog(QWidget):
             return
         try:
             self.db.recommendations_delete(id_val)
-            self._refresh()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", str(e))
 
@@ -815,7 +732,8 @@ class PupilsWindow(QWidget):
         self.tabs = QTabWidget()
         self.list_tab = PupilsTableDialog(self.db, self, pupils_window=self)
         self.tabs.addTab(self.list_tab, "Список учеников")
-        self.tabs.addTab(PupilEntryTab(self.db, self), "Добавить ученика")
+        self.entry_tab = PupilEntryTab(self.db, self)
+        self.tabs.addTab(self.entry_tab, "Добавить ученика")
         self.edit_tab = EditPupilTab(self.db, self)
         self.tabs.addTab(self.edit_tab, "Изменения по ученику")
         layout.addWidget(self.tabs)
@@ -824,6 +742,12 @@ class PupilsWindow(QWidget):
     def switch_to_add_tab(self):
         self.tabs.setCurrentIndex(1)
 
+    def closeEvent(self, event):
+        if self.list_tab.confirm_discard_edits() and self.entry_tab.confirm_discard_queue():
+            event.accept()
+        else:
+            event.ignore()
+
     def switch_to_edit_tab_with_pupil_id(self, pupil_id: int) -> bool:
         if self.edit_tab.load_pupil_by_id(pupil_id):
             self.tabs.setCurrentIndex(2)
@@ -831,15 +755,116 @@ class PupilsWindow(QWidget):
         return False
 
 
-class PupilsTableDialog(QWidget):
+# Колонки таблицы учеников, которые правятся прямо в ячейке: {номер колонки: поле pupils}
+_INLINE_EDIT_COLUMNS = {
+    CELL_KEYS.index(key): key
+    for key in ("surname", "name", "patronymic", "birth_date", "address", "gender",
+                "pmpk_date", "pmpk_number", "order_number", "order_date")
+}
+_DATE_KEYS = ("birth_date", "pmpk_date", "order_date")
+# Ограничения длины — как в форме ввода ученика
+_MAX_LENGTH = {"address": 50, "gender": 4}
+_DIRTY_COLOR = QColor(255, 244, 200)
+
+
+class _PupilCellDelegate(QStyledItemDelegate):
+    """Редактор ячейки ученика: даты — DateLineEdit, адрес и пол — с ограничением длины, как в форме."""
+    def createEditor(self, parent, option, index):
+        key = _INLINE_EDIT_COLUMNS.get(index.column())
+        if key in _DATE_KEYS:
+            return DateLineEdit(parent)
+        editor = QLineEdit(parent)
+        if key in _MAX_LENGTH:
+            editor.setMaxLength(_MAX_LENGTH[key])
+        return editor
+
+
+class PupilsBulkEditDialog(QDialog):
+    """Групповое изменение: отмеченные поля записываются всем выбранным ученикам (db.pupils_update_many)."""
+
+    def __init__(self, db: Database, count: int, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Изменить выбранных учеников ({count})")
+        layout = QFormLayout(self)
+        layout.addRow(QLabel("Отметьте поля, которые нужно записать всем выбранным ученикам."))
+        self.class_combo = QComboBox()
+        for r in db.forms_get_all():
+            self.class_combo.addItem(r["number"], r["id"])
+        self.program_combo = QComboBox()
+        self.program_combo.addItem("— не указана —", None)
+        for r in db.programs_get_all():
+            self.program_combo.addItem(f"{r['name']} ({r['version']})", r["id"])
+        self._fields = [
+            ("form_id", "Класс", self.class_combo),
+            ("program_id", "Программа", self.program_combo),
+            ("pmpk_date", "ПМПК дата", DateLineEdit()),
+            ("pmpk_number", "ПМПК №", QLineEdit()),
+            ("order_number", "Приказ №", QLineEdit()),
+            ("order_date", "Дата приказа", DateLineEdit()),
+        ]
+        self._checks = {}
+        for key, label, editor in self._fields:
+            check = QCheckBox(label)
+            editor.setEnabled(False)
+            check.toggled.connect(editor.setEnabled)
+            layout.addRow(check, editor)
+            self._checks[key] = check
+        self._checks["form_id"].setEnabled(self.class_combo.count() > 0)
+        bb = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        bb.accepted.connect(self._on_accept)
+        bb.rejected.connect(self.reject)
+        layout.addRow(bb)
+
+    def _on_accept(self):
+        if not self.fields():
+            QMessageBox.information(self, "Изменение", "Отметьте хотя бы одно поле.")
+            return
+        self.accept()
+
+    def fields(self) -> dict:
+        """{колонка pupils: значение} для отмеченных полей."""
+        result = {}
+        for key, _label, editor in self._fields:
+            if self._checks[key].isChecked():
+                result[key] = editor.currentData() if isinstance(editor, QComboBox) else editor.text().strip()
+        return result
+
+
+class _ParseSourcesThread(QThread):
+    """Разбор источников загрузки из Excel (excel_import.parse_sources) вне потока интерфейса."""
+
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, sources, parent=None):
+        super().__init__(parent)
+        self.sources = sources
+        self.error: Optional[str] = None
+
+    def run(self):
+        try:
+            parse_sources(self.sources, progress=self.progress.emit)
+        except Exception as e:  # сбой пула процессов и т.п. — сообщение покажет окно
+            self.error = str(e) or type(e).__name__
+
+
+class PupilsTableDialog(RefreshOnShowMixin, QWidget):
     PAGE_SIZE = 50
 
     def __init__(self, db: Database, parent=None, pupils_window=None):
         super().__init__(parent)
         self.db = db
         self.pupils_window = pupils_window
-        self._all_rows = []
+        # Ученики — в колоночном снимке; _order — позиции строк после фильтра и сортировки
+        self._snapshot = snapshot_for(db)
+        self._order: list[int] = []
+        self._sort_order = list(DEFAULT_ORDER)
         self._current_page = 0
+        self._specialists = []
+        # Правки в ячейках до «Сохранить всё»: {id: {поле: новое значение}} и значения до правки
+        self._edits: dict[int, dict[str, str]] = {}
+        self._edit_base: dict[int, dict[str, str]] = {}
+        self._filling = False
+        self._parse_thread: Optional[_ParseSourcesThread] = None  # идёт разбор файлов Excel
         self.setWindowTitle("Ученики")
         layout = QVBoxLayout(self)
 
@@ -861,10 +886,32 @@ class PupilsTableDialog(QWidget):
         btn_load = QPushButton("Загрузить")
         btn_load.clicked.connect(self._excel_load)
         load_layout.addWidget(btn_load)
+        self.btn_batch = QPushButton("Пакетная загрузка…")
+        self.btn_batch.setToolTip("Папка файлов или книга с листами: класс — по имени файла или листа (например, «5А»)")
+        batch_menu = QMenu(self.btn_batch)
+        batch_menu.addAction("Папка с файлами Excel…", self._excel_batch_folder)
+        batch_menu.addAction("Книга с листами по классам…", self._excel_batch_workbook)
+        self.btn_batch.setMenu(batch_menu)
+        load_layout.addWidget(self.btn_batch)
         layout.addLayout(load_layout)
 
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Фильтр:"))
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("слова из ФИО, даты рождения, адреса, № ПМПК или приказа")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.textChanged.connect(self._on_filter_changed)
+        filter_layout.addWidget(self.filter_edit, 1)
+        layout.addLayout(filter_layout)
+
         self.table = QTableWidget()
         self._build_columns()
+        header = self.table.horizontalHeader()
+        header.setSectionsClickable(True)
+        header.sectionClicked.connect(self._on_header_clicked)
+        self.table.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed)
+        self.table.setItemDelegate(_PupilCellDelegate(self.table))
+        self.table.itemChanged.connect(self._on_item_changed)
         layout.addWidget(self.table)
 
         # Пагинация
@@ -886,6 +933,9 @@ class PupilsTableDialog(QWidget):
         btn_add.clicked.connect(self._add)
         crud_layout.addWidget(btn_add)
         btn_edit = QPushButton("Изменить")
+        btn_edit.setToolTip(
+            "Одна строка — вкладка «Изменения по ученику»; несколько строк (Ctrl/Shift) — групповое изменение"
+        )
         btn_edit.clicked.connect(self._edit)
         crud_layout.addWidget(btn_edit)
         btn_delete = QPushButton("Удалить")
@@ -895,28 +945,121 @@ class PupilsTableDialog(QWidget):
         refresh_btn.setToolTip("Обновить данные из базы (не сохраняет введённую информацию)")
         refresh_btn.clicked.connect(self._refresh)
         crud_layout.addWidget(refresh_btn)
+        crud_layout.addStretch()
+        self.edits_label = QLabel("")
+        crud_layout.addWidget(self.edits_label)
+        self.btn_save_all = QPushButton("Сохранить всё")
+        self.btn_save_all.setToolTip("Записать изменённые ячейки (двойной щелчок по ячейке — правка) одной операцией")
+        self.btn_save_all.clicked.connect(self._save_all)
+        crud_layout.addWidget(self.btn_save_all)
+        self.btn_discard = QPushButton("Отменить правки")
+        self.btn_discard.clicked.connect(self._discard_edits)
+        crud_layout.addWidget(self.btn_discard)
         layout.addLayout(crud_layout)
+        self._update_edits_state()
 
         self._refresh()
+        bus_for(self.db).table_changed.connect(self._on_data_changed)
 
     def _build_columns(self):
         headers = [
             "id", "Класс", "Фамилия", "Имя", "Отчество", "Дата рожд.", "Дом.адр.", "Пол",
             "ПМПК дата", "ПМПК №", "Программа", "Версия", "Приказ №", "Дата приказа",
-            "Рек.1", "Рек.2", "Рек.3", "Рек.4", "Рек.5"
-        ]
+        ] + self._specialists
         self.table.setColumnCount(len(headers))
         self.table.setHorizontalHeaderLabels(headers)
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+
+    def _refresh(self, keep_page: bool = False):
+        self._update_specialists()
+        self._snapshot.refresh()
+        self._update_order(keep_page)
+        self._fill_page()
+
+    def _update_order(self, keep_page: bool = True):
+        """Пересчитать фильтр и сортировку по снимку (без запроса к БД)."""
+        rows = self._snapshot.filter(self.filter_edit.text())
+        self._order = self._snapshot.sort(rows, self._sort_order)
+        last_page = max(0, (len(self._order) - 1) // self.PAGE_SIZE)
+        self._current_page = min(self._current_page, last_page) if keep_page else 0
+
+    def _on_filter_changed(self, _text: str):
+        self._update_order(keep_page=False)
+        self._fill_page()
+
+    def _on_header_clicked(self, column: int):
+        """Сортировка по колонке: повторный щелчок — в обратном порядке; колонки рекомендаций не сортируются."""
+        if column >= len(CELL_KEYS):
+            return
+        key = CELL_KEYS[column]
+        descending = self._sort_order[0] == (key, False)
+        self._sort_order = [(key, descending)] + [k for k in DEFAULT_ORDER if k[0] != key]
+        header = self.table.horizontalHeader()
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(column, Qt.DescendingOrder if descending else Qt.AscendingOrder)
+        self._update_order()
+        self._fill_page()
+
+    def _update_specialists(self):
+        specialists = self.db.recommendations_get_specialists()
+        if specialists != self._specialists:
+            self._specialists = specialists
+            self._build_columns()
+
+    @pyqtSlot(str, object)
+    def _on_data_changed(self, table: str, ids):
+        """Обновление по шине: изменённые ученики — точечно, справочники — перерисовкой текущей страницы."""
+        if self.defer_if_hidden(table, ids, self.window()):
+            return
+        if table == "pupils":
+            self._apply_pupil_changes(ids)
+        elif table in ("forms", "programs"):
+            # Порядок классов/программ в снимке мог смениться — сортировка по ним пересчитывается
+            self._snapshot.refresh()
+            self._update_order()
+            self._fill_page()
+        elif table == "recommendations":
+            self._update_specialists()
+            self._fill_page()
+        elif table == "pupil_recommendations":
+            page_ids = [p.id for p in self._page_rows()]
+            if ids is None:
+                self._fill_page()
+            else:
+                self._update_page_rows(ids.intersection(page_ids))
+
+    def _apply_pupil_changes(self, ids: Optional[frozenset]):
+        """
+        Догнать снимок по журналу изменений (перечитываются только изменённые ученики);
+        если страница осталась той же — перерисовать лишь строки ids.
+        """
+        old_page_ids = [p.id for p in self._page_rows()]
+        self._snapshot.refresh()
+        self._update_order()
+        if ids is not None and [p.id for p in self._page_rows()] == old_page_ids:
+            self._update_page_rows(ids.intersection(old_page_ids))
+        else:
+            self._fill_page()
 
-    def _refresh(self):
+    def _page_rows(self) -> list[Pupil]:
+        start = self._current_page * self.PAGE_SIZE
+        return self._snapshot.pupils(self._order[start:start + self.PAGE_SIZE])
+
+    def _update_page_rows(self, ids):
+        """Перерисовать на текущей странице только строки учеников с указанными id."""
+        if not ids:
+            return
         forms = {r["id"]: r["number"] for r in self.db.forms_get_all()}
         programs = {r["id"]: (r["name"], r["version"]) for r in self.db.programs_get_all()}
-        self._all_rows = list(self.db.pupils_get_all())
-        self._current_page = 0
-        self._fill_page(forms, programs)
+        recs = self.db.pupils_recommendations_map(ids)
+        self._filling = True
+        try:
+            for i, p in enumerate(self._page_rows()):
+                if p.id in ids:
+                    self._set_row(i, p, recs.get(p.id, {}), forms, programs)
+        finally:
+            self._filling = False
 
     def _excel_browse(self):
         path, _ = QFileDialog.getOpenFileName(
@@ -928,7 +1071,9 @@ class PupilsTableDialog(QWidget):
         if path:
             self.excel_file_edit.setText(path)
 
+    @timed_action
     def _excel_load(self):
+        """Загрузка одного файла в указанный класс — тем же путём, что и пакетная (_excel_batch_load)."""
         class_number = self.excel_class_edit.text().strip()
         file_path = self.excel_file_edit.text().strip()
         if not class_number:
@@ -937,100 +1082,305 @@ class PupilsTableDialog(QWidget):
         if not file_path or not os.path.isfile(file_path):
             QMessageBox.warning(self, "Загрузка из Excel", "Выберите существующий файл Excel.")
             return
+        self._excel_batch_load([ImportSource(file_path, class_number=class_number)])
+
+    def _excel_batch_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Папка со списками классов")
+        if not folder:
+            return
+        sources = folder_sources(folder)
+        if not sources:
+            QMessageBox.information(self, "Загрузка из Excel", "В папке нет файлов Excel (.xlsx).")
+            return
+        self._excel_batch_load(sources)
+
+    def _excel_batch_workbook(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self,
+            "Книга со списками классов",
+            "",
+            "Файлы Excel (*.xlsx);;Все файлы (*)",
+        )
+        if not path:
+            return
         try:
-            rows, parse_errors = _read_pupils_from_excel(file_path)
+            sources = workbook_sources(path)
         except ValueError as e:
             QMessageBox.critical(self, "Ошибка загрузки", str(e))
             return
-        if not rows:
-            if parse_errors:
-                QMessageBox.warning(
+        self._excel_batch_load(sources)
+
+    def _excel_batch_load(self, sources):
+        """
+        Загрузка источников: класс, которого нет в имени файла или листа, спрашивается у пользователя;
+        разбор — в фоновом потоке (_ParseSourcesThread) с индикатором, окно при этом не замирает;
+        запись — в потоке интерфейса по окончании разбора (_excel_batch_save).
+        """
+        if self._parse_thread is not None:
+            return
+        for source in sources:
+            if source.class_number is None:
+                text, ok = QInputDialog.getText(
                     self, "Загрузка из Excel",
-                    "Нет строк для загрузки.\n" + "\n".join(parse_errors[:15]),
+                    f"В имени «{source.label}» нет номера класса.\n"
+                    "Класс для этого списка (пусто — пропустить):",
                 )
-            else:
-                QMessageBox.information(self, "Загрузка из Excel", "В файле нет подходящих строк для загрузки.")
+                if ok and text.strip():
+                    source.class_number = class_from_name(text) or text.strip()
+        progress = QProgressDialog(
+            "Разбор файлов Excel…", "", 0, sum(1 for s in sources if s.class_number is not None), self
+        )
+        progress.setWindowTitle("Загрузка из Excel")
+        progress.setCancelButton(None)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(300)
+        progress.setValue(0)
+        thread = _ParseSourcesThread(sources, self)
+        thread.progress.connect(lambda done, _total: progress.setValue(done))
+        thread.finished.connect(lambda: self._on_sources_parsed(thread, progress))
+        self._parse_thread = thread
+        thread.start()
+
+    def _on_sources_parsed(self, thread, progress):
+        self._parse_thread = None
+        progress.reset()
+        progress.deleteLater()
+        thread.deleteLater()
+        if thread.error:
+            QMessageBox.critical(self, "Ошибка загрузки", f"Файлы не разобраны:\n{thread.error}")
+            return
+        self._excel_batch_save(thread.sources)
+
+    @timed_action
+    def _excel_batch_save(self, sources):
+        """
+        Сводка по классам, проверка совпадений с базой и одна транзакция на всех учеников вместе
+        с новыми классами (db.pupils_insert_by_class); ошибки всех файлов и листов — в одном отчёте.
+        """
+        report = [line for source in sources for line in source.report_lines()]
+        loaded = [source for source in sources if source.rows]
+        if not loaded:
+            self._show_import_report("Нет строк для загрузки.", report)
+            return
+
+        rows = [r for source in loaded for r in source.rows]
+        duplicates = {n for n, _pupil in self.db.pupils_find_duplicates(rows)}
+        summary = "\n".join(
+            f"{source.class_number}: {len(source.rows)} — {source.label}" for source in loaded
+        )
+        text = f"Будет загружено учеников: {len(rows)} ({len(loaded)} из {len(sources)} файлов/листов).\n{summary}"
+        if report:
+            text += f"\nОшибок и предупреждений: {len(report)} (будут в отчёте)."
+        skip = set()
+        if duplicates:
+            answer = QMessageBox.question(
+                self, "Загрузка из Excel",
+                f"{text}\n\nУже есть в базе (те же ФИО и дата рождения): {len(duplicates)}.\n"
+                "Да — загрузить всех, Нет — пропустить совпадения, Отмена — не загружать.",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.No,
+            )
+            if answer == QMessageBox.Cancel:
+                return
+            if answer == QMessageBox.No:
+                skip = duplicates
+        elif QMessageBox.question(
+            self, "Загрузка из Excel", f"{text}\n\nЗагрузить?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes,
+        ) != QMessageBox.Yes:
             return
+
+        # Классы — по справочнику («5 а» и «5А» — один класс); недостающие создаёт та же транзакция
+        existing = {class_from_name(r["number"]) or r["number"]: r["number"] for r in self.db.forms_get_all()}
+        rows_by_class = {}
+        n = 0
+        for source in loaded:
+            target = rows_by_class.setdefault(existing.get(source.class_number, source.class_number), [])
+            for r in source.rows:
+                if n not in skip:
+                    target.append(r)
+                n += 1
         try:
-            form_id = self.db.forms_get_or_create_id(class_number)
-        except ValueError as e:
-            QMessageBox.critical(self, "Ошибка", str(e))
+            ids, form_ids = self.db.pupils_insert_by_class({k: v for k, v in rows_by_class.items() if v})
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка загрузки", f"Ученики не загружены:\n{e}")
             return
-        inserted = 0
-        insert_errors = []
-        for i, r in enumerate(rows):
-            try:
-                row = {
-                    "form_id": form_id,
-                    "surname": r["surname"],
-                    "name": r["name"],
-                    "patronymic": r.get("patronymic", ""),
-                    "birth_date": r.get("birth_date", ""),
-                    "address": r.get("address", ""),
-                    "gender": r.get("gender", ""),
-                    "pmpk_date": "",
-                    "pmpk_number": "",
-                    "program_id": None,
-                    "order_number": "",
-                    "order_date": "",
-                    "rec_spec_1": "нет",
-                    "rec_spec_2": "нет",
-                    "rec_spec_3": "нет",
-                    "rec_spec_4": "нет",
-                    "rec_spec_5": "нет",
-                }
-                self.db.pupils_insert(row)
-                inserted += 1
-            except Exception as e:
-                insert_errors.append(f"Строка {i + 2}: {e}")
-        self._refresh()
-        msg = f"Загружено записей: {inserted}."
-        all_errors = parse_errors + insert_errors
-        if all_errors:
-            msg += "\nОшибки/предупреждения:\n" + "\n".join(all_errors[:15])
-            if len(all_errors) > 15:
-                msg += f"\n… и ещё {len(all_errors) - 15}."
-            QMessageBox.warning(self, "Загрузка из Excel", msg)
-        else:
-            QMessageBox.information(self, "Загрузка из Excel", msg)
+        msg = f"Загружено записей: {len(ids)}, классов: {len(form_ids)}."
+        if skip:
+            msg += f"\nПропущено совпадений с базой: {len(skip)}."
+        self._show_import_report(msg, report)
+
+    def _show_import_report(self, message: str, report: list):
+        """Итог загрузки; ошибки всех файлов и листов — в подробностях сообщения."""
+        if not report:
+            QMessageBox.information(self, "Загрузка из Excel", message)
+            return
+        box = QMessageBox(QMessageBox.Warning, "Загрузка из Excel", message, QMessageBox.Ok, self)
+        box.setInformativeText(f"Ошибок и предупреждений: {len(report)}. Подробности — по кнопке ниже.")
+        box.setDetailedText("\n".join(report))
+        box.exec_()
 
+    @timed_action
     def _fill_page(self, forms=None, programs=None):
         if forms is None:
             forms = {r["id"]: r["number"] for r in self.db.forms_get_all()}
         if programs is None:
             programs = {r["id"]: (r["name"], r["version"]) for r in self.db.programs_get_all()}
-        total = len(self._all_rows)
+        total = len(self._order)
         start = self._current_page * self.PAGE_SIZE
         end = min(start + self.PAGE_SIZE, total)
-        page_rows = self._all_rows[start:end]
-        self.table.setRowCount(len(page_rows))
-        for i, r in enumerate(page_rows):
-            form_num = forms.get(r["form_id"], str(r["form_id"]))
-            prog = programs.get(r["program_id"], ("", ""))
-            prog_name, prog_ver = prog[0], prog[1]
-            cells = [
-                str(r["id"]), form_num, r["surname"] or "", r["name"] or "", r["patronymic"] or "",
-                r["birth_date"] or "", (r["address"] if "address" in r.keys() else "") or "", (r["gender"] if "gender" in r.keys() else "") or "",
-                r["pmpk_date"] or "", r["pmpk_number"] or "",
-                prog_name, prog_ver, r["order_number"] or "", r["order_date"] or "",
-                (r["rec_spec_1"] or ""), (r["rec_spec_2"] or ""), (r["rec_spec_3"] or ""),
-                (r["rec_spec_4"] or ""), (r["rec_spec_5"] or ""),
-            ]
-            for j, val in enumerate(cells):
-                self.table.setItem(i, j, QTableWidgetItem(str(val)))
+        page_rows = self._snapshot.pupils(self._order[start:end])
+        recs = self.db.pupils_recommendations_map([p.id for p in page_rows])
+        self._filling = True
+        try:
+            self.table.setRowCount(len(page_rows))
+            for i, p in enumerate(page_rows):
+                self._set_row(i, p, recs.get(p.id, {}), forms, programs)
+        finally:
+            self._filling = False
         self.table.resizeColumnsToContents()
         self.page_label.setText(
             f"Страница: {self._current_page + 1} "
             f"(строки {start + 1}–{end} из {total})" if total else "Страница: 0 (0 из 0)"
         )
 
+    def _set_row(self, i: int, pupil: Pupil, pupil_recs: dict, forms: dict, programs: dict):
+        cells = pupil.cells(forms, programs) + [
+            "; ".join(pupil_recs.get(spec, [])) or "нет" for spec in self._specialists
+        ]
+        edits = self._edits.get(pupil.id, {})
+        for j, val in enumerate(cells):
+            key = _INLINE_EDIT_COLUMNS.get(j)
+            item = QTableWidgetItem(str(edits.get(key, val)))
+            if key is None:
+                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+            elif key in edits:
+                item.setBackground(_DIRTY_COLOR)
+            self.table.setItem(i, j, item)
+
+    # --- правка в ячейках ---
+
+    def _on_item_changed(self, item: QTableWidgetItem):
+        """Правка ячейки: запомнить новое значение (совпало с исходным — правка снимается)."""
+        if self._filling:
+            return
+        key = _INLINE_EDIT_COLUMNS.get(item.column())
+        id_item = self.table.item(item.row(), 0)
+        if key is None or id_item is None:
+            return
+        pupil_id = int(id_item.text())
+        pos = self._snapshot.position(pupil_id)
+        base = self._edit_base.get(pupil_id, {})
+        if key in base:
+            original = base[key]
+        elif pos is not None:
+            original = self._snapshot.text[key][pos]
+        else:
+            return
+        value = item.text().strip()
+        if key in ("surname", "name") and not value:
+            QMessageBox.warning(self, "Правка", "Фамилия и имя не могут быть пустыми.")
+            value = self._edits.get(pupil_id, {}).get(key, original)
+        edits = self._edits.setdefault(pupil_id, {})
+        if value == original:
+            edits.pop(key, None)
+            base.pop(key, None)
+        else:
+            edits[key] = value
+            self._edit_base.setdefault(pupil_id, {}).setdefault(key, original)
+        if not edits:
+            self._edits.pop(pupil_id, None)
+            self._edit_base.pop(pupil_id, None)
+        self._filling = True
+        try:
+            item.setText(value)
+            item.setData(Qt.BackgroundRole, _DIRTY_COLOR if key in edits else None)
+        finally:
+            self._filling = False
+        self._update_edits_state()
+
+    def _update_edits_state(self):
+        cells = sum(len(e) for e in self._edits.values())
+        self.edits_label.setText(f"Изменено ячеек: {cells}, учеников: {len(self._edits)}" if cells else "")
+        self.btn_save_all.setEnabled(bool(cells))
+        self.btn_discard.setEnabled(bool(cells))
+
+    def confirm_discard_edits(self) -> bool:
+        """Перед закрытием: есть несохранённые правки — сохранить, отбросить или остаться (False)."""
+        if not self._edits:
+            return True
+        answer = QMessageBox.question(
+            self, "Несохранённые правки",
+            f"В таблице учеников есть несохранённые правки ({len(self._edits)} учеников). Сохранить?",
+            QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel, QMessageBox.Save,
+        )
+        if answer == QMessageBox.Cancel:
+            return False
+        if answer == QMessageBox.Save:
+            self._save_all()
+            return not self._edits
+        self._discard_edits()
+        return True
+
+    def _discard_edits(self):
+        self._edits.clear()
+        self._edit_base.clear()
+        self._update_edits_state()
+        self._fill_page()
+
+    @timed_action
+    def _save_all(self):
+        """
+        Записать правки одной транзакцией: только изменённые колонки изменённых учеников.
+        Ученики, которых за это время изменил другой пользователь, не перезаписываются без вопроса.
+        """
+        if not self._edits:
+            return
+        try:
+            conflicts = self.db.pupils_update_cells(self._edits, self._edit_base)
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка сохранения", f"Правки не сохранены:\n{e}")
+            return
+        saved = len(self._edits) - len(conflicts)
+        self._edits = {i: self._edits[i] for i in conflicts}
+        self._edit_base = {i: self._edit_base.get(i, {}) for i in conflicts}
+        if conflicts:
+            self._snapshot.refresh()
+            names = []
+            for pupil_id in conflicts[:15]:
+                pos = self._snapshot.position(pupil_id)
+                names.append(
+                    f"{self._snapshot.text['surname'][pos]} {self._snapshot.text['name'][pos]}"
+                    if pos is not None else f"id {pupil_id} (удалён)"
+                )
+            answer = QMessageBox.question(
+                self, "Конфликт правок",
+                f"Сохранено учеников: {saved}.\n"
+                f"Данные {len(conflicts)} учеников уже изменил другой пользователь или ученик удалён:\n"
+                + "\n".join(names)
+                + "\n\nЗаписать ваши значения поверх? «Нет» — отбросить ваши правки этих учеников.",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No,
+            )
+            if answer == QMessageBox.Yes:
+                try:
+                    # Без ожидаемых значений: удалённые ученики остаются в ответе и пропускаются
+                    self.db.pupils_update_cells(self._edits)
+                except Exception as e:
+                    QMessageBox.critical(self, "Ошибка сохранения", f"Правки не сохранены:\n{e}")
+                    return
+            self._edits.clear()
+            self._edit_base.clear()
+        else:
+            QMessageBox.information(self, "Сохранено", f"Сохранено учеников: {saved}.")
+        self._update_edits_state()
+        self._fill_page()
+
     def _prev_page(self):
         if self._current_page > 0:
             self._current_page -= 1
             self._fill_page()
 
     def _next_page(self):
-        total = len(self._all_rows)
+        total = len(self._order)
         if (self._current_page + 1) * self.PAGE_SIZE < total:
             self._current_page += 1
             self._fill_page()
@@ -1039,7 +1389,20 @@ class PupilsTableDialog(QWidget):
         if self.pupils_window:
             self.pupils_window.switch_to_add_tab()
 
+    def _selected_ids(self) -> list[int]:
+        """id учеников в выделенных строках страницы (по порядку строк)."""
+        ids = []
+        for index in sorted(self.table.selectionModel().selectedRows(), key=lambda i: i.row()):
+            item = self.table.item(index.row(), 0)
+            if item and item.text().isdigit():
+                ids.append(int(item.text()))
+        return ids
+
     def _edit(self):
+        ids = self._selected_ids()
+        if len(ids) > 1:
+            self._bulk_edit(ids)
+            return
         row_idx = self.table.currentRow()
         if row_idx < 0:
             QMessageBox.information(self, "Выбор", "Выберите строку для редактирования.")
@@ -1054,6 +1417,19 @@ class PupilsTableDialog(QWidget):
         if self.pupils_window:
             self.pupils_window.switch_to_edit_tab_with_pupil_id(pupil_id)
 
+    @timed_action
+    def _bulk_edit(self, ids: list[int]):
+        """Групповое изменение выбранных учеников: одна транзакция вместо формы на каждого."""
+        dlg = PupilsBulkEditDialog(self.db, len(ids), self)
+        if dlg.exec_() != QDialog.Accepted:
+            return
+        try:
+            updated = self.db.pupils_update_many(ids, dlg.fields())
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        QMessageBox.information(self, "Успех", f"Изменено записей: {updated}.")
+
     def _delete(self):
         row_idx = self.table.currentRow()
         if row_idx < 0:
@@ -1076,13 +1452,12 @@ class PupilsTableDialog(QWidget):
         try:
             self.db.pupils_delete(pupil_id)
             QMessageBox.information(self, "Успех", "Запись удалена.")
-            self._refresh()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", str(e))
 
 
 # --- Архив (просмотр) ---
-class ArchiveTableDialog(QWidget):
+class ArchiveTableDialog(RefreshOnShowMixin, QWidget):
     def __init__(self, db: Database, parent=None):
         super().__init__(parent)
         self.db = db
@@ -1090,29 +1465,30 @@ class ArchiveTableDialog(QWidget):
         layout = QVBoxLayout(self)
         self.table = QTableWidget()
         headers = [
-            "id", "Класс", "Фамилия", "Имя", "Отчество", "Дом.адр.", "Пол", "Дата перевода", "Причина перевода"
+            "id", "Класс", "Фамилия", "Имя", "Отчество", "Дом.адр.", "Пол", "Дата перевода", "Причина перевода",
+            "Рекомендации",
         ]
         self.table.setColumnCount(len(headers))
         self.table.setHorizontalHeaderLabels(headers)
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
         layout.addWidget(self.table)
         refresh_btn = QPushButton("Обновить")
         refresh_btn.setToolTip("Обновить данные из базы (не сохраняет введённую информацию)")
         refresh_btn.clicked.connect(self._refresh)
         layout.addWidget(refresh_btn)
         self._refresh()
+        bus_for(self.db).table_changed.connect(self._on_data_changed)
+
+    @pyqtSlot(str, object)
+    def _on_data_changed(self, table: str, ids):
+        if table in ("pupils_history", "forms") and not self.defer_if_hidden(table, ids):
+            self._refresh()
 
     def _refresh(self):
         forms = {r["id"]: r["number"] for r in self.db.forms_get_all()}
-        rows = self.db.pupils_history_get_all()
+        rows = self.db.pupils_history_get_columns(_ARCHIVE_CELL_COLUMNS)
         self.table.setRowCount(len(rows))
-        for i, r in enumerate(rows):
-            form_num = forms.get(r["form_id"], str(r["form_id"]))
-            cells = [
-                str(r["id"]), form_num, r["surname"] or "", r["name"] or "", r["patronymic"] or "",
-                (r["address"] if "address" in r.keys() else "") or "", (r["gender"] if "gender" in r.keys() else "") or "",
-                r["transfer_date"] or "", r["transfer_reason"] or "",
-            ]
+        for i, (hid, form_id, *rest) in enumerate(rows):
+            cells = [str(hid), forms.get(form_id, str(form_id))] + [v or "" for v in rest]
             for j, val in enumerate(cells):
                 self.table.setItem(i, j, QTableWidgetItem(str(val)))
         self.table.resizeColumnsToContents()
@@ -1185,8 +1561,8 @@ class PupilSelectDialog(QDialog):
         forms = {r["id"]: r["number"] for r in self.db.forms_get_all()}
         rows = self.db.pupils_get_by_form_id(class_id)
         for r in rows:
-            form_num = forms.get(r["form_id"], "")
-            text = f"{r['surname']} {r['name']} {r['patronymic'] or ''} ({form_num})"
+            form_num = forms.get(r.form_id, "")
+            text = f"{r.surname} {r.name} {r.patronymic or ''} ({form_num})"
             item = QListWidgetItem(text.strip())
             item.setData(Qt.UserRole, r)
             self.list_widget.addItem(item)
@@ -1198,7 +1574,91 @@ class PupilSelectDialog(QDialog):
         return item.data(Qt.UserRole)
 
 
-class AnalysisWindow(QWidget):
+class _ResultDelegate(QStyledItemDelegate):
+    """Редактор ячейки результата с подсказками из справочника уровней."""
+    def __init__(self, levels: list, parent=None):
+        super().__init__(parent)
+        self._levels = levels
+
+    def createEditor(self, parent, option, index):
+        editor = QLineEdit(parent)
+        completer = QCompleter(self._levels, editor)
+        completer.setCaseSensitivity(Qt.CaseInsensitive)
+        editor.setCompleter(completer)
+        return editor
+
+
+class AnalysisGridDialog(QDialog):
+    """
+    Ввод результатов по всему классу: строки — ученики, колонки — критерии.
+    Заполненные ранее результаты периода подставляются; сохранение — одной транзакцией.
+    """
+    def __init__(self, db: Database, class_id: int, class_number: str, specialist: str,
+                 result_column: str, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._class_number = class_number
+        self._specialist = specialist
+        self._result_column = result_column
+        self.setWindowTitle(f"Ввод результатов: класс {class_number}, {specialist}")
+        layout = QVBoxLayout(self)
+
+        self._pupils = self.db.pupils_get_by_form_id(class_id)
+        self._criteria = [r["name"] for r in self.db.criterions_get_all() if r["name"]]
+        existing = self.db.analysis_get_class_results(class_number, specialist, result_column)
+
+        self.table = QTableWidget(len(self._pupils), len(self._criteria))
+        self.table.setHorizontalHeaderLabels(self._criteria)
+        self.table.setVerticalHeaderLabels(
+            [f"{p.surname} {p.name} {p.patronymic or ''}".strip() for p in self._pupils]
+        )
+        levels = sorted({r["name"] for r in self.db.standards_get_all() if r["name"]})
+        self.table.setItemDelegate(_ResultDelegate(levels, self.table))
+        # Исходные значения — сохраняются только изменённые ячейки
+        self._original = {}
+        for i, p in enumerate(self._pupils):
+            for j, crit in enumerate(self._criteria):
+                value = existing.get((p.surname, p.name, p.patronymic or "", crit), "")
+                self._original[(i, j)] = value
+                self.table.setItem(i, j, QTableWidgetItem(value))
+        self.table.resizeColumnsToContents()
+        layout.addWidget(self.table)
+
+        bb = QDialogButtonBox(QDialogButtonBox.Save | QDialogButtonBox.Cancel)
+        bb.accepted.connect(self._on_save)
+        bb.rejected.connect(self.reject)
+        layout.addWidget(bb)
+        self.resize(900, 600)
+
+    def changed_results(self) -> list:
+        """Изменённые ячейки: (фамилия, имя, отчество, критерий, значение)."""
+        results = []
+        for (i, j), old in self._original.items():
+            item = self.table.item(i, j)
+            value = item.text().strip() if item else ""
+            if value != old:
+                p = self._pupils[i]
+                results.append((p.surname or "", p.name or "", p.patronymic or "", self._criteria[j], value))
+        return results
+
+    @timed_action
+    def _on_save(self):
+        results = self.changed_results()
+        if not results:
+            self.accept()
+            return
+        try:
+            saved = self.db.analysis_upsert_results(
+                self._class_number, self._specialist, self._result_column, results
+            )
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка сохранения", f"Результаты не сохранены:\n{e}")
+            return
+        QMessageBox.information(self, "Сохранено", f"Изменено результатов в таблице анализа: {saved}.")
+        self.accept()
+
+
+class AnalysisWindow(RefreshOnShowMixin, QWidget):
     """Окно 'Анализ' для ввода результатов мониторинга."""
     def __init__(self, db: Database, parent=None):
         super().__init__(parent)
@@ -1211,7 +1671,7 @@ class AnalysisWindow(QWidget):
 
         self._current_class_id = None
         self._current_class_number = ""
-        self._current_pupil = None  # sqlite3.Row
+        self._current_pupil = None  # Pupil
 
         layout = QVBoxLayout(self)
 
@@ -1254,6 +1714,10 @@ class AnalysisWindow(QWidget):
         btn_find = QPushButton("Найти")
         btn_find.clicked.connect(self._on_find_pupil)
         pupil_layout.addWidget(btn_find)
+        btn_grid = QPushButton("Весь класс…")
+        btn_grid.setToolTip("Ввод результатов всех учеников класса по всем критериям")
+        btn_grid.clicked.connect(self._on_class_grid)
+        pupil_layout.addWidget(btn_grid)
         layout.addWidget(pupil_grp)
 
         # Блок критериев и результатов
@@ -1294,6 +1758,12 @@ class AnalysisWindow(QWidget):
 
         layout.addWidget(crit_grp)
         self.setMinimumSize(800, 500)
+        bus_for(self.db).table_changed.connect(self._on_data_changed)
+
+    @pyqtSlot(str, object)
+    def _on_data_changed(self, table: str, ids):
+        if table == "forms" and not self.defer_if_hidden(table, ids):
+            self._refresh_classes()
 
     def _refresh_specialists(self):
         self.specialist_combo.clear()
@@ -1302,10 +1772,14 @@ class AnalysisWindow(QWidget):
             self.specialist_combo.addItem(r["name"] or "", r["id"])
 
     def _refresh_classes(self):
+        current = self.class_combo.currentData()
         self.class_combo.clear()
         forms = self.db.forms_get_all()
         for r in forms:
             self.class_combo.addItem(r["number"], r["id"])
+        idx = self.class_combo.findData(current)
+        if idx >= 0:
+            self.class_combo.setCurrentIndex(idx)
 
     def _on_find_pupil(self):
         class_id = self.class_combo.currentData()
@@ -1318,13 +1792,58 @@ class AnalysisWindow(QWidget):
         pupil = dlg.selected_pupil()
         if not pupil:
             return
-        self._current_class_id = pupil["form_id"]
+        self._current_class_id = pupil.form_id
         forms = {r["id"]: r["number"] for r in self.db.forms_get_all()}
         self._current_class_number = forms.get(self._current_class_id, "")
         self._current_pupil = pupil
-        self.surname_edit.setText(pupil["surname"] or "")
-        self.name_edit.setText(pupil["name"] or "")
-        self.patronymic_edit.setText(pupil["patronymic"] or "")
+        self.surname_edit.setText(pupil.surname or "")
+        self.name_edit.setText(pupil.name or "")
+        self.patronymic_edit.setText(pupil.patronymic or "")
+
+    def _on_class_grid(self):
+        class_id = self.class_combo.currentData()
+        if class_id is None:
+            QMessageBox.information(self, "Класс", "Сначала добавьте и выберите класс.")
+            return
+        specialist = self.specialist_combo.currentText().strip()
+        if not specialist:
+            QMessageBox.warning(self, "Специалист", "Выберите специалиста.")
+            return
+        if not self.db.criterions_get_all():
+            QMessageBox.information(
+                self,
+                "Критерии",
+                "Сначала добавьте критерии в разделе «Таблицы» → «Критерии».",
+            )
+            return
+        result_column = self._ensure_result_column()
+        if not result_column:
+            return
+        dlg = AnalysisGridDialog(
+            self.db, class_id, self.class_combo.currentText(), specialist, result_column, self
+        )
+        dlg.exec_()
+
+    def _ensure_result_column(self) -> Optional[str]:
+        """Колонка результатов текущего учебного года и периода (None — не заданы или ошибка)."""
+        school_year = self.db.settings_get("school_year") or ""
+        school_period = self.db.settings_get("school_period") or ""
+        if not school_year or not school_period:
+            QMessageBox.warning(
+                self,
+                "Учебный год и период",
+                "Перед сохранением укажите учебный год и период в главном окне.",
+            )
+            return None
+        try:
+            return self.db.analysis_ensure_result_column(school_year, school_period)
+        except Exception as e:
+            QMessageBox.critical(
+                self,
+                "Ошибка таблицы анализа",
+                f"Не удалось подготовить колонку результата:\n{e}",
+            )
+            return None
 
     def _on_add_criterion_from_list(self):
         """Открыть список критериев и подставить выбранный в поле 'Критерий'."""
@@ -1395,6 +1914,7 @@ class AnalysisWindow(QWidget):
         self._current_class_number = ""
         self._current_pupil = None
 
+    @timed_action
     def _on_save(self):
         if not self._current_pupil or not self._current_class_number:
             QMessageBox.warning(self, "Сохранение", "Сначала выберите ученика.")
@@ -1408,63 +1928,46 @@ class AnalysisWindow(QWidget):
             QMessageBox.information(self, "Сохранение", "Нет строк для сохранения.")
             return
 
-        school_year = self.db.settings_get("school_year") or ""
-        school_period = self.db.settings_get("school_period") or ""
-        if not school_year or not school_period:
-            QMessageBox.warning(
-                self,
-                "Учебный год и период",
-                "Перед сохранением укажите учебный год и период в главном окне.",
-            )
+        result_column = self._ensure_result_column()
+        if not result_column:
             return
 
+        # Все строки — одной транзакцией (раньше — commit на каждую строку)
+        rows = []
+        for i in range(rows_count):
+            crit_item = self.temp_table.item(i, 0)
+            res_item = self.temp_table.item(i, 1)
+            crit = crit_item.text().strip() if crit_item else ""
+            res = res_item.text().strip() if res_item else ""
+            if crit:
+                rows.append((crit, res))
         try:
-            result_column = self.db.analysis_ensure_result_column(school_year, school_period)
+            with self.db.batch():
+                for crit, res in rows:
+                    self.db.analysis_insert_row(
+                        class_number=self._current_class_number,
+                        surname=self._current_pupil.surname or "",
+                        name=self._current_pupil.name or "",
+                        patronymic=self._current_pupil.patronymic or "",
+                        specialist=specialist,
+                        criterion=crit,
+                        result_column=result_column,
+                        result_value=res,
+                    )
         except Exception as e:
             QMessageBox.critical(
                 self,
-                "Ошибка таблицы анализа",
-                f"Не удалось подготовить колонку результата:\n{e}",
+                "Ошибка сохранения",
+                f"Не удалось сохранить записи (ни одна не сохранена):\n{e}",
             )
             return
 
-        errors = []
-        inserted = 0
-        for i in range(rows_count):
-            crit_item = self.temp_table.item(i, 0)
-            res_item = self.temp_table.item(i, 1)
-            crit = crit_item.text().strip() if crit_item else ""
-            res = res_item.text().strip() if res_item else ""
-            if not crit:
-                continue
-            try:
-                self.db.analysis_insert_row(
-                    class_number=self._current_class_number,
-                    surname=self._current_pupil["surname"] or "",
-                    name=self._current_pupil["name"] or "",
-                    patronymic=self._current_pupil["patronymic"] or "",
-                    specialist=specialist,
-                    criterion=crit,
-                    result_column=result_column,
-                    result_value=res,
-                )
-                inserted += 1
-            except Exception as e:
-                errors.append(f"Строка {i + 1}: {e}")
-
-        if inserted:
+        if rows:
             self._on_clear_temp()
             QMessageBox.information(
                 self,
                 "Сохранено",
-                f"Сохранено записей в таблице анализа: {inserted}."
-                + ("\nОшибки:\n" + "\n".join(errors) if errors else ""),
-            )
-        elif errors:
-            QMessageBox.critical(
-                self,
-                "Ошибка сохранения",
-                "Не удалось сохранить ни одной записи:\n" + "\n".join(errors),
+                f"Сохранено записей в таблице анализа: {len(rows)}.",
             )
 
 
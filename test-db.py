@@ -1,19 +1,25 @@
 """
 Тестовая программа для просмотра и редактирования SQLite базы данных.
 Отображает список таблиц, позволяет открыть таблицу с пагинацией и выполнять CRUD операции.
+Страницы читаются по rowid (WHERE rowid > последнего на странице LIMIT N), число строк
+считается один раз при открытии таблицы. SQL-консоль показывает план запроса, время и число строк.
 """
 import sys
 import sqlite3
+import time
 from pathlib import Path
 
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QTableWidget, QTableWidgetItem, QFileDialog,
     QMessageBox, QDialog, QFormLayout, QLineEdit, QDialogButtonBox,
-    QListWidget, QHeaderView, QAbstractItemView,
+    QListWidget, QHeaderView, QAbstractItemView, QPlainTextEdit, QSplitter,
 )
 from PyQt5.QtCore import Qt
 
+# Сколько строк результата показывает SQL-консоль (число строк считается по всем)
+CONSOLE_MAX_ROWS = 1000
+
 
 class DatabaseViewer(QMainWindow):
     def __init__(self):
@@ -25,6 +31,10 @@ class DatabaseViewer(QMainWindow):
         self.current_table = None
         self.current_page = 0
         self.page_size = 50
+        # Keyset-пагинация: rowid последней строки каждой пройденной страницы (None — у таблицы нет rowid)
+        self._page_keys: list = []
+        self._has_more = False
+        self._row_count = None
 
         central = QWidget()
         self.setCentralWidget(central)
@@ -78,8 +88,11 @@ class DatabaseViewer(QMainWindow):
         btn_delete.clicked.connect(self._delete_row)
         controls_layout.addWidget(btn_delete)
         btn_refresh = QPushButton("Обновить")
-        btn_refresh.clicked.connect(self._refresh_table)
+        btn_refresh.clicked.connect(self._recount_and_refresh)
         controls_layout.addWidget(btn_refresh)
+        btn_console = QPushButton("SQL-консоль")
+        btn_console.clicked.connect(self._open_console)
+        controls_layout.addWidget(btn_console)
         layout.addLayout(controls_layout)
 
     def _open_database(self):
@@ -121,32 +134,71 @@ class DatabaseViewer(QMainWindow):
             return
         table_name = item.text()
         self.current_table = table_name
+        self._recount_and_refresh()
+
+    def _recount_and_refresh(self):
+        """Пересчитать строки таблицы и показать первую страницу."""
+        if not self.conn or not self.current_table:
+            return
+        try:
+            self._row_count = self.conn.execute(f"SELECT COUNT(*) FROM {self.current_table}").fetchone()[0]
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить таблицу:\n{e}")
+            return
         self.current_page = 0
+        self._page_keys = []
         self._refresh_table()
 
+    def _has_rowid(self) -> bool:
+        """Есть ли у таблицы rowid (нет у WITHOUT ROWID — там страницы по OFFSET)."""
+        try:
+            self.conn.execute(f"SELECT rowid FROM {self.current_table} LIMIT 0")
+            return True
+        except sqlite3.OperationalError:
+            return False
+
     def _refresh_table(self):
         if not self.conn or not self.current_table:
             return
         try:
-            cursor = self.conn.execute(f"SELECT * FROM {self.current_table}")
-            columns = [desc[0] for desc in cursor.description]
-            all_rows = cursor.fetchall()
-            total_rows = len(all_rows)
-            start = self.current_page * self.page_size
-            end = start + self.page_size
-            page_rows = all_rows[start:end]
+            # Строка сверх страницы — есть ли следующая страница (без COUNT(*) на каждый щелчок)
+            limit = self.page_size + 1
+            if self._has_rowid():
+                after = self._page_keys[self.current_page - 1] if self.current_page > 0 else None
+                if after is None:
+                    cursor = self.conn.execute(
+                        f"SELECT rowid, * FROM {self.current_table} ORDER BY rowid LIMIT ?", (limit,))
+                else:
+                    cursor = self.conn.execute(
+                        f"SELECT rowid, * FROM {self.current_table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                        (after, limit))
+                columns = [desc[0] for desc in cursor.description][1:]
+                rows = cursor.fetchall()
+                keys = [row[0] for row in rows[:self.page_size]]
+                page_rows = [tuple(row)[1:] for row in rows[:self.page_size]]
+            else:
+                cursor = self.conn.execute(
+                    f"SELECT * FROM {self.current_table} LIMIT ? OFFSET ?",
+                    (limit, self.current_page * self.page_size))
+                columns = [desc[0] for desc in cursor.description]
+                rows = cursor.fetchall()
+                keys = [None] * min(len(rows), self.page_size)
+                page_rows = rows[:self.page_size]
+            self._has_more = len(rows) > self.page_size
+            del self._page_keys[self.current_page:]
+            self._page_keys.append(keys[-1] if keys else None)
 
             self.data_table.setColumnCount(len(columns))
             self.data_table.setHorizontalHeaderLabels(columns)
             self.data_table.setRowCount(len(page_rows))
             for i, row in enumerate(page_rows):
-                for j, col in enumerate(columns):
-                    val = row[col] if col in row.keys() else ""
+                for j, val in enumerate(row):
                     self.data_table.setItem(i, j, QTableWidgetItem(str(val) if val is not None else ""))
 
+            start = self.current_page * self.page_size
             self.page_label.setText(
                 f"Страница: {self.current_page + 1} "
-                f"(строки {start + 1}-{min(end, total_rows)} из {total_rows})"
+                f"(строки {start + 1}-{start + len(page_rows)} из {self._row_count})"
             )
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить таблицу:\n{e}")
@@ -159,12 +211,21 @@ class DatabaseViewer(QMainWindow):
     def _next_page(self):
         if not self.conn or not self.current_table:
             return
-        cursor = self.conn.execute(f"SELECT COUNT(*) FROM {self.current_table}")
-        total = cursor.fetchone()[0]
-        if (self.current_page + 1) * self.page_size < total:
+        if self._has_more:
             self.current_page += 1
             self._refresh_table()
 
+    def _open_console(self):
+        if not self.conn:
+            QMessageBox.warning(self, "Ошибка", "Сначала выберите файл БД.")
+            return
+        d = SqlConsoleDialog(self.conn, self)
+        if self.current_table:
+            d.sql_edit.setPlainText(f"SELECT * FROM {self.current_table} LIMIT 100")
+        d.exec_()
+        self._load_tables()
+        self._recount_and_refresh()
+
     def _add_row(self):
         if not self.conn or not self.current_table:
             QMessageBox.warning(self, "Ошибка", "Сначала откройте таблицу.")
@@ -183,6 +244,7 @@ class DatabaseViewer(QMainWindow):
                     vals
                 )
                 self.conn.commit()
+                self._row_count += 1
                 self._refresh_table()
                 QMessageBox.information(self, "Успех", "Запись добавлена.")
         except Exception as e:
@@ -247,8 +309,9 @@ class DatabaseViewer(QMainWindow):
                 QMessageBox.warning(self, "Ошибка", "Таблица не имеет первичного ключа.")
                 return
             pk_val = self.data_table.item(row_idx, 0).text()
-            self.conn.execute(f"DELETE FROM {self.current_table} WHERE {pk_col} = ?", (pk_val,))
+            cur = self.conn.execute(f"DELETE FROM {self.current_table} WHERE {pk_col} = ?", (pk_val,))
             self.conn.commit()
+            self._row_count -= cur.rowcount
             self._refresh_table()
             QMessageBox.information(self, "Успех", "Запись удалена.")
         except Exception as e:
@@ -260,6 +323,96 @@ class DatabaseViewer(QMainWindow):
         event.accept()
 
 
+class SqlConsoleDialog(QDialog):
+    """Произвольный SQL: план запроса (EXPLAIN QUERY PLAN), время выполнения и число строк."""
+
+    def __init__(self, conn, parent=None):
+        super().__init__(parent)
+        self.conn = conn
+        self.setWindowTitle("SQL-консоль")
+        self.resize(900, 600)
+        layout = QVBoxLayout(self)
+        splitter = QSplitter(Qt.Vertical)
+        self.sql_edit = QPlainTextEdit()
+        self.sql_edit.setPlaceholderText("SELECT ...")
+        splitter.addWidget(self.sql_edit)
+        self.plan_edit = QPlainTextEdit()
+        self.plan_edit.setReadOnly(True)
+        splitter.addWidget(self.plan_edit)
+        self.result_table = QTableWidget()
+        self.result_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        splitter.addWidget(self.result_table)
+        splitter.setSizes([150, 120, 330])
+        layout.addWidget(splitter)
+
+        buttons = QHBoxLayout()
+        self.status_label = QLabel("")
+        buttons.addWidget(self.status_label)
+        buttons.addStretch()
+        btn_plan = QPushButton("План запроса")
+        btn_plan.clicked.connect(self._show_plan)
+        buttons.addWidget(btn_plan)
+        btn_run = QPushButton("Выполнить")
+        btn_run.clicked.connect(self._run)
+        buttons.addWidget(btn_run)
+        layout.addLayout(buttons)
+
+    def _sql(self) -> str:
+        return self.sql_edit.toPlainText().strip().rstrip(";")
+
+    def _show_plan(self) -> bool:
+        """План запроса деревом (как в sqlite3 .eqp); False — запрос не разобран."""
+        sql = self._sql()
+        if not sql:
+            return False
+        try:
+            rows = self.conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        except sqlite3.Error as e:
+            self.plan_edit.setPlainText(f"Ошибка: {e}")
+            return False
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append("  " * depth[node_id] + detail)
+        self.plan_edit.setPlainText("\n".join(lines) or "(план пуст)")
+        return True
+
+    def _run(self):
+        if not self._show_plan():
+            return
+        sql = self._sql()
+        start = time.perf_counter()
+        try:
+            cursor = self.conn.execute(sql)
+            if cursor.description is None:
+                self.conn.commit()
+                rows, columns = [], []
+                count = cursor.rowcount
+            else:
+                columns = [desc[0] for desc in cursor.description]
+                rows = cursor.fetchmany(CONSOLE_MAX_ROWS)
+                count = len(rows) + sum(1 for _ in cursor)
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            self.status_label.setText(f"Ошибка: {e}")
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self.result_table.setColumnCount(len(columns))
+        self.result_table.setHorizontalHeaderLabels(columns)
+        self.result_table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for j, val in enumerate(row):
+                self.result_table.setItem(i, j, QTableWidgetItem(str(val) if val is not None else ""))
+        self.result_table.resizeColumnsToContents()
+        if cursor.description is None:
+            self.status_label.setText(f"Изменено строк: {count}, {elapsed_ms:.1f} мс")
+        else:
+            shown = f" (показаны первые {len(rows)})" if count > len(rows) else ""
+            self.status_label.setText(f"Строк: {count}{shown}, {elapsed_ms:.1f} мс")
+
+
 class EditRowDialog(QDialog):
     def __init__(self, columns, row_data, parent=None):
         super().__init__(parent)
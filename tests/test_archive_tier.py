@@ -0,0 +1,93 @@
+"""Перенос в архивный файл: повторяемый после сбоя между копированием и удалением."""
+import sqlite3
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from db import ARCHIVE_SCHEMA, Database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(tmp_path / "sveduch.db")
+    db.create_tables()
+    yield db
+    db.close()
+
+
+class _Crash(Exception):
+    pass
+
+
+def _crash_on_transaction(monkeypatch, db: Database, number: int) -> None:
+    """Сбой при входе в number-ю транзакцию (предыдущие фиксируются)."""
+    original = db._transaction
+    entered = [0]
+
+    @contextmanager
+    def transaction():
+        entered[0] += 1
+        if entered[0] == number:
+            raise _Crash()
+        with original() as conn:
+            yield conn
+
+    monkeypatch.setattr(db, "_transaction", transaction)
+
+
+def _count(db: Database, table: str) -> int:
+    conn = sqlite3.connect(db.path)
+    try:
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (str(db.archive_path),))
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _add_history(db: Database, count: int) -> None:
+    form_id = db.forms_add("5А")
+    for n in range(count):
+        db.pupils_history_insert({"form_id": form_id, "surname": f"Ученик {n}", "name": "Иван"}, "31.05.2020", "")
+    db.pupils_history_insert({"form_id": form_id, "surname": "Недавний", "name": "Пётр"}, "31.05.2025", "")
+
+
+def test_history_move_resumes_after_crash(db, monkeypatch):
+    _add_history(db, 3)
+    _crash_on_transaction(monkeypatch, db, 2)  # копия зафиксирована, удаление — нет
+    with pytest.raises(_Crash):
+        db.archive_move_history(2024)
+    monkeypatch.undo()
+    assert (_count(db, "main.pupils_history"), _count(db, "archive.pupils_history")) == (4, 3)
+    assert len(db.pupils_history_get_all()) == 4  # записи в обоих файлах видны один раз
+
+    assert db.archive_move_history(2024) == 3
+    assert (_count(db, "main.pupils_history"), _count(db, "archive.pupils_history")) == (1, 3)
+    assert db.archive_move_history(2024) == 0
+    assert len(db.pupils_history_get_all()) == 4
+
+
+def test_analysis_move_resumes_after_crash(db, monkeypatch):
+    db.standards_get_or_create_id("средний")
+    closed = db.analysis_ensure_result_column("2023-2024", "I")
+    current = db.analysis_ensure_result_column("2024-2025", "I")
+    for criterion in ("Чтение", "Письмо"):
+        db.analysis_insert_row("5А", "Иванов", "Иван", "", "Логопед", criterion, closed, "средний")
+    db.analysis_insert_row("5А", "Иванов", "Иван", "", "Логопед", "Счёт", current, "средний")
+
+    _crash_on_transaction(monkeypatch, db, 2)
+    with pytest.raises(_Crash):
+        db.archive_move_analysis_period(closed)
+    monkeypatch.undo()
+    assert _count(db, "archive.analysis_results") == 2
+    assert closed in db.analysis_result_columns()
+
+    assert db.archive_move_analysis_period(closed) == 2
+    assert _count(db, "archive.analysis_results") == 2  # повтор не продублировал копию
+    assert _count(db, "main.analysis") == 1
+    assert closed not in db.analysis_result_columns()
+    columns, rows = db.analysis_get_results_for_pupil("5А", "Иванов", "Иван", "", "Логопед")
+    assert closed in columns and len(rows) == 3
@@ -0,0 +1,57 @@
+"""Атомарность Database.batch(): справочники не фиксируются посреди пакета."""
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from db import Database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(tmp_path / "sveduch.db")
+    db.create_tables()
+    yield db
+    db.close()
+
+
+def _pupil(form_id: int, surname: str) -> dict:
+    return {"form_id": form_id, "surname": surname, "name": "Иван"}
+
+
+def _counts(path: Path) -> tuple[int, int]:
+    conn = sqlite3.connect(path)
+    try:
+        return (
+            conn.execute("SELECT COUNT(*) FROM pupils").fetchone()[0],
+            conn.execute("SELECT COUNT(*) FROM forms").fetchone()[0],
+        )
+    finally:
+        conn.close()
+
+
+def test_failed_mixed_batch_rolls_back_everything(db):
+    form_id = db.forms_add("5А")
+    before = _counts(db.path)
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.batch():
+            db.pupils_insert(_pupil(form_id, "Первый"))
+            db.forms_add("6Б")
+            db.settings_set("batch", "1")
+            db.recommendations_add("Логопед", "Занятия")
+            db.pupils_insert(_pupil(9999, "Без класса"))  # нет такого класса — FOREIGN KEY
+    assert _counts(db.path) == before
+    assert db.settings_get("batch") is None
+    assert db.recommendations_get_all() == []
+
+
+def test_batch_commits_on_success(db):
+    with db.batch():
+        form_id = db.forms_add("7В")
+        db.pupils_insert(_pupil(form_id, "Петров"))
+        rec_id = db.recommendations_add("Логопед", "Занятия")
+        assert db.recommendations_add("Логопед", "Занятия") == rec_id  # дубликат не откатывает пакет
+    assert _counts(db.path) == (1, 1)
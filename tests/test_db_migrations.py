@@ -0,0 +1,107 @@
+"""Миграции db.py на файлах старого формата."""
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from db import Database, UnknownLevelsError  # noqa: E402
+
+RESULT_COLUMN = "result_I_2024_2025"
+
+
+def _legacy_analysis_db(path: Path, values: list[str]) -> None:
+    """БД с текстовой колонкой результатов analysis (до перехода на id уровней)."""
+    db = Database(path)
+    db.create_tables()
+    db.close()
+    conn = sqlite3.connect(path)
+    conn.execute(f"ALTER TABLE analysis ADD COLUMN {RESULT_COLUMN} TEXT")
+    conn.executemany(
+        "INSERT INTO standards (name, code) VALUES (?, ?)",
+        [("низкий", "1"), ("средний", "3"), ("высокий", "5")],
+    )
+    conn.executemany(
+        f"INSERT INTO analysis (class_number, surname, name, patronymic, specialist, criterion, {RESULT_COLUMN}) "
+        "VALUES ('5А', 'Иванов', 'Иван', '', 'Логопед', ?, ?)",
+        [(f"Критерий {n}", v) for n, v in enumerate(values)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def _column_type(path: Path) -> str:
+    conn = sqlite3.connect(path)
+    try:
+        info = conn.execute("PRAGMA table_info(analysis)").fetchall()
+    finally:
+        conn.close()
+    return {r[1]: r[2] for r in info}[RESULT_COLUMN]
+
+
+def test_numeric_code_maps_to_existing_level(tmp_path):
+    path = tmp_path / "legacy.db"
+    _legacy_analysis_db(path, ["3", "Высокий", " 1 ", None])
+    db = Database(path)
+    try:
+        db.create_tables()
+        levels = {r["name"]: r["id"] for r in db.standards_get_all()}
+        assert len(levels) == 3  # новых уровней не появилось
+        rows = db._get_conn().execute(
+            f"SELECT criterion, {RESULT_COLUMN} FROM analysis ORDER BY criterion"
+        ).fetchall()
+        assert [tuple(r) for r in rows] == [
+            ("Критерий 0", levels["средний"]),
+            ("Критерий 1", levels["высокий"]),
+            ("Критерий 2", levels["низкий"]),
+            ("Критерий 3", None),
+        ]
+    finally:
+        db.close()
+    assert _column_type(path) == "INTEGER"
+
+
+def test_unknown_values_stop_migration(tmp_path):
+    path = tmp_path / "legacy.db"
+    _legacy_analysis_db(path, ["средний", "7", "почти хорошо"])
+    db = Database(path)
+    try:
+        with pytest.raises(UnknownLevelsError) as info:
+            db.create_tables()
+        assert info.value.values == ["7", "почти хорошо"]
+        assert len(db.standards_get_all()) == 3
+    finally:
+        db.close()
+    assert _column_type(path) == "TEXT"
+
+
+def test_legacy_recommendations_without_specialist_are_kept(tmp_path):
+    path = tmp_path / "legacy.db"
+    db = Database(path)
+    db.create_tables()
+    db.close()
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO recommendations (specialist_name, recommendation_name) VALUES ('Логопед', 'Артикуляция')")
+    conn.execute("INSERT INTO forms (number) VALUES ('5А')")
+    conn.execute(
+        "INSERT INTO pupils (form_id, surname, name, rec_spec_1, rec_spec_3) "
+        "VALUES (1, 'Иванов', 'Иван', 'Артикуляция; Дыхание', 'Моторика')"
+    )
+    conn.commit()
+    conn.close()
+    db = Database(path)
+    try:
+        db.create_tables()
+        rows = db._get_conn().execute(
+            "SELECT r.specialist_name, r.recommendation_name FROM pupil_recommendations pr "
+            "JOIN recommendations r ON r.id = pr.recommendation_id ORDER BY r.id"
+        ).fetchall()
+        assert [tuple(r) for r in rows] == [
+            ("Логопед", "Артикуляция"), ("Логопед", "Дыхание"), ("Специалист 3", "Моторика"),
+        ]
+        left = db._get_conn().execute("SELECT rec_spec_1, rec_spec_3 FROM pupils").fetchone()
+        assert tuple(left) == (None, None)
+    finally:
+        db.close()
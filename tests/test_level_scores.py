@@ -0,0 +1,40 @@
+"""Баллы уровней: одна функция db.level_scores для отчёта по классу и вкладки «Аналитика»."""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from db import DEFAULT_LEVELS, level_score, level_scores  # noqa: E402
+
+
+def _levels(*pairs):
+    return [{"name": name, "code": code} for name, code in pairs]
+
+
+def test_numeric_codes_only():
+    scores = level_scores(_levels(("высокий", "5"), ("низкий", ""), ("средний", "3,5")))
+    assert scores == {"высокий": 5.0, "средний": 3.5}
+    assert level_score("низкий", scores) is None  # без числового кода — без балла, а не 1 по умолчанию
+    assert level_score(" Высокий ", scores) == 5.0
+    assert level_score("4", scores) == 4.0
+
+
+def test_default_scale_without_numeric_codes():
+    scores = level_scores(_levels(("низкий", "н"), ("высокий", "")))
+    assert scores == {name: float(code) for name, code in DEFAULT_LEVELS}
+    assert level_score("Средний", scores) == 3.0
+    assert level_score(None, scores) is None
+
+
+def test_analytics_uses_the_same_scores():
+    analytics = pytest.importorskip("analytics")
+    scores = level_scores(_levels(("высокий", "5"), ("низкий", "")))
+    rows = [
+        ("5А", "Иванов", "Иван", "", "Логопед", "Чтение", "result_I_2024_2025", "низкий"),
+        ("5А", "Иванов", "Иван", "", "Логопед", "Чтение", "result_II_2024_2025", "высокий"),
+    ]
+    cube = analytics.ResultsCube(["result_I_2024_2025", "result_II_2024_2025"], rows, scores)
+    assert cube.levels == ["высокий", "низкий"]
+    assert cube.scores[0, 0, 1] == 5.0 and cube.scores[0, 0, 0] != cube.scores[0, 0, 0]  # NaN, как в отчёте
@@ -0,0 +1,123 @@
+"""Журнал pupils_changes и восстановление состояния ученика на дату (pupils_state_as_of)."""
+import json
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import db as db_module  # noqa: E402
+from db import PUPIL_AUDIT_COLUMNS, Database, _AUDIT_SNAPSHOT_EVERY  # noqa: E402
+
+
+class _Clock(datetime):
+    """datetime.now() для db.py: время каждой записи журнала задаёт тест."""
+
+    current = datetime(2024, 9, 2, 9, 0, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+    @classmethod
+    def tick(cls, minutes: int = 1) -> str:
+        cls.current += timedelta(minutes=minutes)
+        return cls.current.isoformat(timespec="seconds")
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_module, "datetime", _Clock)
+    _Clock.current = datetime(2024, 9, 2, 9, 0, 0)
+    db = Database(tmp_path / "sveduch.db")
+    db.create_tables()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def form_id(db):
+    return db.forms_add("5А")
+
+
+def _state(db: Database, pupil_id: int):
+    state = db._pupil_audit_state(pupil_id)
+    return None if state is None else dict(zip(PUPIL_AUDIT_COLUMNS, state))
+
+
+def _ops(db: Database, pupil_id: int) -> str:
+    return "".join(r["op"] for r in db.pupils_changes_get(pupil_id))
+
+
+def test_insert(db, form_id):
+    before = _Clock.tick()
+    _Clock.tick()
+    pupil_id = db.pupils_insert({"form_id": form_id, "surname": "Иванов", "name": "Иван", "gender": "м"})
+    assert _ops(db, pupil_id) == "I"
+    assert db.pupils_state_as_of(pupil_id, before) is None
+    assert db.pupils_state_as_of(pupil_id, _Clock.tick()) == _state(db, pupil_id)
+    assert db.pupils_state_as_of(pupil_id, date(2024, 9, 2))["surname"] == "Иванов"  # дата — на конец дня
+
+
+def test_many_updates_match_true_state(db, form_id):
+    other_form = db.forms_add("6Б")
+    _Clock.tick()
+    pupil_id = db.pupils_insert({"form_id": form_id, "surname": "Петров", "name": "Пётр"})
+    history = [(_Clock.current.isoformat(timespec="seconds"), _state(db, pupil_id))]
+    for n in range(_AUDIT_SNAPSHOT_EVERY * 2 + 5):
+        _Clock.tick()
+        if n % 3 == 0:
+            db.pupils_update_many([pupil_id], {"address": f"ул. Школьная, {n}"})
+        elif n % 3 == 1:
+            db.pupils_update_many([pupil_id], {"form_id": other_form if n % 2 else form_id, "pmpk_number": str(n)})
+        else:
+            row = {**_state(db, pupil_id), "surname": f"Петров-{n}"}
+            db.pupils_update(pupil_id, row)
+        history.append((_Clock.current.isoformat(timespec="seconds"), _state(db, pupil_id)))
+        _Clock.tick()  # между изменениями — момент, когда действует предыдущее
+    ops = _ops(db, pupil_id)
+    assert ops[0] == "I" and "S" in ops and ops.count("S") == len(ops) // _AUDIT_SNAPSHOT_EVERY
+    for ts, expected in history:
+        assert db.pupils_state_as_of(pupil_id, ts) == expected
+        later = (datetime.fromisoformat(ts) + timedelta(seconds=30)).isoformat()
+        assert db.pupils_state_as_of(pupil_id, later) == expected
+
+
+def test_before_insert_is_none(db, form_id):
+    _Clock.tick(60 * 24)
+    pupil_id = db.pupils_insert({"form_id": form_id, "surname": "Сидоров", "name": "Семён"})
+    assert db.pupils_state_as_of(pupil_id, date(2024, 9, 2)) is None
+    assert db.pupils_state_as_of(pupil_id, datetime(2024, 9, 3, 8, 59, 59)) is None
+    assert db.pupils_state_as_of(pupil_id, "2024-09-03")["surname"] == "Сидоров"
+
+
+def test_delete(db, form_id):
+    pupil_id = db.pupils_insert({"form_id": form_id, "surname": "Козлов", "name": "Кирилл"})
+    inserted = _state(db, pupil_id)
+    before_delete = _Clock.tick()
+    _Clock.tick()
+    db.pupils_delete(pupil_id)
+    assert _ops(db, pupil_id) == "ID"
+    assert db.pupils_state_as_of(pupil_id, before_delete) == inserted
+    assert db.pupils_state_as_of(pupil_id, _Clock.tick()) is None
+
+
+def test_pupil_added_before_the_log_gets_snapshot(db, form_id):
+    conn = db._get_conn()
+    pupil_id = conn.execute(
+        "INSERT INTO pupils (form_id, surname, name) VALUES (?, 'Старый', 'Олег')", (form_id,)
+    ).lastrowid
+    conn.commit()
+    old = _state(db, pupil_id)
+    assert _ops(db, pupil_id) == ""
+    before = _Clock.tick()
+    _Clock.tick()
+    db.pupils_update_many([pupil_id], {"address": "ул. Новая, 1"})
+    changes = db.pupils_changes_get(pupil_id)
+    assert [r["op"] for r in changes] == ["S", "U"]
+    assert dict(zip(PUPIL_AUDIT_COLUMNS, json.loads(changes[0]["diff"]))) == old
+    assert db.pupils_state_as_of(pupil_id, before) is None  # журнал о нём ещё ничего не знал
+    assert db.pupils_state_as_of(pupil_id, _Clock.tick()) == _state(db, pupil_id)
+    assert _state(db, pupil_id)["address"] == "ул. Новая, 1"
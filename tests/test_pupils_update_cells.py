@@ -0,0 +1,63 @@
+"""Правки ячеек таблицы учеников: pupils_update_cells с оптимистической проверкой."""
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from db import PUPIL_AUDIT_COLUMNS, Database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(tmp_path / "sveduch.db")
+    db.create_tables()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def pupil_id(db):
+    form_id = db.forms_add("5А")
+    return db.pupils_insert({
+        "form_id": form_id, "surname": "Иванов", "name": "Иван", "address": "ул. Лесная, 1", "gender": "м",
+    })
+
+
+def test_stale_expected_value_is_a_conflict(db, pupil_id):
+    db.pupils_update_many([pupil_id], {"address": "ул. Садовая, 2"})  # правка другого пользователя
+    conflicts = db.pupils_update_cells(
+        {pupil_id: {"address": "ул. Полевая, 3"}}, {pupil_id: {"address": "ул. Лесная, 1"}}
+    )
+    assert conflicts == [pupil_id]
+    assert db.pupils_get_by_id(pupil_id).address == "ул. Садовая, 2"
+    assert [r["op"] for r in db.pupils_changes_get(pupil_id)] == ["I", "U"]
+
+
+def test_only_edited_columns_are_written(db, pupil_id):
+    other = db.pupils_insert({"form_id": db.pupils_get_by_id(pupil_id).form_id, "surname": "Петров", "name": "Пётр"})
+    db.pupils_update_many([pupil_id], {"surname": "Иванов-Петров"})  # другой пользователь, другая колонка
+    conflicts = db.pupils_update_cells(
+        {pupil_id: {"address": "ул. Полевая, 3"}, other: {"gender": "м"}},
+        {pupil_id: {"address": "ул. Лесная, 1"}, other: {"gender": ""}},
+    )
+    assert conflicts == []
+    pupil = db.pupils_get_by_id(pupil_id)
+    assert (pupil.surname, pupil.address, pupil.gender) == ("Иванов-Петров", "ул. Полевая, 3", "м")
+    assert db.pupils_get_by_id(other).gender == "м"
+    last = db.pupils_changes_get(pupil_id)[-1]
+    assert (last["op"], json.loads(last["diff"])) == ("U", {str(PUPIL_AUDIT_COLUMNS.index("address")): "ул. Полевая, 3"})
+
+
+def test_deleted_pupil_is_a_conflict(db, pupil_id):
+    other = db.pupils_insert({"form_id": db.pupils_get_by_id(pupil_id).form_id, "surname": "Петров", "name": "Пётр"})
+    db.pupils_delete(pupil_id)
+    conflicts = db.pupils_update_cells(
+        {pupil_id: {"address": "ул. Полевая, 3"}, other: {"address": "ул. Речная, 4"}},
+        {pupil_id: {"address": "ул. Лесная, 1"}, other: {"address": ""}},
+    )
+    assert conflicts == [pupil_id]
+    assert db.pupils_get_by_id(pupil_id) is None
+    assert db.pupils_get_by_id(other).address == "ул. Речная, 4"
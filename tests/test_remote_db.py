@@ -0,0 +1,127 @@
+"""Сервер БД (db_server.py) и клиент RemoteDatabase на localhost: порт 0 — любой свободный."""
+import http.client
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from db import Database, UnknownLevelsError  # noqa: E402
+from db_server import DatabaseServer  # noqa: E402
+from pupil import Pupil  # noqa: E402
+from remote_db import RemoteDatabase, RemoteError  # noqa: E402
+
+TOKEN = "test-secret"
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = DatabaseServer(tmp_path / "sveduch.db", port=0, token=TOKEN).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def remote(server):
+    remote = RemoteDatabase(server.url, token=TOKEN)
+    yield remote
+    remote.close()
+
+
+def test_read_round_trip(server, remote):
+    form_id = server.db.forms_add("5А")
+    server.db.pupils_insert({"form_id": form_id, "surname": "Иванов", "name": "Иван", "birth_date": "01.02.2015"})
+    assert [(r["id"], r["number"]) for r in remote.forms_get_all()] == [(form_id, "5А")]
+    pupils = remote.pupils_get_by_form_id(form_id)
+    assert len(pupils) == 1 and isinstance(pupils[0], Pupil)
+    assert (pupils[0].surname, pupils[0].birth_date) == ("Иванов", "01.02.2015")
+
+
+def test_write_round_trip_notifies_changes(server, remote):
+    changes = []
+    remote.add_change_listener(lambda table, ids: changes.append((table, ids)))
+    form_id = remote.forms_add("6Б")
+    pupil_id = remote.pupils_insert({"form_id": form_id, "surname": "Петров", "name": "Пётр"})
+    assert server.db.pupils_get_by_id(pupil_id).surname == "Петров"
+    assert ("forms", frozenset({form_id})) in changes
+    assert ("pupils", frozenset({pupil_id})) in changes
+
+
+def test_integrity_error_is_mapped(remote):
+    remote.forms_add("7В")
+    with pytest.raises(sqlite3.IntegrityError):
+        remote.forms_add("7В")
+
+
+def test_wrong_token_is_rejected(server):
+    with pytest.raises(RemoteError, match="Неверный токен"):
+        RemoteDatabase(server.url, token="wrong")
+    host, port = server.httpd.server_address[:2]
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        conn.request("GET", "/backup")
+        response = conn.getresponse()
+        response.read()
+    finally:
+        conn.close()
+    assert response.status == 403
+
+
+def test_failed_batch_rolls_back(server, remote):
+    form_id = remote.forms_add("8Г")
+    changes = []
+    remote.add_change_listener(lambda table, ids: changes.append(table))
+    with pytest.raises(sqlite3.IntegrityError):
+        with remote.batch() as batch:
+            batch.pupils_insert({"form_id": form_id, "surname": "Первый", "name": "Иван"})
+            batch.forms_add("9Д")
+            batch.pupils_insert({"form_id": 9999, "surname": "Без класса", "name": "Иван"})
+    assert server.db.pupils_get_all() == []
+    assert [r["number"] for r in server.db.forms_get_all()] == ["8Г"]
+    assert changes == []
+
+
+def test_network_address_requires_token(tmp_path):
+    with pytest.raises(ValueError, match="--token"):
+        DatabaseServer(tmp_path / "sveduch.db", host="0.0.0.0", port=0)
+
+
+def test_non_ascii_token_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="ASCII"):
+        DatabaseServer(tmp_path / "sveduch.db", port=0, token="СЕКРЕТ")
+
+
+def test_unknown_level_error_keeps_values(remote):
+    column = remote.analysis_ensure_result_column("2024-2025", "I")
+    with pytest.raises(UnknownLevelsError) as error:
+        remote.analysis_insert_row("5А", "Иванов", "Иван", "", "Логопед", "Чтение", column, "отлично")
+    assert error.value.values == ["отлично"]
+
+
+def _legacy_results_db(path: Path) -> None:
+    """БД с текстовой колонкой результатов analysis, где есть значение не из справочника."""
+    db = Database(path)
+    db.create_tables()
+    db.close()
+    conn = sqlite3.connect(path)
+    conn.execute("ALTER TABLE analysis ADD COLUMN result_I_2024_2025 TEXT")
+    conn.execute(
+        "INSERT INTO analysis (class_number, surname, name, specialist, criterion, result_I_2024_2025) "
+        "VALUES ('5А', 'Иванов', 'Иван', 'Логопед', 'Чтение', 'отлично')"
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_server_start_with_unknown_levels(tmp_path):
+    path = tmp_path / "sveduch.db"
+    _legacy_results_db(path)
+    with pytest.raises(UnknownLevelsError):
+        DatabaseServer(path, port=0, token=TOKEN)
+    server = DatabaseServer(path, port=0, token=TOKEN, add_unknown_levels=True).start()
+    try:
+        assert "отлично" in [r["name"] for r in server.db.standards_get_all()]
+    finally:
+        server.shutdown()
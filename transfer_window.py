@@ -8,20 +8,16 @@ from PyQt5.QtWidgets import (
     QLabel, QLineEdit, QComboBox, QGroupBox, QRadioButton, QButtonGroup,
     QMessageBox, QHeaderView, QAbstractItemView, QCheckBox,
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSlot
 from PyQt5.QtGui import QIcon
 
 from app_icon import get_icon_path
+from data_bus import RefreshOnShowMixin, bus_for
 from db import Database
+from perf_trace import timed_action
 from date_widget import DateLineEdit
 
 
-def _row_to_dict(row) -> dict:
-    """sqlite3.Row -> dict (без id для передачи в pupils_history_insert)."""
-    d = {k: row[k] for k in row.keys() if k != "id"}
-    return d
-
-
 def _parse_class_number(number: str) -> tuple[str, str]:
     """Разбирает номер класса на цифры и букву. Например: '5А' -> ('5', 'А'), '11' -> ('11', '')."""
     number = (number or "").strip()
@@ -43,7 +39,7 @@ def _increment_class_number(number: str) -> str:
         return number
 
 
-class TransferWindow(QWidget):
+class TransferWindow(RefreshOnShowMixin, QWidget):
     def __init__(self, db: Database, parent=None):
         super().__init__(parent)
         self.db = db
@@ -54,6 +50,7 @@ class TransferWindow(QWidget):
             self.setWindowIcon(QIcon(icon_path))
         self._pupil_rows = []   # результат поиска учеников (блок 1)
         self._class_pupil_rows = []  # ученики выбранного класса (блок 2)
+        self._class_form_id = None  # класс, ученики которого загружены в блок 2
         self._form_map = {}  # id -> number
         self._program_map = {}  # id -> (name, version)
 
@@ -168,6 +165,51 @@ class TransferWindow(QWidget):
         class_layout.addWidget(self.btn_class_save)
 
         self._refresh_combos()
+        bus_for(self.db).table_changed.connect(self._on_data_changed)
+
+    @pyqtSlot(str, object)
+    def _on_data_changed(self, table: str, ids):
+        """Обновление по шине: справочники — комбобоксы, ученики — только затронутые строки таблиц."""
+        if self.defer_if_hidden(table, ids):
+            return
+        if table in ("forms", "programs"):
+            combos = [self.pupil_class_combo, self.pupil_new_class, self.class_combo, self.pupil_new_program]
+            selected = [c.currentData() for c in combos]
+            self._refresh_combos()
+            for combo, data in zip(combos, selected):
+                combo.setCurrentIndex(max(combo.findData(data), 0))
+            if table == "forms":
+                self._fill_pupil_table()
+                self._fill_class_table(self._checked_class_ids())
+        elif table == "pupils":
+            if ids is None:
+                ids = {r.id for r in self._pupil_rows} | {r.id for r in self._class_pupil_rows}
+            self._apply_pupil_changes(ids)
+
+    def _apply_pupil_changes(self, ids):
+        """Заменить изменённых учеников свежими строками; удалённых (и ушедших из загруженного класса) убрать."""
+        affected = [r.id for r in self._pupil_rows + list(self._class_pupil_rows) if r.id in ids]
+        if not affected:
+            return
+        fresh = {r.id: r for r in self.db.pupils_get_by_ids(affected)}
+
+        def updated(rows, form_id=None):
+            result = []
+            for r in rows:
+                if r.id in ids:
+                    r = fresh.get(r.id)
+                    if r is None or (form_id is not None and r.form_id != form_id):
+                        continue
+                result.append(r)
+            return result
+
+        if any(r.id in ids for r in self._pupil_rows):
+            self._pupil_rows = updated(self._pupil_rows)
+            self._fill_pupil_table()
+        if any(r.id in ids for r in self._class_pupil_rows):
+            checked = self._checked_class_ids()
+            self._class_pupil_rows = updated(self._class_pupil_rows, self._class_form_id)
+            self._fill_class_table(checked)
 
     def _refresh_combos(self):
         self._form_map = {r["id"]: r["number"] for r in self.db.forms_get_all()}
@@ -206,11 +248,11 @@ class TransferWindow(QWidget):
             rows = self.db.pupils_get_all()
         result = []
         for r in rows:
-            if surname and (r["surname"] or "").lower().find(surname) < 0:
+            if surname and (r.surname or "").lower().find(surname) < 0:
                 continue
-            if name and (r["name"] or "").lower().find(name) < 0:
+            if name and (r.name or "").lower().find(name) < 0:
                 continue
-            if patronymic and (r["patronymic"] or "").lower().find(patronymic) < 0:
+            if patronymic and (r.patronymic or "").lower().find(patronymic) < 0:
                 continue
             result.append(r)
         self._pupil_rows = result
@@ -221,13 +263,14 @@ class TransferWindow(QWidget):
         self.pupil_table.setHorizontalHeaderLabels(["id", "Класс", "Фамилия", "Имя", "Отчество"])
         self.pupil_table.setRowCount(len(self._pupil_rows))
         for i, r in enumerate(self._pupil_rows):
-            form_num = self._form_map.get(r["form_id"], "")
-            self.pupil_table.setItem(i, 0, QTableWidgetItem(str(r["id"])))
+            form_num = self._form_map.get(r.form_id, "")
+            self.pupil_table.setItem(i, 0, QTableWidgetItem(str(r.id)))
             self.pupil_table.setItem(i, 1, QTableWidgetItem(form_num))
-            self.pupil_table.setItem(i, 2, QTableWidgetItem(r["surname"] or ""))
-            self.pupil_table.setItem(i, 3, QTableWidgetItem(r["name"] or ""))
-            self.pupil_table.setItem(i, 4, QTableWidgetItem(r["patronymic"] or ""))
+            self.pupil_table.setItem(i, 2, QTableWidgetItem(r.surname or ""))
+            self.pupil_table.setItem(i, 3, QTableWidgetItem(r.name or ""))
+            self.pupil_table.setItem(i, 4, QTableWidgetItem(r.patronymic or ""))
 
+    @timed_action
     def _pupil_save(self):
         row_idx = self.pupil_table.currentRow()
         if row_idx < 0 or row_idx >= len(self._pupil_rows):
@@ -242,11 +285,8 @@ class TransferWindow(QWidget):
                 QMessageBox.warning(self, "Данные", "Укажите дату перевода.")
                 return
             try:
-                d = _row_to_dict(row)
-                self.db.pupils_history_insert(d, transfer_date, transfer_reason)
-                self.db.pupils_delete(row["id"])
+                self.db.pupils_archive(row.id, transfer_date, transfer_reason)
                 QMessageBox.information(self, "Сохранено", "Ученик перенесён в архив.")
-                self._pupil_find()
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", str(e))
         else:
@@ -256,14 +296,13 @@ class TransferWindow(QWidget):
                 QMessageBox.warning(self, "Данные", "Выберите новый класс и/или программу.")
                 return
             try:
-                upd = _row_to_dict(row)
+                upd = row.copy()
                 if new_form_id is not None:
-                    upd["form_id"] = new_form_id
+                    upd.form_id = new_form_id
                 if new_program_id is not None:
-                    upd["program_id"] = new_program_id
-                self.db.pupils_update(row["id"], upd)
+                    upd.program_id = new_program_id
+                self.db.pupils_update(row.id, upd)
                 QMessageBox.information(self, "Сохранено", "Запись ученика обновлена.")
-                self._pupil_find()
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", str(e))
 
@@ -272,23 +311,35 @@ class TransferWindow(QWidget):
         if form_id is None:
             QMessageBox.warning(self, "Выбор", "Выберите класс.")
             return
+        self._class_form_id = form_id
         self._class_pupil_rows = self.db.pupils_get_by_form_id(form_id)
         self._fill_class_table()
 
-    def _fill_class_table(self):
+    def _checked_class_ids(self) -> set:
+        """id отмеченных учеников в таблице перевода класса."""
+        checked = set()
+        for i in range(self.class_table.rowCount()):
+            w = self.class_table.cellWidget(i, 0)
+            if isinstance(w, QCheckBox) and w.isChecked() and i < len(self._class_pupil_rows):
+                checked.add(self._class_pupil_rows[i].id)
+        return checked
+
+    def _fill_class_table(self, checked_ids=()):
         self.class_table.setColumnCount(6)
         self.class_table.setHorizontalHeaderLabels(["", "id", "Фамилия", "Имя", "Отчество", "Класс"])
         self.class_table.setRowCount(len(self._class_pupil_rows))
         for i, r in enumerate(self._class_pupil_rows):
             cb = QCheckBox()
+            cb.setChecked(r.id in checked_ids)
             self.class_table.setCellWidget(i, 0, cb)
-            form_num = self._form_map.get(r["form_id"], "")
-            self.class_table.setItem(i, 1, QTableWidgetItem(str(r["id"])))
-            self.class_table.setItem(i, 2, QTableWidgetItem(r["surname"] or ""))
-            self.class_table.setItem(i, 3, QTableWidgetItem(r["name"] or ""))
-            self.class_table.setItem(i, 4, QTableWidgetItem(r["patronymic"] or ""))
+            form_num = self._form_map.get(r.form_id, "")
+            self.class_table.setItem(i, 1, QTableWidgetItem(str(r.id)))
+            self.class_table.setItem(i, 2, QTableWidgetItem(r.surname or ""))
+            self.class_table.setItem(i, 3, QTableWidgetItem(r.name or ""))
+            self.class_table.setItem(i, 4, QTableWidgetItem(r.patronymic or ""))
             self.class_table.setItem(i, 5, QTableWidgetItem(form_num))
 
+    @timed_action
     def _class_save(self):
         form_id = self.class_combo.currentData()
         if form_id is None:
@@ -314,10 +365,9 @@ class TransferWindow(QWidget):
         is_11 = form_number.strip().startswith("11")
         try:
             if is_11:
-                for r in selected:
-                    d = _row_to_dict(r)
-                    self.db.pupils_history_insert(d, transfer_date, transfer_reason)
-                    self.db.pupils_delete(r["id"])
+                with self.db.batch():
+                    for r in selected:
+                        self.db.pupils_archive(r.id, transfer_date, transfer_reason)
                 QMessageBox.information(self, "Сохранено", "Ученики 11-го класса перенесены в архив.")
             else:
                 new_number = _increment_class_number(form_number)
@@ -329,11 +379,11 @@ class TransferWindow(QWidget):
                         break
                 if new_form_id is None:
                     new_form_id = self.db.forms_add(new_number)
-                for r in selected:
-                    upd = _row_to_dict(r)
-                    upd["form_id"] = new_form_id
-                    self.db.pupils_update(r["id"], upd)
+                with self.db.batch():
+                    for r in selected:
+                        upd = r.copy()
+                        upd.form_id = new_form_id
+                        self.db.pupils_update(r.id, upd)
                 QMessageBox.information(self, "Сохранено", f"Номер класса обновлён на {new_number}.")
-            self._class_load()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", str(e))